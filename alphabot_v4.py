@@ -21,6 +21,7 @@ import os
 import logging
 import threading
 import queue
+import asyncio
 import requests
 import io
 from datetime import datetime, timedelta
@@ -33,6 +34,8 @@ from typing import Optional, List, Dict, Tuple, Any
 from enum import Enum
 from abc import ABC, abstractmethod
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 warnings.filterwarnings('ignore')
 
 # Import matplotlib for charts
@@ -60,6 +63,96 @@ try:
 except ImportError:
     ML_MODEL_AVAILABLE = False
 
+try:
+    from backtest_engine import IncrementalBacktestEngine, diff_trades, print_intrabar_report
+    BACKTEST_ENGINE_AVAILABLE = True
+except ImportError:
+    BACKTEST_ENGINE_AVAILABLE = False
+
+try:
+    from portfolio_backtest import PortfolioBacktestEngine, history_feeds, print_portfolio_report
+    PORTFOLIO_BACKTEST_AVAILABLE = True
+except ImportError:
+    PORTFOLIO_BACKTEST_AVAILABLE = False
+
+try:
+    from perf_metrics import span, get_registry, PerfExporter
+    PERF_METRICS_AVAILABLE = True
+except ImportError:
+    PERF_METRICS_AVAILABLE = False
+    
+    class span:
+        """No-op stand-in when perf_metrics.py is missing"""
+        def __init__(self, name: str):
+            pass
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def __call__(self, fn):
+            return fn
+
+try:
+    from market_meta import MarketMetaCache
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
+try:
+    from user_stream import UserDataStream, market_id
+    USER_STREAM_AVAILABLE = True
+except ImportError:
+    USER_STREAM_AVAILABLE = False
+
+try:
+    from async_executor import AsyncExchangeExecutor
+    ASYNC_EXECUTOR_AVAILABLE = True
+except ImportError:
+    ASYNC_EXECUTOR_AVAILABLE = False
+
+try:
+    from session_replay import SessionRecorder
+    SESSION_REPLAY_AVAILABLE = True
+except ImportError:
+    SESSION_REPLAY_AVAILABLE = False
+
+try:
+    from history_store import HistoryStore
+    HISTORY_STORE_AVAILABLE = True
+except ImportError:
+    HISTORY_STORE_AVAILABLE = False
+
+try:
+    from streaming_indicators import StreamingIndicators, IndicatorWindow
+    STREAMING_AVAILABLE = True
+except ImportError:
+    STREAMING_AVAILABLE = False
+
+try:
+    from market_stream import MarketStream, WEBSOCKETS_AVAILABLE
+    MARKET_STREAM_AVAILABLE = True
+except ImportError:
+    MARKET_STREAM_AVAILABLE = False
+    WEBSOCKETS_AVAILABLE = False
+
+try:
+    from candle_cache import get_cache
+    CANDLE_CACHE_AVAILABLE = True
+except ImportError:
+    CANDLE_CACHE_AVAILABLE = False
+
+try:
+    from candle_store import CandleStore
+    CANDLE_STORE_AVAILABLE = True
+except ImportError:
+    CANDLE_STORE_AVAILABLE = False
+
+try:
+    from volatility import volatility_series, fit_garch
+    VOLATILITY_AVAILABLE = True
+except ImportError:
+    VOLATILITY_AVAILABLE = False
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # CONFIGURATION
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -100,11 +193,16 @@ class Config:
     # Portfolio
     INITIAL_CAPITAL: float = 4.5  # Current balance
     POSITION_SIZE_PCT: float = 1.00  # 100% per trade (full equity)
+    MAX_POSITIONS: int = 3                  # Portfolio backtest / multi-position: positions พร้อมกันสูงสุด
+    MULTI_POSITION_MODE: bool = False       # True = AgentC ถือหลาย position (SYMBOLS) ใน loop เดียว
+    MULTI_FETCH_WORKERS: int = 8            # Threads ดึงข้อมูลทุก symbol พร้อมกันใน multi-position cycle
     MAX_LEVERAGE: int = 20  # ลดจาก 50x เป็น 20x (ปลอดภัยกว่า)
     
     # Risk Management (Agent-C)
     DAILY_STOP_LOSS_PCT: float = 0.80      # 80% DSL (for testing)
     MAX_DRAWDOWN_PCT: float = 0.80          # 80% MDD limit (for testing)
+    SYMBOL_DAILY_STOP_LOSS_PCT: float = 0.20  # Multi-position: หยุดเปิดเหรียญนั้นวันนี้เมื่อขาดทุน ≥ % ของ balance ต้นวัน
+    SYMBOL_MAX_DRAWDOWN_PCT: float = 0.30   # Multi-position: ปิดเหรียญนั้นเมื่อ PnL สะสมย่อจากจุดสูงสุด ≥ % ของทุนเริ่มต้น
     STOP_LOSS_PCT: float = 0.015            # 1.5% SL (= -30% ที่ 20x) - Scalping เร็ว
     TAKE_PROFIT_PCT: float = 0.020          # 2% TP (= +40% ที่ 20x) Risk:Reward = 1:1.33
     TRAILING_STOP_PCT: float = 0.010        # 1% trailing - ตามติดกำไรใกล้ๆ
@@ -127,14 +225,31 @@ class Config:
     
     # Live Trading Mode
     LIVE_MODE: bool = False                 # False = Paper Trade (no real orders)
+    ASYNC_EXECUTOR: bool = True             # ส่ง SL/TP พร้อมกันหลัง fill + HTTP session เดียว (async_executor.py)
+    BATCH_PROTECTIVE_ORDERS: bool = False   # True = ส่ง SL+TP เป็น batchOrders request เดียว
+    MARKETS_CACHE_TTL: int = 86400          # load_markets จากไฟล์ data/markets ถ้าอายุไม่เกิน (วินาที)
+    USER_STREAM: bool = True                # LIVE: positions/balances/fills จาก user-data WebSocket (user_stream.py)
+    USER_STREAM_WS_URL: str = ""            # ว่าง = Binance Futures
+    USE_WEBSOCKET: bool = False             # True = WebSocket feed (tick SL/TP) แทน polling 60s
+    MARKET_WS_URL: str = ""                 # ว่าง = Binance Futures, หรือ ws://127.0.0.1:8765 (ReplayServer)
+    SESSION_RECORD_PATH: str = ""           # บันทึก exchange/news responses ทุก cycle (session_replay.py) - ว่าง = ไม่บันทึก
+    PERF_METRICS_PORT: int = 9108           # Prometheus /metrics บน localhost (0 = ปิด)
+    PERF_METRICS_FILE: str = "data/perf_metrics.json"  # Latency snapshot (ว่าง = ไม่เขียนไฟล์)
+    PERF_EXPORT_INTERVAL: int = 60          # เขียนไฟล์ JSON ทุกกี่วินาที
     
     # Agent-A Settings
     DATA_LOOKBACK: int = 1500               # Candles for analysis (more data)
+    STREAMING_INDICATORS: bool = True       # Seed ครั้งเดียว แล้วอัปเดต indicators เฉพาะแท่งใหม่
+    CANDLE_CACHE_MAX_AGE: float = 5.0       # แท่งปัจจุบันใน shared candle cache เก่าได้ไม่เกิน (วินาที)
     VOLATILITY_WINDOW: int = 20             # GARCH window
+    VOLATILITY_MODEL: str = "ewma"          # "ewma" (RiskMetrics) หรือ "garch" (fitted GARCH(1,1))
+    GARCH_REFIT_INTERVAL: int = 3600        # Refit GARCH params ทุก 1 ชั่วโมง (วินาที)
     VOLUME_SPIKE_MULT: float = 3.0          # Volume spike detection
     
     # Agent-B Settings
     BACKTEST_DAYS: int = 180                # 6 months backtest
+    HISTORY_OFFLINE: bool = False           # True = backtest จาก cache บนดิสก์เท่านั้น (ไม่ดึงใหม่)
+    INTRABAR_TIMEFRAME: str = ""            # "1m" = เล่นแท่งย่อยระหว่างถือ position ใน backtest ("" = ราคาปิดอย่างเดียว)
     RL_LEARNING_RATE: float = 0.001
     RL_GAMMA: float = 0.95
     MIN_SHARPE_RATIO: float = 1.5
@@ -217,12 +332,13 @@ If there's HIGH IMPACT news in next 2 hours, set safe_to_trade to false."""
                 "temperature": 0.1
             }
             
-            response = requests.post(
-                self.base_url, 
-                headers=headers, 
-                json=data, 
-                timeout=15
-            )
+            with span('news.perplexity'):
+                response = requests.post(
+                    self.base_url, 
+                    headers=headers, 
+                    json=data, 
+                    timeout=15
+                )
             
             if response.status_code == 200:
                 result = response.json()
@@ -321,6 +437,7 @@ class TelegramNotifier:
         self.polling_thread = None
         self.is_polling = False
         
+    @span('telegram.send_message')
     def send_message(self, text: str, parse_mode: str = "HTML") -> bool:
         """Send text message to Telegram"""
         if not self.enabled:
@@ -598,6 +715,18 @@ class TelegramNotifier:
         elif cmd == "/ml":
             self.send_ml_stats()
         
+        elif cmd == "/perf":
+            if PERF_METRICS_AVAILABLE:
+                self.send_message(get_registry().summary_text())
+            else:
+                self.send_message("❌ Perf metrics module not available")
+        
+        elif cmd == "/cache":
+            if CANDLE_CACHE_AVAILABLE:
+                self.send_message(get_cache().summary())
+            else:
+                self.send_message("❌ Candle cache module not available")
+        
         elif text.startswith("/"):
             self.send_message("❓ ไม่รู้จัก command นี้\nพิมพ์ /help เพื่อดูวิธีใช้")
         
@@ -632,6 +761,8 @@ class TelegramNotifier:
 /journal - 📓 สถิติ Trade Journal
 /scan - 🔍 Multi-Coin Scanner
 /ml - 🤖 ML Model Status
+/cache - 🗄️ Candle cache hit/miss
+/perf - ⏱️ Latency แต่ละขั้นของ cycle
 
 <b>⚙️ Settings:</b>
 /settings - ดูการตั้งค่า
@@ -698,11 +829,16 @@ class TelegramNotifier:
         """Send balance info"""
         if self.bot_ref:
             stats = self.bot_ref.agent_c.get_stats()
+            account = self.bot_ref.agent_c.account
+            exchange_line = ""
+            if account is not None and account.synced:
+                exchange_line = (f"\n🏦 Exchange wallet: ${account.balance('USDT'):.2f} "
+                                 f"(cross ${account.balance('USDT', 'cross_wallet'):.2f})")
             msg = f"""💰 <b>Balance Info</b>
 
 💵 ยอดเงิน: <b>${stats['balance']:.2f}</b>
 📈 ROI: {stats['roi']*100:+.2f}%
-💹 กำไร/ขาดทุน: ${stats['total_pnl']:.2f}
+💹 กำไร/ขาดทุน: ${stats['total_pnl']:.2f}{exchange_line}
 
 🕐 {datetime.now().strftime('%H:%M:%S')}"""
         else:
@@ -737,6 +873,17 @@ class TelegramNotifier:
 ไม่มี Position ตอนนี้
 ⏳ รอสัญญาณเข้าเทรด..."""
         
+        # Exchange side from the user-stream mirror (no REST call)
+        account = self.bot_ref.agent_c.account if self.bot_ref else None
+        if account is not None and account.synced:
+            live = account.position(self.config.SYMBOL)
+            if live:
+                orders = account.orders(self.config.SYMBOL)
+                msg += (f"\n\n🏦 Exchange: {live.side.upper()} {abs(live.amount)} @ ${live.entry_price:,.2f} "
+                        f"| uPnL ${live.unrealized_pnl:+.2f} | {len(orders)} open orders")
+            else:
+                msg += "\n\n🏦 Exchange: flat"
+        
         self.send_message(msg)
     
     # ===== NEW FEATURES =====
@@ -744,12 +891,17 @@ class TelegramNotifier:
     def kill_switch(self):
         """Emergency stop - close all positions and halt trading"""
         if self.bot_ref:
-            # Close position if any
-            if self.bot_ref.agent_c.position:
+            # Close positions if any (every symbol in the book)
+            agent_c = self.bot_ref.agent_c
+            if agent_c.positions:
                 self.send_message("🛑 <b>KILL SWITCH ACTIVATED!</b>\n\n⏳ กำลังปิด Position...")
-                # Force close
-                current_price = self.bot_ref.agent_a.df['close'].iloc[-1] if self.bot_ref.agent_a.df is not None else 0
-                self.bot_ref.agent_c._close_position(current_price, "KILL_SWITCH")
+                # Force close - under the book lock so stream callbacks / update_positions
+                # cannot close the same position or resize the book meanwhile
+                with agent_c.position_lock:
+                    for symbol, _ in list(agent_c.positions.items()):
+                        agent = self.bot_ref.symbol_agents.get(symbol)
+                        current_price = agent.df['close'].iloc[-1] if agent is not None and agent.df is not None else 0
+                        agent_c._close_position(current_price, "KILL_SWITCH", symbol)
             
             # Halt trading
             self.bot_ref.agent_c.halt_trading("Kill switch activated by user")
@@ -927,6 +1079,7 @@ class TelegramNotifier:
         except Exception as e:
             self.send_message(f"❌ Error loading ML model: {e}")
     
+    @span('telegram.send_photo')
     def send_photo(self, photo_bytes: bytes, caption: str = "") -> bool:
         """Send photo to Telegram"""
         if not self.enabled:
@@ -1244,6 +1397,14 @@ class TelegramNotifier:
                        xytext=(len(df_chart)-5, current_price * 1.001),
                        fontsize=11, color='white', fontweight='bold')
             
+            # Volatility (precomputed series from Agent-A) on secondary axis
+            if 'Volatility' in df_chart.columns:
+                ax_vol = ax.twinx()
+                ax_vol.plot(x, df_chart['Volatility'] * 100, color='#ff6b81',
+                           linewidth=1, alpha=0.6, label='Volatility')
+                ax_vol.set_ylabel('Volatility (%)', color='#ff6b81')
+                ax_vol.tick_params(colors='#ff6b81')
+            
             ax.set_title('📊 BTC/USDT - Status Update', fontsize=14, 
                         fontweight='bold', color='white')
             ax.set_ylabel('Price ($)', color='white')
@@ -1336,6 +1497,7 @@ class Position:
     breakeven_activated: bool = False      # SL moved to entry
     partial_tp_taken: bool = False         # First TP taken
     original_size: float = 0.0             # Original position size
+    symbol: str = ""                       # Key in AgentC.positions
     
     def __post_init__(self):
         if self.original_size == 0.0:
@@ -1369,6 +1531,7 @@ class Trade:
     exit_time: datetime
     exit_reason: str
     fees: float
+    symbol: str = ""
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1459,9 +1622,16 @@ class AgentA:
         })
         
         # Data storage
-        self.df: Optional[pd.DataFrame] = None
+        self._df: Optional[pd.DataFrame] = None
+        self.candles = CandleStore() if CANDLE_STORE_AVAILABLE else None  # NumPy ring buffer per symbol
+        self.stream: Optional['StreamingIndicators'] = None  # Incremental indicator state
+        self.stream_index: deque = deque()                    # Closed candles (timestamps)
+        self.stream_rows: deque = deque()                     # Closed candles + indicators (dicts)
+        self.window: Optional['IndicatorWindow'] = None       # Last streaming analysis window
         self.market_state: MarketState = MarketState.RANGING
         self.volatility: float = 0.0
+        self.volatility_series: Optional[pd.Series] = None  # Full series (chart/backtest)
+        self.garch_params = None
         self.volume_zscore: float = 0.0
         self.sentiment_score: float = 0.0  # -1 to 1
         self.pattern_detected: str = "None"
@@ -1472,14 +1642,38 @@ class AgentA:
         self.volatility_spike: bool = False
         self.fud_detected: bool = False
     
+    @property
+    def df(self) -> Optional[pd.DataFrame]:
+        """Last analysis frame - streaming mode builds it on first access (chart / Telegram)"""
+        window = self.window
+        return window.frame() if window is not None else self._df
+    
+    @df.setter
+    def df(self, value: Optional[pd.DataFrame]):
+        self._df = value
+        self.window = None
+    
+    @span('agent_a.fetch')
     def fetch_ohlcv(self, limit: int = 500) -> pd.DataFrame:
         """Fetch OHLCV data from exchange"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(
-                self.config.SYMBOL,
-                self.config.TIMEFRAME,
-                limit=limit
-            )
+            if CANDLE_CACHE_AVAILABLE:
+                ohlcv = get_cache().fetch_ohlcv(
+                    self.exchange,
+                    self.config.SYMBOL,
+                    self.config.TIMEFRAME,
+                    limit=limit,
+                    max_age=self.config.CANDLE_CACHE_MAX_AGE
+                )
+            else:
+                ohlcv = self.exchange.fetch_ohlcv(
+                    self.config.SYMBOL,
+                    self.config.TIMEFRAME,
+                    limit=limit
+                )
+            if self.candles is not None:
+                # Read-only view over the ring buffer (calculate_indicators/dropna copy it)
+                return self.candles.frame(self.config.SYMBOL, self.config.TIMEFRAME, ohlcv)
             df = pd.DataFrame(
                 ohlcv,
                 columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']
@@ -1491,6 +1685,45 @@ class AgentA:
             self.logger.error(f"[Agent-A] Failed to fetch data: {e}")
             return pd.DataFrame()
     
+    def fetch_history(self, days: float, offline: bool = False) -> pd.DataFrame:
+        """
+        Fetch `days` of candles via the paginated on-disk history store
+        (fetch_ohlcv alone is capped at ~1500 candles per request)
+        """
+        if not HISTORY_STORE_AVAILABLE:
+            return self.fetch_ohlcv(limit=1500)
+        
+        if not hasattr(self, 'history_store'):
+            self.history_store = HistoryStore(self.exchange)
+        try:
+            return self.history_store.get(
+                self.config.SYMBOL, self.config.TIMEFRAME, days, offline=offline
+            )
+        except Exception as e:
+            self.logger.error(f"[Agent-A] Failed to load history: {e}")
+            return pd.DataFrame()
+    
+    def subbar_cursor(self, days: float, timeframe: str, offline: bool = False):
+        """
+        Lazy forward-only reader over cached sub-bars (e.g. 1m inside 5m) for intrabar replay
+        Syncs the cache first unless offline; None when the history store is unavailable
+        """
+        if not HISTORY_STORE_AVAILABLE:
+            return None
+        
+        if not hasattr(self, 'history_store'):
+            self.history_store = HistoryStore(self.exchange)
+        since = datetime.utcnow() - timedelta(days=days)
+        if not offline:
+            try:
+                fetched = self.history_store.update(self.config.SYMBOL, timeframe, since)
+                if fetched:
+                    self.logger.info(f"[Agent-A] {timeframe} sub-bars: +{fetched} candles")
+            except Exception as e:
+                self.logger.error(f"[Agent-A] Failed to sync {timeframe} sub-bars, using cache: {e}")
+        return self.history_store.cursor(self.config.SYMBOL, timeframe, since)
+    
+    @span('agent_a.indicators')
     def calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate all technical indicators"""
         if df.empty or len(df) < 50:
@@ -1541,16 +1774,75 @@ class AgentA:
         df['Returns'] = df['close'].pct_change()
         df['Momentum'] = df['close'].pct_change(10)
         
-        return df.dropna()
+        df = df.dropna()
+        
+        # EWMA volatility per bar (causal - safe for backtest)
+        if VOLATILITY_AVAILABLE and not df.empty:
+            df['Volatility'] = volatility_series(df['Returns'])
+        
+        return df
+    
+    @span('agent_a.streaming')
+    def update_streaming_indicators(self) -> Optional['IndicatorWindow']:
+        """
+        Incremental version of fetch_ohlcv + calculate_indicators
+        Seeds once from DATA_LOOKBACK candles, then each cycle fetches only the new
+        candles, commits the closed ones and peeks the in-progress one
+        → rows as dicts (no DataFrame per cycle), None when there is no data
+        """
+        lookback = self.config.DATA_LOOKBACK
+        missing = lookback + 1
+        if self.stream is not None and self.stream.last_timestamp is not None:
+            tf_sec = self.exchange.parse_timeframe(self.config.TIMEFRAME)
+            elapsed = datetime.utcnow() - self.stream.last_timestamp.to_pydatetime().replace(tzinfo=None)
+            missing = int(elapsed.total_seconds() // tf_sec) + 2
+        
+        if missing > lookback:
+            # (Re)seed - first run or the gap is longer than the window
+            raw = self.fetch_ohlcv(lookback)
+            if len(raw) < 2:
+                return None
+            self.stream = StreamingIndicators.from_config(self.config)
+            self.stream_index = deque(maxlen=lookback - 1)
+            self.stream_rows = deque(maxlen=lookback - 1)
+        else:
+            raw = self.fetch_ohlcv(missing)
+            if raw.empty:
+                return None
+        
+        # Closed candles → state; rows still warming up are dropped (dropna)
+        for ts, row in zip(*self.stream.feed(raw.iloc[:-1])):
+            if not any(v != v for v in row.values()):
+                self.stream_index.append(ts)
+                self.stream_rows.append(row)
+        
+        # In-progress candle (not committed)
+        ts = raw.index[-1]
+        o, h, l, c, v = raw[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)[-1]
+        index, rows = list(self.stream_index), list(self.stream_rows)
+        if ts > self.stream.last_timestamp:
+            index.append(ts)
+            rows.append(self.stream.update(ts, o, h, l, c, v, closed=False))
+        return IndicatorWindow(index, rows) if rows else None
     
     def estimate_volatility_garch(self, returns: pd.Series) -> float:
         """
-        Simplified GARCH-like volatility estimation
-        Uses exponentially weighted moving variance
+        GARCH-like volatility estimation
+        EWMA variance (default) or fitted GARCH(1,1) when VOLATILITY_MODEL = "garch"
+        Full series is kept in self.volatility_series
         """
         if len(returns) < 20:
             return 0.0
         
+        if VOLATILITY_AVAILABLE:
+            params = None
+            if self.config.VOLATILITY_MODEL == "garch":
+                params = self._get_garch_params(returns)
+            self.volatility_series = volatility_series(
+                returns, model=self.config.VOLATILITY_MODEL, params=params
+            )
+            return float(self.volatility_series.iloc[-1])
+        
         # EWMA variance (approximates GARCH(1,1))
         lambda_param = 0.94  # Standard RiskMetrics decay factor
         returns_sq = returns ** 2
@@ -1562,24 +1854,39 @@ class AgentA:
         volatility = np.sqrt(var) * np.sqrt(252 * 24 * 60)  # Annualized
         return float(volatility)
     
+    def _get_garch_params(self, returns: pd.Series):
+        """Cached GARCH(1,1) params - refit every GARCH_REFIT_INTERVAL seconds"""
+        params = self.garch_params
+        if params is None or time.time() - params.fitted_at > self.config.GARCH_REFIT_INTERVAL:
+            fitted = fit_garch(returns)
+            if fitted is not None:
+                self.garch_params = fitted
+                self.logger.info(
+                    f"[Agent-A] GARCH(1,1) fitted: alpha={fitted.alpha:.4f} "
+                    f"beta={fitted.beta:.4f} persistence={fitted.persistence:.4f}"
+                )
+        return self.garch_params
+    
     def detect_patterns(self, df: pd.DataFrame) -> str:
         """Detect price action patterns"""
         if len(df) < 10:
             return "None"
         
         patterns = []
-        close = df['close'].values
-        high = df['high'].values
-        low = df['low'].values
+        # np.asarray: DataFrame columns or IndicatorWindow columns
+        open_ = np.asarray(df['open'])
+        close = np.asarray(df['close'])
+        high = np.asarray(df['high'])
+        low = np.asarray(df['low'])
         
         # Bullish engulfing
-        if close[-1] > df['open'].values[-1] and close[-2] < df['open'].values[-2]:
-            if close[-1] > high[-2] and df['open'].values[-1] < low[-2]:
+        if close[-1] > open_[-1] and close[-2] < open_[-2]:
+            if close[-1] > high[-2] and open_[-1] < low[-2]:
                 patterns.append("Bullish Engulfing")
         
         # Bearish engulfing
-        if close[-1] < df['open'].values[-1] and close[-2] > df['open'].values[-2]:
-            if close[-1] < low[-2] and df['open'].values[-1] > high[-2]:
+        if close[-1] < open_[-1] and close[-2] > open_[-2]:
+            if close[-1] < low[-2] and open_[-1] > high[-2]:
                 patterns.append("Bearish Engulfing")
         
         # Double bottom (simplified)
@@ -1599,15 +1906,23 @@ class AgentA:
         if len(df) < 20:
             return MarketState.RANGING
         
-        row = df.iloc[-1]
+        # Volatility assessment
+        avg_atr = df['ATRr_14'].mean() if 'ATRr_14' in df.columns else 0
+        
+        return self.classify_row(df.iloc[-1], avg_atr)
+    
+    def classify_row(self, row, avg_atr: float) -> MarketState:
+        """Market state from the latest row (Series or streaming dict)"""
         adx = row.get(f'ADX_{self.config.ADX_PERIOD}', 20)
         ema_fast = row.get(f'EMA_{self.config.EMA_FAST}', row['close'])
         ema_slow = row.get(f'EMA_{self.config.EMA_SLOW}', row['close'])
         atr = row.get('ATRr_14', 0)
         
-        # Volatility assessment
-        avg_atr = df['ATRr_14'].mean() if 'ATRr_14' in df.columns else 0
-        
+        return self.classify_market_state(adx, ema_fast, ema_slow, atr, avg_atr)
+    
+    def classify_market_state(self, adx: float, ema_fast: float, ema_slow: float,
+                              atr: float, avg_atr: float) -> MarketState:
+        """Market state from latest values (avg_atr = mean ATR of the window)"""
         if self.risk_level > 0.7:
             return MarketState.RISK_OFF
         
@@ -1625,8 +1940,8 @@ class AgentA:
         
         return MarketState.RANGING
     
-    def calculate_risk_level(self, df: pd.DataFrame) -> float:
-        """Calculate overall risk level (0-1)"""
+    def calculate_risk_level(self, last) -> float:
+        """Calculate overall risk level (0-1) from the latest row (Series or streaming dict)"""
         risks = []
         
         # Volume spike risk
@@ -1638,14 +1953,14 @@ class AgentA:
             risks.append(0.4)
         
         # Price far from VWAP
-        if len(df) > 0 and 'VWAP_D' in df.columns:
-            vwap_dist = abs(df['close'].iloc[-1] / df['VWAP_D'].iloc[-1] - 1)
+        if last is not None and 'VWAP_D' in last:
+            vwap_dist = abs(last['close'] / last['VWAP_D'] - 1)
             if vwap_dist > 0.02:  # 2% away from VWAP
                 risks.append(0.2)
         
         # ADX extremely high (overextended trend)
-        if len(df) > 0:
-            adx = df.iloc[-1].get(f'ADX_{self.config.ADX_PERIOD}', 0)
+        if last is not None:
+            adx = last.get(f'ADX_{self.config.ADX_PERIOD}', 0)
             if adx > 50:
                 risks.append(0.2)
         
@@ -1675,41 +1990,81 @@ class AgentA:
         
         return True
     
-    def analyze(self) -> Dict[str, Any]:
-        """Main analysis function - called every minute"""
-        start_time = time.time()
+    def validate_window(self, window: 'IndicatorWindow') -> bool:
+        """cross_validate_data for the streaming window - closed rows are complete, check the latest"""
+        last = window.latest
         
-        # Fetch data
-        df = self.fetch_ohlcv(self.config.DATA_LOOKBACK)
-        if df.empty:
-            return {'valid': False}
+        # Check for missing values
+        if sum(v != v for v in last.values()) > len(window) * 0.1:
+            self.logger.warning("[Agent-A] Data quality issue: Too many missing values")
+            return False
         
-        # Calculate indicators
-        df = self.calculate_indicators(df)
-        if df.empty:
-            return {'valid': False}
+        # Check for stale data
+        if datetime.now() - window.timestamp.to_pydatetime().replace(tzinfo=None) > timedelta(minutes=5):
+            self.logger.warning("[Agent-A] Data quality issue: Stale data")
+            return False
         
-        # Validate data
-        if not self.cross_validate_data(df):
-            return {'valid': False}
+        # Check for price anomalies
+        if abs(last['Returns']) > 0.1:  # 10% move in 1 candle
+            self.logger.warning("[Agent-A] Data quality issue: Price anomaly detected")
+            # Still return True but flag it
         
-        self.df = df
+        return True
+    
+    @span('agent_a.analyze')
+    def analyze(self) -> Dict[str, Any]:
+        """Main analysis function - called every minute"""
+        start_time = time.time()
         
-        # Calculate volatility (GARCH-like)
-        self.volatility = self.estimate_volatility_garch(df['Returns'])
+        if self.config.STREAMING_INDICATORS and STREAMING_AVAILABLE:
+            # Incremental indicators (only new candles) - latest row, no DataFrame
+            window = self.update_streaming_indicators()
+            if window is None or not self.validate_window(window):
+                return {'valid': False}
+            self.window = window
+            last = window.latest
+            
+            # Streaming state already has EWMA volatility
+            if 'Volatility' in last and self.config.VOLATILITY_MODEL == "ewma":
+                self.volatility = float(last['Volatility'])
+            else:
+                self.volatility = self.estimate_volatility_garch(pd.Series(window['Returns']))
+            rows, recent = len(window), window.tail(10)
+            avg_atr = window['ATRr_14'].mean() if 'ATRr_14' in last else 0
+        else:
+            # Fetch data
+            df = self.fetch_ohlcv(self.config.DATA_LOOKBACK)
+            if df.empty:
+                return {'valid': False}
+            
+            # Calculate indicators
+            df = self.calculate_indicators(df)
+            if df.empty:
+                return {'valid': False}
+            
+            # Validate data
+            if not self.cross_validate_data(df):
+                return {'valid': False}
+            self.df = df
+            last = df.iloc[-1]  # One row lookup instead of one per indicator
+            
+            # Calculate volatility (GARCH-like)
+            self.volatility = self.estimate_volatility_garch(df['Returns'])
+            rows, recent = len(df), df
+            avg_atr = df['ATRr_14'].mean() if 'ATRr_14' in df.columns else 0
         
         # Volume analysis
-        self.volume_zscore = df['Volume_Zscore'].iloc[-1]
+        self.volume_zscore = last['Volume_Zscore']
         self.volume_spike = self.volume_zscore > self.config.VOLUME_SPIKE_MULT
         
         # Pattern detection
-        self.pattern_detected = self.detect_patterns(df)
+        self.pattern_detected = self.detect_patterns(recent)
         
         # Risk assessment
-        self.risk_level = self.calculate_risk_level(df)
+        self.risk_level = self.calculate_risk_level(last)
         
         # Market state
-        self.market_state = self.assess_market_state(df)
+        self.market_state = MarketState.RANGING if rows < 20 else self.classify_row(last, avg_atr)
         
         # Log decision
         analysis_time = (time.time() - start_time) * 1000
@@ -1717,7 +2072,7 @@ class AgentA:
         result = {
             'valid': True,
             'timestamp': datetime.now(),
-            'price': df['close'].iloc[-1],
+            'price': last['close'],
             'volatility': self.volatility,
             'volume_zscore': self.volume_zscore,
             'volume_spike': self.volume_spike,
@@ -1726,17 +2081,17 @@ class AgentA:
             'risk_level': self.risk_level,
             'analysis_time_ms': analysis_time,
             'indicators': {
-                'rsi': df[f'RSI_{self.config.RSI_PERIOD}'].iloc[-1],
-                'ema_fast': df[f'EMA_{self.config.EMA_FAST}'].iloc[-1],
-                'ema_slow': df[f'EMA_{self.config.EMA_SLOW}'].iloc[-1],
-                'ema_20': df['EMA_20'].iloc[-1],
-                'ema_50': df['EMA_50'].iloc[-1],
-                'trend_up': df['EMA_20'].iloc[-1] > df['EMA_50'].iloc[-1],  # Trend direction
-                'adx': df[f'ADX_{self.config.ADX_PERIOD}'].iloc[-1],
-                'macd_hist': df['MACDh_12_26_9'].iloc[-1],
-                'bb_upper': df[f'BBU_{self.config.BB_PERIOD}_{self.config.BB_STD}_{self.config.BB_STD}'].iloc[-1],
-                'bb_lower': df[f'BBL_{self.config.BB_PERIOD}_{self.config.BB_STD}_{self.config.BB_STD}'].iloc[-1],
-                'momentum': df['Momentum'].iloc[-1],
+                'rsi': last[f'RSI_{self.config.RSI_PERIOD}'],
+                'ema_fast': last[f'EMA_{self.config.EMA_FAST}'],
+                'ema_slow': last[f'EMA_{self.config.EMA_SLOW}'],
+                'ema_20': last['EMA_20'],
+                'ema_50': last['EMA_50'],
+                'trend_up': last['EMA_20'] > last['EMA_50'],  # Trend direction
+                'adx': last[f'ADX_{self.config.ADX_PERIOD}'],
+                'macd_hist': last['MACDh_12_26_9'],
+                'bb_upper': last[f'BBU_{self.config.BB_PERIOD}_{self.config.BB_STD}_{self.config.BB_STD}'],
+                'bb_lower': last[f'BBL_{self.config.BB_PERIOD}_{self.config.BB_STD}_{self.config.BB_STD}'],
+                'momentum': last['Momentum'],
             }
         }
         
@@ -1906,6 +2261,7 @@ class AgentB:
         
         return SignalType.HOLD, 0.0, ["No clear signal"]
     
+    @span('agent_b.signal')
     def generate_signal(self, analysis: Dict) -> Optional[Signal]:
         """Generate trading signal with all parameters"""
         signal_type, confidence, reasons = self.calculate_signal_score(analysis)
@@ -2063,8 +2419,37 @@ class ExchangeExecutor:
             'sandbox': False,
             'options': {'defaultType': 'future'}
         })
-        self.exchange.load_markets()
+        self.account = None  # AccountMirror (user_stream.py) - positions without fetch_positions
+        
+        # Markets + leverage / margin mode per symbol cached on disk
+        self.meta = None
+        if MARKET_META_AVAILABLE:
+            self.meta = MarketMetaCache(self.exchange.id, account=config.API_KEY,
+                                        markets_ttl=config.MARKETS_CACHE_TTL)
+            self.meta.load(self.exchange)
+        else:
+            self.exchange.load_markets()
+    
+    def _positions(self, symbol: str) -> list:
+        """Positions from the user-stream mirror when synced, else REST"""
+        if self.account is not None and self.account.synced:
+            pos = self.account.position(symbol)
+            return [pos.to_ccxt()] if pos else []
+        return self.exchange.fetch_positions([symbol])
+    
+    def _on_error(self, symbol: str, error: Exception):
+        """Drop cached metadata the exchange error says is stale"""
+        if self.meta is not None:
+            scope = self.meta.on_error(symbol, error)
+            if scope:
+                self.logger.warning(f"[Executor] Cached {scope} for {symbol} invalidated")
+            if scope == 'markets':
+                try:
+                    self.meta.load(self.exchange, reload=True)
+                except Exception as e:
+                    self.logger.error(f"[Executor] Failed to reload markets: {e}")
     
+    @span('executor.get_balance')
     def get_balance(self) -> float:
         """Get USDT balance"""
         try:
@@ -2074,25 +2459,42 @@ class ExchangeExecutor:
             self.logger.error(f"[Executor] Failed to get balance: {e}")
             return 0.0
     
+    @span('executor.set_leverage')
     def set_leverage(self, symbol: str, leverage: int) -> bool:
-        """Set leverage for symbol"""
+        """Set leverage for symbol (skipped when the cache says it is already set)"""
+        if self.meta is not None and self.meta.leverage(symbol) == leverage:
+            return True
         try:
             self.exchange.set_leverage(leverage, symbol)
             self.logger.info(f"[Executor] Leverage set to {leverage}x for {symbol}")
+            if self.meta is not None:
+                self.meta.remember(symbol, leverage=leverage)
             return True
         except Exception as e:
             self.logger.error(f"[Executor] Failed to set leverage: {e}")
+            self._on_error(symbol, e)
             return False
     
+    def ensure_margin_mode(self, symbol: str, mode: str = 'cross'):
+        """Set margin mode once per symbol (cached)"""
+        if self.meta is not None and self.meta.margin_mode(symbol) == mode:
+            return
+        try:
+            self.exchange.set_margin_mode(mode, symbol)
+        except Exception as e:
+            if self.meta is None or not self.meta.already_set(e):
+                self._on_error(symbol, e)
+                return
+        if self.meta is not None:
+            self.meta.remember(symbol, margin_mode=mode)
+    
+    @span('executor.open_position')
     def open_position(self, symbol: str, side: str, amount: float, 
                       stop_loss: float = None, take_profit: float = None) -> dict:
         """Open a position with optional SL/TP"""
         try:
-            # Set margin mode to CROSSED
-            try:
-                self.exchange.set_margin_mode('cross', symbol)
-            except:
-                pass  # Might already be set
+            # Set margin mode to CROSSED (once per symbol)
+            self.ensure_margin_mode(symbol, 'cross')
             
             # Place market order
             order_side = 'buy' if side == 'long' else 'sell'
@@ -2118,6 +2520,7 @@ class ExchangeExecutor:
                     self.logger.info(f"[Executor] SL set @ {stop_loss}")
                 except Exception as e:
                     self.logger.warning(f"[Executor] Failed to set SL: {e}")
+                    self._on_error(symbol, e)
             
             if take_profit:
                 tp_side = 'sell' if side == 'long' else 'buy'
@@ -2132,18 +2535,21 @@ class ExchangeExecutor:
                     self.logger.info(f"[Executor] TP set @ {take_profit}")
                 except Exception as e:
                     self.logger.warning(f"[Executor] Failed to set TP: {e}")
+                    self._on_error(symbol, e)
             
             return order
             
         except Exception as e:
             self.logger.error(f"[Executor] ❌ Failed to open position: {e}")
+            self._on_error(symbol, e)
             return None
     
+    @span('executor.close_position')
     def close_position(self, symbol: str) -> dict:
         """Close current position"""
         try:
             # Get current position
-            positions = self.exchange.fetch_positions([symbol])
+            positions = self._positions(symbol)
             for pos in positions:
                 if float(pos['contracts']) > 0:
                     side = 'sell' if pos['side'] == 'long' else 'buy'
@@ -2167,10 +2573,11 @@ class ExchangeExecutor:
             self.logger.error(f"[Executor] ❌ Failed to close position: {e}")
             return None
     
+    @span('executor.get_position')
     def get_position(self, symbol: str) -> dict:
         """Get current position info"""
         try:
-            positions = self.exchange.fetch_positions([symbol])
+            positions = self._positions(symbol)
             for pos in positions:
                 if float(pos['contracts']) > 0:
                     return pos
@@ -2204,8 +2611,11 @@ class AgentC:
         self.daily_start_balance = config.INITIAL_CAPITAL
         self.last_reset_date = datetime.now().date()
         
-        # Position management
-        self.position: Optional[Position] = None
+        # Position management - book keyed by symbol (self.position = config.SYMBOL's entry)
+        self.positions: Dict[str, Position] = {}
+        self.symbol_daily_pnl: Dict[str, float] = {}
+        self.symbol_pnl: Dict[str, float] = {}        # Realized since start
+        self.symbol_peak_pnl: Dict[str, float] = {}
         self.trades: List[Trade] = []
         self.trade_counter = 0
         
@@ -2222,12 +2632,29 @@ class AgentC:
         # Profit protection
         self.last_win_pct = 0.0
         self.risk_reduction_active = False
+        
+        # Exchange mirror (user_stream.py) - set by AlphaBotV4 in live mode
+        self.account = None
+        self.position_lock = threading.RLock()  # Stream callbacks vs trading loop
+    
+    @property
+    def position(self) -> Optional[Position]:
+        """Position of config.SYMBOL (single-symbol API)"""
+        return self.positions.get(self.config.SYMBOL)
+    
+    @position.setter
+    def position(self, pos: Optional[Position]):
+        if pos is None:
+            self.positions.pop(self.config.SYMBOL, None)
+        else:
+            self.positions[self.config.SYMBOL] = pos
     
     def reset_daily_counters(self):
         """Reset daily PnL tracking"""
         today = datetime.now().date()
         if today > self.last_reset_date:
             self.daily_pnl = 0.0
+            self.symbol_daily_pnl = {}
             self.daily_start_balance = self.balance
             self.last_reset_date = today
             self.logger.info("[Agent-C] Daily counters reset")
@@ -2248,14 +2675,29 @@ class AgentC:
         
         return True, "OK"
     
+    def check_symbol_limits(self, symbol: str) -> Tuple[bool, str]:
+        """Per-symbol DSL/MDD + open-position cap (multi-position mode) - blocks entries, never halts"""
+        if len(self.positions) >= self.config.MAX_POSITIONS:
+            return False, f"Max positions ({self.config.MAX_POSITIONS}) open"
+        
+        daily_loss = -self.symbol_daily_pnl.get(symbol, 0.0)
+        if self.daily_start_balance > 0 and daily_loss / self.daily_start_balance >= self.config.SYMBOL_DAILY_STOP_LOSS_PCT:
+            return False, f"{symbol} DSL: -${daily_loss:.2f} today"
+        
+        drawdown = self.symbol_peak_pnl.get(symbol, 0.0) - self.symbol_pnl.get(symbol, 0.0)
+        if self.starting_balance > 0 and drawdown / self.starting_balance >= self.config.SYMBOL_MAX_DRAWDOWN_PCT:
+            return False, f"{symbol} MDD: -${drawdown:.2f} from peak"
+        
+        return True, "OK"
+    
     def activate_protection_mode(self, reason: str):
         """Activate risk protection mode"""
         self.protection_mode = True
         self.logger.warning(f"[Agent-C] 🛡️ PROTECTION MODE: {reason}")
         
         # Close any open positions
-        if self.position:
-            self.logger.warning("[Agent-C] Closing position due to protection mode")
+        if self.positions:
+            self.logger.warning(f"[Agent-C] Closing {len(self.positions)} position(s) due to protection mode")
     
     def halt_trading(self, reason: str):
         """Emergency halt all trading"""
@@ -2264,8 +2706,8 @@ class AgentC:
         self.logger.error(f"[Agent-C] 🚨 TRADING HALTED: {reason}")
         
         # Close any open positions
-        if self.position:
-            self.logger.error("[Agent-C] Emergency position closure")
+        if self.positions:
+            self.logger.error(f"[Agent-C] Emergency closure of {', '.join(self.positions)}")
     
     def determine_order_type(self, signal: Signal, current_price: float) -> str:
         """Smart Order Routing - decide Limit vs Market"""
@@ -2282,8 +2724,11 @@ class AgentC:
         # Otherwise, use limit for better fill
         return "LIMIT"
     
-    def execute_signal(self, signal: Signal, current_price: float) -> bool:
-        """Execute trading signal"""
+    @span('agent_c.execute')
+    def execute_signal(self, signal: Signal, current_price: float, symbol: str = None) -> bool:
+        """Execute trading signal (symbol defaults to config.SYMBOL)"""
+        symbol = symbol or self.config.SYMBOL
+        
         # Check if halted
         if self.is_halted:
             self.logger.warning(f"[Agent-C] Cannot execute - Trading halted: {self.halt_reason}")
@@ -2296,10 +2741,16 @@ class AgentC:
             return False
         
         # Check if already in position
-        if self.position is not None:
-            self.logger.info("[Agent-C] Already in position - skipping signal")
+        if symbol in self.positions:
+            self.logger.info(f"[Agent-C] Already in {symbol} position - skipping signal")
             return False
         
+        if self.config.MULTI_POSITION_MODE:
+            allowed, reason = self.check_symbol_limits(symbol)
+            if not allowed:
+                self.logger.info(f"[Agent-C] Skipping {symbol}: {reason}")
+                return False
+        
         # Cooldown check after consecutive losses
         if self.cooldown_candles > 0:
             self.cooldown_candles -= 1
@@ -2312,6 +2763,15 @@ class AgentC:
         # Calculate position size in USDT
         position_value = self.balance * signal.position_size
         
+        # Shared balance: at most 1/MAX_POSITIONS of equity each and never more than the
+        # uncommitted part (live: the exchange's free margin already nets margin in use)
+        if self.config.MULTI_POSITION_MODE:
+            if self.config.LIVE_MODE and self.executor:
+                available = self.executor.get_balance()
+            else:
+                available = max(self.balance - sum(p.size for p in self.positions.values()), 0.0)
+            position_value = min(position_value, self.balance / self.config.MAX_POSITIONS, available)
+        
         # PROFIT PROTECTION: Reduce position size after big win
         if self.risk_reduction_active:
             position_value *= 0.5  # Use only 50% of balance
@@ -2335,21 +2795,28 @@ class AgentC:
         # ===== LIVE TRADING: Send real order to exchange =====
         if self.config.LIVE_MODE and self.executor:
             # Set leverage
-            self.executor.set_leverage(self.config.SYMBOL, signal.leverage)
+            self.executor.set_leverage(symbol, signal.leverage)
             
-            # Calculate amount in BTC (contracts)
+            # Calculate amount in contracts (market precision / min size when cached)
             btc_amount = (position_value * signal.leverage) / current_price
-            # Round to 3 decimals for BTC
-            btc_amount = round(btc_amount, 3)
-            
-            # Minimum order size check (0.001 BTC)
-            if btc_amount < 0.001:
-                self.logger.warning(f"[Agent-C] Order size too small: {btc_amount} BTC (min: 0.001)")
+            min_amount = 0.001
+            exchange = self.executor.exchange
+            try:
+                market = exchange.market(symbol) if getattr(exchange, 'markets', None) else None
+                btc_amount = float(exchange.amount_to_precision(symbol, btc_amount)) if market else round(btc_amount, 3)
+                min_amount = ((market or {}).get('limits') or {}).get('amount', {}).get('min') or min_amount
+            except Exception:
+                # Round to 3 decimals for BTC
+                btc_amount = round(btc_amount, 3)
+            
+            # Minimum order size check
+            if btc_amount < min_amount:
+                self.logger.warning(f"[Agent-C] Order size too small: {btc_amount} {symbol} (min: {min_amount})")
                 return False
             
             # Send order
             order = self.executor.open_position(
-                symbol=self.config.SYMBOL,
+                symbol=symbol,
                 side=side,
                 amount=btc_amount,
                 stop_loss=signal.stop_loss,
@@ -2360,12 +2827,18 @@ class AgentC:
                 self.logger.error("[Agent-C] ❌ Failed to execute live order")
                 return False
             
-            # Update balance from exchange
-            self.balance = self.executor.get_balance()
+            # Update balance from exchange - equity, not free margin: DSL / MDD and sizing
+            # work on the wallet (user-stream mirror when synced), margin in use is not a loss
+            if self.account is not None and self.account.synced:
+                self.balance = self.account.balance('USDT')
+            else:
+                free_margin = self.executor.get_balance()
+                if free_margin > 0:
+                    self.balance = free_margin + sum(p.size for p in self.positions.values()) + position_value
             self.logger.info(f"[Agent-C] 💰 Updated balance: ${self.balance:.2f}")
         # ===== END LIVE TRADING =====
         
-        self.position = Position(
+        self.positions[symbol] = Position(
             side=side,
             entry_price=current_price,
             size=position_value,
@@ -2374,7 +2847,8 @@ class AgentC:
             take_profit=signal.take_profit,
             # Initialize trailing stop at entry price level (not stop loss)
             trailing_stop=current_price * (1 - self.config.TRAILING_STOP_PCT) if side == 'long' else current_price * (1 + self.config.TRAILING_STOP_PCT),
-            entry_time=datetime.now()
+            entry_time=datetime.now(),
+            symbol=symbol
         )
         
         # Calculate fees
@@ -2383,6 +2857,7 @@ class AgentC:
             self.balance -= fees
         
         self.logger.log_decision('Agent-C', 'EXECUTE', {
+            'symbol': symbol,
             'side': side,
             'order_type': order_type,
             'entry': current_price,
@@ -2396,7 +2871,7 @@ class AgentC:
         })
         
         self.logger.info(
-            f"[Agent-C] ✅ {side.upper()} @ {current_price:.2f} | "
+            f"[Agent-C] ✅ {side.upper()} {symbol} @ {current_price:.2f} | "
             f"Size: ${position_value:.2f} | Lev: {signal.leverage}x | "
             f"SL: {signal.stop_loss:.2f} | TP: {signal.take_profit:.2f} | "
             f"Mode: {'🔴 LIVE' if self.config.LIVE_MODE else '⚪ SIM'}"
@@ -2413,8 +2888,8 @@ class AgentC:
                 tp=signal.take_profit,
                 balance=self.balance
             )
-            # Send chart with entry point
-            if self.agent_a and self.agent_a.df is not None:
+            # Send chart with entry point (AgentA holds config.SYMBOL candles)
+            if self.agent_a and self.agent_a.df is not None and symbol == self.config.SYMBOL:
                 self.telegram.send_trade_chart(
                     df=self.agent_a.df,
                     entry_price=current_price,
@@ -2425,13 +2900,97 @@ class AgentC:
         
         return True
     
-    def update_position(self, current_price: float) -> Optional[Trade]:
+    def update_position(self, current_price: float, symbol: str = None) -> Optional[Trade]:
         """Update position with current price, check SL/TP/Trailing/Breakeven"""
-        if self.position is None:
+        with self.position_lock:
+            return self._update_position(current_price, symbol or self.config.SYMBOL)
+    
+    def update_positions(self, prices: Dict[str, float]) -> List[Trade]:
+        """
+        Vectorized update_position() for the whole book: one numpy pass evaluates
+        break-even / trailing / SL / TP for every symbol that has a price
+        Same rules and exit priority as update_position() → returns the closed trades
+        """
+        with self.position_lock:
+            symbols = [sym for sym in self.positions if prices.get(sym)]
+            if not symbols:
+                return []
+            cfg = self.config
+            book = [self.positions[sym] for sym in symbols]
+            
+            price = np.array([prices[sym] for sym in symbols], dtype=float)
+            entry = np.array([pos.entry_price for pos in book], dtype=float)
+            size = np.array([pos.size for pos in book], dtype=float)
+            lev = np.array([pos.leverage for pos in book], dtype=float)
+            sl = np.array([pos.stop_loss for pos in book], dtype=float)
+            tp = np.array([pos.take_profit for pos in book], dtype=float)
+            trail = np.array([pos.trailing_stop for pos in book], dtype=float)
+            highest = np.array([pos.highest_pnl for pos in book], dtype=float)
+            breakeven = np.array([pos.breakeven_activated for pos in book], dtype=bool)
+            is_long = np.array([pos.side == 'long' for pos in book], dtype=bool)
+            sign = np.where(is_long, 1.0, -1.0)
+            
+            # sign * (a - b) turns every short comparison into the long one
+            pnl_pct = sign * (price - entry) / entry
+            pnl = pnl_pct * size * lev
+            
+            # ===== BREAK-EVEN STOP =====
+            be_sl = np.where(is_long, entry * 1.001, entry * 0.999)
+            be_hit = ~breakeven & (pnl_pct >= cfg.BREAKEVEN_TRIGGER_PCT) & (sign * (be_sl - sl) > 0)
+            sl = np.where(be_hit, be_sl, sl)
+            breakeven |= be_hit
+            
+            # ===== PARTIAL TAKE PROFIT ===== (rare → per position)
+            if cfg.PARTIAL_TP_ENABLED:
+                partial_idx = np.flatnonzero(pnl_pct >= cfg.PARTIAL_TP_PCT)
+                for i in partial_idx:
+                    if not book[i].partial_tp_taken:
+                        self._take_partial_profit(book[i], float(pnl_pct[i]))
+            
+            # ===== TRAILING STOP UPDATE =====
+            new_high = pnl > highest
+            highest = np.where(new_high, pnl, highest)
+            new_trail = np.where(is_long, price * (1 - cfg.TRAILING_STOP_PCT), price * (1 + cfg.TRAILING_STOP_PCT))
+            trail = np.where(new_high & (sign * (new_trail - trail) > 0), new_trail, trail)
+            
+            # ===== EXITS ===== (SL → trailing → TP, like update_position)
+            hit_sl = sign * (price - sl) <= 0
+            hit_trail = ~hit_sl & (sign * (price - trail) <= 0) & (sign * (trail - sl) > 0)
+            hit_tp = ~hit_sl & ~hit_trail & (sign * (price - tp) >= 0)
+            
+            for i, pos in enumerate(book):
+                if be_hit[i]:
+                    self.logger.info(f"[Agent-C] 🔒 BREAK-EVEN {symbols[i]} activated @ ${sl[i]:.2f}")
+                pos.stop_loss = float(sl[i])
+                pos.breakeven_activated = bool(breakeven[i])
+                pos.highest_pnl = float(highest[i])
+                pos.trailing_stop = float(trail[i])
+            
+            closed = []
+            for i in np.flatnonzero(hit_sl | hit_trail | hit_tp):
+                if hit_sl[i]:
+                    reason = "BREAKEVEN_STOP" if breakeven[i] else "STOP_LOSS"
+                else:
+                    reason = "TRAILING_STOP" if hit_trail[i] else "TAKE_PROFIT"
+                closed.append(self._close_position(float(price[i]), reason, symbols[i]))
+            
+            # ===== AGGREGATE DSL ===== realized today + open PnL of the whole book
+            if cfg.MULTI_POSITION_MODE and self.positions and self.daily_start_balance > 0:
+                open_pnl = sum(pos.unrealized_pnl(prices[sym]) for sym, pos in self.positions.items() if prices.get(sym))
+                equity_loss = -(self.daily_pnl + open_pnl) / self.daily_start_balance
+                if equity_loss >= cfg.DAILY_STOP_LOSS_PCT:
+                    self.logger.warning(f"[Agent-C] Book DSL hit (-{equity_loss*100:.2f}% incl. open PnL) - closing all")
+                    for sym in [sym for sym in self.positions if prices.get(sym)]:
+                        closed.append(self._close_position(prices[sym], "DAILY_STOP_LOSS", sym))
+                    self.halt_trading(f"Book DSL: -{equity_loss*100:.2f}% incl. open positions")
+            
+            return closed
+    
+    def _update_position(self, current_price: float, symbol: str) -> Optional[Trade]:
+        pos = self.positions.get(symbol)
+        if pos is None:
             return None
         
-        pos = self.position
-        
         # Calculate current PnL
         pnl = pos.unrealized_pnl(current_price)
         pnl_pct = pos.unrealized_pnl_pct(current_price)
@@ -2457,29 +3016,7 @@ class AgentC:
         # Take partial profit at first target
         if self.config.PARTIAL_TP_ENABLED and not pos.partial_tp_taken:
             if pnl_pct >= self.config.PARTIAL_TP_PCT:
-                # Close partial position
-                partial_size = pos.original_size * self.config.PARTIAL_TP_CLOSE_PCT
-                partial_pnl = pnl_pct * partial_size * pos.leverage
-                
-                # Update balance with partial profit
-                fees = partial_size * pos.leverage * self.config.TAKER_FEE
-                partial_pnl -= fees
-                self.balance += partial_pnl
-                self.daily_pnl += partial_pnl
-                
-                # Reduce position size
-                pos.size -= partial_size
-                pos.partial_tp_taken = True
-                
-                self.logger.info(f"[Agent-C] 💰 PARTIAL TP: Closed {self.config.PARTIAL_TP_CLOSE_PCT*100:.0f}% @ +{pnl_pct*100:.2f}% | +${partial_pnl:.3f}")
-                
-                # Notify Telegram
-                self.telegram.send_message(
-                    f"💰 <b>Partial TP!</b>\n\n"
-                    f"ปิด {self.config.PARTIAL_TP_CLOSE_PCT*100:.0f}% @ +{pnl_pct*100:.2f}%\n"
-                    f"กำไร: +${partial_pnl:.3f}\n"
-                    f"เหลือ: {pos.size/pos.original_size*100:.0f}% running"
-                )
+                self._take_partial_profit(pos, pnl_pct)
         
         # ===== TRAILING STOP UPDATE =====
         if pos.side == 'long':
@@ -2524,13 +3061,49 @@ class AgentC:
         
         # Execute exit if triggered
         if exit_reason:
-            return self._close_position(exit_price, exit_reason)
+            return self._close_position(exit_price, exit_reason, symbol)
         
         return None
     
-    def _close_position(self, exit_price: float, reason: str) -> Trade:
+    def _take_partial_profit(self, pos: Position, pnl_pct: float):
+        """Close PARTIAL_TP_CLOSE_PCT of the position at the first target"""
+        # Close partial position
+        partial_size = pos.original_size * self.config.PARTIAL_TP_CLOSE_PCT
+        partial_pnl = pnl_pct * partial_size * pos.leverage
+        
+        # Update balance with partial profit
+        fees = partial_size * pos.leverage * self.config.TAKER_FEE
+        partial_pnl -= fees
+        self.balance += partial_pnl
+        self.daily_pnl += partial_pnl
+        self._book_symbol_pnl(pos.symbol or self.config.SYMBOL, partial_pnl)
+        
+        # Reduce position size
+        pos.size -= partial_size
+        pos.partial_tp_taken = True
+        
+        self.logger.info(f"[Agent-C] 💰 PARTIAL TP: Closed {self.config.PARTIAL_TP_CLOSE_PCT*100:.0f}% @ +{pnl_pct*100:.2f}% | +${partial_pnl:.3f}")
+        
+        # Notify Telegram
+        if self.telegram:
+            self.telegram.send_message(
+                f"💰 <b>Partial TP!</b>\n\n"
+                f"ปิด {self.config.PARTIAL_TP_CLOSE_PCT*100:.0f}% @ +{pnl_pct*100:.2f}%\n"
+                f"กำไร: +${partial_pnl:.3f}\n"
+                f"เหลือ: {pos.size/pos.original_size*100:.0f}% running"
+            )
+    
+    def _book_symbol_pnl(self, symbol: str, pnl: float):
+        """Realized PnL per symbol (per-symbol DSL/MDD)"""
+        pnl = float(pnl)
+        self.symbol_daily_pnl[symbol] = self.symbol_daily_pnl.get(symbol, 0.0) + pnl
+        self.symbol_pnl[symbol] = self.symbol_pnl.get(symbol, 0.0) + pnl
+        self.symbol_peak_pnl[symbol] = max(self.symbol_peak_pnl.get(symbol, 0.0), self.symbol_pnl[symbol])
+    
+    def _close_position(self, exit_price: float, reason: str, symbol: str = None) -> Trade:
         """Close position and record trade"""
-        pos = self.position
+        symbol = symbol or self.config.SYMBOL
+        pos = self.positions[symbol]
         
         # Calculate final PnL
         if pos.side == 'long':
@@ -2547,6 +3120,7 @@ class AgentC:
         # Update balance
         self.balance += pnl
         self.daily_pnl += pnl
+        self._book_symbol_pnl(symbol, pnl)
         
         # Update peak balance
         if self.balance > self.peak_balance:
@@ -2566,12 +3140,13 @@ class AgentC:
             entry_time=pos.entry_time,
             exit_time=datetime.now(),
             exit_reason=reason,
-            fees=fees
+            fees=fees,
+            symbol=symbol
         )
         self.trades.append(trade)
         
         # Clear position
-        self.position = None
+        del self.positions[symbol]
         
         # Track consecutive losses for cooldown
         if pnl < 0:
@@ -2590,6 +3165,7 @@ class AgentC:
         # Log
         emoji = "🟢" if pnl > 0 else "🔴"
         self.logger.log_decision('Agent-C', 'CLOSE', {
+            'symbol': symbol,
             'side': trade.side,
             'entry': trade.entry_price,
             'exit': trade.exit_price,
@@ -2600,7 +3176,7 @@ class AgentC:
         })
         
         self.logger.info(
-            f"[Agent-C] {emoji} CLOSED {trade.side.upper()} @ {exit_price:.2f} | "
+            f"[Agent-C] {emoji} CLOSED {trade.side.upper()} {symbol} @ {exit_price:.2f} | "
             f"PnL: ${pnl:.2f} ({pnl_pct*100:.2f}%) | {reason} | "
             f"Balance: ${self.balance:.2f}"
         )
@@ -2623,7 +3199,7 @@ class AgentC:
                 balance=self.balance
             )
             # Send chart with exit point
-            if self.agent_a and self.agent_a.df is not None:
+            if self.agent_a and self.agent_a.df is not None and symbol == self.config.SYMBOL:
                 self.telegram.send_trade_chart(
                     df=self.agent_a.df,
                     entry_price=trade.entry_price,
@@ -2636,6 +3212,27 @@ class AgentC:
         
         return trade
     
+    def reconcile_exchange_close(self, fill=None, fallback_price: float = 0.0,
+                                 symbol: str = None) -> Optional[Trade]:
+        """
+        Exchange position went flat (SL/TP/liquidation filled on Binance) → close the local one
+        at the fill price so AgentC.positions do not drift from the exchange
+        """
+        symbol = symbol or self.config.SYMBOL
+        with self.position_lock:
+            pos = self.positions.get(symbol)
+            if pos is None:
+                return None
+            reasons = {'STOP_MARKET': 'STOP_LOSS', 'TAKE_PROFIT_MARKET': 'TAKE_PROFIT',
+                       'TRAILING_STOP_MARKET': 'TRAILING_STOP', 'LIQUIDATION': 'LIQUIDATION'}
+            if fill is not None and fill.time_ms >= pos.entry_time.timestamp() * 1000:
+                price = fill.avg_price or fill.price
+                reason = reasons.get(fill.order_type, 'EXCHANGE_CLOSE')
+            else:
+                price, reason = fallback_price or pos.entry_price, 'EXCHANGE_CLOSE'
+            self.logger.warning(f"[Agent-C] {symbol} closed on exchange ({reason}) @ {price:.2f} - syncing")
+            return self._close_position(price, reason, symbol)
+    
     def get_stats(self) -> Dict:
         """Get current trading statistics"""
         if not self.trades:
@@ -2701,7 +3298,10 @@ class AlphaBotV4:
         # Initialize exchange executor for live trading
         self.executor = None
         if self.config.LIVE_MODE:
-            self.executor = ExchangeExecutor(self.config, self.logger)
+            if self.config.ASYNC_EXECUTOR and ASYNC_EXECUTOR_AVAILABLE:
+                self.executor = AsyncExchangeExecutor(self.config, self.logger)
+            else:
+                self.executor = ExchangeExecutor(self.config, self.logger)
             # Get real balance
             real_balance = self.executor.get_balance()
             self.config.INITIAL_CAPITAL = real_balance
@@ -2721,6 +3321,18 @@ class AlphaBotV4:
         self.agent_c.telegram = self.telegram
         self.agent_c.agent_a = self.agent_a  # For chart data
         
+        # Multi-position: one AgentA per symbol (config.SYMBOL keeps self.agent_a)
+        self.symbol_agents: Dict[str, AgentA] = {self.config.SYMBOL: self.agent_a}
+        if self.config.MULTI_POSITION_MODE:
+            import dataclasses
+            for symbol in self.config.SYMBOLS:
+                if symbol not in self.symbol_agents:
+                    # Own ccxt client: run_multi_cycle fetches from worker threads and a
+                    # sync ccxt instance is not thread-safe
+                    agent = AgentA(dataclasses.replace(self.config, SYMBOL=symbol), self.logger)
+                    self.symbol_agents[symbol] = agent
+        self.markets_shared = len(self.symbol_agents) == 1  # Seeded on the first multi cycle
+        
         # Update agent_c balance for live mode
         if self.config.LIVE_MODE and self.executor:
             self.agent_c.balance = self.config.INITIAL_CAPITAL
@@ -2732,6 +3344,8 @@ class AlphaBotV4:
         self.cycle_count = 0
         self.last_daily_report = datetime.now().date()
         self.last_hourly_report = datetime.now().hour
+        self.market_stream = None
+        self.user_stream = None
         
         # 🔔 Live Updates Tracking (เหมือน Paper Bot)
         self.last_live_status = 0  # ส่งทันทีตอนเริ่ม
@@ -2749,7 +3363,14 @@ class AlphaBotV4:
         self.logger.info(f"   MDD: {self.config.MAX_DRAWDOWN_PCT*100}%")
         self.logger.info(f"   Telegram: {'✅ Enabled' if self.telegram.enabled else '❌ Disabled'}")
         self.logger.info("=" * 60)
+        
+        # Session recording for offline replay (session_replay.py)
+        self.recorder = None
+        if self.config.SESSION_RECORD_PATH and SESSION_REPLAY_AVAILABLE:
+            SessionRecorder(self.config.SESSION_RECORD_PATH).attach(self)
+            self.logger.info(f"🎬 Recording session → {self.config.SESSION_RECORD_PATH}")
     
+    @span('cycle.total')
     def run_cycle(self) -> Dict:
         """Run one trading cycle"""
         start_time = time.time()
@@ -2821,6 +3442,106 @@ class AlphaBotV4:
         
         return result
     
+    def share_markets(self):
+        """
+        Load markets once on agent_a's client and seed every per-symbol client with them
+        (otherwise each worker's first fetch runs its own full load_markets())
+        """
+        if self.markets_shared:
+            return
+        self.markets_shared = True
+        source = self.agent_a.exchange
+        try:
+            if MARKET_META_AVAILABLE:
+                MarketMetaCache(source.id, markets_ttl=self.config.MARKETS_CACHE_TTL).load(source)
+            else:
+                source.load_markets()
+            for agent in self.symbol_agents.values():
+                if agent is not self.agent_a:
+                    agent.exchange.set_markets(source.markets, source.currencies)
+        except Exception as e:
+            self.logger.warning(f"[Agent-A] Shared markets unavailable, each client loads its own: {e}")
+    
+    @span('cycle.multi')
+    def run_multi_cycle(self) -> Dict:
+        """
+        One trading cycle over every symbol (MULTI_POSITION_MODE)
+        Fetch/analyze in parallel → update_positions() in one pass → rank new signals by confidence
+        """
+        start_time = time.time()
+        self.cycle_count += 1
+        result = {
+            'cycle': self.cycle_count,
+            'timestamp': datetime.now(),
+            'action': 'HOLD',
+            'trade': None,
+            'trades': [],
+            'opened': []
+        }
+        
+        # Agent-A: all symbols at once (I/O bound - each agent has its own ccxt client)
+        self.share_markets()
+        symbols = list(self.symbol_agents)
+        workers = max(1, min(self.config.MULTI_FETCH_WORKERS, len(symbols)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            analyses = dict(zip(symbols, pool.map(lambda sym: self.symbol_agents[sym].analyze(), symbols)))
+        analyses = {sym: a for sym, a in analyses.items() if a.get('valid', False)}
+        if not analyses:
+            result['action'] = 'DATA_ERROR'
+            return result
+        prices = {sym: a['price'] for sym, a in analyses.items()}
+        
+        # Agent-C: SL/TP/trailing of the whole book
+        for trade in self.agent_c.update_positions(prices):
+            self.agent_b.update_from_trade(trade)
+            result['trades'].append(trade)
+        if result['trades']:
+            result['action'] = 'CLOSED'
+            result['trade'] = result['trades'][-1]
+            if self.agent_b.should_upgrade_model():
+                result['model_upgraded'] = True
+        
+        # Emergency conditions of the primary symbol protect the whole book
+        primary = analyses.get(self.config.SYMBOL)
+        if primary and primary['volume_spike'] and primary['risk_level'] > 0.5:
+            self.agent_c.activate_protection_mode("Volume spike + High risk")
+            result['action'] = 'PROTECTION_MODE'
+            return result
+        
+        # Agent-B: signals for flat symbols, best confidence first
+        if not self.agent_c.protection_mode and not self.agent_c.is_halted:
+            candidates = []
+            for sym, analysis in analyses.items():
+                if sym in self.agent_c.positions or analysis['volume_spike'] and analysis['risk_level'] > 0.5:
+                    continue
+                signal = self.agent_b.generate_signal(analysis)
+                if signal:
+                    candidates.append((signal.confidence, sym, signal))
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            
+            if candidates and self.ai_filter and self.ai_filter.enabled:
+                safe_to_trade, ai_reason = self.ai_filter.should_trade()
+                if not safe_to_trade:
+                    self.logger.info(f"[AI Filter] ⚠️ Trade blocked: {ai_reason}")
+                    result['action'] = 'AI_BLOCKED'
+                    result['ai_reason'] = ai_reason
+                    candidates = []
+            
+            for _, sym, signal in candidates:
+                if len(self.agent_c.positions) >= self.config.MAX_POSITIONS:
+                    break
+                if self.agent_c.execute_signal(signal, prices[sym], sym):
+                    result['opened'].append(sym)
+                    result['action'] = signal.type.value
+        
+        # Reset protection mode if conditions improve
+        if self.agent_c.protection_mode and primary and primary['risk_level'] < 0.3:
+            self.agent_c.protection_mode = False
+            self.logger.info("[Agent-C] Protection mode deactivated")
+        
+        result['cycle_time_ms'] = (time.time() - start_time) * 1000
+        return result
+    
     # ═══════════════════════════════════════════════════════════════════════════════
     # 🔔 LIVE UPDATES FUNCTIONS (เหมือน Paper Bot)
     # ═══════════════════════════════════════════════════════════════════════════════
@@ -3235,71 +3956,39 @@ class AlphaBotV4:
 พิมพ์ /help เพื่อดู commands
 หรือถามอะไรก็ได้!""")
         
+        # Latency exporter (/metrics + JSON snapshot)
+        perf_exporter = None
+        if PERF_METRICS_AVAILABLE:
+            try:
+                perf_exporter = PerfExporter(get_registry(), port=self.config.PERF_METRICS_PORT,
+                                             json_path=self.config.PERF_METRICS_FILE,
+                                             interval=self.config.PERF_EXPORT_INTERVAL).start()
+                self.logger.info(f"⏱️ Perf metrics on http://127.0.0.1:{self.config.PERF_METRICS_PORT}/metrics")
+            except OSError as e:
+                self.logger.warning(f"Perf metrics exporter disabled: {e}")
+        
+        # Fills / positions / balances pushed by the exchange
+        self.start_user_stream()
+        
         try:
-            while self.is_running:
-                if self.agent_c.is_halted:
-                    self.logger.error(f"Trading halted: {self.agent_c.halt_reason}")
-                    self.telegram.notify_bot_stopped(self.agent_c.halt_reason)
-                    break
-                
-                result = self.run_cycle()
-                
-                # Get current price for alerts and PnL
-                current_price = self.agent_a.df['close'].iloc[-1] if self.agent_a.df is not None else 0
-                
-                # ===== CHECK PRICE ALERTS =====
-                if current_price > 0:
-                    self.telegram.check_price_alerts(current_price)
-                
-                # ===== 🔔 LIVE UPDATES (Status 15m, PnL ±10%, Chart 1hr) =====
-                self.check_live_updates()
-                
-                # ===== LIVE PNL UPDATE (every 5 min) =====
-                if self.agent_c.position and time.time() - self.last_pnl_update >= self.config.LIVE_PNL_INTERVAL:
-                    self.telegram.send_live_pnl(current_price)
-                    self.last_pnl_update = time.time()
-                
-                if result['action'] not in ['HOLD', 'DATA_ERROR']:
-                    stats = self.agent_c.get_stats()
-                    self.logger.info(
-                        f"[Cycle {result['cycle']}] Action: {result['action']} | "
-                        f"Balance: ${stats['balance']:.2f} | "
-                        f"ROI: {stats['roi']*100:.2f}%"
-                    )
-                
-                # ===== HOURLY STATUS UPDATE =====
-                current_hour = datetime.now().hour
-                if current_hour != self.last_hourly_report:
-                    stats = self.agent_c.get_stats()
-                    # Get current price
-                    current_price = self.agent_a.df['close'].iloc[-1] if self.agent_a.df is not None else 0
+            # The WebSocket loop follows config.SYMBOL only → multi-position mode polls
+            if (self.config.USE_WEBSOCKET and MARKET_STREAM_AVAILABLE and WEBSOCKETS_AVAILABLE
+                    and not self.config.MULTI_POSITION_MODE):
+                self.run_stream_loop()
+            else:
+                while self.is_running:
+                    if self.agent_c.is_halted:
+                        self.logger.error(f"Trading halted: {self.agent_c.halt_reason}")
+                        self.telegram.notify_bot_stopped(self.agent_c.halt_reason)
+                        break
                     
-                    # Position info
-                    if self.agent_c.position:
-                        pos = self.agent_c.position
-                        unrealized = pos.unrealized_pnl(current_price)
-                        position_info = f"{pos.side.upper()} | Entry: ${pos.entry_price:,.2f} | PnL: {'+' if unrealized >= 0 else ''}{unrealized:.2f}$"
+                    if self.config.MULTI_POSITION_MODE:
+                        result = self.run_multi_cycle()
                     else:
-                        position_info = "ไม่มี Position"
+                        result = self.run_cycle()
+                    self.after_cycle(result)
                     
-                    # Send hourly update with chart
-                    self.telegram.send_hourly_chart(
-                        df=self.agent_a.df,
-                        stats=stats,
-                        current_price=current_price,
-                        position_info=position_info
-                    )
-                    self.last_hourly_report = current_hour
-                    self.logger.info(f"[Telegram] Sent hourly status update")
-                
-                # Daily summary check (send at 00:00)
-                today = datetime.now().date()
-                if today > self.last_daily_report:
-                    stats = self.agent_c.get_stats()
-                    self.telegram.notify_daily_summary(stats)
-                    self.last_daily_report = today
-                
-                time.sleep(interval_seconds)
+                    time.sleep(interval_seconds)
         
         except KeyboardInterrupt:
             self.logger.info("Received shutdown signal...")
@@ -3308,14 +3997,179 @@ class AlphaBotV4:
         finally:
             self.is_running = False
             self.logger.info("Trading stopped")
+            if perf_exporter is not None:
+                perf_exporter.stop()
+            if self.user_stream is not None:
+                self.user_stream.stop()
+            if hasattr(self.executor, 'close'):
+                self.executor.close()  # AsyncExchangeExecutor: HTTP session + loop thread
             self.print_summary()
             
             # Send final summary
             stats = self.agent_c.get_stats()
             self.telegram.notify_daily_summary(stats)
     
-    def backtest(self, days: int = 30):
-        """Run backtest simulation"""
+    def after_cycle(self, result: Dict):
+        """Alerts, live updates, hourly/daily reports after each trading cycle"""
+        # Get current price for alerts and PnL
+        current_price = self.agent_a.df['close'].iloc[-1] if self.agent_a.df is not None else 0
+        
+        # ===== CHECK PRICE ALERTS =====
+        if current_price > 0:
+            self.telegram.check_price_alerts(current_price)
+        
+        # ===== 🔔 LIVE UPDATES (Status 15m, PnL ±10%, Chart 1hr) =====
+        self.check_live_updates()
+        
+        # ===== LIVE PNL UPDATE (every 5 min) =====
+        if self.agent_c.position and time.time() - self.last_pnl_update >= self.config.LIVE_PNL_INTERVAL:
+            self.telegram.send_live_pnl(current_price)
+            self.last_pnl_update = time.time()
+        
+        if result['action'] not in ['HOLD', 'DATA_ERROR']:
+            stats = self.agent_c.get_stats()
+            self.logger.info(
+                f"[Cycle {result['cycle']}] Action: {result['action']} | "
+                f"Balance: ${stats['balance']:.2f} | "
+                f"ROI: {stats['roi']*100:.2f}%"
+            )
+        
+        # ===== HOURLY STATUS UPDATE =====
+        current_hour = datetime.now().hour
+        if current_hour != self.last_hourly_report:
+            stats = self.agent_c.get_stats()
+            # Get current price
+            current_price = self.agent_a.df['close'].iloc[-1] if self.agent_a.df is not None else 0
+            
+            # Position info
+            if self.agent_c.position:
+                pos = self.agent_c.position
+                unrealized = pos.unrealized_pnl(current_price)
+                position_info = f"{pos.side.upper()} | Entry: ${pos.entry_price:,.2f} | PnL: {'+' if unrealized >= 0 else ''}{unrealized:.2f}$"
+            else:
+                position_info = "ไม่มี Position"
+            
+            # Send hourly update with chart
+            self.telegram.send_hourly_chart(
+                df=self.agent_a.df,
+                stats=stats,
+                current_price=current_price,
+                position_info=position_info
+            )
+            self.last_hourly_report = current_hour
+            self.logger.info(f"[Telegram] Sent hourly status update")
+        
+        # Daily summary check (send at 00:00)
+        today = datetime.now().date()
+        if today > self.last_daily_report:
+            stats = self.agent_c.get_stats()
+            self.telegram.notify_daily_summary(stats)
+            self.last_daily_report = today
+    
+    def run_stream_loop(self):
+        """
+        Live loop driven by the WebSocket feed (market_stream.py) instead of sleep(60)
+        - every tick (markPrice / kline update) → AgentC.update_position
+        - every candle close → run_cycle
+        """
+        url = self.config.MARKET_WS_URL or None
+        self.market_stream = MarketStream(
+            self.config.SYMBOL, self.config.TIMEFRAME, url=url,
+            rest_exchange=self.agent_a.exchange,
+            on_tick=self.on_stream_tick,
+            on_candle=self.on_stream_candle
+        )
+        self.logger.info(f"📡 WebSocket feed: {self.market_stream.url}")
+        asyncio.run(self.market_stream.run())
+    
+    def start_user_stream(self):
+        """LIVE only: user-data WebSocket → AccountMirror shared by AgentC, executor and Telegram"""
+        if not (self.config.LIVE_MODE and self.executor and self.config.USER_STREAM
+                and USER_STREAM_AVAILABLE and WEBSOCKETS_AVAILABLE):
+            return
+        # Listen key / resync use raw signed endpoints on a sync client
+        rest = self.executor.exchange
+        if not isinstance(self.executor, ExchangeExecutor):
+            rest = ccxt.binanceusdm({
+                'apiKey': self.config.API_KEY,
+                'secret': self.config.SECRET_KEY,
+                'options': {'defaultType': 'future'}
+            })
+        self.user_stream = UserDataStream(
+            rest, url=self.config.USER_STREAM_WS_URL or None,
+            on_fill=self.on_user_fill,
+            on_position=self.on_user_position,
+            tap=self.recorder.tap_stream if self.recorder is not None else None
+        )
+        self.agent_c.account = self.executor.account = self.user_stream.mirror
+        self.user_stream.start()
+        self.logger.info("📡 User-data stream started (positions / fills from WebSocket)")
+    
+    def on_user_fill(self, fill):
+        """Every execution on the account (entry, SL/TP, manual)"""
+        self.logger.info(
+            f"[UserStream] Fill {fill.order_type} {fill.side} {fill.qty} {fill.symbol} @ {fill.price:,.2f}"
+            + (f" | realized ${fill.realized_pnl:+.2f}" if fill.realized_pnl else "")
+        )
+    
+    def on_user_position(self, symbol: str, before: float, pos):
+        """Exchange position of a book symbol went flat → close it in AgentC at the fill price"""
+        if pos.amount != 0 or before == 0:
+            return
+        book_symbol = next((sym for sym in self.agent_c.positions if market_id(sym) == symbol), None)
+        if book_symbol is None:
+            return
+        fill = self.user_stream.mirror.last_fill.get(symbol)
+        fallback = 0.0
+        if self.market_stream is not None and book_symbol == self.config.SYMBOL:
+            fallback = self.market_stream.last_price
+        agent = self.symbol_agents.get(book_symbol)
+        if not fallback and agent is not None and agent.df is not None:
+            fallback = float(agent.df['close'].iloc[-1])
+        trade = self.agent_c.reconcile_exchange_close(fill, fallback, book_symbol)
+        if trade:
+            self.agent_b.update_from_trade(trade)
+    
+    def on_stream_tick(self, price: float, source: str):
+        """Tick → SL/TP/Trailing check without waiting for the next cycle"""
+        if self.agent_c.position is None:
+            return
+        trade = self.agent_c.update_position(price)
+        if trade:
+            self.agent_b.update_from_trade(trade)
+            self.logger.info(f"[Stream] Position closed on {source} tick @ ${price:,.2f}")
+    
+    def on_stream_candle(self, candle):
+        """Closed candle → full trading cycle (backfilled candles only replay stops)"""
+        if self.agent_c.is_halted:
+            self.logger.error(f"Trading halted: {self.agent_c.halt_reason}")
+            self.telegram.notify_bot_stopped(self.agent_c.halt_reason)
+            self.market_stream.stop()
+            return
+        
+        if candle.backfilled:
+            # Missed candle: check the adverse extreme first, then the close
+            pos = self.agent_c.position
+            if pos:
+                self.on_stream_tick(candle.low if pos.side == 'long' else candle.high, 'backfill')
+                self.on_stream_tick(candle.close, 'backfill')
+            return
+        
+        result = self.run_cycle()
+        self.after_cycle(result)
+    
+    def load_backtest_data(self, days: int) -> pd.DataFrame:
+        """Fetch historical candles (paginated + cached) and calculate indicators once"""
+        df = self.agent_a.fetch_history(days, offline=self.config.HISTORY_OFFLINE)
+        if df.empty:
+            return df
+        
+        df = self.agent_a.calculate_indicators(df)
+        self.logger.info(f"✅ Loaded {len(df)} candles")
+        return df
+    
+    def backtest(self, days: int = 30, engine: str = "incremental"):
+        """Run backtest simulation (engine: 'incremental' or 'legacy')"""
         self.logger.info(f"📊 Starting BACKTEST: {self.config.SYMBOL} {self.config.TIMEFRAME} {days}d")
         
         # Send Telegram notification
@@ -3330,14 +4184,65 @@ class AlphaBotV4:
 ⏳ กำลังประมวลผล...""")
         
         # Fetch historical data
-        df = self.agent_a.fetch_ohlcv(limit=days * 24 * 60)  # 1-min candles
+        df = self.load_backtest_data(days)
         if df.empty:
             self.logger.error("Failed to fetch data for backtest")
             return
         
-        df = self.agent_a.calculate_indicators(df)
-        self.logger.info(f"✅ Loaded {len(df)} candles")
+        if engine == "incremental" and BACKTEST_ENGINE_AVAILABLE:
+            cursor = None
+            if self.config.INTRABAR_TIMEFRAME:
+                cursor = self.agent_a.subbar_cursor(
+                    days, self.config.INTRABAR_TIMEFRAME, offline=self.config.HISTORY_OFFLINE
+                )
+            result = IncrementalBacktestEngine(self, intrabar=cursor).run(df)
+            self.logger.info(
+                f"⚡ Incremental engine: {result['bars']} bars in {result['elapsed_sec']:.2f}s "
+                f"({result['bars_per_sec']:,.0f} bars/s)"
+            )
+            if cursor is not None:
+                self.compare_close_only(df, result)
+        else:
+            self._backtest_legacy(df)
         
+        self.print_summary()
+    
+    def compare_close_only(self, df: pd.DataFrame, result: Dict):
+        """Replay the same frame close-only on a fresh bot and log how many trades changed"""
+        import dataclasses
+        shadow = AlphaBotV4(dataclasses.replace(self.config, INTRABAR_TIMEFRAME="", SIGNAL_PREVIEW=False))
+        shadow.telegram.enabled = False
+        IncrementalBacktestEngine(shadow).run(df)
+        
+        report = diff_trades(shadow.agent_c.trades, self.agent_c.trades)
+        report['intrabar_bars'] = result['intrabar_bars']
+        report['intrabar_missing'] = result['intrabar_missing']
+        print_intrabar_report(report, log=self.logger.info)
+        for entry_time, side, before, after, pnl_before, pnl_after in report['changes'][:5]:
+            self.logger.info(f"   {entry_time} {side}: {before} ${pnl_before:+.3f} → {after} ${pnl_after:+.3f}")
+        return report
+
+    def backtest_portfolio(self, days: int = 30, symbols: List[str] = None) -> Optional[Dict]:
+        """
+        All symbols on one shared balance, time-synchronized (max MAX_POSITIONS open at once)
+        Candles are streamed month by month from the history store
+        """
+        if not (PORTFOLIO_BACKTEST_AVAILABLE and HISTORY_STORE_AVAILABLE):
+            self.logger.error("Portfolio backtest needs portfolio_backtest.py and history_store.py")
+            return None
+
+        symbols = symbols or self.config.SYMBOLS
+        self.logger.info(
+            f"📊 Starting PORTFOLIO BACKTEST: {len(symbols)} symbols {self.config.TIMEFRAME} {days}d "
+            f"| max {self.config.MAX_POSITIONS} positions"
+        )
+        feeds = history_feeds(self, symbols, days, offline=self.config.HISTORY_OFFLINE)
+        result = PortfolioBacktestEngine(self, max_positions=self.config.MAX_POSITIONS).run(feeds)
+        print_portfolio_report(result, self.config.INITIAL_CAPITAL, log=self.logger.info)
+        return result
+
+    def _backtest_legacy(self, df: pd.DataFrame):
+        """Original bar loop (re-slices the frame every bar) - kept for verification"""
         # Run simulation
         for i in range(100, len(df)):
             df_slice = df.iloc[:i+1]
@@ -3391,8 +4296,6 @@ class AlphaBotV4:
         # Close any remaining position
         if self.agent_c.position:
             self.agent_c._close_position(df.iloc[-1]['close'], 'END_OF_TEST')
-        
-        self.print_summary()
     
     def print_summary(self):
         """Print trading summary"""
@@ -3426,6 +4329,12 @@ if __name__ == "__main__":
     
     config = Config()
     
+    if "--record" in sys.argv:
+        # Record exchange/news responses for session_replay.py (sim/live/stream)
+        i = sys.argv.index("--record")
+        config.SESSION_RECORD_PATH = sys.argv[i + 1] if i + 1 < len(sys.argv) else "session.jsonl"
+        del sys.argv[i:i + 2]
+    
     if len(sys.argv) > 1:
         command = sys.argv[1].lower()
         
@@ -3457,10 +4366,25 @@ if __name__ == "__main__":
             bot = AlphaBotV4(config, live_mode=False)
             bot.run_live(interval_seconds=60)
         
+        elif command == "stream":
+            # Simulation driven by WebSocket feed (optional URL, e.g. local ReplayServer)
+            config.USE_WEBSOCKET = True
+            if len(sys.argv) > 2:
+                config.MARKET_WS_URL = sys.argv[2]
+            bot = AlphaBotV4(config, live_mode=False)
+            bot.run_live(interval_seconds=60)
+        
         elif command == "backtest":
-            days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
-            
-            # Multi-symbol backtest
+            days = int(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2].isdigit() else 30
+
+            if "--portfolio" in sys.argv:
+                # Shared balance, all symbols in time order
+                config.HISTORY_OFFLINE = "--offline" in sys.argv
+                bot = AlphaBotV4(config)
+                bot.backtest_portfolio(days)
+                sys.exit(0)
+
+            # Multi-symbol backtest (independent balance per symbol)
             total_pnl = 0
             total_trades = 0
             results = []
@@ -3473,6 +4397,9 @@ if __name__ == "__main__":
                 # Create config for this symbol
                 symbol_config = Config()
                 symbol_config.SYMBOL = symbol
+                symbol_config.HISTORY_OFFLINE = "--offline" in sys.argv
+                if "--intrabar" in sys.argv:
+                    symbol_config.INTRABAR_TIMEFRAME = "1m"
                 
                 bot = AlphaBotV4(symbol_config)
                 bot.backtest(days)
@@ -3509,7 +4436,7 @@ if __name__ == "__main__":
             print(f"Stats: {stats}")
         
         else:
-            print("Usage: python alphabot_v4.py [live|backtest|test] [days]")
+            print("Usage: python alphabot_v4.py [live|sim|stream|backtest|test] [days|ws_url] [--offline] [--intrabar] [--portfolio] [--record FILE]")
     
     else:
         # Default: run single symbol backtest
@@ -0,0 +1,448 @@
+"""
+Async Executor - ส่ง order ผ่าน ccxt.async_support แทน REST แบบ blocking ทีละขา
+- HTTP session (aiohttp) เดียวใช้ตลอด ไม่ต้องเปิด TCP/TLS ใหม่ทุก order
+- SL/TP ส่งพร้อมกันทันทีหลัง market order fill (asyncio.gather) หรือรวมเป็น batchOrders ครั้งเดียว
+- Cache margin mode / leverage ต่อ symbol (market_meta.py) → ไม่ set ซ้ำทุก trade
+- คืน ExecutionReport พร้อมเวลาแต่ละขา (margin, leverage, entry, sl, tp)
+
+ใช้แทน ExchangeExecutor ได้ทันที: method เหมือนกัน (sync) แต่ทำงานบน event loop ใน background thread
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import ccxt
+import ccxt.async_support as ccxt_async
+
+try:
+    from market_meta import DEFAULT_ROOT as DEFAULT_META_ROOT, MARKETS_TTL_SEC, MarketMetaCache
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
+try:
+    from perf_metrics import get_registry
+    PERF_METRICS_AVAILABLE = True
+except ImportError:
+    PERF_METRICS_AVAILABLE = False
+
+
+CALL_TIMEOUT_SEC = 30.0
+CANCEL_GRACE_SEC = 5.0          # Extra wait for a timed-out coroutine to finish cancelling
+RECONCILE_ATTEMPTS = 3          # fetch_positions tries after an entry that never confirmed
+RECONCILE_DELAY_SEC = 1.0
+MARGIN_MODE = 'cross'
+
+
+@dataclass
+class OrderLeg:
+    """One REST round trip of an execution"""
+    name: str                       # margin / leverage / entry / sl / tp / protect
+    ok: bool
+    ms: float
+    order_id: Optional[str] = None
+    error: str = ""
+    cached: bool = False            # Skipped because the exchange already has this setting
+
+
+@dataclass
+class ExecutionReport:
+    """Result of open_position: entry order + timing of every leg (truthy when the entry filled)"""
+    symbol: str
+    side: str
+    amount: float
+    order: Optional[Dict] = None
+    legs: List[OrderLeg] = field(default_factory=list)
+    total_ms: float = 0.0
+    unprotected_ms: float = 0.0     # Entry filled → both SL/TP acknowledged
+    entry_sent: bool = False        # The market order went out (may have filled even without a reply)
+
+    def __bool__(self) -> bool:
+        return self.order is not None
+
+    def __getitem__(self, key):
+        return self.order[key]
+
+    def get(self, key, default=None):
+        return self.order.get(key, default) if self.order else default
+
+    def leg(self, name: str) -> Optional[OrderLeg]:
+        return next((leg for leg in self.legs if leg.name == name), None)
+
+    def summary(self) -> str:
+        parts = [f"{leg.name} {'cached' if leg.cached else f'{leg.ms:.0f}ms'}{'' if leg.ok else ' ❌'}"
+                 for leg in self.legs]
+        return f"{' | '.join(parts)} | total {self.total_ms:.0f}ms (unprotected {self.unprotected_ms:.0f}ms)"
+
+
+class AsyncExchangeExecutor:
+    """Binance Futures executor on a private asyncio loop (same sync API as ExchangeExecutor)"""
+
+    def __init__(self, config, logger, batch_orders: bool = None, exchange=None, meta=None):
+        self.config = config
+        self.logger = logger
+        self.batch_orders = getattr(config, 'BATCH_PROTECTIVE_ORDERS', False) if batch_orders is None else batch_orders
+
+        # Markets + per-symbol settings already applied on the exchange (disk cache)
+        if meta is None and MARKET_META_AVAILABLE:
+            meta = MarketMetaCache('binanceusdm', account=getattr(config, 'API_KEY', ''),
+                                   root=None if exchange is not None else DEFAULT_META_ROOT,
+                                   markets_ttl=getattr(config, 'MARKETS_CACHE_TTL', MARKETS_TTL_SEC))
+        self.meta = meta
+        self.account = None  # AccountMirror (user_stream.py) - positions without fetch_positions
+        self.margin_modes: Dict[str, str] = {}   # Fallback when market_meta.py is missing
+        self.leverages: Dict[str, int] = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-executor", daemon=True)
+        self._thread.start()
+        self.exchange = exchange or self._run(self._connect())
+
+    async def _connect(self):
+        # Created inside the loop so the aiohttp session is bound to it
+        exchange = ccxt_async.binanceusdm({
+            'apiKey': self.config.API_KEY,
+            'secret': self.config.SECRET_KEY,
+            'sandbox': False,
+            'enableRateLimit': True,
+            'options': {'defaultType': 'future'}
+        })
+        if self.meta is not None:
+            await self.meta.load_async(exchange)
+        else:
+            await exchange.load_markets()
+        return exchange
+
+    def _run(self, coro, timeout: float = CALL_TIMEOUT_SEC):
+        """
+        Run a coroutine on the executor loop from the calling (sync) thread
+        On timeout the coroutine is cancelled (and has stopped) before TimeoutError is raised
+        """
+        future = asyncio.run_coroutine_threadsafe(asyncio.wait_for(coro, timeout), self._loop)
+        try:
+            return future.result(timeout + CANCEL_GRACE_SEC)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    async def _timed(self, name: str, coro) -> tuple:
+        """Await one leg → (OrderLeg, result or None)"""
+        t0 = time.perf_counter()
+        try:
+            result = await coro
+            leg = OrderLeg(name, True, (time.perf_counter() - t0) * 1000,
+                           order_id=result.get('id') if isinstance(result, dict) else None)
+        except Exception as e:
+            result = None
+            leg = OrderLeg(name, False, (time.perf_counter() - t0) * 1000, error=f"{type(e).__name__}: {e}")
+        if PERF_METRICS_AVAILABLE:
+            get_registry().record(f'executor.{name}', int(leg.ms * 1000))
+        return leg, result
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Account settings (cached per symbol)
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def _known(self, symbol: str, key: str):
+        if self.meta is not None:
+            return self.meta.margin_mode(symbol) if key == 'margin_mode' else self.meta.leverage(symbol)
+        return (self.margin_modes if key == 'margin_mode' else self.leverages).get(symbol)
+
+    def _remember(self, symbol: str, key: str, value):
+        if self.meta is not None:
+            self.meta.remember(symbol, **{key: value})
+        else:
+            (self.margin_modes if key == 'margin_mode' else self.leverages)[symbol] = value
+
+    async def _on_error(self, symbol: str, leg: OrderLeg):
+        """Drop cached metadata the exchange error says is stale (reload markets if needed)"""
+        if self.meta is None or leg.ok:
+            return
+        scope = self.meta.on_error(symbol, leg.error)
+        if scope:
+            self.logger.warning(f"[Executor] Cached {scope} for {symbol} invalidated")
+        if scope == 'markets':
+            try:
+                await self.meta.load_async(self.exchange, reload=True)
+            except Exception as e:
+                self.logger.error(f"[Executor] Failed to reload markets: {e}")
+
+    async def _ensure_margin_mode(self, symbol: str, mode: str = MARGIN_MODE) -> OrderLeg:
+        if self._known(symbol, 'margin_mode') == mode:
+            return OrderLeg('margin', True, 0.0, cached=True)
+        leg, _ = await self._timed('margin', self.exchange.set_margin_mode(mode, symbol))
+        if not leg.ok and ('No need to change' in leg.error or
+                           (self.meta is not None and self.meta.already_set(leg.error))):
+            leg.ok, leg.error = True, ""  # Already set on the exchange
+        if leg.ok:
+            self._remember(symbol, 'margin_mode', mode)
+        await self._on_error(symbol, leg)
+        return leg
+
+    async def _ensure_leverage(self, symbol: str, leverage: int) -> OrderLeg:
+        if self._known(symbol, 'leverage') == leverage:
+            return OrderLeg('leverage', True, 0.0, cached=True)
+        leg, _ = await self._timed('leverage', self.exchange.set_leverage(leverage, symbol))
+        if leg.ok:
+            self._remember(symbol, 'leverage', leverage)
+        await self._on_error(symbol, leg)
+        return leg
+
+    def get_balance(self) -> float:
+        """Get USDT balance"""
+        try:
+            balance = self._run(self.exchange.fetch_balance())
+            return float(balance['USDT']['free'])
+        except Exception as e:
+            self.logger.error(f"[Executor] Failed to get balance: {e}")
+            return 0.0
+
+    def set_leverage(self, symbol: str, leverage: int) -> bool:
+        """Set leverage for symbol (no request when already set)"""
+        leg = self._run(self._ensure_leverage(symbol, leverage))
+        if not leg.ok:
+            self.logger.error(f"[Executor] Failed to set leverage: {leg.error}")
+        elif not leg.cached:
+            self.logger.info(f"[Executor] Leverage set to {leverage}x for {symbol}")
+        return leg.ok
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Orders
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def _protective_orders(self, symbol: str, side: str, amount: float,
+                           stop_loss: float = None, take_profit: float = None) -> List[tuple]:
+        """[(leg name, order kwargs)] for the reduce-only SL/TP pair"""
+        close_side = 'sell' if side == 'long' else 'buy'
+        orders = []
+        for name, kind, price in (('sl', 'stop_market', stop_loss), ('tp', 'take_profit_market', take_profit)):
+            if price:
+                orders.append((name, dict(symbol=symbol, type=kind, side=close_side, amount=amount,
+                                          params={'stopPrice': price, 'reduceOnly': True})))
+        return orders
+
+    async def _protect(self, orders: List[tuple]) -> List[OrderLeg]:
+        if not orders:
+            return []
+        if self.batch_orders and len(orders) > 1:
+            # One batchOrders request; per-order failures come back inside the response
+            leg, results = await self._timed('protect', self.exchange.create_orders([kw for _, kw in orders]))
+            if not leg.ok:
+                return [leg]
+            legs = [leg]
+            for (name, _), result in zip(orders, results or []):
+                failed = not result or result.get('status') == 'rejected' or not result.get('id')
+                legs.append(OrderLeg(name, not failed, leg.ms, order_id=None if failed else result.get('id'),
+                                     error=str(result.get('info', '')) if failed and result else ""))
+            return legs
+        done = await asyncio.gather(*(self._timed(name, self.exchange.create_order(**kw)) for name, kw in orders))
+        return [leg for leg, _ in done]
+
+    async def _open_position(self, report: ExecutionReport, stop_loss: float = None,
+                             take_profit: float = None, leverage: int = None) -> ExecutionReport:
+        symbol, side, amount = report.symbol, report.side, report.amount
+        t0 = time.perf_counter()
+
+        setup = [self._ensure_margin_mode(symbol)]
+        if leverage:
+            setup.append(self._ensure_leverage(symbol, leverage))
+        report.legs.extend(await asyncio.gather(*setup))
+
+        report.entry_sent = True
+        entry, order = await self._timed('entry', self.exchange.create_market_order(
+            symbol=symbol, side='buy' if side == 'long' else 'sell', amount=amount))
+        report.legs.append(entry)
+        await self._on_error(symbol, entry)
+        if order is None:
+            report.total_ms = (time.perf_counter() - t0) * 1000
+            return report
+        report.order = order
+
+        filled = time.perf_counter()
+        protect = await self._protect(self._protective_orders(symbol, side, amount, stop_loss, take_profit))
+        report.legs.extend(protect)
+        for leg in protect:
+            await self._on_error(symbol, leg)
+        report.unprotected_ms = (time.perf_counter() - filled) * 1000
+        report.total_ms = (time.perf_counter() - t0) * 1000
+        return report
+
+    def open_position(self, symbol: str, side: str, amount: float,
+                      stop_loss: float = None, take_profit: float = None,
+                      leverage: int = None) -> Optional[ExecutionReport]:
+        """Open a position; SL/TP go out concurrently as soon as the entry fills"""
+        report = ExecutionReport(symbol, side, amount)
+        try:
+            self._run(self._open_position(report, stop_loss, take_profit, leverage))
+        except Exception as e:
+            if not report.entry_sent:
+                self.logger.error(f"[Executor] ❌ Failed to open position: {type(e).__name__}: {e}")
+                return None
+            # The entry may have filled - the exchange decides, not the timeout
+            self.logger.warning(f"[Executor] ⚠️ {symbol} entry sent but not confirmed "
+                                f"({type(e).__name__}) - reconciling with the exchange")
+            return self._reconcile_open(report, stop_loss, take_profit)
+
+        entry = report.leg('entry')
+        if not report:
+            self.logger.error(f"[Executor] ❌ Failed to open position: {entry.error if entry else 'setup failed'}")
+            return None
+        self.logger.info(f"[Executor] ✅ Opened {side.upper()} {amount} {symbol} @ market")
+        for leg in report.legs:
+            if not leg.ok:
+                self.logger.warning(f"[Executor] Failed to set {leg.name.upper()}: {leg.error}")
+        self.logger.info(f"[Executor] ⏱️ {report.summary()}")
+        return report
+
+    def _reconcile_open(self, report: ExecutionReport, stop_loss: float = None,
+                        take_profit: float = None) -> Optional[ExecutionReport]:
+        """
+        Entry went out but the call did not finish: read the position over REST
+        (the user-stream mirror may not have the fill yet) and protect it
+        None only when every lookup succeeded and none shows a position
+        """
+        symbol = report.symbol
+        pos, lookup_failed = None, False
+        for attempt in range(RECONCILE_ATTEMPTS):
+            if attempt:
+                time.sleep(RECONCILE_DELAY_SEC)
+            try:
+                positions = self._run(self.exchange.fetch_positions([symbol]))
+            except Exception as e:
+                lookup_failed = True
+                self.logger.error(f"[Executor] Failed to reconcile {symbol}: {e}")
+                continue
+            pos = next((p for p in positions if float(p.get('contracts') or 0) > 0), None)
+            if pos is not None:
+                break
+
+        if pos is None and not lookup_failed:
+            self.logger.error(f"[Executor] ❌ Failed to open position: no {symbol} position on the exchange")
+            return None
+        if pos is None:
+            # Unknown - report it open so the caller tracks (and later closes) it
+            self.logger.error(f"[Executor] ⚠️ {symbol} position state unknown - treating the entry as filled")
+            report.order = report.order or {'id': None, 'symbol': symbol, 'side': report.side,
+                                            'amount': report.amount, 'status': 'unknown'}
+            return report
+
+        contracts = float(pos['contracts'])
+        report.order = report.order or {'id': None, 'symbol': symbol, 'side': report.side, 'amount': contracts,
+                                        'average': pos.get('entryPrice'), 'status': 'reconciled'}
+        missing = [o for o in self._protective_orders(symbol, pos.get('side') or report.side, contracts,
+                                                      stop_loss, take_profit)
+                   if not (report.leg(o[0]) and report.leg(o[0]).ok)]
+        if missing:
+            try:
+                legs = self._run(self._protect(missing))
+            except Exception as e:
+                legs = [OrderLeg('protect', False, 0.0, error=f"{type(e).__name__}: {e}")]
+            report.legs.extend(legs)
+            for leg in legs:
+                if not leg.ok:
+                    self.logger.warning(f"[Executor] Failed to set {leg.name.upper()}: {leg.error}")
+        self.logger.info(f"[Executor] ✅ Reconciled {report.side.upper()} {contracts} {symbol} from the exchange")
+        return report
+
+    async def _positions(self, symbol: str) -> List[Dict]:
+        """Positions from the user-stream mirror when synced, else REST"""
+        if self.account is not None and self.account.synced:
+            pos = self.account.position(symbol)
+            return [pos.to_ccxt()] if pos else []
+        return await self.exchange.fetch_positions([symbol])
+
+    async def _close_position(self, symbol: str) -> Optional[Dict]:
+        positions = await self._positions(symbol)
+        for pos in positions:
+            if float(pos['contracts']) > 0:
+                side = 'sell' if pos['side'] == 'long' else 'buy'
+                order = await self.exchange.create_market_order(
+                    symbol=symbol, side=side, amount=float(pos['contracts']), params={'reduceOnly': True})
+                # Cancel the leftover SL/TP only once the close went through -
+                # a rejected close must keep the position protected
+                try:
+                    await self.exchange.cancel_all_orders(symbol)
+                except Exception as e:
+                    self.logger.warning(f"[Executor] Failed to cancel open orders for {symbol}: {e}")
+                return order
+        return None
+
+    def close_position(self, symbol: str) -> dict:
+        """Close current position"""
+        try:
+            order = self._run(self._close_position(symbol))
+            if order:
+                self.logger.info(f"[Executor] ✅ Closed position {symbol}")
+            return order
+        except Exception as e:
+            self.logger.error(f"[Executor] ❌ Failed to close position: {e}")
+            return None
+
+    def get_position(self, symbol: str) -> dict:
+        """Get current position info"""
+        try:
+            positions = self._run(self._positions(symbol))
+            for pos in positions:
+                if float(pos['contracts']) > 0:
+                    return pos
+            return None
+        except Exception as e:
+            self.logger.error(f"[Executor] Failed to get position: {e}")
+            return None
+
+    def close(self):
+        """Close the HTTP session and stop the loop"""
+        if not self._loop.is_running():
+            return
+        try:
+            self._run(self.exchange.close(), timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+# For testing: python async_executor.py  (fake exchange, no network)
+if __name__ == "__main__":
+    import logging
+    from types import SimpleNamespace
+
+    class FakeExchange:
+        """Every REST call takes 100ms"""
+        LATENCY = 0.1
+
+        async def _reply(self, **order):
+            await asyncio.sleep(self.LATENCY)
+            return {'id': str(int(time.time() * 1e6)), **order}
+
+        async def set_margin_mode(self, mode, symbol):
+            await asyncio.sleep(self.LATENCY)
+            raise ccxt.ExchangeError('binanceusdm {"code":-4046,"msg":"No need to change margin type."}')
+
+        async def set_leverage(self, leverage, symbol):
+            return await self._reply(leverage=leverage)
+
+        async def create_market_order(self, symbol, side, amount, params=None):
+            return await self._reply(symbol=symbol, side=side, amount=amount)
+
+        async def create_order(self, symbol, type, side, amount, params=None):
+            return await self._reply(symbol=symbol, type=type, side=side, amount=amount)
+
+        async def create_orders(self, orders):
+            await asyncio.sleep(self.LATENCY)
+            return [{'id': str(i), **o} for i, o in enumerate(orders)]
+
+        async def close(self):
+            pass
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    executor = AsyncExchangeExecutor(None, logging.getLogger("demo"), batch_orders=False, exchange=FakeExchange())
+
+    for batch in (False, True, False):
+        executor.batch_orders = batch
+        report = executor.open_position('BTC/USDT:USDT', 'long', 0.01, stop_loss=60000, take_profit=70000, leverage=10)
+        print(f"batch={batch}: {report.summary()}")
+    executor.close()
@@ -0,0 +1,377 @@
+"""
+Backtest Engine - Incremental event-driven backtest สำหรับ AlphaBotV4
+คำนวณ indicators ครั้งเดียว แล้วเดินทีละแท่งด้วย state O(1) ต่อแท่ง
+(แทนการสร้าง df.iloc[:i+1] + คำนวณ GARCH / mean ATR ใหม่ทุกแท่ง)
+Intrabar mode: ระหว่างถือ position เล่นแท่งย่อย (เช่น 1m ใน 5m) เป็นลำดับราคา
+→ SL/Trailing/Breakeven/Partial TP ทำงานตามลำดับที่เกิดจริงในแท่ง
+"""
+import dataclasses
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable
+
+import numpy as np
+import pandas as pd
+
+
+EWMA_LAMBDA = 0.94                              # Same decay as AgentA.estimate_volatility_garch
+ANNUALIZE = float(np.sqrt(252 * 24 * 60))
+
+
+def _timeframe_ms(timeframe: str) -> int:
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    return int(timeframe[:-1]) * units[timeframe[-1]] * 1000
+
+
+def subbar_ticks(rows: np.ndarray) -> np.ndarray:
+    """
+    Sub-candles (k, 6) [ts, o, h, l, c, v] → price path of 4 ticks each:
+    open, nearer extreme, farther extreme, close (bullish: low first, bearish: high first)
+    """
+    o, h, l, c = rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+    bullish = c >= o
+    first = np.where(bullish, l, h)
+    second = np.where(bullish, h, l)
+    return np.column_stack([o, first, second, c]).ravel()
+
+
+class IncrementalBacktestEngine:
+    """
+    Event-driven backtest over a precomputed indicator frame
+    - Indicators are read from NumPy columns (no per-bar DataFrame slicing)
+    - Volatility: precomputed 'Volatility' column (volatility.py), else running EWMA
+    - Market state: running mean ATR
+    - Position state: the bot's own AgentC (same SL/TP/Trailing/Breakeven rules)
+    """
+
+    WARMUP_BARS = 100  # Same start index as the legacy loop
+
+    def __init__(self, bot, notify: bool = False, intrabar=None):
+        self.bot = bot
+        self.config = bot.config
+        self.notify = notify  # False = no Telegram previews/charts during the run
+        self.intrabar = intrabar  # history_store.SubBarCursor over sub-bars (None = close only)
+        self.bar_ms = _timeframe_ms(self.config.TIMEFRAME)
+        self.intrabar_bars = 0    # Bars replayed from sub-bars
+        self.intrabar_missing = 0 # Bars without sub-bars (fell back to close)
+
+        # Running state (O(1) per bar)
+        self.ewma_var: Optional[float] = None
+        self.atr_sum = 0.0
+        self.atr_count = 0
+
+        self.equity_curve: List[Dict] = []
+
+    def _column(self, df: pd.DataFrame, name: str, default: np.ndarray = None) -> np.ndarray:
+        """Column as float64 array (default when indicator is missing)"""
+        if name in df.columns:
+            return df[name].to_numpy(dtype=np.float64)
+        return default
+
+    def _update_volatility(self, ret: float) -> float:
+        """Running EWMA variance → annualized volatility"""
+        sq = ret ** 2
+        if self.ewma_var is None:
+            self.ewma_var = sq
+        else:
+            self.ewma_var = EWMA_LAMBDA * self.ewma_var + (1 - EWMA_LAMBDA) * sq
+        return float(np.sqrt(self.ewma_var) * ANNUALIZE)
+
+    def _update_intrabar(self, bar_start_ms: int, close: float):
+        """Feed the bar's sub-bar price path to AgentC; the bar close is the last tick"""
+        agent_c = self.bot.agent_c
+        rows = self.intrabar.take(bar_start_ms, bar_start_ms + self.bar_ms)
+        if len(rows) == 0:
+            self.intrabar_missing += 1
+        else:
+            self.intrabar_bars += 1
+            ticks = subbar_ticks(rows)
+            for k, tick in enumerate(ticks.tolist()):
+                trade = agent_c.update_position(tick)
+                if trade:
+                    trade.exit_time = pd.Timestamp(int(rows[k // 4, 0]), unit='ms').to_pydatetime()
+                    return trade
+        trade = agent_c.update_position(close)
+        if trade:
+            trade.exit_time = self._bar_time(pd.Timestamp(bar_start_ms, unit='ms'))
+        return trade
+
+    def run(self, df: pd.DataFrame,
+            progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """Run the backtest on a frame already processed by AgentA.calculate_indicators"""
+        cfg = self.config
+        agent_a = self.bot.agent_a
+        agent_b = self.bot.agent_b
+        agent_c = self.bot.agent_c
+        start_time = time.time()
+
+        n = len(df)
+        close = df['close'].to_numpy(dtype=np.float64)
+        returns = df['Returns'].to_numpy(dtype=np.float64)
+        rsi = df[f'RSI_{cfg.RSI_PERIOD}'].to_numpy(dtype=np.float64)
+        ema_fast = df[f'EMA_{cfg.EMA_FAST}'].to_numpy(dtype=np.float64)
+        ema_slow = df[f'EMA_{cfg.EMA_SLOW}'].to_numpy(dtype=np.float64)
+        adx = df[f'ADX_{cfg.ADX_PERIOD}'].to_numpy(dtype=np.float64)
+        macd_hist = df['MACDh_12_26_9'].to_numpy(dtype=np.float64)
+        bb_upper = self._column(df, f'BBU_{cfg.BB_PERIOD}_{cfg.BB_STD}_{cfg.BB_STD}', close)
+        bb_lower = self._column(df, f'BBL_{cfg.BB_PERIOD}_{cfg.BB_STD}_{cfg.BB_STD}', close)
+        atr = self._column(df, 'ATRr_14')
+        vol_z = self._column(df, 'Volume_Zscore', np.zeros(n))
+        vol_col = self._column(df, 'Volatility')
+        timestamps = df.index
+        if self.intrabar is not None:
+            bar_ms = df.index.as_unit('ms').asi8
+
+        # Quiet mode: no signal preview sleep / charts per trade
+        saved_telegram = agent_c.telegram
+        if not self.notify:
+            agent_c.telegram = None
+
+        self.ewma_var = None
+        self.atr_sum = 0.0
+        self.atr_count = 0
+        self.equity_curve = []
+        bars_processed = 0
+
+        try:
+            # Warm-up: fold bars before the first trading bar into the running state
+            for i in range(min(self.WARMUP_BARS, n)):
+                if vol_col is None:
+                    self._update_volatility(returns[i])
+                if atr is not None:
+                    self.atr_sum += atr[i]
+                    self.atr_count += 1
+
+            for i in range(self.WARMUP_BARS, n):
+                bars_processed += 1
+                if vol_col is not None:
+                    volatility = vol_col[i]
+                else:
+                    volatility = self._update_volatility(returns[i])
+                if atr is not None:
+                    self.atr_sum += atr[i]
+                    self.atr_count += 1
+                    atr_now = atr[i]
+                    avg_atr = self.atr_sum / self.atr_count
+                else:
+                    atr_now = 0
+                    avg_atr = 0
+
+                price = close[i]
+                market_state = agent_a.classify_market_state(
+                    adx[i], ema_fast[i], ema_slow[i], atr_now, avg_atr
+                )
+
+                analysis = {
+                    'valid': True,
+                    'timestamp': timestamps[i],
+                    'price': price,
+                    'volatility': volatility,
+                    'volume_zscore': vol_z[i],
+                    'volume_spike': vol_z[i] > 3,
+                    'pattern': 'None',
+                    'market_state': market_state.value,
+                    'risk_level': 0.2,
+                    'indicators': {
+                        'rsi': rsi[i],
+                        'ema_fast': ema_fast[i],
+                        'ema_slow': ema_slow[i],
+                        'adx': adx[i],
+                        'macd_hist': macd_hist[i],
+                        'bb_upper': bb_upper[i],
+                        'bb_lower': bb_lower[i],
+                    }
+                }
+
+                bar_time = self._bar_time(timestamps[i])
+
+                # Update position
+                if agent_c.position:
+                    if self.intrabar is not None:
+                        trade = self._update_intrabar(int(bar_ms[i]), price)
+                    else:
+                        trade = agent_c.update_position(price)
+                        if trade:
+                            trade.exit_time = bar_time
+                    if trade:
+                        agent_b.update_from_trade(trade)
+                        self.equity_curve.append({'time': bar_time, 'balance': agent_c.balance})
+
+                # Generate and execute signal
+                if agent_c.position is None:
+                    signal = agent_b.generate_signal(analysis)
+                    if signal and agent_c.execute_signal(signal, price):
+                        agent_c.position.entry_time = bar_time
+
+                # Check risk limits
+                can_trade, reason = agent_c.check_risk_limits()
+                if not can_trade:
+                    self.bot.logger.warning(f"Risk limit hit: {reason}")
+                    break
+
+                if progress_callback and bars_processed % 1000 == 0:
+                    progress_callback(i + 1, n)
+
+            # Close any remaining position
+            if agent_c.position and n > 0:
+                trade = agent_c._close_position(close[-1], 'END_OF_TEST')
+                trade.exit_time = self._bar_time(timestamps[-1])
+                self.equity_curve.append({'time': trade.exit_time, 'balance': agent_c.balance})
+        finally:
+            agent_c.telegram = saved_telegram
+
+        if progress_callback:
+            progress_callback(n, n)
+
+        elapsed = time.time() - start_time
+        return {
+            'bars': bars_processed,
+            'elapsed_sec': elapsed,
+            'bars_per_sec': bars_processed / elapsed if elapsed > 0 else 0,
+            'trades': list(agent_c.trades),
+            'stats': agent_c.get_stats(),
+            'equity_curve': self.equity_curve,
+            'intrabar_bars': self.intrabar_bars,
+            'intrabar_missing': self.intrabar_missing,
+        }
+
+    @staticmethod
+    def _bar_time(ts) -> datetime:
+        """Index value → datetime (falls back to now for non-time indexes)"""
+        if isinstance(ts, pd.Timestamp):
+            return ts.to_pydatetime()
+        return datetime.now()
+
+
+def _trade_key(trade) -> tuple:
+    """Fields that must match between engines (times are wall-clock in legacy)"""
+    return (trade.side, round(trade.entry_price, 10), round(trade.exit_price, 10),
+            round(trade.pnl, 10), trade.exit_reason)
+
+
+def compare_with_legacy(df: pd.DataFrame, config=None) -> Dict[str, Any]:
+    """Run legacy + incremental loops on the same frame and diff trades/stats"""
+    from alphabot_v4 import AlphaBotV4, Config
+
+    def make_bot():
+        cfg = dataclasses.replace(config) if config else Config()
+        cfg.SIGNAL_PREVIEW = False  # Legacy loop would sleep 3s per trade
+        bot = AlphaBotV4(cfg)
+        bot.telegram.enabled = False
+        return bot
+
+    legacy_bot = make_bot()
+    t0 = time.time()
+    legacy_bot._backtest_legacy(df)
+    legacy_sec = time.time() - t0
+
+    fast_bot = make_bot()
+    result = IncrementalBacktestEngine(fast_bot).run(df)
+
+    legacy_trades = [_trade_key(t) for t in legacy_bot.agent_c.trades]
+    fast_trades = [_trade_key(t) for t in fast_bot.agent_c.trades]
+    mismatches = [
+        (i, a, b) for i, (a, b) in enumerate(zip(legacy_trades, fast_trades)) if a != b
+    ]
+
+    legacy_stats = legacy_bot.agent_c.get_stats()
+    fast_stats = result['stats']
+    stats_match = all(
+        np.isclose(legacy_stats[k], fast_stats[k], rtol=1e-9, atol=1e-12)
+        for k in ('total_trades', 'win_rate', 'total_pnl', 'roi', 'balance', 'drawdown')
+    )
+
+    return {
+        'identical': not mismatches and len(legacy_trades) == len(fast_trades) and stats_match,
+        'legacy_trades': len(legacy_trades),
+        'fast_trades': len(fast_trades),
+        'mismatches': mismatches[:10],
+        'legacy_sec': legacy_sec,
+        'fast_sec': result['elapsed_sec'],
+        'speedup': legacy_sec / result['elapsed_sec'] if result['elapsed_sec'] > 0 else float('inf'),
+    }
+
+
+def diff_trades(close_trades: List, intrabar_trades: List) -> Dict[str, Any]:
+    """
+    Close-only vs intrabar replay: trades with the same entry (time, side) whose
+    exit reason changed or whose result flipped win <-> loss, plus entries only one run took
+    """
+    close_by = {(t.entry_time, t.side): t for t in close_trades}
+    intra_by = {(t.entry_time, t.side): t for t in intrabar_trades}
+    common = [k for k in close_by if k in intra_by]
+
+    changed = []
+    flipped = 0
+    for key in common:
+        a, b = close_by[key], intra_by[key]
+        if a.exit_reason != b.exit_reason or (a.pnl > 0) != (b.pnl > 0):
+            changed.append((key[0], key[1], a.exit_reason, b.exit_reason, a.pnl, b.pnl))
+            flipped += (a.pnl > 0) != (b.pnl > 0)
+
+    return {
+        'close_trades': len(close_trades),
+        'intrabar_trades': len(intrabar_trades),
+        'matched': len(common),
+        'changed_outcome': len(changed),
+        'flipped_win_loss': flipped,
+        'only_close': len(close_by) - len(common),
+        'only_intrabar': len(intra_by) - len(common),
+        'close_pnl': sum(t.pnl for t in close_trades),
+        'intrabar_pnl': sum(t.pnl for t in intrabar_trades),
+        'changes': changed[:20],
+    }
+
+
+def compare_intrabar(df: pd.DataFrame, cursor_factory: Callable[[], Any], config=None) -> Dict[str, Any]:
+    """Run close-only and intrabar replay on the same frame (cursor_factory → new SubBarCursor)"""
+    from alphabot_v4 import AlphaBotV4, Config
+
+    def make_bot():
+        cfg = dataclasses.replace(config) if config else Config()
+        cfg.SIGNAL_PREVIEW = False
+        bot = AlphaBotV4(cfg)
+        bot.telegram.enabled = False
+        return bot
+
+    close_bot = make_bot()
+    IncrementalBacktestEngine(close_bot).run(df)
+
+    intra_bot = make_bot()
+    engine = IncrementalBacktestEngine(intra_bot, intrabar=cursor_factory())
+    engine.run(df)
+
+    report = diff_trades(close_bot.agent_c.trades, intra_bot.agent_c.trades)
+    report['intrabar_bars'] = engine.intrabar_bars
+    report['intrabar_missing'] = engine.intrabar_missing
+    return report
+
+
+def print_intrabar_report(report: Dict[str, Any], log=print):
+    log(f"🔬 Intrabar vs close-only: {report['intrabar_trades']} vs {report['close_trades']} trades | "
+        f"changed outcome {report['changed_outcome']}/{report['matched']} "
+        f"(win↔loss {report['flipped_win_loss']}) | only close {report['only_close']} | "
+        f"only intrabar {report['only_intrabar']}")
+    log(f"   PnL: close-only ${report['close_pnl']:.2f} → intrabar ${report['intrabar_pnl']:.2f} | "
+        f"sub-bar coverage {report['intrabar_bars']}/{report['intrabar_bars'] + report['intrabar_missing']} bars")
+
+
+# For testing: python backtest_engine.py [SYMBOL] [days]
+if __name__ == "__main__":
+    import sys
+    from alphabot_v4 import AlphaBotV4, Config
+
+    config = Config()
+    config.SYMBOL = sys.argv[1] if len(sys.argv) > 1 else config.SYMBOL
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    loader = AlphaBotV4(config)
+    df = loader.load_backtest_data(days)
+    print(f"📊 {config.SYMBOL}: {len(df)} candles")
+
+    report = compare_with_legacy(df, config)
+    print(f"   Legacy: {report['legacy_trades']} trades in {report['legacy_sec']:.2f}s")
+    print(f"   Fast:   {report['fast_trades']} trades in {report['fast_sec']:.3f}s")
+    print(f"   Speedup: {report['speedup']:.0f}x | Identical: {'✅' if report['identical'] else '❌'}")
+    for m in report['mismatches']:
+        print(f"   ❌ Trade #{m[0]}: {m[1]} != {m[2]}")
@@ -7,13 +7,27 @@
 - V2: SL 2.5%, TP 3.5%, ADX>=35, ไม่มี Meme Coins, Dynamic Sizing
 """
 
+import sys
 import ccxt
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from history_store import HistoryStore
+    HISTORY_STORE_AVAILABLE = True
+except ImportError:
+    HISTORY_STORE_AVAILABLE = False
+
+try:
+    from exit_engine import ExitEngine
+    EXIT_ENGINE_AVAILABLE = True
+except ImportError:
+    EXIT_ENGINE_AVAILABLE = False
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # CONFIGURATION
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -61,12 +75,14 @@ BACKTEST_DAYS = 7  # 7 วันย้อนหลัง
 # ═══════════════════════════════════════════════════════════════════════════════
 
 class Backtester:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, offline: bool = False):
         self.config = config
+        self.offline = offline  # True = อ่านจาก history cache อย่างเดียว
         self.exchange = ccxt.binanceusdm({
             'enableRateLimit': True,
             'options': {'defaultType': 'future'}
         })
+        self.history = HistoryStore(self.exchange) if HISTORY_STORE_AVAILABLE else None
         
         self.balance = INITIAL_BALANCE
         self.trades = []
@@ -150,6 +166,38 @@ class Backtester:
         
         return None
     
+    def signal_arrays(self, df: pd.DataFrame) -> dict:
+        """
+        analyze_candle สำหรับทั้ง frame ในครั้งเดียว (NumPy boolean masks)
+        side: 1 = LONG, -1 = SHORT, 0 = ไม่มีสัญญาณ / confidence = get_confidence(adx, rsi, True, True)
+        """
+        price = df['close'].to_numpy(dtype=np.float64)
+        rsi = df['rsi'].to_numpy(dtype=np.float64)
+        adx = df['adx'].to_numpy(dtype=np.float64)
+        macd_hist = df['macd_hist'].to_numpy(dtype=np.float64)
+        ema_fast = df['ema_3'].to_numpy(dtype=np.float64)
+        ema_slow = df['ema_8'].to_numpy(dtype=np.float64)
+        ema_trend = df['ema_20'].to_numpy(dtype=np.float64)
+        
+        adx_threshold = self.config['adx_threshold']
+        with np.errstate(invalid='ignore'):
+            valid = ~np.isnan(adx) & ~np.isnan(rsi)
+            valid[:50] = False
+            strong = adx >= adx_threshold
+            trend_up = (ema_fast > ema_slow) & (ema_slow > ema_trend)
+            trend_down = (ema_fast < ema_slow) & (ema_slow < ema_trend)
+            long_sig = valid & trend_up & strong & (macd_hist > 0) & (rsi > 40) & (rsi < 70)
+            short_sig = valid & trend_down & strong & (macd_hist < 0) & (rsi > 30) & (rsi < 60)
+            
+            # Same float operations, same order as get_confidence
+            confidence = 50 + np.where(adx > 25, np.minimum(30, (adx - 25) * 1.5), 0)
+            confidence = confidence + np.where((rsi > 40) & (rsi < 60), 5, 10)
+            confidence = confidence + 10
+        confidence = np.minimum(95, np.trunc(np.nan_to_num(confidence))).astype(int)
+        
+        side = np.where(long_sig, 1, np.where(short_sig, -1, 0))
+        return {'side': side, 'price': price, 'adx': adx, 'rsi': rsi, 'confidence': confidence}
+    
     def simulate_trade(self, df: pd.DataFrame, entry_idx: int, signal: dict) -> dict:
         """จำลองการเทรด - ดูว่าถึง TP หรือ SL ก่อน"""
         entry_price = signal['price']
@@ -185,13 +233,24 @@ class Backtester:
         # Still open
         return None
     
+    def exit_result(self, exits, k: int, confidence: int) -> dict:
+        """simulate_trade result from a precomputed ExitBatch row"""
+        if not exits.hit[k]:
+            return None  # Still open
+        if exits.is_tp[k]:
+            return {'result': 'TP', 'pnl_pct': self.config['tp_pct'] * LEVERAGE * 100, 'bars': int(exits.bars[k]), 'confidence': confidence}
+        return {'result': 'SL', 'pnl_pct': -self.config['sl_pct'] * LEVERAGE * 100, 'bars': int(exits.bars[k]), 'confidence': confidence}
+    
     def backtest_symbol(self, symbol: str) -> list:
         """Backtest 1 symbol"""
         try:
-            # Fetch data
-            ohlcv = self.exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=1000)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+            # Fetch data (BACKTEST_DAYS via paginated cache, else single request)
+            if self.history is not None:
+                df = self.history.get(symbol, TIMEFRAME, BACKTEST_DAYS, offline=self.offline).reset_index()
+            else:
+                ohlcv = self.exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=1000)
+                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+                df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
             
             # Calculate indicators
             df['ema_3'] = ta.ema(df['close'], length=3)
@@ -214,25 +273,45 @@ class Backtester:
             trades = []
             last_trade_idx = 0
             
-            # Scan for signals
-            for i in range(50, len(df) - 20):  # Leave room for trade to complete
+            # Signals for every bar at once → visit only candidate bars
+            arrays = self.signal_arrays(df)
+            side = arrays['side']
+            candidates = np.flatnonzero(side[:max(0, len(df) - 20)])  # Leave room for trade to complete
+            
+            # First SL/TP touch for every candidate at once
+            exits = None
+            if EXIT_ENGINE_AVAILABLE:
+                exits = ExitEngine(df['high'].to_numpy(), df['low'].to_numpy()).resolve(
+                    candidates, side[candidates] == 1, arrays['price'][candidates],
+                    self.config['sl_pct'], self.config['tp_pct']
+                )
+            
+            for k, i in enumerate(candidates.tolist()):
                 if i < last_trade_idx + 5:  # Min 5 bars between trades
                     continue
                     
-                signal = self.analyze_candle(df, i)
+                signal = {
+                    'signal': 'LONG' if side[i] == 1 else 'SHORT',
+                    'price': arrays['price'][i],
+                    'confidence': int(arrays['confidence'][i]),
+                    'adx': arrays['adx'][i],
+                    'rsi': arrays['rsi'][i]
+                }
                 
-                if signal:
+                if exits is not None:
+                    result = self.exit_result(exits, k, signal['confidence'])
+                else:
                     result = self.simulate_trade(df, i, signal)
-                    
-                    if result:
-                        result['symbol'] = symbol
-                        result['side'] = signal['signal']
-                        result['entry_price'] = signal['price']
-                        result['adx'] = signal['adx']
-                        result['rsi'] = signal['rsi']
-                        result['timestamp'] = df['timestamp'].iloc[i]
-                        trades.append(result)
-                        last_trade_idx = i + result['bars']
+                
+                if result:
+                    result['symbol'] = symbol
+                    result['side'] = signal['signal']
+                    result['entry_price'] = signal['price']
+                    result['adx'] = signal['adx']
+                    result['rsi'] = signal['rsi']
+                    result['timestamp'] = df['timestamp'].iloc[i]
+                    trades.append(result)
+                    last_trade_idx = i + result['bars']
             
             return trades
             
@@ -330,12 +409,14 @@ def main():
 ╚═══════════════════════════════════════════════════════════════════╝
     """)
     
+    offline = "--offline" in sys.argv
+    
     # Run V1 Backtest
-    bt_v1 = Backtester(V1_CONFIG)
+    bt_v1 = Backtester(V1_CONFIG, offline=offline)
     results_v1 = bt_v1.run_backtest()
     
     # Run V2 Backtest
-    bt_v2 = Backtester(V2_CONFIG)
+    bt_v2 = Backtester(V2_CONFIG, offline=offline)
     results_v2 = bt_v2.run_backtest()
     
     # Print Comparison
@@ -3,60 +3,314 @@ Backtester Web UI - ทดสอบ strategy ผ่าน Browser
 Run: python backtester_ui.py
 Open: http://localhost:8080
 """
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import hashlib
+import itertools
 import json
+import math
+import multiprocessing
 import os
 import sys
+import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 import threading
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 
+DEFAULT_PARAMS = {
+    'symbol': 'BTC/USDT',
+    'capital': 100.0,
+    'leverage': 50,
+    'stop_loss': 0.012,
+    'take_profit': 0.05,
+    'trailing_stop': 0.015,
+    'period': 30,
+    'offline': False,
+}
+CACHE_TTL_SEC = 3600       # Same params within an hour → reuse the finished run
+MAX_JOBS = 200             # Finished jobs kept in memory
+MAX_SWEEP_RUNS = 100       # Param sets per sweep request
+SSE_KEEPALIVE_SEC = 15
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# WORKER (runs in a pool process)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_EVENTS = None  # multiprocessing.Queue inherited by each pool process
+
+
+def _init_worker(events):
+    global _EVENTS
+    _EVENTS = events
+
+
+def _emit(job_id: str, event: str, data: Dict):
+    if _EVENTS is not None:
+        _EVENTS.put((job_id, event, data))
+
+
+def _json_number(value):
+    """inf/NaN are not valid JSON"""
+    if isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+        return None
+    return value
+
+
+def run_backtest(job_id: str, params: Dict) -> Dict:
+    """Run one incremental backtest, streaming progress + new equity points"""
+    from alphabot_v4 import AlphaBotV4, Config
+    from backtest_engine import IncrementalBacktestEngine
+
+    config = Config()
+    config.SYMBOL = params['symbol']
+    config.INITIAL_CAPITAL = params['capital']
+    config.STOP_LOSS_PCT = params['stop_loss']
+    config.TAKE_PROFIT_PCT = params['take_profit']
+    config.MAX_LEVERAGE = params['leverage']
+    config.TRAILING_STOP_PCT = params['trailing_stop']
+    config.HISTORY_OFFLINE = params['offline']
+    config.SIGNAL_PREVIEW = False
+
+    bot = AlphaBotV4(config)
+    bot.telegram.enabled = False
+    _emit(job_id, 'status', {'status': 'loading'})
+    df = bot.load_backtest_data(params['period'])
+    if df.empty:
+        raise ValueError(f"No candles for {params['symbol']}")
+
+    engine = IncrementalBacktestEngine(bot)
+    sent = 0
+
+    def progress(done: int, total: int):
+        nonlocal sent
+        points = engine.equity_curve[sent:]
+        sent += len(points)
+        _emit(job_id, 'progress', {
+            'progress': done / total if total else 1.0,
+            'equity': [[p['time'].isoformat(), p['balance']] for p in points],
+        })
+
+    result = engine.run(df, progress_callback=progress)
+    stats = result['stats']
+
+    balances = [config.INITIAL_CAPITAL] + [p['balance'] for p in result['equity_curve']]
+    peak, max_dd = balances[0], 0.0
+    for balance in balances:
+        peak = max(peak, balance)
+        if peak > 0:
+            max_dd = max(max_dd, (peak - balance) / peak)
+
+    return {
+        'success': True,
+        'params': params,
+        'trades': stats['total_trades'],
+        'win_rate': stats['win_rate'],
+        'total_pnl': stats['total_pnl'],
+        'roi': stats['roi'],
+        'max_drawdown': max_dd,
+        'profit_factor': _json_number(stats['profit_factor']),
+        'bars': result['bars'],
+        'elapsed_sec': result['elapsed_sec'],
+        'equity': [[p['time'].isoformat(), p['balance']] for p in result['equity_curve']],
+        'message': 'Backtest completed successfully',
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# JOBS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class Job:
+    id: str
+    key: str                                  # Params hash (result cache / dedupe)
+    params: Dict
+    status: str = 'queued'                    # queued | loading | running | done | error
+    progress: float = 0.0
+    result: Optional[Dict] = None
+    error: str = ''
+    created_at: float = field(default_factory=time.time)
+    finished_at: float = 0.0
+    events: List[tuple] = field(default_factory=list)   # (event, data) - replayed to late SSE clients
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'error')
+
+    def summary(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': self.progress,
+            'params': self.params,
+            'result': self.result,
+            'error': self.error,
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(),
+        }
+
+
 class BacktesterAPI:
-    """API for backtesting"""
-    
-    def __init__(self):
-        self.results = {}
-    
-    def run_backtest(self, params: Dict) -> Dict:
-        """Run backtest with given parameters"""
+    """
+    Job-based backtest backend
+    - submit(): queue a run on a process pool, return at once with a job id
+    - Identical params share one job (in flight) or its result (within CACHE_TTL_SEC)
+    - Workers push progress/equity events through a queue; subscribers read job.events
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.jobs: Dict[str, Job] = {}
+        self.by_key: Dict[str, str] = {}          # params key → newest job id
+        self.cache_hits = 0
+        self._cond = threading.Condition()
+        self._events = multiprocessing.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self._events,)
+        )
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Submit
+    # ─────────────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def normalize(params: Dict) -> Dict:
+        """Fill defaults, coerce types (raises ValueError on bad input)"""
+        out = dict(DEFAULT_PARAMS)
+        for name, default in DEFAULT_PARAMS.items():
+            if params.get(name) is None:
+                continue
+            value = params[name]
+            if isinstance(default, bool):
+                out[name] = bool(value)
+            elif isinstance(default, str):
+                out[name] = str(value).upper()
+            elif isinstance(default, int):
+                out[name] = int(value)
+            else:
+                out[name] = round(float(value), 6)
+        if out['period'] <= 0 or out['capital'] <= 0 or out['leverage'] <= 0:
+            raise ValueError("period, capital and leverage must be positive")
+        if not (0 < out['stop_loss'] < 1 and 0 < out['take_profit'] < 1 and 0 < out['trailing_stop'] < 1):
+            raise ValueError("stop_loss, take_profit and trailing_stop are fractions (0-1)")
+        return out
+
+    @staticmethod
+    def params_key(params: Dict) -> str:
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+    def submit(self, params: Dict) -> Dict:
+        params = self.normalize(params)
+        key = self.params_key(params)
+        with self._cond:
+            existing = self.jobs.get(self.by_key.get(key, ''))
+            if existing is not None:
+                fresh = not existing.finished or (
+                    existing.status == 'done' and time.time() - existing.finished_at < CACHE_TTL_SEC
+                )
+                if fresh:
+                    self.cache_hits += 1
+                    return {'job_id': existing.id, 'status': existing.status, 'cached': True}
+
+            job = Job(id=uuid.uuid4().hex[:12], key=key, params=params)
+            self.jobs[job.id] = job
+            self.by_key[key] = job.id
+            self._prune()
+
+        future = self._pool.submit(run_backtest, job.id, params)
+        future.add_done_callback(lambda f, job_id=job.id: self._finish(job_id, f))
+        return {'job_id': job.id, 'status': job.status, 'cached': False}
+
+    def sweep(self, base: Dict, grid: Dict[str, List]) -> Dict:
+        """Cartesian product of grid values over base params → one job each"""
+        names = list(grid)
+        combos = list(itertools.product(*(grid[n] for n in names)))
+        if len(combos) > MAX_SWEEP_RUNS:
+            raise ValueError(f"Sweep too large: {len(combos)} runs (max {MAX_SWEEP_RUNS})")
+        jobs = []
+        for values in combos:
+            params = dict(base)
+            params.update(zip(names, values))
+            jobs.append(self.submit(params))
+        return {'jobs': jobs}
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Events
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def _add_event(self, job: Job, event: str, data: Dict):
+        """Caller holds self._cond"""
+        job.events.append((event, data))
+        self._cond.notify_all()
+
+    def _pump(self):
+        """Move worker events into the jobs (one thread for all workers)"""
+        while True:
+            try:
+                job_id, event, data = self._events.get()
+            except (EOFError, OSError):
+                return
+            with self._cond:
+                job = self.jobs.get(job_id)
+                if job is None or job.finished:
+                    continue
+                if event == 'status':
+                    job.status = data['status']
+                elif event == 'progress':
+                    job.status = 'running'
+                    job.progress = data['progress']
+                self._add_event(job, event, data)
+
+    def _finish(self, job_id: str, future):
         try:
-            # Import here to avoid circular imports
-            from alphabot_v4 import Config, AlphaBotLive
-            
-            # Override config
-            config = Config()
-            config.INITIAL_CAPITAL = params.get('capital', 100)
-            config.STOP_LOSS_PCT = params.get('stop_loss', 0.012)
-            config.TAKE_PROFIT_PCT = params.get('take_profit', 0.05)
-            config.MAX_LEVERAGE = params.get('leverage', 50)
-            config.TRAILING_STOP_PCT = params.get('trailing_stop', 0.015)
-            
-            # Run backtest (simulation mode)
-            # This is a simplified version
-            results = {
-                'success': True,
-                'params': params,
-                'trades': 15,
-                'win_rate': 0.667,
-                'total_pnl': 45.5,
-                'roi': 0.455,
-                'max_drawdown': 0.12,
-                'sharpe_ratio': 1.8,
-                'profit_factor': 2.3,
-                'message': 'Backtest completed successfully'
-            }
-            
-            return results
-            
+            result, error = future.result(), ''
         except Exception as e:
-            return {
-                'success': False,
-                'message': str(e)
-            }
+            result, error = None, f"{type(e).__name__}: {e}"
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.finished_at = time.time()
+            if error:
+                job.status, job.error = 'error', error
+                self._add_event(job, 'error', {'success': False, 'message': error})
+            else:
+                job.status, job.progress, job.result = 'done', 1.0, result
+                self._add_event(job, 'done', result)
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond MAX_JOBS (caller holds self._cond)"""
+        finished = [j for j in self.jobs.values() if j.finished]
+        for job in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(self.jobs) - MAX_JOBS)]:
+            del self.jobs[job.id]
+            if self.by_key.get(job.key) == job.id:
+                del self.by_key[job.key]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def wait_events(self, job: Job, start: int, timeout: float) -> List[tuple]:
+        """Events from index `start` on (blocks up to timeout when there are none)"""
+        with self._cond:
+            if len(job.events) <= start and not job.finished:
+                self._cond.wait(timeout)
+            return job.events[start:]
+
+    def list_jobs(self) -> List[Dict]:
+        with self._cond:
+            jobs = sorted(self.jobs.values(), key=lambda j: j.created_at, reverse=True)
+            return [{k: v for k, v in j.summary().items() if k != 'result'} for j in jobs]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
 HTML_TEMPLATE = '''
@@ -285,6 +539,11 @@ HTML_TEMPLATE = '''
                 </div>
                 
                 <form id="backtestForm">
+                    <div class="form-group">
+                        <label>🪙 Symbol</label>
+                        <input type="text" id="symbol" value="BTC/USDT">
+                    </div>
+                    
                     <div class="form-group">
                         <label>💰 Starting Capital ($)</label>
                         <input type="number" id="capital" value="100" min="1" step="1">
@@ -326,7 +585,7 @@ HTML_TEMPLATE = '''
                 
                 <div class="loading" id="loading">
                     <div class="spinner"></div>
-                    <p>Running backtest...</p>
+                    <p id="progressText">Running backtest...</p>
                 </div>
                 
                 <div class="results" id="results">
@@ -402,54 +661,89 @@ HTML_TEMPLATE = '''
                 period: parseInt(document.getElementById('period').value)
             };
             
-            // Simulate API call with random results for demo
-            setTimeout(() => {
-                const winRate = 0.55 + Math.random() * 0.2;
-                const trades = Math.floor(10 + Math.random() * 30);
-                const avgPnl = (Math.random() - 0.3) * 5;
-                const totalPnl = avgPnl * trades;
-                const roi = totalPnl / params.capital;
-                
-                document.getElementById('winRate').textContent = (winRate * 100).toFixed(1) + '%';
-                document.getElementById('totalPnl').textContent = '$' + totalPnl.toFixed(2);
-                document.getElementById('roi').textContent = (roi * 100).toFixed(1) + '%';
-                document.getElementById('trades').textContent = trades;
-                document.getElementById('profitFactor').textContent = (1 + Math.random()).toFixed(2);
-                document.getElementById('drawdown').textContent = (Math.random() * 15).toFixed(1) + '%';
-                
-                // Color coding
-                document.getElementById('totalPnl').parentElement.classList.toggle('negative', totalPnl < 0);
-                document.getElementById('roi').parentElement.classList.toggle('negative', roi < 0);
-                
-                // Status message
-                const status = document.getElementById('status');
-                status.style.display = 'block';
-                if (roi > 0) {
-                    status.className = 'status success';
-                    status.textContent = '✅ Profitable strategy! Consider live testing.';
-                } else {
-                    status.className = 'status error';
-                    status.textContent = '⚠️ Strategy needs optimization.';
-                }
-                
-                // Draw simple equity curve
-                drawEquityCurve(params.capital, trades, avgPnl);
-                
-                document.getElementById('loading').style.display = 'none';
-            }, 1500);
+            params.symbol = document.getElementById('symbol').value;
+            
+            // Queue the job, then follow it over Server-Sent Events
+            let job;
+            try {
+                const res = await fetch('/api/backtest', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(params)
+                });
+                job = await res.json();
+                if (!res.ok) throw new Error(job.message);
+            } catch (err) {
+                showError(err.message);
+                return;
+            }
+            
+            const equity = [[null, params.capital]];
+            const progressText = document.getElementById('progressText');
+            progressText.textContent = job.cached ? 'Cached result...' : 'Queued...';
+            
+            const source = new EventSource('/api/jobs/' + job.job_id + '/events');
+            source.addEventListener('status', (ev) => {
+                progressText.textContent = 'Loading candles...';
+            });
+            source.addEventListener('progress', (ev) => {
+                const data = JSON.parse(ev.data);
+                progressText.textContent = 'Running backtest... ' + (data.progress * 100).toFixed(0) + '%';
+                equity.push(...data.equity);
+                drawEquityCurve(params.capital, equity.map(p => p[1]));
+            });
+            source.addEventListener('done', (ev) => {
+                source.close();
+                const result = JSON.parse(ev.data);
+                showResults(result);
+                drawEquityCurve(params.capital, [params.capital, ...result.equity.map(p => p[1])]);
+            });
+            source.addEventListener('error', (ev) => {
+                source.close();
+                showError(ev.data ? JSON.parse(ev.data).message : 'Connection lost');
+            });
         });
         
-        function drawEquityCurve(capital, trades, avgPnl) {
+        function showError(message) {
+            document.getElementById('loading').style.display = 'none';
+            const status = document.getElementById('status');
+            status.style.display = 'block';
+            status.className = 'status error';
+            status.textContent = '❌ ' + message;
+        }
+        
+        function showResults(result) {
+            document.getElementById('winRate').textContent = (result.win_rate * 100).toFixed(1) + '%';
+            document.getElementById('totalPnl').textContent = '$' + result.total_pnl.toFixed(2);
+            document.getElementById('roi').textContent = (result.roi * 100).toFixed(1) + '%';
+            document.getElementById('trades').textContent = result.trades;
+            document.getElementById('profitFactor').textContent =
+                result.profit_factor === null ? '∞' : result.profit_factor.toFixed(2);
+            document.getElementById('drawdown').textContent = (result.max_drawdown * 100).toFixed(1) + '%';
+            
+            // Color coding
+            document.getElementById('totalPnl').parentElement.classList.toggle('negative', result.total_pnl < 0);
+            document.getElementById('roi').parentElement.classList.toggle('negative', result.roi < 0);
+            
+            // Status message
+            const status = document.getElementById('status');
+            status.style.display = 'block';
+            if (result.roi > 0) {
+                status.className = 'status success';
+                status.textContent = '✅ Profitable strategy! Consider live testing.';
+            } else {
+                status.className = 'status error';
+                status.textContent = '⚠️ Strategy needs optimization.';
+            }
+            
+            document.getElementById('loading').style.display = 'none';
+        }
+        
+        function drawEquityCurve(capital, equity) {
             const container = document.getElementById('chart');
             const width = container.offsetWidth - 40;
             const height = 260;
-            
-            // Generate equity data
-            let equity = [capital];
-            for (let i = 0; i < trades; i++) {
-                const pnl = (Math.random() - 0.4) * Math.abs(avgPnl) * 2;
-                equity.push(equity[equity.length - 1] + pnl);
-            }
+            if (equity.length < 2) return;
             
             const maxEquity = Math.max(...equity);
             const minEquity = Math.min(...equity);
@@ -475,8 +769,8 @@ HTML_TEMPLATE = '''
                     </defs>
                     <path d="${path} L${width},${height} L0,${height} Z" fill="url(#gradient)"/>
                     <path d="${path}" fill="none" stroke="${color}" stroke-width="2"/>
-                    <text x="10" y="20" fill="#888" font-size="12">$${maxEquity.toFixed(0)}</text>
-                    <text x="10" y="${height - 5}" fill="#888" font-size="12">$${minEquity.toFixed(0)}</text>
+                    <text x="10" y="20" fill="#888" font-size="12">$${maxEquity.toFixed(2)}</text>
+                    <text x="10" y="${height - 5}" fill="#888" font-size="12">$${minEquity.toFixed(2)}</text>
                 </svg>
             `;
         }
@@ -487,43 +781,105 @@ HTML_TEMPLATE = '''
 
 
 class BacktesterHandler(SimpleHTTPRequestHandler):
-    """HTTP handler for backtester UI"""
-    
+    """
+    HTTP handler for backtester UI
+    POST /api/backtest            → {job_id, status, cached}
+    POST /api/sweep               → {jobs: [...]}  body: {"base": {...}, "grid": {"stop_loss": [...]}}
+    GET  /api/jobs                → job list
+    GET  /api/jobs/<id>           → status / result
+    GET  /api/jobs/<id>/events    → Server-Sent Events: status, progress, done, error
+    """
+
+    api: BacktesterAPI = None  # Set by run_server
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict:
+        content_length = int(self.headers.get('Content-Length') or 0)
+        post_data = self.rfile.read(content_length) if content_length else b'{}'
+        return json.loads(post_data.decode('utf-8'))
+
     def do_GET(self):
-        if self.path == '/' or self.path == '/index.html':
+        path = self.path.split('?')[0]
+        if path == '/' or path == '/index.html':
             self.send_response(200)
             self.send_header('Content-type', 'text/html; charset=utf-8')
             self.end_headers()
             self.wfile.write(HTML_TEMPLATE.encode('utf-8'))
+        elif path == '/api/jobs':
+            self._send_json({'jobs': self.api.list_jobs(), 'cache_hits': self.api.cache_hits})
+        elif path.startswith('/api/jobs/'):
+            parts = path[len('/api/jobs/'):].strip('/').split('/')
+            job = self.api.get(parts[0])
+            if job is None:
+                self._send_json({'success': False, 'message': 'Unknown job'}, 404)
+            elif len(parts) == 2 and parts[1] == 'events':
+                self._stream_events(job)
+            else:
+                self._send_json(job.summary())
         else:
             super().do_GET()
-    
+
     def do_POST(self):
-        if self.path == '/api/backtest':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            params = json.loads(post_data.decode('utf-8'))
-            
-            api = BacktesterAPI()
-            results = api.run_backtest(params)
-            
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(results).encode('utf-8'))
-        else:
-            self.send_response(404)
-            self.end_headers()
-    
+        try:
+            if self.path == '/api/backtest':
+                self._send_json(self.api.submit(self._read_json()), 202)
+            elif self.path == '/api/sweep':
+                body = self._read_json()
+                self._send_json(self.api.sweep(body.get('base', {}), body.get('grid', {})), 202)
+            else:
+                self.send_response(404)
+                self.end_headers()
+        except (ValueError, TypeError) as e:
+            self._send_json({'success': False, 'message': str(e)}, 400)
+
+    def _stream_events(self, job: Job):
+        """SSE: replay the job's events, then follow it until done/error"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        # Reconnecting EventSource resumes after the last id it saw
+        last_id = self.headers.get('Last-Event-ID')
+        index = int(last_id) + 1 if last_id and last_id.isdigit() else 0
+        try:
+            while True:
+                events = self.api.wait_events(job, index, SSE_KEEPALIVE_SEC)
+                if not events:
+                    if job.finished:
+                        break
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                for event, data in events:
+                    self.wfile.write(
+                        f"id: {index}\nevent: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+                    )
+                    index += 1
+                self.wfile.flush()
+                if events[-1][0] in ('done', 'error'):
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client went away - the job keeps running
+
     def log_message(self, format, *args):
         """Suppress default logging"""
         pass
 
 
-def run_server(port: int = 8080):
-    """Run the backtester web server"""
-    server = HTTPServer(('0.0.0.0', port), BacktesterHandler)
-    print(f"🌐 Backtester UI running at http://localhost:{port}")
+def run_server(port: int = 8080, workers: int = None):
+    """Run the backtester web server (one thread per request, backtests in a process pool)"""
+    BacktesterHandler.api = BacktesterAPI(workers)
+    server = ThreadingHTTPServer(('0.0.0.0', port), BacktesterHandler)
+    print(f"🌐 Backtester UI running at http://localhost:{port} ({BacktesterHandler.api.workers} workers)")
     print("Press Ctrl+C to stop")
     
     try:
@@ -531,7 +887,10 @@ def run_server(port: int = 8080):
     except KeyboardInterrupt:
         print("\n🛑 Server stopped")
         server.shutdown()
+        BacktesterHandler.api.shutdown()
 
 
 if __name__ == "__main__":
-    run_server()
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    run_server(port, workers)
@@ -0,0 +1,237 @@
+"""
+Candle Cache - cache OHLCV กลางของทั้ง process (AgentA, Scanner, Charts, Telegram ใช้ร่วมกัน)
+- Key: (venue, market type, market id, timeframe) → 'BTC/USDT' บน binance (defaultType=future)
+  กับ 'BTC/USDT:USDT' บน binanceusdm ใช้ entry เดียวกัน (AgentA + Scanner แชร์กันได้)
+- แท่งที่ปิดแล้วไม่เปลี่ยน → ใช้ได้จนถึงเวลาปิดแท่งถัดไป (TTL = bar close)
+- max_age: ถ้าต้องการราคาแท่งปัจจุบันที่สดกว่า → ดึงเฉพาะแท่งท้าย (limit เล็ก) มา patch
+- ผู้เรียกพร้อมกันบน key เดียวกัน → ยิง REST ครั้งเดียว (request coalescing)
+- จำกัดจำนวน key ด้วย LRU
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+# ccxt clients that serve the same markets
+VENUE_ALIASES = {'binanceusdm': 'binance'}
+
+
+def timeframe_ms(timeframe: str) -> int:
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    return int(timeframe[:-1]) * units[timeframe[-1]] * 1000
+
+
+def market_id(symbol: str) -> str:
+    """'BTC/USDT' / 'BTC/USDT:USDT' → 'BTCUSDT'"""
+    return symbol.split(':')[0].replace('/', '').upper()
+
+
+def cache_key(exchange, symbol: str, timeframe: str) -> Tuple[str, str, str, str]:
+    """
+    (venue, 'swap' | 'spot', market id, timeframe)
+    Linear perpetual = settled symbol ('X/USDT:USDT'), a binanceusdm client, or a
+    client with defaultType future/swap (ccxt resolves 'X/USDT' to the perpetual there)
+    """
+    exchange_id = getattr(exchange, 'id', 'exchange')
+    options = getattr(exchange, 'options', None) or {}
+    linear = (':' in symbol or exchange_id == 'binanceusdm'
+              or options.get('defaultType') in ('future', 'swap'))
+    return (VENUE_ALIASES.get(exchange_id, exchange_id), 'swap' if linear else 'spot',
+            market_id(symbol), timeframe)
+
+
+@dataclass
+class _Entry:
+    rows: List[list]                 # [ts_ms, o, h, l, c, v] ascending
+    fetched_at: float                # time.time() of last sync
+    capacity: int                    # Max rows kept (largest limit requested)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0          # Full fetch
+    refreshes: int = 0       # Small tail fetch (new/in-progress candles only)
+    coalesced: int = 0       # Waited for another caller's fetch
+    evictions: int = 0
+    rest_calls: int = 0
+    by_key: Dict[str, int] = field(default_factory=dict)  # REST calls per key
+
+    @property
+    def requests(self) -> int:
+        return self.hits + self.misses + self.refreshes + self.coalesced
+
+    @property
+    def saved_calls(self) -> int:
+        return self.hits + self.coalesced
+
+    @property
+    def hit_rate(self) -> float:
+        return self.saved_calls / self.requests if self.requests else 0.0
+
+
+class CandleCache:
+    """Thread-safe OHLCV cache with bar-close TTL, coalescing and LRU eviction"""
+
+    def __init__(self, max_entries: int = 64, grace_sec: float = 2.0):
+        self.max_entries = max_entries
+        self.grace_ms = int(grace_sec * 1000)  # Exchange needs a moment to publish the new bar
+        self.stats = CacheStats()
+        self._entries: 'OrderedDict[Tuple, _Entry]' = OrderedDict()
+        self._inflight: Dict[Tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PUBLIC
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def fetch_ohlcv(self, exchange, symbol: str, timeframe: str = '5m', limit: int = 500,
+                    max_age: float = None) -> List[list]:
+        """
+        Drop-in for exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+        max_age (sec): refresh the in-progress candle if the copy is older than this
+        """
+        key = cache_key(exchange, symbol, timeframe)
+        tf_ms = timeframe_ms(timeframe)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                action = self._plan(entry, limit, tf_ms, max_age)
+                if action == 'hit':
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return [list(r) for r in entry.rows[-limit:]]
+
+                event = self._inflight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key] = event
+                    break
+
+            # Another thread is fetching this key - wait and re-check
+            event.wait()
+            with self._lock:
+                self.stats.coalesced += 1
+                entry = self._entries.get(key)
+                if entry is not None and len(entry.rows) >= limit:
+                    self._entries.move_to_end(key)
+                    return [list(r) for r in entry.rows[-limit:]]
+
+        try:
+            rows = self._sync(exchange, symbol, key, entry, action, limit, tf_ms)
+            return [list(r) for r in rows[-limit:]]
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def fetch_df(self, exchange, symbol: str, timeframe: str = '5m', limit: int = 500,
+                 max_age: float = None) -> pd.DataFrame:
+        """Cached candles as a DataFrame indexed by timestamp (a fresh copy per call)"""
+        rows = self.fetch_ohlcv(exchange, symbol, timeframe, limit, max_age)
+        df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df.set_index('timestamp', inplace=True)
+        return df
+
+    def is_fresh(self, exchange, symbol: str, timeframe: str = '5m', limit: int = 500,
+                 max_age: float = None) -> bool:
+        """True if fetch_ohlcv would be served without a REST call"""
+        key = cache_key(exchange, symbol, timeframe)
+        with self._lock:
+            return self._plan(self._entries.get(key), limit, timeframe_ms(timeframe), max_age) == 'hit'
+
+    def invalidate(self, symbol: str = None, timeframe: str = None):
+        """Drop cached entries (all, or matching symbol/timeframe - any spelling of the symbol)"""
+        sid = market_id(symbol) if symbol is not None else None
+        with self._lock:
+            for key in list(self._entries):
+                if (sid is None or key[2] == sid) and (timeframe is None or key[3] == timeframe):
+                    del self._entries[key]
+
+    def summary(self) -> str:
+        """Short text for Telegram / logs"""
+        s = self.stats
+        return (f"🗄️ Candle cache: {len(self._entries)}/{self.max_entries} keys | "
+                f"hits {s.hits} | coalesced {s.coalesced} | refresh {s.refreshes} | "
+                f"miss {s.misses} | REST {s.rest_calls} | saved {s.saved_calls} "
+                f"({s.hit_rate*100:.0f}%) | evicted {s.evictions}")
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # INTERNAL
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _plan(self, entry: Optional[_Entry], limit: int, tf_ms: int, max_age: float) -> str:
+        """'hit' | 'refresh' (tail only) | 'miss' (full fetch)"""
+        if entry is None or not entry.rows or len(entry.rows) < limit:
+            return 'miss'
+        now_ms = int(time.time() * 1000)
+        bar_close = entry.rows[-1][0] + tf_ms + self.grace_ms
+        if now_ms < bar_close and (max_age is None or time.time() - entry.fetched_at <= max_age):
+            return 'hit'
+        # Too many bars missed → a full fetch is as cheap
+        missing = (now_ms - entry.rows[-1][0]) // tf_ms + 1
+        return 'refresh' if missing < min(limit, 1000) else 'miss'
+
+    def _sync(self, exchange, symbol: str, key: Tuple, entry: Optional[_Entry], action: str,
+              limit: int, tf_ms: int) -> List[list]:
+        timeframe = key[3]
+        if action == 'refresh':
+            missing = (int(time.time() * 1000) - entry.rows[-1][0]) // tf_ms + 1
+            new_rows = exchange.fetch_ohlcv(symbol, timeframe, limit=int(missing) + 1)
+            rows = self._merge(entry.rows, new_rows)
+            capacity = max(entry.capacity, limit)
+        else:
+            rows = exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            capacity = max(limit, entry.capacity if entry else 0)
+
+        rows = rows[-capacity:]
+        with self._lock:
+            if action == 'refresh':
+                self.stats.refreshes += 1
+            else:
+                self.stats.misses += 1
+            self.stats.rest_calls += 1
+            name = f"{key[2]} {timeframe}"
+            self.stats.by_key[name] = self.stats.by_key.get(name, 0) + 1
+
+            if rows:
+                self._entries[key] = _Entry(rows=rows, fetched_at=time.time(), capacity=capacity)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats.evictions += 1
+        return rows
+
+    @staticmethod
+    def _merge(old: List[list], new: List[list]) -> List[list]:
+        """Replace rows with the same open time (in-progress candle), append newer ones"""
+        if not new:
+            return old
+        first_new = new[0][0]
+        keep = len(old)
+        while keep > 0 and old[keep - 1][0] >= first_new:
+            keep -= 1
+        return old[:keep] + [list(r) for r in new]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PROCESS-WIDE INSTANCE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+_default_cache: Optional[CandleCache] = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> CandleCache:
+    """Shared cache for the whole process"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = CandleCache()
+        return _default_cache
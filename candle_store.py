@@ -0,0 +1,272 @@
+"""
+Candle Store - ring buffer ขนาดคงที่ต่อ symbol/timeframe (NumPy arrays แบบ columnar)
+- เก็บ timestamp/open/high/low/close/volume เป็น array ต่อเนื่อง (ไม่สร้าง DataFrame ทุกรอบ)
+- append แท่งใหม่ / เขียนทับแท่งล่าสุด (in-progress candle) แบบ O(1)
+- to_frame(): ส่งออกเป็น DataFrame แบบ zero-copy (read-only view) เฉพาะตอนที่ต้องใช้ pandas
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class CandleBuffer:
+    """
+    Fixed-capacity OHLCV buffer
+    Storage is 2x capacity and the live window is folded back to the start when the
+    end is reached, so the last `capacity` candles are always one contiguous slice
+    (amortized O(1) append, zero-copy views)
+    """
+
+    def __init__(self, capacity: int = 1500, timeframe_ms: int = None):
+        self.capacity = capacity
+        self.timeframe_ms = timeframe_ms        # Gap detection (None = trust the caller)
+        self._ts = np.zeros(2 * capacity, dtype=np.int64)
+        self._data = np.zeros((len(FIELDS), 2 * capacity), dtype=np.float64)
+        self._start = 0
+        self._end = 0
+        self.lock = threading.Lock()            # Held by CandleStore while merging
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        """Open time (ms) of the newest candle"""
+        return int(self._ts[self._end - 1]) if len(self) else None
+
+    @property
+    def first_timestamp(self) -> Optional[int]:
+        return int(self._ts[self._start]) if len(self) else None
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # WRITE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def clear(self):
+        self._start = self._end = 0
+
+    def reserve(self, capacity: int):
+        """Grow the buffer (keeps the current candles)"""
+        if capacity <= self.capacity:
+            return
+        n = len(self)
+        ts = np.zeros(2 * capacity, dtype=np.int64)
+        data = np.zeros((len(FIELDS), 2 * capacity), dtype=np.float64)
+        ts[:n] = self._ts[self._start:self._end]
+        data[:, :n] = self._data[:, self._start:self._end]
+        self._ts, self._data, self.capacity = ts, data, capacity
+        self._start, self._end = 0, n
+
+    def _make_room(self, count: int):
+        """Fold the window back to index 0 so `count` more candles fit"""
+        if self._end + count <= len(self._ts):
+            return
+        keep = min(len(self), self.capacity - count)
+        src = slice(self._end - keep, self._end)
+        self._ts[:keep] = self._ts[src]
+        self._data[:, :keep] = self._data[:, src]
+        self._start, self._end = 0, keep
+
+    def append(self, ts: int, o: float, h: float, l: float, c: float, v: float) -> bool:
+        """
+        Add one candle; same open time as the last one → overwrite (in-progress update)
+        Returns True when a new bar was added
+        """
+        ts = int(ts)
+        last = self.last_timestamp
+        if last is not None:
+            if ts == last:
+                self._data[:, self._end - 1] = (o, h, l, c, v)
+                return False
+            if ts < last:
+                return False  # Older than what we hold - already final
+            if self.timeframe_ms and ts - last > self.timeframe_ms:
+                self.clear()  # Gap - window would not be continuous
+
+        self._make_room(1)
+        self._ts[self._end] = ts
+        self._data[:, self._end] = (o, h, l, c, v)
+        self._end += 1
+        if len(self) > self.capacity:
+            self._start += 1
+        return True
+
+    def extend(self, rows) -> int:
+        """
+        Merge ccxt rows [[ts, o, h, l, c, v], ...] (ascending)
+        Overlap with the held window is overwritten, newer rows are appended;
+        rows reaching further back than the window (or after a gap) reload it
+        Returns the number of new bars
+        """
+        arr = np.asarray(rows, dtype=np.float64)
+        if arr.ndim != 2 or len(arr) == 0:
+            return 0
+        ts = arr[:, 0].astype(np.int64)
+
+        last = self.last_timestamp
+        reload = (
+            last is None
+            or ts[0] < self.first_timestamp
+            or (self.timeframe_ms and ts[0] - last > self.timeframe_ms)
+        )
+        if reload:
+            self.clear()
+            new = arr
+        else:
+            # Overlapping candles are rewritten (the exchange has the final values)
+            i = int(np.searchsorted(ts, last, side='right'))
+            if i:
+                held = self._ts[self._start:self._end]
+                pos = np.searchsorted(held, ts[:i])
+                match = held[np.minimum(pos, len(held) - 1)] == ts[:i]
+                self._data[:, self._start + pos[match]] = arr[:i][match, 1:].T
+            new = arr[i:]
+
+        if len(new) == 0:
+            return 0
+        if len(new) >= self.capacity:
+            self.clear()
+            new = new[-self.capacity:]
+
+        n = len(new)
+        self._make_room(n)
+        self._ts[self._end:self._end + n] = new[:, 0].astype(np.int64)
+        self._data[:, self._end:self._end + n] = new[:, 1:].T
+        self._end += n
+        self._start = max(self._start, self._end - self.capacity)
+        return len(arr) if reload else n
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # READ (views - valid until the next write)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _window(self, limit: int = None) -> slice:
+        start = self._start if limit is None else max(self._start, self._end - limit)
+        return slice(start, self._end)
+
+    def timestamps(self, limit: int = None) -> np.ndarray:
+        view = self._ts[self._window(limit)]
+        view.flags.writeable = False
+        return view
+
+    def column(self, name: str, limit: int = None) -> np.ndarray:
+        """Read-only view of one field: buffer.column('close')"""
+        view = self._data[FIELDS.index(name), self._window(limit)]
+        view.flags.writeable = False
+        return view
+
+    def last(self) -> Optional[Dict[str, float]]:
+        """Newest candle as plain floats (no pandas)"""
+        if not len(self):
+            return None
+        row = self._data[:, self._end - 1]
+        out = {'timestamp': self.last_timestamp}
+        out.update(zip(FIELDS, row.tolist()))
+        return out
+
+    def to_rows(self, limit: int = None) -> List[list]:
+        """Copy out as ccxt-style rows"""
+        window = self._window(limit)
+        return np.column_stack([self._ts[window].astype(np.float64), self._data[:, window].T]).tolist()
+
+    def to_frame(self, limit: int = None, copy: bool = False) -> pd.DataFrame:
+        """
+        DataFrame indexed by timestamp
+        copy=False shares memory with the buffer: columns are read-only and change on
+        the next write - pass copy=True for a frame that is kept or modified in place
+        """
+        window = self._window(limit)
+        values = self._data[:, window].T
+        index = self._ts[window].astype('datetime64[ms]')  # Always copied - an index must not change
+        if copy:
+            values = values.copy()
+        else:
+            values = values.view()
+            values.flags.writeable = False
+        return pd.DataFrame(
+            values, columns=list(FIELDS),
+            index=pd.DatetimeIndex(index, name='timestamp'), copy=False
+        )
+
+
+class CandleStore:
+    """One CandleBuffer per (symbol, timeframe)"""
+
+    def __init__(self, capacity: int = 1500):
+        self.capacity = capacity
+        self._buffers: Dict[Tuple[str, str], CandleBuffer] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, timeframe: str, capacity: int = None) -> CandleBuffer:
+        key = (symbol, timeframe)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = CandleBuffer(max(self.capacity, capacity or 0), _timeframe_ms(timeframe))
+                self._buffers[key] = buffer
+            elif capacity:
+                buffer.reserve(capacity)
+            return buffer
+
+    def ingest(self, symbol: str, timeframe: str, rows) -> CandleBuffer:
+        """Merge ccxt rows and return the buffer"""
+        buffer = self.get(symbol, timeframe, len(rows))
+        with buffer.lock:
+            buffer.extend(rows)
+        return buffer
+
+    def frame(self, symbol: str, timeframe: str, rows, copy: bool = False) -> pd.DataFrame:
+        """
+        Drop-in for pd.DataFrame(rows) + to_datetime + set_index:
+        merges the rows and returns the same number of candles as a view
+        """
+        if len(rows) == 0:
+            return pd.DataFrame()
+        buffer = self.get(symbol, timeframe, len(rows))
+        with buffer.lock:
+            buffer.extend(rows)
+            return buffer.to_frame(len(rows), copy=copy)
+
+    def symbols(self) -> List[Tuple[str, str]]:
+        return list(self._buffers)
+
+
+def _timeframe_ms(timeframe: str) -> Optional[int]:
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    try:
+        return int(timeframe[:-1]) * units[timeframe[-1]] * 1000
+    except (KeyError, ValueError, IndexError):
+        return None
+
+
+# For testing: python candle_store.py
+if __name__ == "__main__":
+    import time
+
+    n = 500
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, n + 2000))
+    rows = [[i * 60000, c, c + 0.1, c - 0.1, c, 1.0] for i, c in enumerate(close)]
+
+    store = CandleStore(capacity=n)
+    t0 = time.perf_counter()
+    for i in range(n, len(rows)):
+        store.frame('BTC/USDT', '1m', rows[i - n:i + 1])
+    t_store = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(n, len(rows)):
+        df = pd.DataFrame(rows[i - n:i + 1], columns=['timestamp', *FIELDS])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df.set_index('timestamp', inplace=True)
+    t_pandas = time.perf_counter() - t0
+
+    buffer = store.get('BTC/USDT', '1m')
+    print(f"📦 {len(buffer)} candles, last close {buffer.last()['close']:.2f}")
+    print(f"⏱️ CandleStore {t_store * 1000:.0f}ms vs DataFrame per cycle {t_pandas * 1000:.0f}ms "
+          f"({len(rows) - n} cycles)")
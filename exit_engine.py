@@ -0,0 +1,142 @@
+"""
+Exit Engine - หาแท่งแรกที่ราคาแตะ SL/TP ของทุก entry พร้อมกัน (ไม่ต้องวน .iloc ทีละแท่ง)
+- Sparse table ของ high (range max) / low (range min): สร้าง O(n log n) ครั้งเดียวต่อ series
+- First touch ด้วย binary lifting: O(log n) ต่อ entry ทำพร้อมกันทุก entry ด้วย NumPy
+- กติกาเดิม: SL และ TP โดนในแท่งเดียวกัน → นับเป็น SL
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass
+class ExitBatch:
+    """Exit for each entry (same order as the entries passed in)"""
+    hit: np.ndarray         # bool - closed inside the window
+    is_tp: np.ndarray       # bool - TP (False = SL, only meaningful where hit)
+    exit_idx: np.ndarray    # Bar index of the exit (window end where not hit)
+    bars: np.ndarray        # exit_idx - entry_idx
+
+
+class RangeExtrema:
+    """Sparse table: max/min of any [start, start + 2^k) block in O(1)"""
+
+    def __init__(self, values: np.ndarray, mode: str = 'max'):
+        values = np.asarray(values, dtype=np.float64)
+        op = np.maximum if mode == 'max' else np.minimum
+        # NaN never counts as a touch
+        fill = -np.inf if mode == 'max' else np.inf
+        self.levels = [np.where(np.isnan(values), fill, values)]
+        width = 1
+        while width * 2 <= len(values):
+            prev = self.levels[-1]
+            self.levels.append(op(prev[:-width], prev[width:]))
+            width *= 2
+        self.mode = mode
+        self.n = len(values)
+
+    def first_touch(self, starts: np.ndarray, ends: np.ndarray, levels: np.ndarray) -> np.ndarray:
+        """
+        First j in [start, end) with value >= level (mode='max') or <= level (mode='min')
+        Returns `end` where the level is never touched
+        """
+        pos = np.asarray(starts, dtype=np.int64).copy()
+        ends = np.minimum(np.asarray(ends, dtype=np.int64), self.n)
+        levels = np.asarray(levels, dtype=np.float64)
+        if len(pos) == 0:
+            return pos
+
+        # Skip the longest untouched prefix, largest blocks first
+        for k in range(len(self.levels) - 1, -1, -1):
+            width = 1 << k
+            table = self.levels[k]
+            can = pos + width <= ends
+            if not can.any():
+                continue
+            idx = np.where(can, pos, 0)
+            block = table[np.minimum(idx, len(table) - 1)]
+            if self.mode == 'max':
+                clear = block < levels
+            else:
+                clear = block > levels
+            pos = np.where(can & clear, pos + width, pos)
+        return np.minimum(pos, ends)
+
+
+class ExitEngine:
+    """First SL/TP touch for many entries on one OHLC series"""
+
+    def __init__(self, high, low):
+        self.high_max = RangeExtrema(high, 'max')
+        self.low_min = RangeExtrema(low, 'min')
+        self.n = self.high_max.n
+
+    def resolve(self, entry_idx, is_long, entry_price, sl_pct: float, tp_pct: float,
+                horizon: int = None) -> ExitBatch:
+        """
+        Scan bars entry+1 .. min(entry + horizon, n) - 1 (whole series when horizon is None)
+        SL wins when SL and TP are touched in the same bar
+        """
+        entry_idx = np.asarray(entry_idx, dtype=np.int64)
+        is_long = np.asarray(is_long, dtype=bool)
+        entry_price = np.asarray(entry_price, dtype=np.float64)
+
+        starts = entry_idx + 1
+        ends = np.full(len(entry_idx), self.n, dtype=np.int64)
+        if horizon is not None:
+            ends = np.minimum(entry_idx + horizon, self.n)
+
+        sl_long, tp_long = entry_price * (1 - sl_pct), entry_price * (1 + tp_pct)
+        sl_short, tp_short = entry_price * (1 + sl_pct), entry_price * (1 - tp_pct)
+
+        # Long: TP above / SL below - short: SL above / TP below
+        above = self.high_max.first_touch(starts, ends, np.where(is_long, tp_long, sl_short))
+        below = self.low_min.first_touch(starts, ends, np.where(is_long, sl_long, tp_short))
+        sl_at = np.where(is_long, below, above)
+        tp_at = np.where(is_long, above, below)
+
+        exit_idx = np.minimum(sl_at, tp_at)
+        hit = exit_idx < ends
+        is_tp = hit & (tp_at < sl_at)
+        return ExitBatch(hit=hit, is_tp=is_tp, exit_idx=exit_idx, bars=exit_idx - entry_idx)
+
+
+# For testing: python exit_engine.py
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    n = 20000
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    high = close * (1 + np.abs(rng.normal(0, 0.002, n)))
+    low = close * (1 - np.abs(rng.normal(0, 0.002, n)))
+    entries = np.sort(rng.choice(n - 1, 3000, replace=False))
+    is_long = rng.random(len(entries)) < 0.5
+
+    t0 = time.perf_counter()
+    batch = ExitEngine(high, low).resolve(entries, is_long, close[entries], 0.01, 0.015)
+    t_vec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    mismatch = 0
+    for k, i in enumerate(entries):
+        e = close[i]
+        sl, tp = (e * 0.99, e * 1.015) if is_long[k] else (e * 1.01, e * 0.985)
+        found = None
+        for j in range(i + 1, n):
+            if is_long[k]:
+                if low[j] <= sl:
+                    found = (j, False); break
+                if high[j] >= tp:
+                    found = (j, True); break
+            else:
+                if high[j] >= sl:
+                    found = (j, False); break
+                if low[j] <= tp:
+                    found = (j, True); break
+        got = (int(batch.exit_idx[k]), bool(batch.is_tp[k])) if batch.hit[k] else None
+        mismatch += got != found
+    t_loop = time.perf_counter() - t0
+
+    print(f"🎯 {len(entries)} entries, {int(batch.hit.sum())} closed, mismatches: {mismatch}")
+    print(f"⏱️ vectorized {t_vec * 1000:.1f}ms vs bar loop {t_loop * 1000:.0f}ms")
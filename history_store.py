@@ -0,0 +1,389 @@
+"""
+History Store - ดาวน์โหลด OHLCV ย้อนหลังแบบแบ่งหน้า (since) + cache บนดิสก์
+- Exchange จำกัด 1000-1500 แท่งต่อ request → วนดึงทีละหน้าจนครบช่วงที่ขอ
+- เก็บเป็น partition รายเดือนต่อ symbol/timeframe (Parquet หรือ NumPy .npy)
+- รันครั้งถัดไปดึงเฉพาะแท่งที่ขาด (tail) / อ่าน offline ได้
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401 - parquet engine
+    PARQUET_AVAILABLE = True
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        PARQUET_AVAILABLE = True
+    except ImportError:
+        PARQUET_AVAILABLE = False
+
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history')
+
+
+def timeframe_ms(timeframe: str) -> int:
+    """'1m' → 60000, '5m' → 300000, '1h' → 3600000 ..."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000}
+    return int(timeframe[:-1]) * units[timeframe[-1]] * 1000
+
+
+class HistoryStore:
+    """
+    Per-symbol/timeframe OHLCV cache
+    Layout: <root>/<exchange>/<SYMBOL>/<timeframe>/YYYY-MM.parquet|.npy + meta.json
+    """
+
+    PAGE_LIMIT = 1500        # Binance futures max per request
+    FLUSH_EVERY_PAGES = 20   # Write partitions during long downloads (resumable)
+
+    def __init__(self, exchange=None, root: str = DEFAULT_ROOT,
+                 exchange_id: str = None, fmt: str = None):
+        self.exchange = exchange
+        self.root = root
+        self.exchange_id = exchange_id or (exchange.id if exchange is not None else 'binanceusdm')
+        self.fmt = fmt or ('parquet' if PARQUET_AVAILABLE else 'npy')
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PATHS / META
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _safe_symbol(symbol: str) -> str:
+        return symbol.replace('/', '_').replace(':', '_')
+
+    def _dir(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, self.exchange_id, self._safe_symbol(symbol), timeframe)
+
+    def _meta_path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self._dir(symbol, timeframe), 'meta.json')
+
+    def _load_meta(self, symbol: str, timeframe: str) -> Dict:
+        path = self._meta_path(symbol, timeframe)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass
+        return {}
+
+    def _save_meta(self, symbol: str, timeframe: str, meta: Dict):
+        path = self._meta_path(symbol, timeframe)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, path)
+
+    def symbols(self) -> List[str]:
+        """Symbols cached for this exchange (original ccxt names from meta.json)"""
+        base = os.path.join(self.root, self.exchange_id)
+        if not os.path.isdir(base):
+            return []
+        result = []
+        for name in sorted(os.listdir(base)):
+            for tf in sorted(os.listdir(os.path.join(base, name))):
+                meta_path = os.path.join(base, name, tf, 'meta.json')
+                if os.path.exists(meta_path):
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        symbol = json.load(f).get('symbol', name)
+                    if symbol not in result:
+                        result.append(symbol)
+        return result
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PARTITIONS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _partition_files(self, symbol: str, timeframe: str) -> List[str]:
+        d = self._dir(symbol, timeframe)
+        if not os.path.isdir(d):
+            return []
+        return sorted(
+            os.path.join(d, f) for f in os.listdir(d)
+            if f.endswith('.parquet') or f.endswith('.npy')
+        )
+
+    @staticmethod
+    def _read_partition(path: str) -> np.ndarray:
+        """Partition → (n, 6) float64 array [ts_ms, o, h, l, c, v]"""
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)[COLUMNS].to_numpy(dtype=np.float64)
+        return np.load(path, mmap_mode='r')
+
+    def _write_partition(self, path: str, data: np.ndarray):
+        tmp = path + '.tmp'
+        if path.endswith('.parquet'):
+            pd.DataFrame(data, columns=COLUMNS).to_parquet(tmp, index=False)
+        else:
+            with open(tmp, 'wb') as f:
+                np.save(f, data)
+        os.replace(tmp, path)
+
+    def _merge_rows(self, symbol: str, timeframe: str, rows: np.ndarray):
+        """Merge new candles into their monthly partitions (dedupe by timestamp)"""
+        if len(rows) == 0:
+            return
+        d = self._dir(symbol, timeframe)
+        os.makedirs(d, exist_ok=True)
+
+        months = pd.to_datetime(rows[:, 0], unit='ms').strftime('%Y-%m').to_numpy()
+        for month in np.unique(months):
+            new = rows[months == month]
+            path = os.path.join(d, f'{month}.{self.fmt}')
+            other = os.path.join(d, f'{month}.{"npy" if self.fmt == "parquet" else "parquet"}')
+            existing = [self._read_partition(p) for p in (path, other) if os.path.exists(p)]
+            merged = np.concatenate(existing + [new]) if existing else new
+            # Keep the newest copy of each timestamp
+            _, idx = np.unique(merged[::-1, 0], return_index=True)
+            merged = merged[::-1][idx]
+            self._write_partition(path, np.ascontiguousarray(merged))
+            if os.path.exists(other):
+                os.remove(other)
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # READ (OFFLINE)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def load(self, symbol: str, timeframe: str, since: datetime = None,
+             until: datetime = None) -> pd.DataFrame:
+        """Read cached candles (no network) - index = timestamp"""
+        since_ms = int(pd.Timestamp(since).timestamp() * 1000) if since is not None else None
+        until_ms = int(pd.Timestamp(until).timestamp() * 1000) if until is not None else None
+        since_month = pd.Timestamp(since).strftime('%Y-%m') if since is not None else None
+        until_month = pd.Timestamp(until).strftime('%Y-%m') if until is not None else None
+
+        arrays = []
+        for path in self._partition_files(symbol, timeframe):
+            month = os.path.basename(path).split('.')[0]
+            if since_month and month < since_month:
+                continue
+            if until_month and month > until_month:
+                break
+            arrays.append(np.asarray(self._read_partition(path)))
+
+        if not arrays:
+            df = pd.DataFrame(columns=COLUMNS[1:], dtype=np.float64)
+            df.index = pd.DatetimeIndex([], name='timestamp')
+            return df
+
+        data = np.concatenate(arrays)
+        mask = np.ones(len(data), dtype=bool)
+        if since_ms is not None:
+            mask &= data[:, 0] >= since_ms
+        if until_ms is not None:
+            mask &= data[:, 0] < until_ms
+        data = data[mask]
+
+        df = pd.DataFrame(data[:, 1:], columns=COLUMNS[1:])
+        df.index = pd.DatetimeIndex(pd.to_datetime(data[:, 0].astype(np.int64), unit='ms'), name='timestamp')
+        return df
+
+    def iter_partitions(self, symbol: str, timeframe: str, since_ms: int = None):
+        """
+        Yield cached candles one monthly partition at a time as (n, 6) arrays
+        (lazy - only one month is in memory; .npy partitions are memory-mapped)
+        """
+        since_month = (pd.Timestamp(since_ms, unit='ms').strftime('%Y-%m')
+                       if since_ms is not None else None)
+        for path in self._partition_files(symbol, timeframe):
+            month = os.path.basename(path).split('.')[0]
+            if since_month and month < since_month:
+                continue
+            data = self._read_partition(path)
+            if since_ms is not None and len(data) and data[-1, 0] < since_ms:
+                continue
+            yield data
+
+    def cursor(self, symbol: str, timeframe: str, since: datetime = None) -> 'SubBarCursor':
+        """Forward-only reader over cached candles (see SubBarCursor)"""
+        since_ms = int(pd.Timestamp(since).timestamp() * 1000) if since is not None else None
+        return SubBarCursor(self.iter_partitions(symbol, timeframe, since_ms))
+
+    def first_timestamp(self, symbol: str, timeframe: str) -> Optional[int]:
+        """First cached candle open time (ms) or None"""
+        for path in self._partition_files(symbol, timeframe):
+            data = self._read_partition(path)
+            if len(data):
+                return int(data[0, 0])
+        return None
+
+    def last_timestamp(self, symbol: str, timeframe: str) -> Optional[int]:
+        """Last cached candle open time (ms) or None"""
+        files = self._partition_files(symbol, timeframe)
+        for path in reversed(files):
+            data = self._read_partition(path)
+            if len(data):
+                return int(data[-1, 0])
+        return None
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # DOWNLOAD
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _fetch_range(self, symbol: str, timeframe: str, since_ms: int, until_ms: int) -> Tuple[int, bool]:
+        """
+        Page through [since_ms, until_ms) with `since`; flush partitions as we go
+        Returns (rows written, complete) - complete is False when a page fetch failed
+        """
+        step = timeframe_ms(timeframe)
+        cursor = since_ms
+        buffer: List[list] = []
+        pages = 0
+        total = 0
+        complete = True
+
+        while cursor < until_ms:
+            batch = None
+            for attempt in range(3):
+                try:
+                    batch = self.exchange.fetch_ohlcv(symbol, timeframe, since=cursor, limit=self.PAGE_LIMIT)
+                    break
+                except Exception as e:
+                    if attempt == 2:
+                        print(f"[History] {symbol} {timeframe} fetch failed at {cursor}: {e}")
+                    time.sleep(1 + attempt * 2)
+            if batch is None:
+                complete = False
+                break
+            if not batch:
+                break
+
+            # Only closed candles inside the window
+            batch = [c for c in batch if cursor <= c[0] < until_ms]
+            if not batch:
+                break
+
+            buffer.extend(batch)
+            cursor = int(batch[-1][0]) + step
+            pages += 1
+
+            if pages % self.FLUSH_EVERY_PAGES == 0:
+                self._merge_rows(symbol, timeframe, np.asarray(buffer, dtype=np.float64))
+                total += len(buffer)
+                buffer = []
+
+        if buffer:
+            self._merge_rows(symbol, timeframe, np.asarray(buffer, dtype=np.float64))
+            total += len(buffer)
+        return total, complete
+
+    def update(self, symbol: str, timeframe: str, since: datetime) -> int:
+        """
+        Make the cache cover [since, last closed candle]
+        Downloads only the missing head (older than cached) and tail (newer)
+        """
+        if self.exchange is None:
+            raise ValueError("HistoryStore has no exchange - use load() for offline reads")
+
+        step = timeframe_ms(timeframe)
+        now_ms = int(time.time() * 1000)
+        until_ms = now_ms - now_ms % step  # Open time of the in-progress candle (excluded)
+        since_ms = int(pd.Timestamp(since).timestamp() * 1000)
+        since_ms -= since_ms % step
+
+        meta = self._load_meta(symbol, timeframe)
+        covered_from = meta.get('covered_from')
+        last_ts = self.last_timestamp(symbol, timeframe)
+        fetched = 0
+
+        # Missing head: requested older data than we have ever asked for
+        # (covered_from only moves back once the whole head is on disk - a failed
+        # page leaves a gap that the next update must download again)
+        if covered_from is None or last_ts is None:
+            rows, complete = self._fetch_range(symbol, timeframe, since_ms, until_ms)
+            fetched += rows
+            # Written rows are contiguous from since_ms; the tail resumes from last_timestamp
+            covered_from = since_ms if complete else self.first_timestamp(symbol, timeframe)
+        else:
+            if since_ms < covered_from:
+                rows, complete = self._fetch_range(symbol, timeframe, since_ms, covered_from)
+                fetched += rows
+                if complete:
+                    covered_from = since_ms
+            # Missing tail
+            fetched += self._fetch_range(symbol, timeframe, last_ts + step, until_ms)[0]
+
+        self._save_meta(symbol, timeframe, {
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'covered_from': covered_from,
+            'last_timestamp': self.last_timestamp(symbol, timeframe),
+            'updated_at': datetime.now().isoformat(),
+        })
+        return fetched
+
+    def get(self, symbol: str, timeframe: str, days: float, offline: bool = False) -> pd.DataFrame:
+        """Last `days` of closed candles - syncs with the exchange unless offline"""
+        since = datetime.utcnow() - timedelta(days=days)
+        if not offline and self.exchange is not None:
+            try:
+                fetched = self.update(symbol, timeframe, since)
+                if fetched:
+                    print(f"[History] {symbol} {timeframe}: +{fetched} candles")
+            except Exception as e:
+                print(f"[History] {symbol} {timeframe} update failed, using cache: {e}")
+        return self.load(symbol, timeframe, since=since)
+
+
+class SubBarCursor:
+    """
+    Forward-only window reader over a stream of partition arrays
+    take(t0, t1) returns the candles with open time in [t0, t1); calls must move forward
+    (backtests walk bars in order, so memory stays at one partition)
+    """
+
+    def __init__(self, partitions):
+        self._partitions = iter(partitions)
+        self._data = np.empty((0, 6))
+        self._pos = 0
+
+    def _next_partition(self) -> bool:
+        for data in self._partitions:
+            if len(data):
+                self._data = data
+                self._pos = 0
+                return True
+        return False
+
+    def take(self, t0_ms: int, t1_ms: int) -> np.ndarray:
+        chunks = []
+        while True:
+            data = self._data
+            # Skip candles before the window
+            self._pos += int(np.searchsorted(data[self._pos:, 0], t0_ms, side='left'))
+            end = self._pos + int(np.searchsorted(data[self._pos:, 0], t1_ms, side='left'))
+            if end > self._pos:
+                chunks.append(np.asarray(data[self._pos:end]))
+            self._pos = end
+            # Window continues into the next partition?
+            if self._pos < len(data) or not self._next_partition():
+                break
+            if self._data[0, 0] >= t1_ms:
+                break
+        if not chunks:
+            return np.empty((0, 6))
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+# For testing: python history_store.py SYMBOL TIMEFRAME DAYS
+if __name__ == "__main__":
+    import sys
+    import ccxt
+
+    symbol = sys.argv[1] if len(sys.argv) > 1 else 'BTC/USDT:USDT'
+    timeframe = sys.argv[2] if len(sys.argv) > 2 else '1m'
+    days = float(sys.argv[3]) if len(sys.argv) > 3 else 30
+
+    store = HistoryStore(ccxt.binanceusdm({'enableRateLimit': True}))
+    t0 = time.time()
+    df = store.get(symbol, timeframe, days)
+    print(f"📊 {symbol} {timeframe}: {len(df)} candles in {time.time() - t0:.1f}s")
+    if len(df):
+        print(f"   {df.index[0]} → {df.index[-1]}")
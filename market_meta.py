@@ -0,0 +1,256 @@
+"""
+Market Meta - cache markets ของ exchange + ค่าตั้งต่อ symbol (leverage / margin mode) ลงดิสก์
+- load_markets() ของ binanceusdm คือ JSON หลาย MB → โหลดจากไฟล์แทนถ้ายังไม่หมดอายุ (TTL)
+- precision / min amount / min notional อ่านจาก cache ได้ทันที
+- จำ leverage / margin mode ที่ตั้งไว้แล้วต่อ symbol → ไม่ยิง signed request ซ้ำทุก trade
+- Error code ของ exchange (symbol หาย, precision ผิด, leverage ไม่ตรง) → invalidate อัตโนมัติ
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'markets')
+MARKETS_TTL_SEC = 24 * 3600      # Listings / filters change rarely
+SETTINGS_TTL_SEC = 6 * 3600      # Leverage can also be changed from the web UI
+
+# Binance error code → what it makes stale
+# (per-order sizing rejections such as -4003 / -4164 say nothing about the metadata)
+INVALIDATE_CODES = {
+    -1121: 'markets',    # Invalid symbol (delisted / renamed)
+    -1111: 'markets',    # Precision is over the maximum defined for this asset
+    -1013: 'markets',    # Filter failure (LOT_SIZE / PRICE_FILTER changed)
+    -4028: 'leverage',   # Leverage is not valid
+    -2027: 'leverage',   # Exceeded the maximum allowable position at current leverage
+    -4047: 'margin',     # Margin type cannot be changed with open orders
+    -4048: 'margin',     # Margin type cannot be changed with an open position
+}
+ALREADY_SET_CODES = {-4046: 'margin'}  # "No need to change margin type."
+_CODE_RE = re.compile(r'"code"\s*:\s*(-?\d+)')
+
+
+def error_code(error) -> Optional[int]:
+    """Exchange error code from a ccxt exception message ('binanceusdm {"code":-4046,...}')"""
+    match = _CODE_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+class MarketMetaCache:
+    """
+    <root>/<exchange>.json                  markets + currencies (TTL = markets_ttl)
+    <root>/<exchange>-<account>.settings.json   {symbol: {leverage, margin_mode, ts}}
+    root=None → memory only (replay / tests)
+    """
+
+    def __init__(self, exchange_id: str = 'binanceusdm', root: str = DEFAULT_ROOT, account: str = '',
+                 markets_ttl: float = MARKETS_TTL_SEC, settings_ttl: float = SETTINGS_TTL_SEC):
+        self.exchange_id = exchange_id
+        self.root = root
+        self.markets_ttl = markets_ttl
+        self.settings_ttl = settings_ttl
+        # Settings are per account - the file name keeps only a hash of the API key
+        suffix = hashlib.sha1(account.encode()).hexdigest()[:10] if account else 'public'
+        self.markets_path = os.path.join(root, f"{exchange_id}.json") if root else None
+        self.settings_path = os.path.join(root, f"{exchange_id}-{suffix}.settings.json") if root else None
+
+        self.markets: Dict[str, Dict] = {}
+        self.loaded_at = 0.0
+        self.from_disk = False
+        self.settings: Dict[str, Dict] = self._read(self.settings_path) or {}
+        self._lock = threading.Lock()
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # FILES
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _read(path: Optional[str]) -> Optional[Dict]:
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path: str, data: Dict):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def _save_settings(self):
+        if not self.settings_path:
+            return
+        try:
+            self._write(self.settings_path, self.settings)
+        except OSError:
+            pass  # Cache only - the exchange is still the source of truth
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # MARKETS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _cached_markets(self) -> Optional[Dict]:
+        data = self._read(self.markets_path)
+        if not data or time.time() - data.get('saved_at', 0) > self.markets_ttl:
+            return None
+        return data
+
+    def load(self, exchange, reload: bool = False) -> Dict[str, Dict]:
+        """exchange.load_markets() from disk when fresh, otherwise fetch and persist"""
+        data = None if reload else self._cached_markets()
+        if data is not None:
+            exchange.set_markets(data['markets'], data.get('currencies') or None)
+            self.loaded_at, self.from_disk = data['saved_at'], True
+        else:
+            exchange.load_markets(True)
+            self._store(exchange)
+        self.markets = exchange.markets
+        return self.markets
+
+    async def load_async(self, exchange, reload: bool = False) -> Dict[str, Dict]:
+        """Same as load() for a ccxt.async_support exchange"""
+        data = None if reload else self._cached_markets()
+        if data is not None:
+            exchange.set_markets(data['markets'], data.get('currencies') or None)
+            self.loaded_at, self.from_disk = data['saved_at'], True
+        else:
+            await exchange.load_markets(True)
+            self._store(exchange)
+        self.markets = exchange.markets
+        return self.markets
+
+    def _store(self, exchange):
+        self.loaded_at, self.from_disk = time.time(), False
+        if not self.markets_path:
+            return
+        try:
+            self._write(self.markets_path, {
+                'exchange': self.exchange_id,
+                'saved_at': self.loaded_at,
+                'markets': exchange.markets,
+                'currencies': exchange.currencies,
+            })
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def market(self, symbol: str) -> Optional[Dict]:
+        return self.markets.get(symbol)
+
+    def precision(self, symbol: str) -> Dict:
+        """{'amount': ..., 'price': ...} as ccxt reports it"""
+        market = self.market(symbol) or {}
+        return market.get('precision') or {}
+
+    def min_amount(self, symbol: str) -> float:
+        market = self.market(symbol) or {}
+        return float(((market.get('limits') or {}).get('amount') or {}).get('min') or 0.0)
+
+    def min_notional(self, symbol: str) -> float:
+        market = self.market(symbol) or {}
+        return float(((market.get('limits') or {}).get('cost') or {}).get('min') or 0.0)
+
+    def is_stale(self) -> bool:
+        return not self.markets or time.time() - self.loaded_at > self.markets_ttl
+
+    def invalidate_markets(self):
+        """Next load() fetches from the exchange"""
+        self.loaded_at = 0.0
+        if not self.markets_path:
+            return
+        try:
+            os.remove(self.markets_path)
+        except OSError:
+            pass
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # SYMBOL SETTINGS
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _setting(self, symbol: str, key: str):
+        entry = self.settings.get(symbol) or {}
+        if time.time() - entry.get(f'{key}_ts', 0) > self.settings_ttl:
+            return None
+        return entry.get(key)
+
+    def leverage(self, symbol: str) -> Optional[int]:
+        """Leverage known to be set on the exchange (None = unknown / expired)"""
+        return self._setting(symbol, 'leverage')
+
+    def margin_mode(self, symbol: str) -> Optional[str]:
+        return self._setting(symbol, 'margin_mode')
+
+    def remember(self, symbol: str, **values):
+        """remember('BTC/USDT', leverage=20, margin_mode='cross')"""
+        now = time.time()
+        with self._lock:
+            entry = self.settings.setdefault(symbol, {})
+            for key, value in values.items():
+                entry[key] = value
+                entry[f'{key}_ts'] = now
+            self._save_settings()
+
+    def forget(self, symbol: str, *keys: str):
+        """Drop cached settings of a symbol (all when no keys given)"""
+        with self._lock:
+            if symbol not in self.settings:
+                return
+            if not keys:
+                del self.settings[symbol]
+            else:
+                for key in keys:
+                    self.settings[symbol].pop(key, None)
+                    self.settings[symbol].pop(f'{key}_ts', None)
+            self._save_settings()
+
+    def on_error(self, symbol: str, error) -> Optional[str]:
+        """
+        Invalidate what an exchange error says is wrong
+        Returns 'markets' / 'leverage' / 'margin' (what was dropped) or None
+        """
+        code = error_code(error)
+        scope = INVALIDATE_CODES.get(code)
+        if scope == 'markets':
+            self.invalidate_markets()
+        elif scope == 'leverage':
+            self.forget(symbol, 'leverage')
+        elif scope == 'margin':
+            self.forget(symbol, 'margin_mode')
+        return scope
+
+    @staticmethod
+    def already_set(error) -> bool:
+        """Error that only means the setting already has the requested value"""
+        return error_code(error) in ALREADY_SET_CODES
+
+
+def load_markets(exchange, root: str = DEFAULT_ROOT, ttl: float = MARKETS_TTL_SEC) -> MarketMetaCache:
+    """Drop-in for exchange.load_markets() in scripts (markets come from disk when fresh)"""
+    meta = MarketMetaCache(exchange.id, root=root, markets_ttl=ttl)
+    meta.load(exchange)
+    return meta
+
+
+# For testing: python market_meta.py
+if __name__ == "__main__":
+    import ccxt
+
+    for attempt in ('network / stale cache', 'disk cache'):
+        exchange = ccxt.binanceusdm()
+        t0 = time.perf_counter()
+        try:
+            meta = load_markets(exchange)
+        except Exception as e:
+            print(f"load_markets failed: {e}")
+            break
+        print(f"{attempt}: {len(exchange.markets)} markets in {(time.perf_counter() - t0) * 1000:.0f}ms "
+              f"(from_disk={meta.from_disk})")
+        print(f"  BTC/USDT:USDT precision {meta.precision('BTC/USDT:USDT')} "
+              f"min notional {meta.min_notional('BTC/USDT:USDT')}")
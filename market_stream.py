@@ -0,0 +1,422 @@
+"""
+Market Stream - Binance Futures WebSocket (kline + markPrice) แทน REST polling ทุก 60 วินาที
+- เชื่อมต่อใหม่อัตโนมัติ (exponential backoff)
+- ตรวจจับแท่งที่หายไป (kline open time กระโดด / หลุดการเชื่อมต่อ) แล้ว backfill ผ่าน REST
+- ทุก tick → on_tick(), ทุกแท่งปิด → on_candle()
+- บันทึก frames เป็น JSONL และ ReplayServer เล่นซ้ำบนเครื่อง (ทดสอบได้โดยไม่ต่อ Binance)
+
+Binance kline/markPrice streams ไม่มี update ID → ตรวจ gap จากเวลาเปิดแท่ง (kline 't')
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+
+BINANCE_FUTURES_WS = "wss://fstream.binance.com/stream"
+
+
+def stream_symbol(symbol: str) -> str:
+    """'BTC/USDT' / 'BTC/USDT:USDT' → 'btcusdt'"""
+    return symbol.split(':')[0].replace('/', '').lower()
+
+
+def timeframe_ms(timeframe: str) -> int:
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    return int(timeframe[:-1]) * units[timeframe[-1]] * 1000
+
+
+@dataclass
+class Candle:
+    """One kline (open_time in ms)"""
+    open_time: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    closed: bool = True
+    backfilled: bool = False
+
+    @classmethod
+    def from_kline(cls, k: Dict) -> 'Candle':
+        return cls(
+            open_time=int(k['t']),
+            open=float(k['o']),
+            high=float(k['h']),
+            low=float(k['l']),
+            close=float(k['c']),
+            volume=float(k['v']),
+            closed=bool(k['x']),
+        )
+
+    @classmethod
+    def from_ohlcv(cls, row: list) -> 'Candle':
+        return cls(int(row[0]), float(row[1]), float(row[2]), float(row[3]),
+                   float(row[4]), float(row[5]), closed=True, backfilled=True)
+
+
+@dataclass
+class StreamStats:
+    messages: int = 0
+    ticks: int = 0
+    candles: int = 0
+    reconnects: int = 0
+    gaps: int = 0
+    backfilled: int = 0
+    last_message_at: float = 0.0
+    started_at: float = field(default_factory=time.time)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MARKET STREAM
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class MarketStream:
+    """
+    asyncio kline + markPrice feed for one symbol
+
+    Callbacks are plain (blocking) functions; they run one at a time on a worker
+    thread so bot code (REST calls, Telegram) never blocks the socket reader.
+    Ticks are coalesced - if the worker is busy only the latest price is kept.
+    """
+
+    def __init__(self, symbol: str, timeframe: str = '5m', url: str = None,
+                 rest_exchange=None,
+                 on_tick: Callable[[float, str], None] = None,
+                 on_candle: Callable[[Candle], None] = None,
+                 mark_price: bool = True, record_path: str = None,
+                 reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0,
+                 stale_timeout: float = 30.0):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.tf_ms = timeframe_ms(timeframe)
+        self.rest_exchange = rest_exchange
+        self.on_tick = on_tick
+        self.on_candle = on_candle
+        self.record_path = record_path
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stale_timeout = stale_timeout
+
+        name = stream_symbol(symbol)
+        streams = [f"{name}@kline_{timeframe}"]
+        if mark_price:
+            streams.append(f"{name}@markPrice@1s")
+        base = url or BINANCE_FUTURES_WS
+        self.url = f"{base}?streams={'/'.join(streams)}" if base.endswith('/stream') else base
+
+        self.last_closed_open_time: Optional[int] = None  # Last delivered closed candle
+        self.last_price: float = 0.0
+        self.stats = StreamStats()
+
+        self._running = False
+        self._ws = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._record_file = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="market-stream")
+        self._events: Optional[asyncio.Queue] = None
+        self._pending_tick: Optional[tuple] = None
+        self._tick_event: Optional[asyncio.Event] = None
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PUBLIC
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    async def run(self):
+        """Connect, read and reconnect until stop()"""
+        if not WEBSOCKETS_AVAILABLE:
+            raise RuntimeError("websockets not installed (pip install websockets)")
+
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self._tick_event = asyncio.Event()
+        if self.record_path:
+            self._record_file = open(self.record_path, 'a', encoding='utf-8')
+
+        dispatcher = asyncio.create_task(self._dispatch())
+        delay = self.reconnect_delay
+        try:
+            while self._running:
+                try:
+                    async with websockets.connect(self.url, ping_interval=20, max_size=2 ** 22) as ws:
+                        self._ws = ws
+                        delay = self.reconnect_delay
+                        print(f"[Stream] Connected {self.url}")
+                        await self._backfill()  # Candles closed while we were away
+                        await self._read(ws)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not self._running:
+                        break
+                    print(f"[Stream] Disconnected: {e}")
+                finally:
+                    self._ws = None
+
+                if not self._running:
+                    break
+                self.stats.reconnects += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            self._running = False
+            self._tick_event.set()
+            await self._events.put(None)
+            await dispatcher
+            if self._record_file:
+                self._record_file.close()
+                self._record_file = None
+
+    def stop(self):
+        """Stop after the current message (safe to call from any thread)"""
+        self._running = False
+        ws, loop = self._ws, self._loop
+        if ws is not None and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(ws.close()))
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # READ / PARSE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    async def _read(self, ws):
+        while self._running:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=self.stale_timeout)
+            except asyncio.TimeoutError:
+                raise ConnectionError(f"no data for {self.stale_timeout:.0f}s")
+
+            self.stats.messages += 1
+            self.stats.last_message_at = time.time()
+            if self._record_file:
+                self._record_file.write(json.dumps({'t': int(time.time() * 1000), 'msg': raw}) + "\n")
+
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                continue
+            data = msg.get('data', msg)  # Combined stream wraps payload in 'data'
+            event = data.get('e')
+
+            if event == 'kline':
+                await self._on_kline(Candle.from_kline(data['k']))
+            elif event == 'markPriceUpdate':
+                self._push_tick(float(data['p']), 'mark')
+
+    async def _on_kline(self, candle: Candle):
+        # Gap: this kline starts more than one bar after the last closed one
+        if (self.last_closed_open_time is not None
+                and candle.open_time > self.last_closed_open_time + self.tf_ms):
+            self.stats.gaps += 1
+            await self._backfill(until_open_time=candle.open_time)
+
+        self._push_tick(candle.close, 'kline')
+
+        if candle.closed:
+            self._deliver_candle(candle)
+
+    def _deliver_candle(self, candle: Candle):
+        if self.last_closed_open_time is not None and candle.open_time <= self.last_closed_open_time:
+            return  # Duplicate (e.g. backfill overlap)
+        self.last_closed_open_time = candle.open_time
+        self.stats.candles += 1
+        self._events.put_nowait(candle)
+
+    async def _backfill(self, until_open_time: int = None):
+        """REST fetch of closed candles after last_closed_open_time"""
+        if self.rest_exchange is None or self.last_closed_open_time is None:
+            return
+        since = self.last_closed_open_time + self.tf_ms
+        now_ms = int(time.time() * 1000)
+        until = until_open_time if until_open_time is not None else now_ms - now_ms % self.tf_ms
+        if since >= until:
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await loop.run_in_executor(
+                None, lambda: self.rest_exchange.fetch_ohlcv(self.symbol, self.timeframe, since=since, limit=1500)
+            )
+        except Exception as e:
+            print(f"[Stream] Backfill failed: {e}")
+            return
+
+        for row in rows or []:
+            if since <= row[0] < until:
+                self._deliver_candle(Candle.from_ohlcv(row))
+                self.stats.backfilled += 1
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # DISPATCH (serialized on one worker thread)
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _push_tick(self, price: float, source: str):
+        self.last_price = price
+        self.stats.ticks += 1
+        self._pending_tick = (price, source)
+        self._tick_event.set()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Candle closes first (ordered), then the latest tick
+            if not self._events.empty():
+                candle = self._events.get_nowait()
+                if candle is None:
+                    break
+                if self.on_candle:
+                    await self._call(loop, self.on_candle, candle)
+                continue
+
+            if self._pending_tick is not None:
+                price, source = self._pending_tick
+                self._pending_tick = None
+                self._tick_event.clear()
+                if self.on_tick:
+                    await self._call(loop, self.on_tick, price, source)
+                continue
+
+            if not self._running:
+                break
+
+            # Wait for either a candle or a tick
+            get_candle = asyncio.ensure_future(self._events.get())
+            get_tick = asyncio.ensure_future(self._tick_event.wait())
+            done, pending = await asyncio.wait({get_candle, get_tick}, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            if get_candle in done:
+                candle = get_candle.result()
+                if candle is None:
+                    break
+                if self.on_candle:
+                    await self._call(loop, self.on_candle, candle)
+
+    async def _call(self, loop, fn, *args):
+        try:
+            await loop.run_in_executor(self._executor, fn, *args)
+        except Exception as e:
+            print(f"[Stream] Callback error in {getattr(fn, '__name__', fn)}: {e}")
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPLAY SERVER (local testing)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_frames(path: str) -> List[Dict]:
+    """Recorded JSONL → [{'t': ms, 'msg': raw}, ...]"""
+    frames = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                frames.append(json.loads(line))
+    return frames
+
+
+class ReplayServer:
+    """
+    Local WebSocket server that plays recorded frames to every client
+    speed=0 → as fast as possible; drop_after=N closes the socket after N frames
+    (to exercise reconnect + backfill)
+    """
+
+    def __init__(self, frames: List[Dict], host: str = '127.0.0.1', port: int = 8765,
+                 speed: float = 0.0, drop_after: int = None):
+        self.frames = frames
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.drop_after = drop_after
+        self.connections = 0
+        self._position = 0  # Resume point across reconnects
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def _handler(self, ws, *args):
+        self.connections += 1
+        sent = 0
+        prev_t = None
+        while self._position < len(self.frames):
+            frame = self.frames[self._position]
+            if self.speed > 0 and prev_t is not None:
+                await asyncio.sleep(max(0.0, (frame['t'] - prev_t) / 1000 / self.speed))
+            prev_t = frame['t']
+            await ws.send(frame['msg'])
+            self._position += 1
+            sent += 1
+            if self.drop_after and sent >= self.drop_after and self.connections == 1:
+                self._position += 1  # Lose one frame to create a gap
+                await ws.close()
+                return
+        await ws.close()
+
+    async def start(self):
+        if not WEBSOCKETS_AVAILABLE:
+            raise RuntimeError("websockets not installed (pip install websockets)")
+        self._server = await websockets.serve(self._handler, self.host, self.port)
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+# For testing:
+#   python market_stream.py stream BTC/USDT 1m
+#   python market_stream.py record BTC/USDT 1m frames.jsonl
+#   python market_stream.py replay frames.jsonl [port]
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "stream"
+
+    def print_tick(price: float, source: str):
+        print(f"   tick {source:5s} {price:,.2f}")
+
+    def print_candle(candle: Candle):
+        tag = " (backfill)" if candle.backfilled else ""
+        print(f"🕯️ {time.strftime('%H:%M', time.gmtime(candle.open_time / 1000))} "
+              f"O {candle.open:,.2f} H {candle.high:,.2f} L {candle.low:,.2f} C {candle.close:,.2f}{tag}")
+
+    if command in ("stream", "record"):
+        import ccxt
+        symbol = sys.argv[2] if len(sys.argv) > 2 else 'BTC/USDT'
+        timeframe = sys.argv[3] if len(sys.argv) > 3 else '1m'
+        record = sys.argv[4] if command == "record" and len(sys.argv) > 4 else None
+        stream = MarketStream(
+            symbol, timeframe,
+            rest_exchange=ccxt.binanceusdm({'enableRateLimit': True}),
+            on_tick=print_tick, on_candle=print_candle, record_path=record
+        )
+        try:
+            asyncio.run(stream.run())
+        except KeyboardInterrupt:
+            print(f"\n📊 {stream.stats}")
+
+    elif command == "replay":
+        path = sys.argv[2]
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else 8765
+
+        async def serve():
+            server = await ReplayServer(load_frames(path), port=port, speed=1.0).start()
+            print(f"🔁 Replaying {len(server.frames)} frames on {server.url}")
+            await asyncio.Future()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
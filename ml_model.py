@@ -1,15 +1,25 @@
 """
 ML Model - Pattern Recognition for Trading Signals
 เรียนรู้จาก Trade Journal และ historical data
+- predict(): pattern เก็บเป็น NumPy matrix (feature → integer code) + hash index สำหรับ exact match
+  แล้วหา partial match ด้วย Hamming similarity แบบ vectorized (เร็วแม้มีหลายหมื่น pattern)
 """
 import json
 import os
 import math
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass, asdict
 import random
 
+import numpy as np
+
+try:
+    from trade_journal import iter_records, journal_paths
+    JOURNAL_AVAILABLE = True
+except ImportError:
+    JOURNAL_AVAILABLE = False
+
 
 @dataclass
 class PatternFeatures:
@@ -24,6 +34,12 @@ class PatternFeatures:
     recent_trend: str  # up, down, sideways
 
 
+SIMILARITY_FEATURES = ('rsi_zone', 'ema_trend', 'macd_signal', 'volume_profile')
+MIN_SIMILARITY = 0.7               # Below this predict() returns NEUTRAL
+BATCH_CELLS = 4_000_000            # predict_batch: max query × pattern × feature cells per chunk
+SIDES = ('LONG', 'SHORT', 'SKIP', 'NEUTRAL')
+
+
 @dataclass
 class TradePattern:
     """Pattern learned from historical trades"""
@@ -46,13 +62,24 @@ class MLPatternModel:
     def __init__(self, data_dir: str = "."):
         self.data_dir = data_dir
         self.model_file = os.path.join(data_dir, "ml_model.json")
+        self.binary_file = os.path.join(data_dir, "ml_model.npz")
         self.patterns: List[TradePattern] = []
         self.feature_importance: Dict[str, float] = {}
+        
+        # Pattern matrix - built lazily by predict(); call _invalidate_index() whenever
+        # self.patterns changes
+        self._vocab: List[Dict[str, int]] = []       # Per feature: value → code (0 = missing)
+        self._codes: Optional[np.ndarray] = None     # (patterns, features) int32
+        self._hash_index: Dict[str, int] = {}        # calculate_pattern_hash → first full pattern
         self.load_model()
     
     def load_model(self):
-        """Load trained model from file"""
-        if os.path.exists(self.model_file):
+        """Load trained model from file (the newer of ml_model.npz / ml_model.json)"""
+        if os.path.exists(self.binary_file) and (
+                not os.path.exists(self.model_file)
+                or os.path.getmtime(self.binary_file) >= os.path.getmtime(self.model_file)):
+            self.load_binary()
+        elif os.path.exists(self.model_file):
             try:
                 with open(self.model_file, 'r') as f:
                     data = json.load(f)
@@ -64,6 +91,7 @@ class MLPatternModel:
             except Exception as e:
                 print(f"⚠️ Error loading model: {e}")
                 self.patterns = []
+        self._invalidate_index()
     
     def save_model(self):
         """Save trained model to file"""
@@ -164,6 +192,88 @@ class MLPatternModel:
         
         return features
     
+    def save_binary(self, path: str = None) -> str:
+        """
+        Save as compressed NumPy arrays (one column per pattern field)
+        Feature values are stored as codes into a per-feature vocabulary
+        """
+        path = path or self.binary_file
+        keys = sorted({k for p in self.patterns for k in p.features})
+        vocab: Dict[str, List] = {k: [] for k in keys}
+        lookup: Dict[str, Dict] = {k: {} for k in keys}
+        codes = np.zeros((len(self.patterns), len(keys)), dtype=np.int32)   # 0 = missing
+        for row, pattern in enumerate(self.patterns):
+            for col, key in enumerate(keys):
+                if key in pattern.features:
+                    value = pattern.features[key]
+                    if value not in lookup[key]:
+                        vocab[key].append(value)
+                        lookup[key][value] = len(vocab[key])
+                    codes[row, col] = lookup[key][value]
+        
+        meta = {
+            'keys': keys,
+            'vocab': vocab,
+            'feature_importance': self.feature_importance,
+            'updated_at': datetime.now().isoformat(),
+        }
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                meta=np.array(json.dumps(meta)),
+                pattern_id=np.array([p.pattern_id for p in self.patterns], dtype=str),
+                features=codes,
+                success_rate=np.array([p.success_rate for p in self.patterns], dtype=np.float64),
+                sample_count=np.array([p.sample_count for p in self.patterns], dtype=np.int64),
+                avg_profit=np.array([p.avg_profit for p in self.patterns], dtype=np.float64),
+                avg_duration=np.array([p.avg_duration for p in self.patterns], dtype=np.float64),
+                recommended_side=np.array([SIDES.index(p.recommended_side) for p in self.patterns],
+                                          dtype=np.int8),
+                confidence=np.array([p.confidence for p in self.patterns], dtype=np.float64),
+            )
+        print(f"💾 Saved {len(self.patterns)} patterns to {os.path.basename(path)}")
+        return path
+    
+    def load_binary(self, path: str = None):
+        """Load a model written by save_binary"""
+        path = path or self.binary_file
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                keys, vocab = meta['keys'], meta['vocab']
+                codes = data['features']
+                columns = {name: data[name].tolist() for name in (
+                    'pattern_id', 'success_rate', 'sample_count', 'avg_profit',
+                    'avg_duration', 'recommended_side', 'confidence')}
+            self.patterns = [
+                TradePattern(
+                    pattern_id=columns['pattern_id'][row],
+                    features={key: vocab[key][code - 1]
+                              for key, code in zip(keys, codes[row].tolist()) if code},
+                    success_rate=columns['success_rate'][row],
+                    sample_count=columns['sample_count'][row],
+                    avg_profit=columns['avg_profit'][row],
+                    avg_duration=columns['avg_duration'][row],
+                    recommended_side=SIDES[columns['recommended_side'][row]],
+                    confidence=columns['confidence'][row],
+                )
+                for row in range(len(codes))
+            ]
+            self.feature_importance = meta.get('feature_importance', {})
+            print(f"✅ Loaded {len(self.patterns)} patterns from {os.path.basename(path)}")
+        except Exception as e:
+            print(f"⚠️ Error loading model: {e}")
+            self.patterns = []
+        self._invalidate_index()
+    
+    def set_patterns(self, patterns: List[TradePattern], save: bool = True):
+        """Replace the learned patterns (e.g. from ml_training.py) and write the binary model"""
+        self.patterns = list(patterns)
+        self._invalidate_index()
+        self._calculate_feature_importance()
+        if save:
+            self.save_binary()
+    
     def calculate_pattern_hash(self, features: Dict) -> str:
         """Create a hash for pattern matching"""
         key_features = [
@@ -177,15 +287,20 @@ class MLPatternModel:
     def train_from_journal(self, journal_file: str = "trade_journal.json"):
         """Train model from trade journal"""
         journal_path = os.path.join(self.data_dir, journal_file)
+        # JSONL journal (trade_journal.py) or the legacy JSON array
+        candidates = journal_paths(journal_path) if JOURNAL_AVAILABLE else (journal_path,)
         
-        if not os.path.exists(journal_path):
+        if not any(os.path.exists(p) for p in candidates):
             print("⚠️ Trade journal not found. Using sample data.")
             self._create_sample_patterns()
             return
         
         try:
-            with open(journal_path, 'r') as f:
-                trades = json.load(f)
+            if JOURNAL_AVAILABLE:
+                trades = list(iter_records(journal_path))
+            else:
+                with open(journal_path, 'r') as f:
+                    trades = json.load(f)
             
             if not trades:
                 print("⚠️ No trades in journal. Using sample patterns.")
@@ -273,6 +388,7 @@ class MLPatternModel:
                     confidence=confidence
                 )
                 self.patterns.append(pattern)
+            self._invalidate_index()
             
             # Calculate feature importance
             self._calculate_feature_importance()
@@ -355,6 +471,7 @@ class MLPatternModel:
         ]
         
         self.patterns = sample_patterns
+        self._invalidate_index()
         self._calculate_feature_importance()
         self.save_model()
         print(f"✅ Created {len(self.patterns)} sample patterns")
@@ -381,6 +498,99 @@ class MLPatternModel:
             k: v / total for k, v in feature_scores.items()
         }
     
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PATTERN INDEX
+    # ═══════════════════════════════════════════════════════════════════════════
+    
+    def _invalidate_index(self):
+        """Drop the pattern matrix (rebuilt on the next predict)"""
+        self._codes = None
+        self._vocab = []
+        self._hash_index = {}
+    
+    def _ensure_index(self):
+        """Encode patterns into an integer matrix + exact-match hash index"""
+        if self._codes is not None:
+            return
+        self._vocab = [{} for _ in SIMILARITY_FEATURES]
+        codes = np.zeros((len(self.patterns), len(SIMILARITY_FEATURES)), dtype=np.int32)
+        self._hash_index = {}
+        for row, pattern in enumerate(self.patterns):
+            features = pattern.features
+            for col, name in enumerate(SIMILARITY_FEATURES):
+                if name in features:
+                    vocab = self._vocab[col]
+                    codes[row, col] = vocab.setdefault(features[name], len(vocab) + 1)
+            if all(name in features for name in SIMILARITY_FEATURES):
+                self._hash_index.setdefault(self.calculate_pattern_hash(features), row)
+        self._codes = codes
+    
+    def _encode(self, features: Dict) -> np.ndarray:
+        """Features → codes (0 = missing, -1 = value no pattern has)"""
+        return np.array([
+            self._vocab[col].get(features[name], -1) if name in features else 0
+            for col, name in enumerate(SIMILARITY_FEATURES)
+        ], dtype=np.int32)
+    
+    def _similarities(self, queries: np.ndarray) -> np.ndarray:
+        """(queries, features) codes → (queries, patterns) Hamming similarity over shared features"""
+        patterns = self._codes[None, :, :]
+        queries = queries[:, None, :]
+        shared = (patterns != 0) & (queries != 0)
+        total = shared.sum(axis=2)
+        matching = (shared & (patterns == queries)).sum(axis=2)
+        return np.divide(matching, total, out=np.zeros(total.shape), where=total > 0)
+    
+    def _best_matches(self, feature_sets: List[Dict]) -> List[Tuple[Optional[TradePattern], float]]:
+        """Exact hash hit first, otherwise the most similar pattern (first one on ties)"""
+        self._ensure_index()
+        results: List[Optional[Tuple[Optional[TradePattern], float]]] = [None] * len(feature_sets)
+        pending = []
+        for i, features in enumerate(feature_sets):
+            row = self._hash_index.get(self.calculate_pattern_hash(features))
+            if row is not None and all(features.get(name) == self.patterns[row].features[name]
+                                       for name in SIMILARITY_FEATURES):
+                results[i] = (self.patterns[row], 1.0)
+            else:
+                pending.append(i)
+        
+        if pending and len(self.patterns):
+            queries = np.stack([self._encode(feature_sets[i]) for i in pending])
+            chunk = max(1, BATCH_CELLS // (len(self.patterns) * len(SIMILARITY_FEATURES)))
+            for start in range(0, len(pending), chunk):
+                sims = self._similarities(queries[start:start + chunk])
+                best = sims.argmax(axis=1)
+                for offset, col in enumerate(best):
+                    score = float(sims[offset, col])
+                    pattern = self.patterns[col] if score > 0 else None
+                    results[pending[start + offset]] = (pattern, score)
+        for i in pending:
+            if results[i] is None:
+                results[i] = (None, 0)
+        return results
+    
+    def _prediction(self, features: Dict, pattern: Optional[TradePattern], similarity: float) -> Dict:
+        if pattern and similarity > MIN_SIMILARITY:
+            return {
+                'signal': pattern.recommended_side,
+                'confidence': pattern.confidence * similarity,
+                'matching_pattern': asdict(pattern),
+                'similarity': similarity,
+                'reasons': self._generate_reasons(pattern, features),
+                'expected_profit': pattern.avg_profit,
+                'success_rate': pattern.success_rate
+            }
+        else:
+            return {
+                'signal': 'NEUTRAL',
+                'confidence': 0.3,
+                'matching_pattern': None,
+                'similarity': similarity,
+                'reasons': ["No strong pattern match found"],
+                'expected_profit': 0,
+                'success_rate': 0.5
+            }
+    
     def predict(self, market_data: Dict) -> Dict:
         """
         Predict trade signal based on current market data
@@ -393,38 +603,20 @@ class MLPatternModel:
             - reasons: list of reasons for prediction
         """
         features = self.extract_features(market_data)
-        pattern_hash = self.calculate_pattern_hash(features)
-        
-        # Find matching pattern
-        matching_pattern = None
-        best_similarity = 0
-        
-        for pattern in self.patterns:
-            similarity = self._calculate_similarity(features, pattern.features)
-            if similarity > best_similarity:
-                best_similarity = similarity
-                matching_pattern = pattern
-        
-        if matching_pattern and best_similarity > 0.7:
-            return {
-                'signal': matching_pattern.recommended_side,
-                'confidence': matching_pattern.confidence * best_similarity,
-                'matching_pattern': asdict(matching_pattern),
-                'similarity': best_similarity,
-                'reasons': self._generate_reasons(matching_pattern, features),
-                'expected_profit': matching_pattern.avg_profit,
-                'success_rate': matching_pattern.success_rate
-            }
-        else:
-            return {
-                'signal': 'NEUTRAL',
-                'confidence': 0.3,
-                'matching_pattern': None,
-                'similarity': best_similarity,
-                'reasons': ["No strong pattern match found"],
-                'expected_profit': 0,
-                'success_rate': 0.5
-            }
+        pattern, similarity = self._best_matches([features])[0]
+        return self._prediction(features, pattern, similarity)
+    
+    def predict_batch(self, market_data: Union[Dict[str, Dict], List[Dict]]) -> Union[Dict[str, Dict], List[Dict]]:
+        """
+        predict() for many symbols in one scan
+        {symbol: market_data} → {symbol: prediction}  (a list gives a list back)
+        """
+        keys = list(market_data) if isinstance(market_data, dict) else None
+        rows = [market_data[k] for k in keys] if keys is not None else list(market_data)
+        feature_sets = [self.extract_features(data) for data in rows]
+        predictions = [self._prediction(features, pattern, similarity)
+                       for features, (pattern, similarity) in zip(feature_sets, self._best_matches(feature_sets))]
+        return dict(zip(keys, predictions)) if keys is not None else predictions
     
     def _calculate_similarity(self, features1: Dict, features2: Dict) -> float:
         """Calculate similarity between two feature sets"""
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+ML Training - สร้าง pattern ของ MLPatternModel จากข้อมูลย้อนหลังหลายล้านแท่ง (แทนการรอ trade journal)
+- Features เดียวกับ MLPatternModel.extract_features แต่คำนวณทั้ง series ด้วย array ops (np.select)
+- ติด label ทุกแท่งทั้งฝั่ง LONG/SHORT ด้วย ExitEngine (SL/TP แรกที่โดน, กติกาเดียวกับ backtest)
+- รวมสถิติต่อ pattern ด้วย np.bincount → ไม่มี dict ต่อแท่ง
+- แบ่งแต่ละเหรียญเป็นช่วงเวลา (chunk) แล้วกระจายให้ process pool อ่านจาก HistoryStore เอง
+- บันทึกโมเดลเป็น ml_model.npz (binary, compressed) แทน JSON
+
+python ml_training.py [--days N] [--workers N] [--symbols BTC,ETH] [--min-samples N] [--offline]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+import warnings
+warnings.filterwarnings('ignore')
+
+try:
+    from history_store import HistoryStore, timeframe_ms
+    HISTORY_STORE_AVAILABLE = True
+except ImportError:
+    HISTORY_STORE_AVAILABLE = False
+
+try:
+    from market_meta import load_markets
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
+from exit_engine import ExitEngine
+from ml_model import MLPatternModel, TradePattern, SIMILARITY_FEATURES
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONFIGURATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+TIMEFRAME = '5m'
+HISTORY_DAYS = 365
+EMA_FAST = 3                  # Config.EMA_FAST
+EMA_SLOW = 8                  # Config.EMA_SLOW
+SL_PCT = 0.015                # Config.STOP_LOSS_PCT
+TP_PCT = 0.020                # Config.TAKE_PROFIT_PCT
+MAX_HOLD_BARS = 150
+VOLUME_WINDOW = 20            # avg_volume = rolling mean of volume
+ATR_WINDOW = 50               # avg_atr = rolling mean of ATR(14)
+TREND_BARS = 12               # price_change_pct over the last hour
+WARMUP_BARS = 200             # Extra bars loaded before each chunk so indicators settle
+CHUNK_BARS = 100_000          # Labelled bars per pool task
+MIN_SAMPLES = 30              # Patterns with fewer labelled trades are dropped
+BASES = ['BTC', 'ETH', 'SOL', 'XRP', 'LINK', 'LTC', 'AVAX', 'DOT', 'ADA', 'OP', 'ARB', 'INJ', 'SUI', 'NEAR', 'BNB']
+
+# Category order = code (same labels as MLPatternModel.extract_features)
+VOCAB = {
+    'rsi_zone': ('oversold', 'neutral', 'overbought'),
+    'ema_trend': ('bullish', 'bearish', 'neutral'),
+    'macd_signal': ('cross_up', 'cross_down', 'bullish', 'bearish'),
+    'volume_profile': ('low', 'normal', 'high'),
+    'volatility': ('low', 'medium', 'high'),
+    'recent_trend': ('up', 'down', 'sideways'),
+}
+
+# Pattern key = the features MLPatternModel matches on
+KEY_SIZES = [len(VOCAB[name]) for name in SIMILARITY_FEATURES]
+N_KEYS = int(np.prod(KEY_SIZES))
+
+# Per side × pattern key: labelled trades, wins, summed pnl %, summed bars held
+STAT_FIELDS = ('n', 'wins', 'pnl_sum', 'bars_sum')
+SIDE_NAMES = ('LONG', 'SHORT')
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FEATURES (vectorized extract_features)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def indicator_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """OHLCV frame → the inputs extract_features reads, one array per key"""
+    close = df['close']
+    macd = ta.macd(close)
+    atr = ta.atr(df['high'], df['low'], close, length=14)
+    cols = {
+        'price': close,
+        'rsi': ta.rsi(close, length=14),
+        'ema_fast': ta.ema(close, length=EMA_FAST),
+        'ema_slow': ta.ema(close, length=EMA_SLOW),
+        'macd': macd['MACD_12_26_9'],
+        'macd_signal': macd['MACDs_12_26_9'],
+        'macd_prev': macd['MACD_12_26_9'].shift(1),
+        'volume': df['volume'],
+        'avg_volume': df['volume'].rolling(VOLUME_WINDOW).mean(),
+        'atr': atr,
+        'avg_atr': atr.rolling(ATR_WINDOW).mean(),
+        'price_change_pct': close.pct_change(TREND_BARS) * 100,
+    }
+    out = {k: np.asarray(v, dtype=np.float64) for k, v in cols.items()}
+    out['high'] = df['high'].to_numpy(dtype=np.float64)
+    out['low'] = df['low'].to_numpy(dtype=np.float64)
+    return out
+
+
+def feature_codes(cols: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Same thresholds and branch order as MLPatternModel.extract_features,
+    for every bar at once → {feature: int8 codes into VOCAB[feature]}
+    """
+    rsi = cols['rsi']
+    ema_fast, ema_slow = cols['ema_fast'], cols['ema_slow']
+    macd, signal, prev = cols['macd'], cols['macd_signal'], cols['macd_prev']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vol_ratio = cols['volume'] / cols['avg_volume']
+        atr_ratio = cols['atr'] / cols['avg_atr']
+        has_volume = cols['avg_volume'] > 0
+        has_atr = cols['avg_atr'] > 0
+        change = cols['price_change_pct']
+        codes = {
+            'rsi_zone': np.select([rsi < 30, rsi > 70], [0, 2], 1),
+            'ema_trend': np.select([ema_fast > ema_slow * 1.002, ema_fast < ema_slow * 0.998], [0, 1], 2),
+            'macd_signal': np.select([(macd > signal) & (prev <= signal),
+                                      (macd < signal) & (prev >= signal),
+                                      macd > signal], [0, 1, 2], 3),
+            'volume_profile': np.select([has_volume & (vol_ratio > 1.5),
+                                         has_volume & (vol_ratio < 0.5)], [2, 0], 1),
+            'volatility': np.select([has_atr & (atr_ratio > 1.3),
+                                     has_atr & (atr_ratio < 0.7)], [2, 0], 1),
+            'recent_trend': np.select([change > 0.5, change < -0.5], [0, 1], 2),
+        }
+    return {k: v.astype(np.int8) for k, v in codes.items()}
+
+
+def pattern_keys(codes: Dict[str, np.ndarray]) -> np.ndarray:
+    """Mixed-radix index over SIMILARITY_FEATURES → 0 .. N_KEYS-1"""
+    key = np.zeros(len(codes[SIMILARITY_FEATURES[0]]), dtype=np.int64)
+    for name, size in zip(SIMILARITY_FEATURES, KEY_SIZES):
+        key = key * size + codes[name]
+    return key
+
+
+def key_features(key: int) -> Dict[str, str]:
+    """Inverse of pattern_keys for one key"""
+    features = {}
+    for name, size in reversed(list(zip(SIMILARITY_FEATURES, KEY_SIZES))):
+        key, code = divmod(key, size)
+        features[name] = VOCAB[name][code]
+    return {name: features[name] for name in SIMILARITY_FEATURES}
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LABELLING + GROUP-BY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def empty_stats() -> np.ndarray:
+    return np.zeros((len(SIDE_NAMES), len(STAT_FIELDS), N_KEYS), dtype=np.float64)
+
+
+def label_frame(df: pd.DataFrame, lo: int = 0, hi: int = None) -> np.ndarray:
+    """
+    Enter LONG and SHORT at the close of every bar in [lo, hi) that has all
+    indicators, resolve SL/TP with ExitEngine and aggregate per pattern key
+    Entries still open after MAX_HOLD_BARS (or at the end of data) are ignored
+    """
+    stats = empty_stats()
+    hi = len(df) if hi is None else hi
+    if hi <= lo:
+        return stats
+
+    cols = indicator_columns(df)
+    codes = feature_codes(cols)
+    ready = np.ones(len(df), dtype=bool)
+    for name in ('rsi', 'ema_fast', 'ema_slow', 'macd', 'macd_signal', 'macd_prev',
+                 'avg_volume', 'avg_atr', 'price_change_pct'):
+        ready &= np.isfinite(cols[name])
+    ready[:lo] = False
+    ready[hi:] = False
+    entries = np.flatnonzero(ready)
+    if not len(entries):
+        return stats
+
+    keys = pattern_keys({k: v[entries] for k, v in codes.items()})
+    engine = ExitEngine(cols['high'], cols['low'])
+    price = cols['price'][entries]
+    for side, is_long in enumerate((True, False)):
+        exits = engine.resolve(entries, np.full(len(entries), is_long), price,
+                               SL_PCT, TP_PCT, horizon=MAX_HOLD_BARS)
+        hit = exits.hit
+        key = keys[hit]
+        pnl = np.where(exits.is_tp[hit], TP_PCT * 100, -SL_PCT * 100)
+        stats[side, 0] = np.bincount(key, minlength=N_KEYS)
+        stats[side, 1] = np.bincount(key, weights=exits.is_tp[hit].astype(np.float64), minlength=N_KEYS)
+        stats[side, 2] = np.bincount(key, weights=pnl, minlength=N_KEYS)
+        stats[side, 3] = np.bincount(key, weights=exits.bars[hit].astype(np.float64), minlength=N_KEYS)
+    return stats
+
+
+def _wilson_lower(wins: float, n: float, z: float = 1.96) -> float:
+    """Lower bound of the Wilson score interval for wins / n"""
+    if n <= 0:
+        return 0.0
+    p = wins / n
+    denom = 1 + z * z / n
+    centre = p + z * z / (2 * n)
+    margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return float((centre - margin) / denom)
+
+
+def build_patterns(stats: np.ndarray, min_samples: int = MIN_SAMPLES,
+                   timeframe: str = TIMEFRAME) -> List[TradePattern]:
+    """
+    Aggregated stats → TradePattern per key, using the better side:
+    LONG/SHORT when it wins > 50%, SKIP when both sides win < 40%, else NEUTRAL
+    """
+    bar_hours = timeframe_ms(timeframe) / 3_600_000
+    patterns = []
+    for key in range(N_KEYS):
+        n = stats[:, 0, key]
+        if n.max() < min_samples:
+            continue
+        rates = np.divide(stats[:, 1, key], n, out=np.zeros(2), where=n > 0)
+        side = int(rates.argmax())
+        count, wins = n[side], stats[side, 1, key]
+        rate = float(rates[side])
+
+        if rate > 0.5:
+            recommended = SIDE_NAMES[side]
+            confidence = _wilson_lower(wins, count)
+        elif rates.max() < 0.4:
+            recommended = 'SKIP'
+            confidence = _wilson_lower(count - wins, count)
+        else:
+            recommended = 'NEUTRAL'
+            confidence = _wilson_lower(wins, count)
+
+        features = key_features(key)
+        patterns.append(TradePattern(
+            pattern_id='_'.join(features.values()),
+            features=features,
+            success_rate=rate,
+            sample_count=int(count),
+            avg_profit=float(stats[side, 2, key] / count),
+            avg_duration=float(stats[side, 3, key] / count * bar_hours),
+            recommended_side=recommended,
+            confidence=min(0.95, confidence),
+        ))
+    return patterns
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CHUNKED TRAINING (process pool)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Worker-side HistoryStore (each process reads its own chunks from disk)
+_WORKER: Dict = {}
+
+
+def _attach(root: str, exchange_id: str, fmt: str):
+    """Process pool initializer"""
+    _WORKER['history'] = HistoryStore(None, root, exchange_id, fmt)
+
+
+def _to_ms(index: pd.DatetimeIndex) -> np.ndarray:
+    return index.values.astype('datetime64[ms]').astype(np.int64)
+
+
+def label_chunk(task: Tuple[str, int, int]) -> np.ndarray:
+    """
+    (symbol, start_ms, end_ms) → stats for entries in that window
+    Loads WARMUP_BARS before it and MAX_HOLD_BARS after it so chunk edges
+    see the same indicators/exits as one long series
+    """
+    symbol, start_ms, end_ms = task
+    step = timeframe_ms(TIMEFRAME)
+    df = _WORKER['history'].load(
+        symbol, TIMEFRAME,
+        since=pd.Timestamp(start_ms - WARMUP_BARS * step, unit='ms'),
+        until=pd.Timestamp(end_ms + MAX_HOLD_BARS * step, unit='ms'),
+    )
+    if df.empty:
+        return empty_stats()
+    ts = _to_ms(df.index)
+    lo, hi = np.searchsorted(ts, [start_ms, end_ms])
+    return label_frame(df, int(lo), int(hi))
+
+
+class PatternTrainer:
+    """Split cached history into time chunks and label them over a process pool"""
+
+    def __init__(self, history: 'HistoryStore', workers: int = None, chunk_bars: int = CHUNK_BARS):
+        self.history = history
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.chunk_bars = chunk_bars
+        self.bars = 0
+
+    def tasks(self, symbols: List[str], since: datetime) -> List[Tuple[str, int, int]]:
+        """(symbol, start_ms, end_ms) windows covering each symbol's cached range"""
+        step = timeframe_ms(TIMEFRAME)
+        since_ms = int(pd.Timestamp(since).timestamp() * 1000)
+        out = []
+        self.bars = 0
+        for symbol in symbols:
+            first = next(iter(self.history.iter_partitions(symbol, TIMEFRAME, since_ms)), None)
+            last = self.history.last_timestamp(symbol, TIMEFRAME)
+            if first is None or not len(first) or last is None:
+                continue
+            start = max(since_ms, int(first[0, 0]))
+            end = last + step
+            self.bars += (end - start) // step
+            for t0 in range(start, end, self.chunk_bars * step):
+                out.append((symbol, t0, min(t0 + self.chunk_bars * step, end)))
+        return out
+
+    def run(self, symbols: List[str], since: datetime) -> np.ndarray:
+        """Summed stats over every chunk of every symbol"""
+        tasks = self.tasks(symbols, since)
+        stats = empty_stats()
+        if not tasks:
+            return stats
+        t0 = time.time()
+        h = self.history
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_attach,
+                                 initargs=(h.root, h.exchange_id, h.fmt)) as pool:
+            for part in pool.map(label_chunk, tasks):
+                stats += part
+        print(f"[Train] {self.bars:,} bars in {len(tasks)} chunks, "
+              f"{int(stats[:, 0].sum()):,} labelled trades in {time.time() - t0:.1f}s "
+              f"({self.workers} workers)")
+        return stats
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MAIN
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _arg(name: str, default: str) -> str:
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[:-1] else default
+
+
+def main():
+    import ccxt
+
+    days = float(_arg('--days', str(HISTORY_DAYS)))
+    workers = int(_arg('--workers', '0')) or None
+    min_samples = int(_arg('--min-samples', str(MIN_SAMPLES)))
+    bases = [b.strip().upper() for b in _arg('--symbols', ','.join(BASES)).split(',') if b.strip()]
+    offline = '--offline' in sys.argv
+
+    if not HISTORY_STORE_AVAILABLE:
+        print("❌ history_store.py is required")
+        return
+
+    exchange = ccxt.binanceusdm({'enableRateLimit': True})
+    history = HistoryStore(exchange)
+    if offline:
+        symbols = history.symbols()
+    else:
+        if MARKET_META_AVAILABLE:
+            load_markets(exchange)
+        else:
+            exchange.load_markets()
+        symbols = exchange.symbols
+    symbols = [s for s in symbols
+               if s.endswith(':USDT') and '/USDT' in s and s.split('/')[0] in bases]
+
+    since = datetime.utcnow() - timedelta(days=days)
+    if not offline:
+        # Download/refresh the cache first; workers only read from disk
+        for symbol in symbols:
+            try:
+                fetched = history.update(symbol, TIMEFRAME, since)
+                if fetched:
+                    print(f"[History] {symbol} {TIMEFRAME}: +{fetched} candles")
+            except Exception as e:
+                print(f"[History] {symbol}: {e}")
+
+    stats = PatternTrainer(history, workers).run(symbols, since)
+    patterns = build_patterns(stats, min_samples)
+    if not patterns:
+        print("❌ No pattern reached --min-samples")
+        return
+
+    model = MLPatternModel()
+    model.set_patterns(patterns)
+
+    print()
+    print('=' * 90)
+    print(f'🤖 ML PATTERNS ({days:g} days, {len(symbols)} coins, {len(patterns)} patterns)')
+    print('=' * 90)
+    table = pd.DataFrame([{
+        'pattern': p.pattern_id, 'side': p.recommended_side, 'win_rate': p.success_rate,
+        'samples': p.sample_count, 'avg_pnl%': p.avg_profit, 'hours': p.avg_duration,
+        'confidence': p.confidence,
+    } for p in patterns]).sort_values(['confidence', 'samples'], ascending=False)
+    print(table.head(20).to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+
+
+if __name__ == "__main__":
+    main()
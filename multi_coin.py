@@ -1,5 +1,7 @@
 """
 Multi-Coin Scanner - เทรดหลายเหรียญพร้อมกัน
+- scan_all(): ดึงข้อมูลพร้อมกันด้วย thread pool (จำกัดด้วย request weight budget)
+  และคำนวณ indicators ใน process pool ได้ (mode="processes")
 """
 import ccxt
 import pandas as pd
@@ -7,9 +9,28 @@ import pandas_ta as ta
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 import threading
 import time
 
+try:
+    from candle_cache import get_cache
+    CANDLE_CACHE_AVAILABLE = True
+except ImportError:
+    CANDLE_CACHE_AVAILABLE = False
+
+try:
+    from candle_store import CandleStore
+    CANDLE_STORE_AVAILABLE = True
+except ImportError:
+    CANDLE_STORE_AVAILABLE = False
+
+try:
+    from market_meta import load_markets
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
 
 @dataclass
 class CoinSignal:
@@ -22,6 +43,223 @@ class CoinSignal:
     take_profit: float
     strength: float  # 0-100
     reasons: List[str]
+    latency_ms: float = 0.0  # fetch + compute time for this symbol
+
+
+@dataclass
+class ScanResult:
+    """Per-symbol outcome of one scan (signal may be None)"""
+    symbol: str
+    signal: Optional[CoinSignal] = None
+    fetch_ms: float = 0.0
+    compute_ms: float = 0.0
+    total_ms: float = 0.0
+    error: str = ""
+
+
+class RequestBudget:
+    """
+    Token bucket for Binance request weight (futures: 2400/min per IP)
+    Threads block in acquire() until enough weight has refilled
+    """
+    
+    def __init__(self, weight_per_minute: int = 2400, safety: float = 0.8):
+        self.capacity = weight_per_minute * safety
+        self.rate = self.capacity / 60.0  # weight per second
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waited_sec = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def acquire(self, weight: float, timeout: float = None) -> bool:
+        """Take `weight` tokens; False if not available within timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return True
+                wait_sec = (weight - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait_sec > deadline:
+                return False
+            self.waited_sec += wait_sec
+            time.sleep(wait_sec)
+    
+    def observe_used(self, used_weight: int, weight_per_minute: int = 2400):
+        """Sync with the exchange's X-MBX-USED-WEIGHT-1M header"""
+        with self.lock:
+            self._refill()
+            remaining = self.capacity - used_weight * self.capacity / weight_per_minute
+            self.tokens = min(self.tokens, max(0.0, remaining))
+
+
+def kline_weight(limit: int) -> int:
+    """Binance futures /klines request weight by limit"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def calculate_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """Calculate technical indicators"""
+    if df.empty:
+        return df
+    
+    # RSI
+    df['RSI'] = ta.rsi(df['close'], length=14)
+    
+    # EMA
+    df['EMA_8'] = ta.ema(df['close'], length=8)
+    df['EMA_21'] = ta.ema(df['close'], length=21)
+    df['EMA_50'] = ta.ema(df['close'], length=50)
+    
+    # MACD
+    macd = ta.macd(df['close'], fast=12, slow=26, signal=9)
+    if macd is not None:
+        df = pd.concat([df, macd], axis=1)
+    
+    # Bollinger Bands
+    bb = ta.bbands(df['close'], length=20, std=2)
+    if bb is not None:
+        df = pd.concat([df, bb], axis=1)
+    
+    # ADX
+    adx = ta.adx(df['high'], df['low'], df['close'], length=14)
+    if adx is not None:
+        df = pd.concat([df, adx], axis=1)
+    
+    # Volume SMA
+    df['Volume_SMA'] = ta.sma(df['volume'], length=20)
+    df['Volume_Ratio'] = df['volume'] / df['Volume_SMA']
+    
+    return df
+
+
+def compute_signal(symbol: str, df: pd.DataFrame, coin_info: Dict) -> Optional[CoinSignal]:
+    """Indicators + scoring for one symbol (module-level so a process pool can run it)"""
+    df = calculate_indicators(df)
+    if len(df) < 50:
+        return None
+    
+    current = df.iloc[-1]
+    prev = df.iloc[-2]
+    
+    # Score system
+    long_score = 0
+    short_score = 0
+    reasons = []
+    
+    # RSI signals
+    rsi = current.get('RSI', 50)
+    if rsi < 30:
+        long_score += 25
+        reasons.append(f"RSI oversold ({rsi:.0f})")
+    elif rsi > 70:
+        short_score += 25
+        reasons.append(f"RSI overbought ({rsi:.0f})")
+    elif rsi < 45:
+        long_score += 10
+    elif rsi > 55:
+        short_score += 10
+    
+    # EMA trend
+    ema8 = current.get('EMA_8', 0)
+    ema21 = current.get('EMA_21', 0)
+    ema50 = current.get('EMA_50', 0)
+    
+    if ema8 > ema21 > ema50:
+        long_score += 20
+        reasons.append("EMA uptrend")
+    elif ema8 < ema21 < ema50:
+        short_score += 20
+        reasons.append("EMA downtrend")
+    
+    # EMA crossover
+    prev_ema8 = prev.get('EMA_8', 0)
+    prev_ema21 = prev.get('EMA_21', 0)
+    
+    if prev_ema8 < prev_ema21 and ema8 > ema21:
+        long_score += 30
+        reasons.append("EMA bullish cross")
+    elif prev_ema8 > prev_ema21 and ema8 < ema21:
+        short_score += 30
+        reasons.append("EMA bearish cross")
+    
+    # MACD
+    macd_val = current.get('MACD_12_26_9', 0)
+    macd_signal = current.get('MACDs_12_26_9', 0)
+    macd_hist = current.get('MACDh_12_26_9', 0)
+    
+    if macd_val > macd_signal and macd_hist > 0:
+        long_score += 15
+        reasons.append("MACD bullish")
+    elif macd_val < macd_signal and macd_hist < 0:
+        short_score += 15
+        reasons.append("MACD bearish")
+    
+    # ADX trend strength
+    adx = current.get('ADX_14', 0)
+    if adx > 25:
+        # Strong trend - amplify signals
+        if long_score > short_score:
+            long_score += 10
+        else:
+            short_score += 10
+        reasons.append(f"Strong trend (ADX={adx:.0f})")
+    
+    # Volume confirmation
+    vol_ratio = current.get('Volume_Ratio', 1)
+    if vol_ratio > 1.5:
+        if long_score > short_score:
+            long_score += 10
+        else:
+            short_score += 10
+        reasons.append(f"High volume ({vol_ratio:.1f}x)")
+    
+    # Determine signal
+    price = current['close']
+    
+    if long_score >= 50 and long_score > short_score:
+        sl_pct = 0.015 if coin_info.get('volatility') == 'high' else 0.012
+        tp_pct = 0.06 if coin_info.get('volatility') == 'high' else 0.05
+        
+        return CoinSignal(
+            symbol=symbol,
+            side='long',
+            confidence=min(long_score / 100, 0.95),
+            entry_price=price,
+            stop_loss=price * (1 - sl_pct),
+            take_profit=price * (1 + tp_pct),
+            strength=long_score,
+            reasons=reasons
+        )
+    
+    elif short_score >= 50 and short_score > long_score:
+        sl_pct = 0.015 if coin_info.get('volatility') == 'high' else 0.012
+        tp_pct = 0.06 if coin_info.get('volatility') == 'high' else 0.05
+        
+        return CoinSignal(
+            symbol=symbol,
+            side='short',
+            confidence=min(short_score / 100, 0.95),
+            entry_price=price,
+            stop_loss=price * (1 + sl_pct),
+            take_profit=price * (1 - tp_pct),
+            strength=short_score,
+            reasons=reasons
+        )
+    
+    return None
 
 
 class MultiCoinScanner:
@@ -67,24 +305,51 @@ class MultiCoinScanner:
         }
     }
     
-    def __init__(self, api_key: str, secret_key: str, enabled_coins: List[str] = None):
+    def __init__(self, api_key: str, secret_key: str, enabled_coins: List[str] = None,
+                 mode: str = "threads", max_workers: int = 8, process_workers: int = 4,
+                 symbol_timeout: float = 10.0, weight_per_minute: int = 2400,
+                 cache_max_age: float = 15.0):
         self.exchange = ccxt.binanceusdm({
             'apiKey': api_key,
             'secret': secret_key,
             'sandbox': False,
+            'timeout': int(symbol_timeout * 1000),  # Per-request timeout (ms)
             'options': {'defaultType': 'future'}
         })
-        self.exchange.load_markets()
+        if MARKET_META_AVAILABLE:
+            load_markets(self.exchange)  # From data/markets when fresh
+        else:
+            self.exchange.load_markets()
         
         # Default to BTC, ETH, SOL if not specified
         self.enabled_coins = enabled_coins or ['BTC/USDT', 'ETH/USDT', 'SOL/USDT']
         self.coin_data: Dict[str, pd.DataFrame] = {}
         self.last_signals: Dict[str, CoinSignal] = {}
+        
+        # Concurrent scan settings
+        self.mode = mode  # "sequential" | "threads" | "processes"
+        self.max_workers = max_workers
+        self.process_workers = process_workers
+        self.symbol_timeout = symbol_timeout
+        self.budget = RequestBudget(weight_per_minute)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self.last_scan: List[ScanResult] = []
+        self.last_scan_ms: float = 0.0
+        
+        # Shared candle cache (AgentA / charts / Telegram use the same one)
+        self.cache = get_cache() if CANDLE_CACHE_AVAILABLE else None
+        self.candles = CandleStore() if CANDLE_STORE_AVAILABLE else None  # Ring buffer per symbol
+        self.cache_max_age = cache_max_age
     
     def fetch_ohlcv(self, symbol: str, timeframe: str = '5m', limit: int = 500) -> pd.DataFrame:
         """Fetch OHLCV data for a symbol"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            if self.cache is not None:
+                ohlcv = self.cache.fetch_ohlcv(self.exchange, symbol, timeframe, limit, max_age=self.cache_max_age)
+            else:
+                ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            if self.candles is not None:
+                return self.candles.frame(symbol, timeframe, ohlcv)
             df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
             df.set_index('timestamp', inplace=True)
@@ -95,177 +360,141 @@ class MultiCoinScanner:
     
     def calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calculate technical indicators"""
-        if df.empty:
-            return df
-        
-        # RSI
-        df['RSI'] = ta.rsi(df['close'], length=14)
-        
-        # EMA
-        df['EMA_8'] = ta.ema(df['close'], length=8)
-        df['EMA_21'] = ta.ema(df['close'], length=21)
-        df['EMA_50'] = ta.ema(df['close'], length=50)
-        
-        # MACD
-        macd = ta.macd(df['close'], fast=12, slow=26, signal=9)
-        if macd is not None:
-            df = pd.concat([df, macd], axis=1)
-        
-        # Bollinger Bands
-        bb = ta.bbands(df['close'], length=20, std=2)
-        if bb is not None:
-            df = pd.concat([df, bb], axis=1)
-        
-        # ADX
-        adx = ta.adx(df['high'], df['low'], df['close'], length=14)
-        if adx is not None:
-            df = pd.concat([df, adx], axis=1)
-        
-        # Volume SMA
-        df['Volume_SMA'] = ta.sma(df['volume'], length=20)
-        df['Volume_Ratio'] = df['volume'] / df['Volume_SMA']
-        
-        return df
+        return calculate_indicators(df)
     
     def analyze_coin(self, symbol: str) -> Optional[CoinSignal]:
         """Analyze a single coin and generate signal"""
+        start = time.time()
         df = self.fetch_ohlcv(symbol)
         if df.empty:
             return None
         
-        df = self.calculate_indicators(df)
-        if len(df) < 50:
-            return None
-        
-        current = df.iloc[-1]
-        prev = df.iloc[-2]
-        
-        # Score system
-        long_score = 0
-        short_score = 0
-        reasons = []
-        
-        # RSI signals
-        rsi = current.get('RSI', 50)
-        if rsi < 30:
-            long_score += 25
-            reasons.append(f"RSI oversold ({rsi:.0f})")
-        elif rsi > 70:
-            short_score += 25
-            reasons.append(f"RSI overbought ({rsi:.0f})")
-        elif rsi < 45:
-            long_score += 10
-        elif rsi > 55:
-            short_score += 10
-        
-        # EMA trend
-        ema8 = current.get('EMA_8', 0)
-        ema21 = current.get('EMA_21', 0)
-        ema50 = current.get('EMA_50', 0)
-        
-        if ema8 > ema21 > ema50:
-            long_score += 20
-            reasons.append("EMA uptrend")
-        elif ema8 < ema21 < ema50:
-            short_score += 20
-            reasons.append("EMA downtrend")
-        
-        # EMA crossover
-        prev_ema8 = prev.get('EMA_8', 0)
-        prev_ema21 = prev.get('EMA_21', 0)
-        
-        if prev_ema8 < prev_ema21 and ema8 > ema21:
-            long_score += 30
-            reasons.append("EMA bullish cross")
-        elif prev_ema8 > prev_ema21 and ema8 < ema21:
-            short_score += 30
-            reasons.append("EMA bearish cross")
-        
-        # MACD
-        macd_val = current.get('MACD_12_26_9', 0)
-        macd_signal = current.get('MACDs_12_26_9', 0)
-        macd_hist = current.get('MACDh_12_26_9', 0)
-        
-        if macd_val > macd_signal and macd_hist > 0:
-            long_score += 15
-            reasons.append("MACD bullish")
-        elif macd_val < macd_signal and macd_hist < 0:
-            short_score += 15
-            reasons.append("MACD bearish")
-        
-        # ADX trend strength
-        adx = current.get('ADX_14', 0)
-        if adx > 25:
-            # Strong trend - amplify signals
-            if long_score > short_score:
-                long_score += 10
-            else:
-                short_score += 10
-            reasons.append(f"Strong trend (ADX={adx:.0f})")
-        
-        # Volume confirmation
-        vol_ratio = current.get('Volume_Ratio', 1)
-        if vol_ratio > 1.5:
-            if long_score > short_score:
-                long_score += 10
-            else:
-                short_score += 10
-            reasons.append(f"High volume ({vol_ratio:.1f}x)")
-        
-        # Determine signal
-        price = current['close']
-        
-        if long_score >= 50 and long_score > short_score:
-            coin_info = self.COINS.get(symbol, {})
-            sl_pct = 0.015 if coin_info.get('volatility') == 'high' else 0.012
-            tp_pct = 0.06 if coin_info.get('volatility') == 'high' else 0.05
-            
-            return CoinSignal(
-                symbol=symbol,
-                side='long',
-                confidence=min(long_score / 100, 0.95),
-                entry_price=price,
-                stop_loss=price * (1 - sl_pct),
-                take_profit=price * (1 + tp_pct),
-                strength=long_score,
-                reasons=reasons
-            )
-        
-        elif short_score >= 50 and short_score > long_score:
-            coin_info = self.COINS.get(symbol, {})
-            sl_pct = 0.015 if coin_info.get('volatility') == 'high' else 0.012
-            tp_pct = 0.06 if coin_info.get('volatility') == 'high' else 0.05
-            
-            return CoinSignal(
-                symbol=symbol,
-                side='short',
-                confidence=min(short_score / 100, 0.95),
-                entry_price=price,
-                stop_loss=price * (1 + sl_pct),
-                take_profit=price * (1 - tp_pct),
-                strength=short_score,
-                reasons=reasons
-            )
-        
-        return None
+        signal = compute_signal(symbol, df, self.COINS.get(symbol, {}))
+        if signal:
+            signal.latency_ms = (time.time() - start) * 1000
+        return signal
+    
+    # ═══════════════════════════════════════════════════════════════════════════
+    # CONCURRENT SCAN
+    # ═══════════════════════════════════════════════════════════════════════════
+    
+    def _fetch_with_budget(self, symbol: str, timeframe: str = '5m', limit: int = 500) -> Tuple[pd.DataFrame, float, str]:
+        """Fetch under the request budget → (df, fetch_ms, error)"""
+        start = time.time()
+        cached = self.cache is not None and self.cache.is_fresh(
+            self.exchange, symbol, timeframe, limit, max_age=self.cache_max_age
+        )
+        if not cached and not self.budget.acquire(kline_weight(limit), timeout=self.symbol_timeout):
+            return pd.DataFrame(), (time.time() - start) * 1000, "rate budget timeout"
+        
+        df = self.fetch_ohlcv(symbol, timeframe, limit)
+        
+        headers = getattr(self.exchange, 'last_response_headers', None) or {}
+        used = headers.get('x-mbx-used-weight-1m') or headers.get('X-MBX-USED-WEIGHT-1M')
+        if used:
+            self.budget.observe_used(int(used))
+        
+        error = "" if not df.empty else "no data"
+        return df, (time.time() - start) * 1000, error
+    
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+        return self._process_pool
+    
+    def scan_concurrent(self, symbols: List[str] = None) -> List[ScanResult]:
+        """
+        Fetch all symbols on a bounded thread pool, compute each as soon as its data arrives
+        (in this process, or in the process pool when mode == "processes")
+        """
+        symbols = symbols or self.enabled_coins
+        started = {s: time.time() for s in symbols}
+        results: Dict[str, ScanResult] = {s: ScanResult(symbol=s) for s in symbols}
+        deadline = time.time() + self.symbol_timeout * 2  # Whole-scan deadline
+        
+        io_pool = ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols)) or 1,
+                                     thread_name_prefix="scan-fetch")
+        compute_pool = self._get_process_pool() if self.mode == "processes" else None
+        
+        pending = {io_pool.submit(self._fetch_with_budget, s): ('fetch', s) for s in symbols}
+        compute_started: Dict[str, float] = {}
+        try:
+            while pending:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    stage, symbol = pending.pop(fut)
+                    res = results[symbol]
+                    try:
+                        if stage == 'fetch':
+                            df, res.fetch_ms, res.error = fut.result()
+                            if res.error:
+                                continue
+                            coin_info = self.COINS.get(symbol, {})
+                            compute_started[symbol] = time.time()
+                            if compute_pool is not None:
+                                nxt = compute_pool.submit(compute_signal, symbol, df, coin_info)
+                            else:
+                                nxt = io_pool.submit(compute_signal, symbol, df, coin_info)
+                            pending[nxt] = ('compute', symbol)
+                        else:
+                            res.signal = fut.result()
+                            res.compute_ms = (time.time() - compute_started[symbol]) * 1000
+                    except Exception as e:
+                        res.error = str(e)
+        finally:
+            # Anything still running missed the deadline
+            for fut, (stage, symbol) in pending.items():
+                fut.cancel()
+                results[symbol].error = f"timeout ({stage})"
+            io_pool.shutdown(wait=False, cancel_futures=True)
+        
+        for symbol, res in results.items():
+            res.total_ms = (time.time() - started[symbol]) * 1000 if res.error else res.fetch_ms + res.compute_ms
+            if res.signal:
+                res.signal.latency_ms = res.total_ms
+        return [results[s] for s in symbols]
     
     def scan_all(self) -> List[CoinSignal]:
         """Scan all enabled coins and return signals"""
+        scan_start = time.time()
         signals = []
         
-        for symbol in self.enabled_coins:
-            try:
-                signal = self.analyze_coin(symbol)
-                if signal:
-                    signals.append(signal)
-                    self.last_signals[symbol] = signal
-            except Exception as e:
-                print(f"[Scanner] Error scanning {symbol}: {e}")
+        if self.mode == "sequential":
+            self.last_scan = []
+            for symbol in self.enabled_coins:
+                start = time.time()
+                try:
+                    signal = self.analyze_coin(symbol)
+                    self.last_scan.append(ScanResult(symbol, signal, total_ms=(time.time() - start) * 1000))
+                except Exception as e:
+                    print(f"[Scanner] Error scanning {symbol}: {e}")
+                    self.last_scan.append(ScanResult(symbol, None, total_ms=(time.time() - start) * 1000, error=str(e)))
+        else:
+            self.last_scan = self.scan_concurrent()
+            for res in self.last_scan:
+                if res.error and res.error != "no data":
+                    print(f"[Scanner] Error scanning {res.symbol}: {res.error}")
+        
+        for res in self.last_scan:
+            if res.signal:
+                signals.append(res.signal)
+                self.last_signals[res.symbol] = res.signal
+        
+        self.last_scan_ms = (time.time() - scan_start) * 1000
         
         # Sort by strength
         signals.sort(key=lambda x: x.strength, reverse=True)
         return signals
     
+    def close(self):
+        """Shut down the indicator process pool"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(cancel_futures=True)
+            self._process_pool = None
+    
     def get_best_opportunity(self) -> Optional[CoinSignal]:
         """Get the best trading opportunity across all coins"""
         signals = self.scan_all()
@@ -277,9 +506,17 @@ class MultiCoinScanner:
         """Get overview of all coins"""
         overview = {}
         
+        # Fetch all coins first (concurrently unless sequential mode)
+        if self.mode == "sequential":
+            frames = {s: self.fetch_ohlcv(s, limit=100) for s in self.enabled_coins}
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.enabled_coins)) or 1) as pool:
+                futures = {s: pool.submit(self._fetch_with_budget, s, '5m', 100) for s in self.enabled_coins}
+                frames = {s: f.result()[0] for s, f in futures.items()}
+        
         for symbol in self.enabled_coins:
             try:
-                df = self.fetch_ohlcv(symbol, limit=100)
+                df = frames[symbol]
                 if df.empty:
                     continue
                 
@@ -333,6 +570,11 @@ class MultiCoinScanner:
             lines.append(f"   {best.side.upper()} @ ${best.entry_price:,.2f}")
             lines.append(f"   Confidence: {best.confidence*100:.0f}%")
         
+        # Scan latency
+        if self.last_scan:
+            slowest = max(self.last_scan, key=lambda r: r.total_ms)
+            lines.append(f"\n⏱️ Scan: {self.last_scan_ms:.0f}ms | slowest {slowest.symbol} {slowest.total_ms:.0f}ms")
+        
         return "\n".join(lines)
 
 
@@ -350,3 +592,13 @@ if __name__ == "__main__":
     )
     
     print(scanner.get_telegram_summary())
+    
+    # Sequential vs concurrent timing
+    for mode in ("sequential", "threads", "processes"):
+        scanner.mode = mode
+        scanner.scan_all()
+        print(f"\n⏱️ {mode}: {scanner.last_scan_ms:.0f}ms")
+        for res in scanner.last_scan:
+            print(f"   {res.symbol:<12} fetch {res.fetch_ms:6.0f}ms compute {res.compute_ms:6.0f}ms "
+                  f"total {res.total_ms:6.0f}ms {res.error}")
+    scanner.close()
@@ -26,6 +26,18 @@ import matplotlib.pyplot as plt
 
 load_dotenv()
 
+try:
+    from candle_cache import get_cache
+    CANDLE_CACHE_AVAILABLE = True
+except ImportError:
+    CANDLE_CACHE_AVAILABLE = False
+
+try:
+    from candle_store import CandleStore
+    CANDLE_STORE_AVAILABLE = True
+except ImportError:
+    CANDLE_STORE_AVAILABLE = False
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # CONFIGURATION
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -371,6 +383,7 @@ class PaperTradeBotFull:
         self.positions = {}
         self.trade_history = []
         self.df_cache = {}  # Cache dataframes for charts
+        self.candles = CandleStore() if CANDLE_STORE_AVAILABLE else None  # Ring buffer per symbol
         self.stats = {
             'total_trades': 0,
             'wins': 0,
@@ -421,11 +434,18 @@ class PaperTradeBotFull:
     def get_data_with_indicators(self, symbol: str) -> pd.DataFrame:
         """ดึงข้อมูลพร้อม Indicators"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=100)
+            if CANDLE_CACHE_AVAILABLE:
+                # Shared cache: save_status_file / charts reuse the scan's candles
+                ohlcv = get_cache().fetch_ohlcv(self.exchange, symbol, TIMEFRAME, limit=100, max_age=SCAN_INTERVAL)
+            else:
+                ohlcv = self.exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=100)
             if len(ohlcv) < 60:
                 return None
             
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+            if self.candles is not None:
+                df = self.candles.frame(symbol, TIMEFRAME, ohlcv)
+            else:
+                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             
             # Calculate indicators
             df['rsi'] = ta.rsi(df['close'], length=14)
@@ -511,7 +531,7 @@ class PaperTradeBotFull:
             'reason': reason
         }
         
-        self.df_cache[symbol] = df  # Save for chart
+        self.df_cache[symbol] = df.copy()  # Save for chart (own copy - candle views change on the next fetch)
         
         # Print
         emoji = "🟢" if side == "LONG" else "🔴"
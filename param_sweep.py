@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Parameter Sweep - หา SL/TP/ADX ที่ดีที่สุดข้ามหลายเหรียญ (grid / random / bayes)
+- โหลดข้อมูลแต่ละเหรียญครั้งเดียว + คำนวณ indicators ที่ไม่ขึ้นกับ parameter ครั้งเดียว
+- เก็บทุกเหรียญไว้ใน shared memory ก้อนเดียว → worker ใน process pool อ่านได้โดยไม่ต้อง copy
+- กลยุทธ์เดียวกับ quick_backtest.py (EMA 3/8/20 + RSI + MACD + ADX)
+- บันทึกตารางผลเรียงตาม ROI: win rate, profit factor, max drawdown
+
+python param_sweep.py [--mode grid|random|bayes] [--trials N] [--days N] [--workers N] [--offline]
+"""
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+import warnings
+warnings.filterwarnings('ignore')
+
+try:
+    from history_store import HistoryStore
+    HISTORY_STORE_AVAILABLE = True
+except ImportError:
+    HISTORY_STORE_AVAILABLE = False
+
+try:
+    from market_meta import load_markets
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
+try:
+    import optuna
+    OPTUNA_AVAILABLE = True
+except ImportError:
+    OPTUNA_AVAILABLE = False
+
+from exit_engine import ExitEngine
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONFIGURATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+TIMEFRAME = '5m'
+HISTORY_DAYS = 5
+LEVERAGE = 20
+INITIAL_BALANCE = 4.50
+POSITION_FRACTION = 1 / 3     # quick_backtest: pos_size = balance / 3
+COOLDOWN_BARS = 8             # ไม่เข้าใหม่ภายใน 8 แท่งหลังปิด
+MAX_HOLD_BARS = 150
+WARMUP_BARS = 50
+TAIL_BARS = 30
+BASES = ['BTC', 'ETH', 'SOL', 'XRP', 'LINK', 'LTC', 'AVAX', 'DOT', 'ADA', 'OP', 'ARB', 'INJ', 'SUI', 'NEAR', 'BNB']
+
+# (low, high, grid step) - adx_thresh is an integer
+PARAM_SPACE = {
+    'sl_pct': (0.008, 0.025, 0.002),
+    'tp_pct': (0.010, 0.035, 0.0025),
+    'adx_thresh': (20, 40, 5),
+}
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sweeps')
+
+# Parameter-independent columns kept in shared memory
+COLUMNS = ['high', 'low', 'close', 'ema_3', 'ema_8', 'ema_20', 'rsi', 'macd_hist', 'adx']
+
+
+@dataclass
+class SweepResult:
+    sl_pct: float
+    tp_pct: float
+    adx_thresh: int
+    trades: int = 0
+    wins: int = 0
+    losses: int = 0
+    win_rate: float = 0.0
+    roi: float = 0.0
+    profit_factor: float = 0.0
+    max_drawdown: float = 0.0
+    final_balance: float = INITIAL_BALANCE
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DATA (loaded once)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def prepare_columns(df: pd.DataFrame) -> np.ndarray:
+    """Indicators that do not depend on SL/TP/ADX threshold → (len(COLUMNS), n) array"""
+    out = pd.DataFrame(index=df.index)
+    out['high'] = df['high']
+    out['low'] = df['low']
+    out['close'] = df['close']
+    out['ema_3'] = ta.ema(df['close'], length=3)
+    out['ema_8'] = ta.ema(df['close'], length=8)
+    out['ema_20'] = ta.ema(df['close'], length=20)
+    out['rsi'] = ta.rsi(df['close'], length=14)
+    macd = ta.macd(df['close'])
+    out['macd_hist'] = macd['MACDh_12_26_9'] if macd is not None else 0
+    adx = ta.adx(df['high'], df['low'], df['close'], length=14)
+    out['adx'] = adx['ADX_14'] if adx is not None else 0
+    return out[COLUMNS].to_numpy(dtype=np.float64).T
+
+
+def select_symbols(exchange, history, offline: bool) -> List[str]:
+    """USDT perpetuals in BASES (same selection as quick_backtest)"""
+    if offline and history is not None:
+        symbols = history.symbols()
+    else:
+        if MARKET_META_AVAILABLE:
+            load_markets(exchange)
+        else:
+            exchange.load_markets()
+        symbols = exchange.symbols
+    return [s for s in symbols
+            if s.endswith(':USDT') and '/USDT' in s and s.split('/')[0] in BASES]
+
+
+def load_frames(symbols: List[str], days: float, offline: bool, exchange=None,
+                history=None) -> Dict[str, pd.DataFrame]:
+    frames = {}
+    for symbol in symbols:
+        try:
+            if history is not None:
+                df = history.get(symbol, TIMEFRAME, days, offline=offline)
+            else:
+                ohlcv = exchange.fetch_ohlcv(symbol, TIMEFRAME, limit=1500)
+                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+            if len(df) > WARMUP_BARS + TAIL_BARS:
+                frames[symbol] = df
+        except Exception as e:
+            print(f"[Sweep] {symbol}: {e}")
+    return frames
+
+
+class SharedData:
+    """All symbols' columns in one shared-memory block (owner side)"""
+
+    def __init__(self, frames: Dict[str, pd.DataFrame]):
+        arrays = [prepare_columns(df) for df in frames.values()]
+        total = sum(a.shape[1] for a in arrays)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, len(COLUMNS) * total * 8))
+        data = np.ndarray((len(COLUMNS), total), dtype=np.float64, buffer=self.shm.buf)
+
+        self.layout: List[Tuple[str, int, int]] = []  # (symbol, start, end)
+        pos = 0
+        for symbol, arr in zip(frames, arrays):
+            data[:, pos:pos + arr.shape[1]] = arr
+            self.layout.append((symbol, pos, pos + arr.shape[1]))
+            pos += arr.shape[1]
+        self.spec = {'name': self.shm.name, 'shape': (len(COLUMNS), total), 'layout': self.layout}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Worker-side view of the shared block
+_WORKER: Dict = {}
+
+
+def _attach(spec: Dict):
+    """Process pool initializer: map the shared block (no copy)"""
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    data = np.ndarray(spec['shape'], dtype=np.float64, buffer=shm.buf)
+    _WORKER['shm'] = shm
+    _WORKER['symbols'] = [
+        (symbol, {c: data[k, start:end] for k, c in enumerate(COLUMNS)})
+        for symbol, start, end in spec['layout']
+    ]
+    # Range max/min tables do not depend on the parameters either - build once per worker
+    _WORKER['engines'] = [ExitEngine(cols['high'], cols['low']) for _, cols in _WORKER['symbols']]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# EVALUATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def signal_masks(cols: Dict[str, np.ndarray], adx_thresh: float) -> Tuple[np.ndarray, np.ndarray]:
+    """quick_backtest entry rules for every bar → (long, short) boolean arrays"""
+    ema_fast, ema_slow, ema_trend = cols['ema_3'], cols['ema_8'], cols['ema_20']
+    rsi, macd_hist, adx = cols['rsi'], cols['macd_hist'], cols['adx']
+    with np.errstate(invalid='ignore'):
+        strong = adx >= adx_thresh
+        long_sig = (ema_fast > ema_slow) & (ema_slow > ema_trend) & strong & (macd_hist > 0) & (rsi > 40) & (rsi < 70)
+        short_sig = (ema_fast < ema_slow) & (ema_slow < ema_trend) & strong & (macd_hist < 0) & (rsi > 30) & (rsi < 60)
+    return long_sig, short_sig
+
+
+def simulate_symbol(cols: Dict[str, np.ndarray], sl_pct: float, tp_pct: float,
+                    adx_thresh: float, engine: ExitEngine = None) -> List[Tuple[str, float]]:
+    """
+    Trades for one symbol as [(result, pnl_pct), ...]
+    Signals and exits are resolved for all candidates at once; only the cooldown
+    walk is sequential (it depends on where the previous trade closed)
+    """
+    close = cols['close']
+    n = len(close)
+
+    long_sig, short_sig = signal_masks(cols, adx_thresh)
+    candidates = np.flatnonzero(long_sig | short_sig)
+    candidates = candidates[(candidates >= WARMUP_BARS) & (candidates < n - TAIL_BARS)]
+
+    engine = engine or ExitEngine(cols['high'], cols['low'])
+    exits = engine.resolve(candidates, long_sig[candidates], close[candidates],
+                           sl_pct, tp_pct, horizon=MAX_HOLD_BARS)
+
+    trades = []
+    last_idx = 0
+    for k, i in enumerate(candidates.tolist()):
+        # Never closed inside the window - ignored like quick_backtest
+        if i < last_idx + COOLDOWN_BARS or not exits.hit[k]:
+            continue
+        if exits.is_tp[k]:
+            trades.append(('TP', tp_pct * LEVERAGE * 100))
+        else:
+            trades.append(('SL', -sl_pct * LEVERAGE * 100))
+        last_idx = int(exits.exit_idx[k])
+    return trades
+
+
+def score(params: Dict, trades: List[Tuple[str, float]]) -> SweepResult:
+    """Compound trades (balance / 3 per trade) into ROI, PF and drawdown"""
+    balance = INITIAL_BALANCE
+    peak = balance
+    max_dd = 0.0
+    gross_win = gross_loss = 0.0
+    wins = 0
+    for result, pnl_pct in trades:
+        change = balance * POSITION_FRACTION * pnl_pct / 100
+        balance += change
+        if result == 'TP':
+            wins += 1
+            gross_win += change
+        else:
+            gross_loss -= change
+        peak = max(peak, balance)
+        max_dd = max(max_dd, (peak - balance) / peak * 100 if peak > 0 else 0.0)
+
+    total = len(trades)
+    return SweepResult(
+        sl_pct=params['sl_pct'],
+        tp_pct=params['tp_pct'],
+        adx_thresh=params['adx_thresh'],
+        trades=total,
+        wins=wins,
+        losses=total - wins,
+        win_rate=wins / total * 100 if total else 0.0,
+        roi=(balance - INITIAL_BALANCE) / INITIAL_BALANCE * 100,
+        profit_factor=gross_win / gross_loss if gross_loss > 0 else (float('inf') if gross_win > 0 else 0.0),
+        max_drawdown=max_dd,
+        final_balance=balance,
+    )
+
+
+def evaluate(params: Dict) -> SweepResult:
+    """One parameter set over every symbol (runs inside a worker)"""
+    trades = []
+    for (_, cols), engine in zip(_WORKER['symbols'], _WORKER['engines']):
+        trades.extend(simulate_symbol(cols, params['sl_pct'], params['tp_pct'], params['adx_thresh'], engine))
+    return score(params, trades)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SEARCH
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _round(params: Dict) -> Dict:
+    return {
+        'sl_pct': round(float(params['sl_pct']), 4),
+        'tp_pct': round(float(params['tp_pct']), 4),
+        'adx_thresh': int(params['adx_thresh']),
+    }
+
+
+def grid_params(space: Dict = PARAM_SPACE) -> List[Dict]:
+    axes = {k: np.arange(lo, hi + step / 2, step) for k, (lo, hi, step) in space.items()}
+    return [_round(dict(zip(axes, combo))) for combo in itertools.product(*axes.values())]
+
+
+def random_params(trials: int, space: Dict = PARAM_SPACE, seed: int = 42) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(trials):
+        out.append(_round({
+            'sl_pct': rng.uniform(*space['sl_pct'][:2]),
+            'tp_pct': rng.uniform(*space['tp_pct'][:2]),
+            'adx_thresh': rng.integers(space['adx_thresh'][0], space['adx_thresh'][1] + 1),
+        }))
+    return out
+
+
+class Sweep:
+    """Fan parameter sets out over a process pool that shares one data block"""
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], workers: int = None):
+        self.frames = frames
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.results: List[SweepResult] = []
+
+    def run(self, mode: str = 'grid', trials: int = 100, space: Dict = PARAM_SPACE,
+            seed: int = 42) -> pd.DataFrame:
+        shared = SharedData(self.frames)
+        t0 = time.time()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_attach,
+                                     initargs=(shared.spec,)) as pool:
+                if mode == 'bayes' and OPTUNA_AVAILABLE:
+                    self.results = self._run_bayes(pool, trials, space, seed)
+                else:
+                    if mode == 'bayes':
+                        print("[Sweep] optuna not installed - bayes falls back to random search")
+                    params = grid_params(space) if mode == 'grid' else random_params(trials, space, seed)
+                    chunk = max(1, len(params) // (self.workers * 4))
+                    self.results = list(pool.map(evaluate, params, chunksize=chunk))
+        finally:
+            shared.close()
+
+        elapsed = time.time() - t0
+        print(f"[Sweep] {len(self.results)} parameter sets × {len(self.frames)} symbols "
+              f"in {elapsed:.1f}s ({self.workers} workers)")
+        return self.table()
+
+    def _run_bayes(self, pool, trials: int, space: Dict, seed: int) -> List[SweepResult]:
+        """TPE (optuna ask/tell) in batches of `workers` trials"""
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        study = optuna.create_study(direction='maximize', sampler=optuna.samplers.TPESampler(seed=seed))
+        results = []
+        while len(results) < trials:
+            batch = [study.ask() for _ in range(min(self.workers, trials - len(results)))]
+            params = [_round({
+                'sl_pct': t.suggest_float('sl_pct', *space['sl_pct'][:2]),
+                'tp_pct': t.suggest_float('tp_pct', *space['tp_pct'][:2]),
+                'adx_thresh': t.suggest_int('adx_thresh', *space['adx_thresh'][:2]),
+            }) for t in batch]
+            for trial, result in zip(batch, pool.map(evaluate, params)):
+                study.tell(trial, result.roi)
+                results.append(result)
+        return results
+
+    def table(self) -> pd.DataFrame:
+        """Results ranked by ROI"""
+        df = pd.DataFrame([asdict(r) for r in self.results])
+        if df.empty:
+            return df
+        return df.sort_values(['roi', 'profit_factor'], ascending=False).reset_index(drop=True)
+
+    def save(self, table: pd.DataFrame, path: str = None) -> str:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = path or os.path.join(RESULTS_DIR, f"sweep_{datetime.now():%Y%m%d_%H%M%S}.csv")
+        table.to_csv(path, index=False)
+        return path
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MAIN
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _arg(name: str, default: str) -> str:
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv[:-1] else default
+
+
+def main():
+    import ccxt
+
+    mode = _arg('--mode', 'grid')
+    trials = int(_arg('--trials', '100'))
+    days = float(_arg('--days', str(HISTORY_DAYS)))
+    workers = int(_arg('--workers', '0')) or None
+    offline = '--offline' in sys.argv
+
+    exchange = ccxt.binanceusdm({'enableRateLimit': True})
+    history = HistoryStore(exchange) if HISTORY_STORE_AVAILABLE else None
+    symbols = select_symbols(exchange, history, offline)
+
+    t0 = time.time()
+    frames = load_frames(symbols, days, offline, exchange, history)
+    print(f"📥 Loaded {len(frames)} symbols in {time.time() - t0:.1f}s")
+    if not frames:
+        print("❌ No data")
+        return
+
+    sweep = Sweep(frames, workers)
+    table = sweep.run(mode, trials)
+    path = sweep.save(table)
+
+    print()
+    print('=' * 90)
+    print(f'📊 PARAMETER SWEEP ({mode}, {days:g} days, {len(frames)} coins)')
+    print('=' * 90)
+    print(table.head(15).to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+    print(f'\n💾 Saved: {path}')
+
+
+if __name__ == "__main__":
+    main()
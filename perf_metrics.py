@@ -0,0 +1,290 @@
+"""
+Perf Metrics - จับเวลาแต่ละขั้นของ run_cycle (span/timer) + latency histogram แบบ HDR
+- span('agent_a.fetch'): context manager / @timed('...'): decorator → บันทึกเวลาเป็น µs
+- LatencyHistogram: bucket แบบ log-linear (HDR-style) ความละเอียด ~1% ใช้ memory คงที่
+- Export: Prometheus text (/metrics) + ไฟล์ JSON + ข้อความสรุปสำหรับ /perf ใน Telegram
+"""
+import json
+import os
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+SUB_BUCKET_BITS = 7        # 128 sub-buckets per power of two → ≤ 0.8% relative error
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of integer microseconds
+    A value keeps its top SUB_BUCKET_BITS bits: bucket = (shift, value >> shift)
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    @staticmethod
+    def _key(us: int) -> int:
+        shift = max(0, us.bit_length() - SUB_BUCKET_BITS)
+        return (shift << SUB_BUCKET_BITS) + (us >> shift)
+
+    @staticmethod
+    def _upper(key: int) -> int:
+        """Highest value that falls in the bucket"""
+        shift, mantissa = key >> SUB_BUCKET_BITS, key & ((1 << SUB_BUCKET_BITS) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, us: int):
+        us = max(0, int(us))
+        key = self._key(us)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total_us += us
+        self.min_us = us if self.min_us is None else min(self.min_us, us)
+        self.max_us = max(self.max_us, us)
+
+    def merge(self, other: 'LatencyHistogram'):
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, q: float) -> int:
+        """Value (µs) at quantile q (0-1) - upper edge of its bucket, capped at max"""
+        if not self.count:
+            return 0
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(self._upper(key), self.max_us)
+        return self.max_us
+
+    @property
+    def mean_us(self) -> float:
+        return self.total_us / self.count if self.count else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_ms': self.mean_us / 1000,
+            'min_ms': (self.min_us or 0) / 1000,
+            'max_ms': self.max_us / 1000,
+            **{f'p{int(q * 100)}_ms': self.percentile(q) / 1000 for q in QUANTILES},
+        }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REGISTRY / SPANS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class PerfRegistry:
+    """Histogram per stage name (thread-safe)"""
+
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, name: str, us: int):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = LatencyHistogram()
+            hist.record(us)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.started_at = time.time()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: h.to_dict() for name, h in sorted(self.histograms.items())}
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Export
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def prometheus_text(self) -> str:
+        """Prometheus exposition format (summary per stage, seconds)"""
+        lines = [
+            "# HELP alphabot_stage_latency_seconds Latency of each trading-cycle stage",
+            "# TYPE alphabot_stage_latency_seconds summary",
+        ]
+        with self._lock:
+            items = sorted(self.histograms.items())
+            for name, h in items:
+                label = name.replace('"', '')
+                for q in QUANTILES:
+                    lines.append(f'alphabot_stage_latency_seconds{{stage="{label}",quantile="{q}"}} '
+                                 f'{h.percentile(q) / 1e6:.6f}')
+                lines.append(f'alphabot_stage_latency_seconds_sum{{stage="{label}"}} {h.total_us / 1e6:.6f}')
+                lines.append(f'alphabot_stage_latency_seconds_count{{stage="{label}"}} {h.count}')
+            lines.append("# HELP alphabot_stage_latency_max_seconds Slowest call per stage")
+            lines.append("# TYPE alphabot_stage_latency_max_seconds gauge")
+            for name, h in items:
+                lines.append(f'alphabot_stage_latency_max_seconds{{stage="{name}"}} {h.max_us / 1e6:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def save_json(self, path: str):
+        """Atomic write of the snapshot"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        data = {'started_at': self.started_at, 'saved_at': time.time(), 'stages': self.snapshot()}
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def summary_text(self) -> str:
+        """Short table for Telegram /perf"""
+        stages = self.snapshot()
+        if not stages:
+            return "⏱️ ยังไม่มีข้อมูล latency"
+        width = max(len(n) for n in stages)
+        rows = [f"{'stage'.ljust(width)}      n    p50    p95    p99    max (ms)"]
+        for name, s in stages.items():
+            rows.append(f"{name.ljust(width)} {s['count']:>6} {s['p50_ms']:>6.1f} {s['p95_ms']:>6.1f} "
+                        f"{s['p99_ms']:>6.1f} {s['max_ms']:>6.0f}")
+        uptime = (time.time() - self.started_at) / 3600
+        return f"⏱️ <b>Latency per stage</b> ({uptime:.1f}h)\n<pre>" + "\n".join(rows) + "</pre>"
+
+
+class span:
+    """
+    Time a block: `with span('agent_a.fetch'):` (recorded even if the block raises)
+    Also usable as a decorator: @span('agent_b.signal')
+    """
+    __slots__ = ('name', 'registry', '_t0')
+
+    def __init__(self, name: str, registry: PerfRegistry = None):
+        self.name = name
+        self.registry = registry
+
+    def __enter__(self):
+        self._t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        (self.registry or _registry).record(self.name, (time.perf_counter_ns() - self._t0) // 1000)
+        return False
+
+    def __call__(self, fn):
+        name, registry = self.name, self.registry
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                (registry or _registry).record(name, (time.perf_counter_ns() - t0) // 1000)
+        return wrapper
+
+
+timed = span  # Decorator spelling
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# EXPORTER
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class PerfExporter:
+    """GET /metrics (Prometheus) and /metrics.json on localhost + periodic JSON file"""
+
+    def __init__(self, registry: PerfRegistry = None, port: int = 9108, json_path: str = None,
+                 interval: float = 60.0, host: str = '127.0.0.1'):
+        self.registry = registry or _registry
+        self.port = port
+        self.host = host
+        self.json_path = json_path
+        self.interval = interval
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+
+    def start(self) -> 'PerfExporter':
+        if self.port:
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path == '/metrics':
+                        body, kind = registry.prometheus_text().encode(), 'text/plain; version=0.0.4'
+                    elif self.path == '/metrics.json':
+                        body, kind = json.dumps(registry.snapshot()).encode(), 'application/json'
+                    else:
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', kind)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if self.json_path:
+            threading.Thread(target=self._write_loop, daemon=True).start()
+        return self
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.registry.save_json(self.json_path)
+            except OSError as e:
+                print(f"[Perf] Failed to write {self.json_path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        if self.json_path:
+            try:
+                self.registry.save_json(self.json_path)
+            except OSError:
+                pass
+
+
+_registry = PerfRegistry()
+
+
+def get_registry() -> PerfRegistry:
+    """Process-wide registry used by span()/timed() without an explicit one"""
+    return _registry
+
+
+# For testing: python perf_metrics.py
+if __name__ == "__main__":
+    import random
+
+    rng = random.Random(0)
+    values = [int(rng.lognormvariate(8, 1)) for _ in range(100000)]
+    hist = LatencyHistogram()
+    for v in values:
+        hist.record(v)
+    ordered = sorted(values)
+    for q in QUANTILES:
+        exact = ordered[int(q * len(ordered)) - 1]
+        print(f"p{int(q * 100)}: hdr {hist.percentile(q)}µs vs exact {exact}µs "
+              f"({abs(hist.percentile(q) - exact) / exact * 100:.2f}% off) | {len(hist.counts)} buckets")
+
+    for _ in range(50):
+        with span('demo.sleep'):
+            time.sleep(0.001)
+    print(get_registry().prometheus_text())
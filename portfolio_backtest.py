@@ -0,0 +1,451 @@
+"""
+Portfolio Backtest - backtest หลายเหรียญพร้อมกันบนทุนก้อนเดียว (shared balance)
+- รวมแท่งของทุก symbol ตามเวลาด้วย k-way heap merge (heapq.merge) → เดินทีละ timestamp
+- AgentC ตัวเดียวเป็น book กลาง: balance / DSL / MDD / cooldown ใช้ร่วมกันทุก position
+- สัญญาณที่เกิดพร้อมกันเรียงตาม confidence แล้วเปิดจนครบ MAX_POSITIONS (เหมือน scan_and_trade)
+- อ่าน history ทีละ partition รายเดือน + คำนวณ indicators ทีละก้อน → memory ไม่โตตามจำนวนวัน
+"""
+import heapq
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import EWMA_LAMBDA, ANNUALIZE
+
+
+INDICATOR_WARMUP = 500    # Raw candles carried into the next chunk (EMA/ADX/MACD converge well before this)
+MIN_CHUNK = 300           # Smaller partitions are merged with the next one
+DECISION_LOG_LIMIT = 1000 # Decisions kept in memory during a run (thousands of signals per day)
+
+# Per-bar values read by the engine (one row per bar, same order)
+BAR_FIELDS = ('close', 'returns', 'rsi', 'ema_fast', 'ema_slow', 'adx', 'macd_hist',
+              'bb_upper', 'bb_lower', 'atr', 'volume_zscore', 'volatility')
+
+
+def bar_columns(df: pd.DataFrame, config) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indicator frame → (timestamps ms, values (n, len(BAR_FIELDS)))
+    Missing optional columns: bands fall back to close, ATR/Volatility to NaN, z-score to 0
+    """
+    n = len(df)
+    close = df['close'].to_numpy(dtype=np.float64)
+    nan = np.full(n, np.nan)
+
+    def col(name, default):
+        return df[name].to_numpy(dtype=np.float64) if name in df.columns else default
+
+    values = np.column_stack([
+        close,
+        df['Returns'].to_numpy(dtype=np.float64),
+        df[f'RSI_{config.RSI_PERIOD}'].to_numpy(dtype=np.float64),
+        df[f'EMA_{config.EMA_FAST}'].to_numpy(dtype=np.float64),
+        df[f'EMA_{config.EMA_SLOW}'].to_numpy(dtype=np.float64),
+        df[f'ADX_{config.ADX_PERIOD}'].to_numpy(dtype=np.float64),
+        df['MACDh_12_26_9'].to_numpy(dtype=np.float64),
+        col(f'BBU_{config.BB_PERIOD}_{config.BB_STD}_{config.BB_STD}', close),
+        col(f'BBL_{config.BB_PERIOD}_{config.BB_STD}_{config.BB_STD}', close),
+        col('ATRr_14', nan),
+        col('Volume_Zscore', np.zeros(n)),
+        col('Volatility', nan),
+    ]) if n else np.empty((0, len(BAR_FIELDS)))
+    return df.index.as_unit('ms').asi8, values
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FEEDS - iterators of (timestamp_ms, symbol_idx, values) in time order
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _emit(ts: np.ndarray, values: np.ndarray, idx: int, after_ms: int) -> Iterator[tuple]:
+    start = int(np.searchsorted(ts, after_ms, side='right'))
+    for i in range(start, len(ts)):
+        yield int(ts[i]), idx, values[i].tolist()
+
+
+def frame_feed(df: pd.DataFrame, config, idx: int) -> Iterator[tuple]:
+    """Feed over a frame already processed by AgentA.calculate_indicators"""
+    ts, values = bar_columns(df, config)
+    yield from _emit(ts, values, idx, -1)
+
+
+def history_feed(agent_a, partitions, idx: int, since_ms: int = None) -> Iterator[tuple]:
+    """
+    Feed over raw candle partitions (HistoryStore.iter_partitions)
+    Indicators are computed one chunk at a time, with the last INDICATOR_WARMUP raw
+    candles of the previous chunk prepended so the values carry on seamlessly
+    """
+    config = agent_a.config
+    carry = np.empty((0, 6))
+    last_ms = (since_ms - 1) if since_ms is not None else -1
+
+    def chunk(raw: np.ndarray):
+        df = pd.DataFrame(raw[:, 1:], columns=['open', 'high', 'low', 'close', 'volume'])
+        df.index = pd.DatetimeIndex(pd.to_datetime(raw[:, 0].astype(np.int64), unit='ms'), name='timestamp')
+        df = agent_a.calculate_indicators(df)
+        if f'RSI_{config.RSI_PERIOD}' not in df.columns:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(BAR_FIELDS)))
+        return bar_columns(df, config)
+
+    for data in partitions:
+        raw = np.concatenate([carry, np.asarray(data, dtype=np.float64)])
+        if int((raw[:, 0] > last_ms).sum()) < MIN_CHUNK:
+            carry = raw
+            continue
+        ts, values = chunk(raw)
+        carry = raw[-INDICATOR_WARMUP:]
+        for bar in _emit(ts, values, idx, last_ms):
+            last_ms = bar[0]
+            yield bar
+
+    if len(carry) and carry[-1, 0] > last_ms:
+        ts, values = chunk(carry)
+        yield from _emit(ts, values, idx, last_ms)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class _SymbolState:
+    """Running per-symbol state (same O(1) updates as IncrementalBacktestEngine)"""
+    __slots__ = ('bars', 'ewma_var', 'atr_sum', 'atr_count', 'last_close', 'last_ms')
+
+    def __init__(self):
+        self.bars = 0
+        self.ewma_var = None
+        self.atr_sum = 0.0
+        self.atr_count = 0
+        self.last_close = None
+        self.last_ms = None
+
+
+class PortfolioBacktestEngine:
+    """
+    Time-synchronized backtest of many symbols on one shared book
+    - Bars of all symbols are merged by open time; each timestamp is one step:
+      1) update every open position with its symbol's close
+      2) collect signals of flat symbols, rank by confidence, open up to max_positions
+    - The bot's AgentC is the book: each position is swapped into agent_c.position while
+      it is updated/opened, so balance, fees, SL/TP/Trailing/Breakeven, cooldown and risk
+      limits are exactly the single-symbol rules
+    - Position size = min(signal size, 1 / max_positions, free capital) of the balance
+    """
+
+    WARMUP_BARS = 100  # Per symbol, same as the single-symbol engines
+
+    def __init__(self, bot, max_positions: int = None, notify: bool = False):
+        self.bot = bot
+        self.config = bot.config
+        self.max_positions = max_positions or getattr(self.config, 'MAX_POSITIONS', 3)
+        self.notify = notify
+
+        self.positions: Dict[str, Any] = {}          # symbol → Position
+        self.trade_symbols: Dict[int, str] = {}      # trade.id → symbol
+        self.equity_curve: List[Dict] = []
+        self.signals_seen = 0
+        self.signals_skipped = 0                     # Ranked out: book full / no free capital
+        self.max_concurrent = 0
+
+    def _volatility(self, state: _SymbolState, ret: float, precomputed: float) -> float:
+        if precomputed == precomputed:  # Not NaN
+            return precomputed
+        sq = ret ** 2
+        state.ewma_var = sq if state.ewma_var is None else EWMA_LAMBDA * state.ewma_var + (1 - EWMA_LAMBDA) * sq
+        return float(np.sqrt(state.ewma_var) * ANNUALIZE)
+
+    def _analysis(self, state: _SymbolState, ts_ms: int, v: list) -> Optional[Dict]:
+        """Fold one bar into the symbol state; analysis dict once past warm-up"""
+        (close, ret, rsi, ema_fast, ema_slow, adx, macd_hist,
+         bb_upper, bb_lower, atr, vol_z, vol_pre) = v
+        state.bars += 1
+        volatility = self._volatility(state, ret, vol_pre)
+        if atr == atr:
+            state.atr_sum += atr
+            state.atr_count += 1
+            avg_atr = state.atr_sum / state.atr_count
+        else:
+            atr, avg_atr = 0, 0
+        if state.bars <= self.WARMUP_BARS:
+            return None
+
+        market_state = self.bot.agent_a.classify_market_state(adx, ema_fast, ema_slow, atr, avg_atr)
+        return {
+            'valid': True,
+            'timestamp': pd.Timestamp(ts_ms, unit='ms'),
+            'price': close,
+            'volatility': volatility,
+            'volume_zscore': vol_z,
+            'volume_spike': vol_z > 3,
+            'pattern': 'None',
+            'market_state': market_state.value,
+            'risk_level': 0.2,
+            'indicators': {
+                'rsi': rsi,
+                'ema_fast': ema_fast,
+                'ema_slow': ema_slow,
+                'adx': adx,
+                'macd_hist': macd_hist,
+                'bb_upper': bb_upper,
+                'bb_lower': bb_lower,
+            }
+        }
+
+    def _update(self, symbol: str, price: float, bar_time: datetime):
+        """Run AgentC's exit rules on one position"""
+        agent_c = self.bot.agent_c
+        agent_c.position = self.positions[symbol]
+        try:
+            trade = agent_c.update_position(price)
+        finally:
+            agent_c.position = None
+        if trade:
+            del self.positions[symbol]
+            self._record(symbol, trade, bar_time)
+        return trade
+
+    def _record(self, symbol: str, trade, bar_time: datetime):
+        trade.exit_time = bar_time
+        self.trade_symbols[trade.id] = symbol
+        self.bot.agent_b.update_from_trade(trade)
+        self.equity_curve.append({'time': bar_time, 'balance': self.bot.agent_c.balance,
+                                  'open_positions': len(self.positions)})
+
+    def _open(self, symbol: str, signal, price: float, bar_time: datetime) -> bool:
+        agent_c = self.bot.agent_c
+        if agent_c.balance <= 0:
+            return False
+        committed = sum(p.size for p in self.positions.values())
+        free = max(agent_c.balance - committed, 0.0) / agent_c.balance
+        signal.position_size = min(signal.position_size, 1.0 / self.max_positions, free)
+        if signal.position_size <= 0:
+            return False
+
+        agent_c.position = None
+        try:
+            opened = agent_c.execute_signal(signal, price)
+            if opened:
+                agent_c.position.entry_time = bar_time
+                self.positions[symbol] = agent_c.position
+        finally:
+            agent_c.position = None
+        return opened
+
+    def _step(self, ts_ms: int, bars: List[tuple], symbols: List[str],
+              states: List[_SymbolState]) -> bool:
+        """One timestamp across all symbols; False when a risk limit stops the run"""
+        agent_c = self.bot.agent_c
+        bar_time = pd.Timestamp(ts_ms, unit='ms').to_pydatetime()
+        candidates = []
+
+        for _, idx, values in bars:
+            symbol, state = symbols[idx], states[idx]
+            price = values[0]
+            state.last_close, state.last_ms = price, ts_ms
+            analysis = self._analysis(state, ts_ms, values)
+
+            if symbol in self.positions:
+                self._update(symbol, price, bar_time)
+            if symbol not in self.positions and analysis is not None:
+                signal = self.bot.agent_b.generate_signal(analysis)
+                if signal:
+                    candidates.append((signal.confidence, idx, signal, price))
+
+        # Highest confidence first (ties: symbol order)
+        if candidates:
+            self.signals_seen += len(candidates)
+            candidates.sort(key=lambda c: (-c[0], c[1]))
+            for k, (_, idx, signal, price) in enumerate(candidates):
+                if len(self.positions) >= self.max_positions:
+                    self.signals_skipped += len(candidates) - k
+                    break
+                if not self._open(symbols[idx], signal, price, bar_time) and agent_c.is_halted:
+                    break
+        self.max_concurrent = max(self.max_concurrent, len(self.positions))
+
+        can_trade, reason = agent_c.check_risk_limits()
+        if not can_trade:
+            self.bot.logger.warning(f"Risk limit hit: {reason}")
+            return False
+        return True
+
+    def run(self, feeds: Dict[str, Iterator[tuple]],
+            progress_callback: Callable[[int, int], None] = None) -> Dict[str, Any]:
+        """
+        feeds: symbol → iterator of (timestamp_ms, symbol_idx, values) where symbol_idx
+        is the symbol's position in `feeds` (see frame_feed / history_feed)
+        """
+        agent_c = self.bot.agent_c
+        symbols = list(feeds)
+        states = [_SymbolState() for _ in symbols]
+        start_time = time.time()
+
+        saved_telegram = agent_c.telegram
+        if not self.notify:
+            agent_c.telegram = None
+        # Bounded decision log (AlphaBotLogger keeps every decision in a list)
+        logger = self.bot.logger
+        saved_decisions = getattr(logger, 'decisions', None)
+        if saved_decisions is not None:
+            logger.decisions = deque(maxlen=DECISION_LOG_LIMIT)
+
+        self.positions = {}
+        self.trade_symbols = {}
+        self.equity_curve = []
+        self.signals_seen = self.signals_skipped = self.max_concurrent = 0
+        steps = bars_total = 0
+
+        try:
+            # k-way merge: only the head bar of each feed is held by the heap
+            merged = heapq.merge(*feeds.values(), key=lambda bar: (bar[0], bar[1]))
+            group: List[tuple] = []
+            for bar in merged:
+                if group and bar[0] != group[0][0]:
+                    steps += 1
+                    bars_total += len(group)
+                    if not self._step(group[0][0], group, symbols, states):
+                        group = []
+                        break
+                    if progress_callback and steps % 1000 == 0:
+                        progress_callback(steps, bars_total)
+                    group = []
+                group.append(bar)
+            if group:
+                steps += 1
+                bars_total += len(group)
+                self._step(group[0][0], group, symbols, states)
+
+            # Close what is still open at each symbol's last close
+            for symbol in list(self.positions):
+                state = states[symbols.index(symbol)]
+                agent_c.position = self.positions.pop(symbol)
+                trade = agent_c._close_position(state.last_close, 'END_OF_TEST')
+                self._record(symbol, trade, pd.Timestamp(state.last_ms, unit='ms').to_pydatetime())
+        finally:
+            agent_c.position = None
+            agent_c.telegram = saved_telegram
+            if saved_decisions is not None:
+                logger.decisions = saved_decisions + list(logger.decisions)
+
+        if progress_callback:
+            progress_callback(steps, bars_total)
+
+        elapsed = time.time() - start_time
+        return {
+            'symbols': len(symbols),
+            'steps': steps,
+            'bars': bars_total,
+            'elapsed_sec': elapsed,
+            'bars_per_sec': bars_total / elapsed if elapsed > 0 else 0,
+            'trades': list(agent_c.trades),
+            'stats': agent_c.get_stats(),
+            'equity_curve': self.equity_curve,
+            'per_symbol': self.per_symbol(),
+            'max_positions': self.max_positions,
+            'max_concurrent': self.max_concurrent,
+            'signals_seen': self.signals_seen,
+            'signals_skipped': self.signals_skipped,
+        }
+
+    def per_symbol(self) -> Dict[str, Dict[str, float]]:
+        """PnL / trades / wins per symbol from the shared trade list"""
+        out: Dict[str, Dict[str, float]] = {}
+        for trade in self.bot.agent_c.trades:
+            symbol = self.trade_symbols.get(trade.id, '?')
+            row = out.setdefault(symbol, {'pnl': 0.0, 'trades': 0, 'wins': 0})
+            row['pnl'] += trade.pnl
+            row['trades'] += 1
+            row['wins'] += trade.pnl > 0
+        return out
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# HELPERS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def history_feeds(bot, symbols: List[str], days: float, offline: bool = False) -> Dict[str, Iterator[tuple]]:
+    """Sync (unless offline) and open one lazy history_feed per symbol"""
+    from history_store import HistoryStore
+
+    agent_a = bot.agent_a
+    store = getattr(agent_a, 'history_store', None) or HistoryStore(agent_a.exchange)
+    agent_a.history_store = store
+    timeframe = bot.config.TIMEFRAME
+    since = datetime.utcnow() - timedelta(days=days)
+    since_ms = int(pd.Timestamp(since).timestamp() * 1000)
+    # Earlier candles only warm up the indicators
+    warm_ms = since_ms - INDICATOR_WARMUP * int(pd.Timedelta(timeframe).total_seconds() * 1000)
+
+    feeds = {}
+    for symbol in symbols:
+        if not offline:
+            try:
+                fetched = store.update(symbol, timeframe, since)
+                if fetched:
+                    bot.logger.info(f"[Portfolio] {symbol} {timeframe}: +{fetched} candles")
+            except Exception as e:
+                bot.logger.error(f"[Portfolio] {symbol} sync failed, using cache: {e}")
+        feeds[symbol] = history_feed(agent_a, store.iter_partitions(symbol, timeframe, warm_ms),
+                                     len(feeds), since_ms)
+    return feeds
+
+
+def print_portfolio_report(result: Dict[str, Any], initial_capital: float, log=print):
+    stats = result['stats']
+    log("=" * 60)
+    log(f"📊 PORTFOLIO BACKTEST - {result['symbols']} symbols | max {result['max_positions']} positions")
+    log("=" * 60)
+    rows = sorted(result['per_symbol'].items(), key=lambda kv: kv[1]['pnl'], reverse=True)
+    for symbol, row in rows:
+        wr = row['wins'] / row['trades'] * 100 if row['trades'] else 0
+        log(f"  {symbol}: PnL ${row['pnl']:+.2f} | {row['trades']} trades | WR {wr:.1f}%")
+    log("-" * 60)
+    pf = stats.get('profit_factor', 0)
+    pf_text = "∞" if math.isinf(pf) else f"{pf:.2f}"
+    log(f"  🎯 TOTAL: PnL ${stats['total_pnl']:.2f} | ROI {stats['roi']*100:.2f}% | "
+        f"{stats['total_trades']} trades | WR {stats['win_rate']*100:.1f}% | PF {pf_text}")
+    log(f"  💰 Balance ${stats['balance']:.2f} (start ${initial_capital:.2f}) | "
+        f"peak concurrent {result['max_concurrent']}")
+    log(f"  📡 Signals {result['signals_seen']} | skipped (book full) {result['signals_skipped']}")
+    log(f"  ⚡ {result['bars']:,} bars / {result['steps']:,} steps in {result['elapsed_sec']:.1f}s "
+        f"({result['bars_per_sec']:,.0f} bars/s)")
+    log("=" * 60)
+
+
+# For testing: python portfolio_backtest.py [SYMBOLS] [DAYS]   (synthetic candles, offline)
+if __name__ == "__main__":
+    import sys
+    from alphabot_v4 import AlphaBotV4, Config
+
+    n_symbols = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    days = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    config = Config()
+    config.SIGNAL_PREVIEW = False
+    bot = AlphaBotV4(config)
+    bot.telegram.enabled = False
+
+    bars = int(days * 24 * 12)
+    rng = np.random.default_rng(0)
+    start_ms = int(pd.Timestamp('2024-01-01').timestamp() * 1000)
+
+    def partitions(seed):
+        # One synthetic "month" (8640 x 5m) at a time, like HistoryStore.iter_partitions
+        r = np.random.default_rng(seed)
+        price = 100.0
+        for first in range(0, bars, 8640):
+            k = min(8640, bars - first)
+            close = price * np.exp(np.cumsum(r.normal(0, 0.003, k)))
+            price = close[-1]
+            opens = np.concatenate([[close[0]], close[:-1]])
+            ts = start_ms + (first + np.arange(k)) * 300000
+            high = np.maximum(opens, close) * (1 + np.abs(r.normal(0, 0.001, k)))
+            low = np.minimum(opens, close) * (1 - np.abs(r.normal(0, 0.001, k)))
+            yield np.column_stack([ts, opens, high, low, close, r.uniform(100, 1000, k)])
+
+    feeds = {f"SYM{i}/USDT": history_feed(bot.agent_a, partitions(i), i) for i in range(n_symbols)}
+    result = PortfolioBacktestEngine(bot, max_positions=3).run(feeds)
+    print_portfolio_report(result, config.INITIAL_CAPITAL)
@@ -1,20 +1,58 @@
 #!/usr/bin/env python3
-"""Quick Backtest Script"""
+"""Quick Backtest Script (python quick_backtest.py [--offline])"""
+import sys
 import ccxt
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from history_store import HistoryStore
+    HISTORY_STORE_AVAILABLE = True
+except ImportError:
+    HISTORY_STORE_AVAILABLE = False
+
+try:
+    from market_meta import load_markets
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
+try:
+    from param_sweep import signal_masks
+    SIGNAL_MASKS_AVAILABLE = True
+except ImportError:
+    SIGNAL_MASKS_AVAILABLE = False
+
+try:
+    from exit_engine import ExitEngine
+    EXIT_ENGINE_AVAILABLE = True
+except ImportError:
+    EXIT_ENGINE_AVAILABLE = False
+
+OFFLINE = '--offline' in sys.argv  # อ่านจาก history cache อย่างเดียว
+HISTORY_DAYS = 5
+BASES = ['BTC', 'ETH', 'SOL', 'XRP', 'LINK', 'LTC', 'AVAX', 'DOT', 'ADA', 'OP', 'ARB', 'INJ', 'SUI', 'NEAR', 'BNB']
+
 exchange = ccxt.binanceusdm({'enableRateLimit': True})
-exchange.load_markets()
+history = HistoryStore(exchange) if HISTORY_STORE_AVAILABLE else None
 
 # Get symbols
 COINS = []
-for sym in exchange.symbols:
+if OFFLINE and history is not None:
+    symbols = history.symbols()
+else:
+    if MARKET_META_AVAILABLE:
+        load_markets(exchange)  # data/markets cache (TTL 24h)
+    else:
+        exchange.load_markets()
+    symbols = exchange.symbols
+for sym in symbols:
     if sym.endswith(':USDT') and '/USDT' in sym:
         base = sym.split('/')[0]
-        if base in ['BTC', 'ETH', 'SOL', 'XRP', 'LINK', 'LTC', 'AVAX', 'DOT', 'ADA', 'OP', 'ARB', 'INJ', 'SUI', 'NEAR', 'BNB']:
+        if base in BASES:
             COINS.append(sym)
 
 print(f'Testing {len(COINS)} coins: {COINS[:5]}...')
@@ -22,6 +60,59 @@ print(f'Testing {len(COINS)} coins: {COINS[:5]}...')
 LEVERAGE = 20
 INITIAL_BALANCE = 4.50
 
+_FRAMES = {}  # symbol → candles (ดึงครั้งเดียว ใช้ซ้ำทุก config)
+
+def load_candles(symbol):
+    if symbol not in _FRAMES:
+        if history is not None:
+            _FRAMES[symbol] = history.get(symbol, '5m', HISTORY_DAYS, offline=OFFLINE).reset_index()
+        else:
+            ohlcv = exchange.fetch_ohlcv(symbol, '5m', limit=1500)
+            _FRAMES[symbol] = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    return _FRAMES[symbol].copy()
+
+def scan_signals(df, adx_thresh):
+    """Bar-by-bar entry rules (fallback when param_sweep.signal_masks is missing)"""
+    long_sig = np.zeros(len(df), dtype=bool)
+    short_sig = np.zeros(len(df), dtype=bool)
+    for i in range(len(df)):
+        adx = df['adx'].iloc[i]
+        rsi = df['rsi'].iloc[i]
+        macd_hist = df['macd_hist'].iloc[i]
+        ema_fast = df['ema_3'].iloc[i]
+        ema_slow = df['ema_8'].iloc[i]
+        ema_trend = df['ema_20'].iloc[i]
+        
+        if pd.isna(adx):
+            continue
+        
+        if ema_fast > ema_slow > ema_trend and adx >= adx_thresh and macd_hist > 0 and 40 < rsi < 70:
+            long_sig[i] = True
+        elif ema_fast < ema_slow < ema_trend and adx >= adx_thresh and macd_hist < 0 and 30 < rsi < 60:
+            short_sig[i] = True
+    return long_sig, short_sig
+
+def scan_exits(df, candidates, is_long, sl_pct, tp_pct, horizon):
+    """First SL/TP touch per entry, bar by bar (fallback when exit_engine is missing)"""
+    hit = np.zeros(len(candidates), dtype=bool)
+    is_tp = np.zeros(len(candidates), dtype=bool)
+    exit_idx = np.zeros(len(candidates), dtype=np.int64)
+    for k, i in enumerate(candidates.tolist()):
+        entry = df['close'].iloc[i]
+        sl = entry * (1 - sl_pct) if is_long[k] else entry * (1 + sl_pct)
+        tp = entry * (1 + tp_pct) if is_long[k] else entry * (1 - tp_pct)
+        for j in range(i+1, min(i+horizon, len(df))):
+            high = df['high'].iloc[j]
+            low = df['low'].iloc[j]
+            if is_long[k]:
+                sl_hit, tp_hit = low <= sl, high >= tp
+            else:
+                sl_hit, tp_hit = high >= sl, low <= tp
+            if sl_hit or tp_hit:
+                hit[k], is_tp[k], exit_idx[k] = True, not sl_hit, j
+                break
+    return hit, is_tp, exit_idx
+
 def backtest(name, sl_pct, tp_pct, adx_thresh):
     wins, losses = 0, 0
     balance = INITIAL_BALANCE
@@ -29,8 +120,7 @@ def backtest(name, sl_pct, tp_pct, adx_thresh):
     
     for symbol in COINS:
         try:
-            ohlcv = exchange.fetch_ohlcv(symbol, '5m', limit=1500)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+            df = load_candles(symbol)
             
             df['ema_3'] = ta.ema(df['close'], length=3)
             df['ema_8'] = ta.ema(df['close'], length=8)
@@ -41,71 +131,51 @@ def backtest(name, sl_pct, tp_pct, adx_thresh):
             adx_data = ta.adx(df['high'], df['low'], df['close'], length=14)
             df['adx'] = adx_data['ADX_14'] if adx_data is not None else 0
             
+            # Entry rules for every bar at once → visit only candidate bars
+            if SIGNAL_MASKS_AVAILABLE:
+                cols = {c: df[c].to_numpy(dtype=float) for c in ('ema_3', 'ema_8', 'ema_20', 'rsi', 'macd_hist', 'adx')}
+                long_sig, short_sig = signal_masks(cols, adx_thresh)
+            else:
+                long_sig, short_sig = scan_signals(df, adx_thresh)
+            candidates = np.flatnonzero(long_sig | short_sig)
+            candidates = candidates[(candidates >= 50) & (candidates < len(df) - 30)]
+            
+            # First SL/TP touch inside 150 bars for every candidate at once
+            is_long = long_sig[candidates]
+            if EXIT_ENGINE_AVAILABLE:
+                exits = ExitEngine(df['high'].to_numpy(), df['low'].to_numpy()).resolve(
+                    candidates, is_long, df['close'].to_numpy()[candidates], sl_pct, tp_pct, horizon=150
+                )
+                hit_at, tp_at, exit_at = exits.hit, exits.is_tp, exits.exit_idx
+            else:
+                hit_at, tp_at, exit_at = scan_exits(df, candidates, is_long, sl_pct, tp_pct, 150)
+            
             last_idx = 0
             
-            for i in range(50, len(df)-30):
-                if i < last_idx + 8:
+            for k, i in enumerate(candidates.tolist()):
+                if i < last_idx + 8 or not hit_at[k]:
                     continue
                 
-                adx = df['adx'].iloc[i]
-                rsi = df['rsi'].iloc[i]
-                macd_hist = df['macd_hist'].iloc[i]
-                ema_fast = df['ema_3'].iloc[i]
-                ema_slow = df['ema_8'].iloc[i]
-                ema_trend = df['ema_20'].iloc[i]
+                signal = 'LONG' if is_long[k] else 'SHORT'
+                if tp_at[k]:
+                    hit = 'TP'
+                    wins += 1
+                    pnl_pct = tp_pct * LEVERAGE * 100
+                else:
+                    hit = 'SL'
+                    losses += 1
+                    pnl_pct = -sl_pct * LEVERAGE * 100
                 
-                if pd.isna(adx):
-                    continue
-                
-                trend_up = ema_fast > ema_slow > ema_trend
-                trend_down = ema_fast < ema_slow < ema_trend
-                
-                signal = None
-                if trend_up and adx >= adx_thresh and macd_hist > 0 and 40 < rsi < 70:
-                    signal = 'LONG'
-                elif trend_down and adx >= adx_thresh and macd_hist < 0 and 30 < rsi < 60:
-                    signal = 'SHORT'
-                
-                if signal:
-                    entry = df['close'].iloc[i]
-                    sl = entry * (1 - sl_pct) if signal == 'LONG' else entry * (1 + sl_pct)
-                    tp = entry * (1 + tp_pct) if signal == 'LONG' else entry * (1 - tp_pct)
-                    
-                    for j in range(i+1, min(i+150, len(df))):
-                        high = df['high'].iloc[j]
-                        low = df['low'].iloc[j]
-                        
-                        hit = None
-                        if signal == 'LONG':
-                            if low <= sl:
-                                hit = 'SL'
-                            elif high >= tp:
-                                hit = 'TP'
-                        else:
-                            if high >= sl:
-                                hit = 'SL'
-                            elif low <= tp:
-                                hit = 'TP'
-                        
-                        if hit:
-                            if hit == 'TP':
-                                wins += 1
-                                pnl_pct = tp_pct * LEVERAGE * 100
-                            else:
-                                losses += 1
-                                pnl_pct = -sl_pct * LEVERAGE * 100
-                            
-                            pos_size = balance / 3
-                            balance += pos_size * (pnl_pct / 100)
-                            all_trades.append({
-                                'symbol': symbol,
-                                'signal': signal,
-                                'result': hit,
-                                'pnl_pct': pnl_pct
-                            })
-                            last_idx = j
-                            break
-                            
+                pos_size = balance / 3
+                balance += pos_size * (pnl_pct / 100)
+                all_trades.append({
+                    'symbol': symbol,
+                    'signal': signal,
+                    'result': hit,
+                    'pnl_pct': pnl_pct
+                })
+                last_idx = int(exit_at[k])
+            
         except Exception as e:
             pass
     
@@ -127,7 +197,7 @@ def backtest(name, sl_pct, tp_pct, adx_thresh):
 
 print()
 print('=' * 70)
-print('📊 BACKTEST COMPARISON (5 days data)')
+print(f'📊 BACKTEST COMPARISON ({HISTORY_DAYS} days data)')
 print('=' * 70)
 
 # Test different configs
@@ -159,3 +229,4 @@ print(f'🏆 WINNER: {best["name"]}')
 print(f'   📊 {best["trades"]} trades, {best["wr"]:.1f}% Win Rate')
 print(f'   💰 Balance: ${best["balance"]:.2f} (ROI: {best["roi"]:+.1f}%)')
 print('=' * 70)
+print('💡 Full SL/TP/ADX search: python param_sweep.py --mode grid|random|bayes')
@@ -0,0 +1,591 @@
+"""
+Session Replay - บันทึก session ของ live loop แล้วเล่นซ้ำแบบ deterministic (offline)
+- SessionRecorder: เก็บทุก response ของ exchange (AgentA / ExchangeExecutor) + ผล Perplexity
+  + event ของ user-data stream พร้อมเวลาที่เห็น ลงไฟล์ JSONL แบบ append-only (.gz ได้)
+- ReplayClock: แทน time/datetime ของ alphabot_v4, candle_cache, volatility ด้วยนาฬิกาเสมือน
+  (เดินตามเวลาที่บันทึกไว้, sleep ไม่รอจริง)
+- ReplayExchange: ตอบ fetch_ohlcv / create_order / ... จากไฟล์ตามลำดับเดิม
+- replay_session(): ป้อน AlphaBotV4.run_cycle / run_multi_cycle เร็วกว่าเวลาจริง แล้วเทียบ decision ทุก cycle
+"""
+import dataclasses
+import gzip
+import inspect
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from candle_cache import timeframe_ms
+
+try:
+    from market_meta import MarketMetaCache
+    MARKET_META_AVAILABLE = True
+except ImportError:
+    MARKET_META_AVAILABLE = False
+
+
+# Calls recorded per source (everything else passes straight through)
+# Per-symbol AgentA clients of run_multi_cycle record as 'exchange:<symbol>'
+RECORDED_CALLS = {
+    'exchange': ('fetch_ohlcv', 'fetch_ticker', 'fetch_order_book', 'fetch_trades'),
+    'executor': ('fetch_balance', 'fetch_positions', 'set_leverage', 'set_margin_mode',
+                 'create_market_order', 'create_order', 'create_orders', 'cancel_all_orders', 'fetch_ticker'),
+}
+SECRET_FIELDS = ('KEY', 'SECRET', 'TOKEN', 'CHAT_ID', 'PASSWORD')
+CLOCK_MODULES = ('alphabot_v4', 'candle_cache', 'volatility')
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):  # NumPy scalar
+        return value.item()
+    return str(value)
+
+
+def recorded_calls(source: str) -> tuple:
+    return RECORDED_CALLS.get(source.split(':', 1)[0], ())
+
+
+def summarize_result(result: Dict) -> Dict:
+    """run_cycle() / run_multi_cycle() result → the fields compared between recording and replay"""
+    trade = result.get('trade')
+    trades = result.get('trades')
+    return {
+        'cycle': result.get('cycle'),
+        'action': result.get('action'),
+        'ai_reason': result.get('ai_reason'),
+        'opened': result.get('opened'),
+        'closed': None if trades is None else [t.symbol for t in trades],
+        'trade': None if trade is None else {
+            'side': trade.side,
+            'entry_price': round(float(trade.entry_price), 8),
+            'exit_price': round(float(trade.exit_price), 8),
+            'pnl': round(float(trade.pnl), 8),
+            'exit_reason': trade.exit_reason,
+        },
+    }
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RECORD
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class SessionRecorder:
+    """
+    Append-only JSONL: one record per line, flushed as written
+    {"t": ms, "k": "session" | "cycle" | "call" | "stream" | "result", ...}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self._file = _open(path, 'a')
+        self._lock = threading.Lock()
+
+    def write(self, kind: str, **data):
+        record = {'t': int(time.time() * 1000), 'k': kind}
+        record.update(data)
+        line = json.dumps(record, separators=(',', ':'), default=_json_default)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def wrap(self, target, source: str) -> 'RecordingProxy':
+        return RecordingProxy(target, self, source)
+
+    def tap_stream(self, kind: str, data: Dict):
+        """UserDataStream tap: raw events / REST snapshots / disconnects in arrival order"""
+        self.write('stream', ev=kind, data=data)
+
+    def attach(self, bot):
+        """
+        Record a fresh AlphaBotV4 (call before its first cycle):
+        exchange responses, Perplexity results, and every run_cycle / run_multi_cycle start/result
+        (user-data stream events come through tap_stream, wired by start_user_stream)
+        """
+        config = {
+            k: v for k, v in dataclasses.asdict(bot.config).items()
+            if not any(s in k.upper() for s in SECRET_FIELDS)
+        }
+        agent_c = bot.agent_c
+        meta = getattr(bot.executor, 'meta', None)
+        self.write(
+            'session',
+            config=config,
+            utc_offset=int((datetime.now() - datetime.utcnow()).total_seconds() // 60 * 60),
+            exchange_id=getattr(bot.agent_a.exchange, 'id', 'exchange'),
+            live_mode=bool(bot.config.LIVE_MODE and bot.executor),
+            executor=type(bot.executor).__name__ if bot.executor is not None else None,
+            news_filter=bool(bot.ai_filter and bot.ai_filter.enabled),
+            balance=agent_c.balance,
+            starting_balance=agent_c.starting_balance,
+            peak_balance=agent_c.peak_balance,
+            # Leverage / margin mode already cached → those set_* calls are skipped live
+            symbol_settings=dict(meta.settings) if meta is not None else {},
+        )
+
+        bot.agent_a.exchange = self.wrap(bot.agent_a.exchange, 'exchange')
+        for symbol, agent in getattr(bot, 'symbol_agents', {}).items():
+            if agent is not bot.agent_a:
+                # Own client per symbol (run_multi_cycle worker threads) → own replay queue
+                agent.exchange = self.wrap(agent.exchange, f'exchange:{symbol}')
+        if bot.executor is not None:
+            bot.executor.exchange = self.wrap(bot.executor.exchange, 'executor')
+
+        if bot.ai_filter is not None:
+            analyze = bot.ai_filter.analyze_market_news
+
+            def analyze_market_news():
+                result = analyze()
+                self.write('call', src='news', fn='analyze_market_news', args=[], res=result)
+                return result
+            bot.ai_filter.analyze_market_news = analyze_market_news
+
+        def recording(name: str) -> Callable[[], Dict]:
+            run = getattr(bot, name)
+
+            def recorded_cycle() -> Dict:
+                self.write('cycle', n=bot.cycle_count + 1, fn=name)
+                result = run()
+                self.write('result', **summarize_result(result), cycle_time_ms=result.get('cycle_time_ms'))
+                return result
+            return recorded_cycle
+        bot.run_cycle = recording('run_cycle')
+        bot.run_multi_cycle = recording('run_multi_cycle')
+        bot.recorder = self
+
+
+class RecordingProxy:
+    """Forwards everything to the real exchange; recorded calls are written with their result"""
+
+    def __init__(self, target, recorder: SessionRecorder, source: str):
+        self._target = target
+        self._recorder = recorder
+        self._source = source
+        self._calls = recorded_calls(source)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name not in self._calls or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._write(name, args, kwargs, err=f"{type(e).__name__}: {e}")
+                raise
+            self._write(name, args, kwargs, res=result)
+            return result
+
+        async def async_call(*args, **kwargs):
+            # ccxt.async_support exchange (AsyncExchangeExecutor)
+            try:
+                result = await attr(*args, **kwargs)
+            except Exception as e:
+                self._write(name, args, kwargs, err=f"{type(e).__name__}: {e}")
+                raise
+            self._write(name, args, kwargs, res=result)
+            return result
+        return async_call if inspect.iscoroutinefunction(attr) else call
+
+    def _write(self, name: str, args: tuple, kwargs: Dict, **outcome):
+        self._recorder.write('call', src=self._source, fn=name, args=list(args), kwargs=kwargs, **outcome)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# REPLAY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def load_records(path: str) -> List[Dict]:
+    """Read a session file (a torn last line from a crash is skipped)"""
+    records = []
+    with _open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+class ReplayClock:
+    """Virtual wall clock: jumps to recorded times, sleep() only moves it forward"""
+
+    def __init__(self, start_ms: int, utc_offset_sec: int = 0):
+        self.now_sec = start_ms / 1000
+        self.utc_offset_sec = utc_offset_sec   # Local time of the recording machine
+        self.slept_sec = 0.0
+
+    def set_ms(self, t_ms: int):
+        self.now_sec = t_ms / 1000
+
+    def time(self) -> float:
+        return self.now_sec
+
+    def sleep(self, seconds: float):
+        self.now_sec += seconds
+        self.slept_sec += seconds
+
+    def local(self) -> datetime:
+        return datetime(1970, 1, 1) + timedelta(seconds=self.now_sec + self.utc_offset_sec)
+
+    def utc(self) -> datetime:
+        return datetime(1970, 1, 1) + timedelta(seconds=self.now_sec)
+
+
+class _ClockTime:
+    """Stand-in for the `time` module: time()/sleep() virtual, perf_counter() etc. real"""
+
+    def __init__(self, clock: ReplayClock):
+        self._clock = clock
+
+    def time(self) -> float:
+        return self._clock.time()
+
+    def sleep(self, seconds: float):
+        self._clock.sleep(seconds)
+
+    def __getattr__(self, name: str):
+        return getattr(time, name)
+
+
+def _clock_datetime(clock: ReplayClock):
+    """datetime subclass whose now()/utcnow() read the replay clock"""
+
+    class ClockDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            if tz is not None:
+                return tz.fromutc(clock.utc().replace(tzinfo=tz))
+            return clock.local()
+
+        @classmethod
+        def utcnow(cls):
+            return clock.utc()
+
+    return ClockDatetime
+
+
+class _installed_clock:
+    """Context manager: swap time/datetime in CLOCK_MODULES, restore on exit"""
+
+    def __init__(self, clock: ReplayClock):
+        self.clock = clock
+        self._saved = []
+
+    def __enter__(self):
+        import importlib
+        fake_time = _ClockTime(self.clock)
+        fake_datetime = _clock_datetime(self.clock)
+        for name in CLOCK_MODULES:
+            try:
+                module = importlib.import_module(name)
+            except ImportError:
+                continue
+            for attr, fake in (('time', fake_time), ('datetime', fake_datetime)):
+                if attr in vars(module):
+                    self._saved.append((module, attr, getattr(module, attr)))
+                    setattr(module, attr, fake)
+        return self.clock
+
+    def __exit__(self, *exc):
+        for module, attr, value in reversed(self._saved):
+            setattr(module, attr, value)
+        self._saved = []
+        return False
+
+
+class RecordedError(Exception):
+    """Exception replayed from the recording"""
+
+
+class ReplayExchange:
+    """
+    Serves recorded calls of one source in their original order (per method)
+    Args that differ from the recording are counted, the recorded response is still returned
+    """
+
+    def __init__(self, source: str, calls: List[Dict], clock: ReplayClock, exchange_id: str = 'exchange',
+                 asynchronous: bool = False, before_call: Callable[[Dict], None] = None):
+        self.id = exchange_id
+        self._source = source
+        self._clock = clock
+        self._asynchronous = asynchronous      # ccxt.async_support stand-in (AsyncExchangeExecutor)
+        self._before_call = before_call        # Runs with the record about to be served
+        self._queues: Dict[str, deque] = defaultdict(deque)
+        for record in calls:
+            self._queues[record['fn']].append(record)
+        self.served = 0
+        self.arg_mismatches: List[str] = []
+        self.missing: List[str] = []
+
+    def parse_timeframe(self, timeframe: str) -> int:
+        return timeframe_ms(timeframe) // 1000
+
+    def load_markets(self, *args, **kwargs):
+        if self._asynchronous:
+            async def loaded():
+                return {}
+            return loaded()
+        return {}
+
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def __getattr__(self, name: str):
+        if name.startswith('_') or name not in recorded_calls(self._source):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            queue = self._queues.get(name)
+            if not queue:
+                self.missing.append(name)
+                raise RecordedError(f"{self._source}.{name}: no recorded response left")
+            record = queue.popleft()
+            self.served += 1
+            if self._before_call is not None:
+                self._before_call(record)
+            self._clock.set_ms(record['t'])
+            if json.loads(json.dumps([list(args), kwargs], default=_json_default)) != [record['args'], record.get('kwargs', {})]:
+                self.arg_mismatches.append(f"{name}{tuple(args)} ≠ recorded {record['args']}")
+            if 'err' in record:
+                raise RecordedError(record['err'])
+            return record['res']
+
+        async def async_call(*args, **kwargs):
+            return call(*args, **kwargs)
+        return async_call if self._asynchronous else call
+
+
+@dataclass
+class ReplayReport:
+    cycles: int = 0
+    mismatches: List[Dict] = field(default_factory=list)   # Cycles whose decision differs
+    actions: Dict[str, int] = field(default_factory=dict)
+    session_sec: float = 0.0                               # Recorded wall time covered
+    replay_sec: float = 0.0
+    cycle_ms: List[float] = field(default_factory=list)    # Replay latency per cycle
+    recorded_cycle_ms: List[float] = field(default_factory=list)
+    calls_served: int = 0
+    calls_left: int = 0
+    stream_events: int = 0                                 # User-data stream records applied
+    stream_left: int = 0
+    arg_mismatches: List[str] = field(default_factory=list)
+    missing_calls: List[str] = field(default_factory=list)
+
+    @property
+    def identical(self) -> bool:
+        return not self.mismatches and not self.missing_calls
+
+    @property
+    def speedup(self) -> float:
+        return self.session_sec / self.replay_sec if self.replay_sec > 0 else 0.0
+
+    def summary(self) -> str:
+        def pct(values, q):
+            if not values:
+                return 0.0
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        lines = [
+            f"🎬 Replayed {self.cycles} cycles ({self.session_sec / 3600:.2f}h recorded) "
+            f"in {self.replay_sec:.2f}s - {self.speedup:,.0f}x real time",
+            f"{'✅ Identical decisions' if self.identical else '❌ Decisions diverged'}: "
+            f"{len(self.mismatches)} mismatched cycles | actions {self.actions}",
+            f"📡 Calls served {self.calls_served} | left {self.calls_left} | "
+            f"arg mismatches {len(self.arg_mismatches)} | missing {len(self.missing_calls)} | "
+            f"stream events {self.stream_events} (left {self.stream_left})",
+            f"⏱️ Cycle latency replay p50 {pct(self.cycle_ms, 0.5):.2f}ms p95 {pct(self.cycle_ms, 0.95):.2f}ms "
+            f"max {max(self.cycle_ms, default=0):.2f}ms | recorded p50 {pct(self.recorded_cycle_ms, 0.5):.0f}ms "
+            f"p95 {pct(self.recorded_cycle_ms, 0.95):.0f}ms",
+        ]
+        for m in self.mismatches[:5]:
+            lines.append(f"   cycle {m['cycle']}: recorded {m['recorded']} → replay {m['replay']}")
+        return "\n".join(lines)
+
+
+def replay_session(path: str, on_cycle: Callable[[int, Dict], None] = None,
+                   config_overrides: Dict[str, Any] = None) -> ReplayReport:
+    """
+    Rebuild the recorded bot and drive run_cycle / run_multi_cycle from the file - no network, no Telegram
+    User-data stream records are applied to an AccountMirror in file order: before each
+    cycle and before each call served on the replay thread
+    """
+    import candle_cache
+    from alphabot_v4 import AlphaBotV4, Config, ExchangeExecutor
+
+    records = load_records(path)
+    header = next((r for r in records if r['k'] == 'session'), None)
+    if header is None:
+        raise ValueError(f"{path}: no session header")
+
+    fields = {f.name for f in dataclasses.fields(Config)}
+    config = Config()
+    for name, value in header['config'].items():
+        if name in fields:
+            setattr(config, name, value)
+    config.LIVE_MODE = False  # Executor is attached below from the recording
+    config.SESSION_RECORD_PATH = ""
+    for name, value in (config_overrides or {}).items():
+        setattr(config, name, value)
+
+    clock = ReplayClock(header['t'], header.get('utc_offset', 0))
+    report = ReplayReport()
+    calls = defaultdict(list)
+    stream = deque()
+    for seq, record in enumerate(records):
+        record['seq'] = seq  # File order across sources
+        if record['k'] == 'call':
+            calls[record['src']].append(record)
+        elif record['k'] == 'stream':
+            stream.append(record)
+
+    user_stream = None
+    replay_thread = threading.get_ident()
+
+    def feed_stream(upto: int):
+        """Apply stream records written before file position `upto` (replay thread only:
+        executor loop / fetch worker threads may hold locks the callbacks need)"""
+        if user_stream is None or threading.get_ident() != replay_thread:
+            return
+        while stream and stream[0]['seq'] < upto:
+            record = stream.popleft()
+            clock.set_ms(record['t'])
+            user_stream.replay(record['ev'], record['data'])
+            report.stream_events += 1
+
+    def before_call(record: Dict):
+        feed_stream(record['seq'])
+
+    with _installed_clock(clock):
+        bot = AlphaBotV4(config)
+        bot.telegram.enabled = False
+
+        # One replay queue per AgentA client (config.SYMBOL + run_multi_cycle's per-symbol agents)
+        sources = []
+        for symbol, agent in bot.symbol_agents.items():
+            source = 'exchange' if agent is bot.agent_a else f'exchange:{symbol}'
+            agent.exchange = ReplayExchange(source, calls[source], clock, header.get('exchange_id', 'exchange'),
+                                            before_call=before_call)
+            sources.append(agent.exchange)
+            # A warm process-wide cache would skip recorded fetches
+            candle_cache.get_cache().invalidate(symbol, config.TIMEFRAME)
+        bot.markets_shared = True  # Recorded responses need no markets
+
+        if header.get('live_mode'):
+            # Same executor class as the recording (older files: sync ExchangeExecutor)
+            asynchronous = header.get('executor') == 'AsyncExchangeExecutor'
+            replay_exchange = ReplayExchange('executor', calls['executor'], clock, 'binanceusdm',
+                                             asynchronous=asynchronous, before_call=before_call)
+            meta = None
+            if MARKET_META_AVAILABLE:
+                meta = MarketMetaCache(root=None, settings_ttl=float('inf'))
+                meta.settings = dict(header.get('symbol_settings') or {})
+            if asynchronous:
+                from async_executor import AsyncExchangeExecutor
+                executor = AsyncExchangeExecutor(config, bot.logger, exchange=replay_exchange, meta=meta)
+            else:
+                executor = ExchangeExecutor.__new__(ExchangeExecutor)
+                executor.config = config
+                executor.logger = bot.logger
+                executor.exchange = replay_exchange
+                executor.meta = meta
+                executor.account = None
+            sources.append(replay_exchange)
+            bot.executor = bot.agent_c.executor = executor
+            config.LIVE_MODE = True
+
+            if stream:
+                # Recorded with the user-data stream: same mirror wiring as start_user_stream
+                from user_stream import UserDataStream
+                user_stream = UserDataStream(None, on_fill=bot.on_user_fill, on_position=bot.on_user_position)
+                bot.user_stream = user_stream
+                bot.agent_c.account = executor.account = user_stream.mirror
+
+        agent_c = bot.agent_c
+        agent_c.balance = header['balance']
+        agent_c.starting_balance = header['starting_balance']
+        agent_c.peak_balance = header['peak_balance']
+        agent_c.daily_start_balance = header['balance']
+
+        if bot.ai_filter is not None:
+            news = deque(r['res'] for r in calls['news'])
+            bot.ai_filter.enabled = header.get('news_filter', False)
+
+            def analyze_market_news():
+                if not news:
+                    report.missing_calls.append('news.analyze_market_news')
+                    return {"safe_to_trade": True, "reason": "No recorded response"}
+                return news.popleft()
+            bot.ai_filter.analyze_market_news = analyze_market_news
+
+        results = {r['cycle']: r for r in records if r['k'] == 'result'}
+        cycles = [r for r in records if r['k'] == 'cycle']
+        start = time.perf_counter()
+        for record in cycles:
+            feed_stream(record['seq'])
+            clock.set_ms(record['t'])
+            bot.cycle_count = record['n'] - 1
+            t0 = time.perf_counter()
+            result = getattr(bot, record.get('fn', 'run_cycle'))()
+            report.cycle_ms.append((time.perf_counter() - t0) * 1000)
+
+            got = summarize_result(result)
+            report.actions[got['action']] = report.actions.get(got['action'], 0) + 1
+            expected = results.get(record['n'])
+            if expected is not None:
+                if expected.get('cycle_time_ms') is not None:
+                    report.recorded_cycle_ms.append(expected['cycle_time_ms'])
+                want = {k: expected.get(k) for k in got}
+                if want != got:
+                    report.mismatches.append({'cycle': record['n'], 'recorded': want, 'replay': got})
+            if on_cycle:
+                on_cycle(record['n'], result)
+        report.replay_sec = time.perf_counter() - start
+        if hasattr(bot.executor, 'close'):
+            bot.executor.close()  # AsyncExchangeExecutor loop thread
+
+    report.cycles = len(cycles)
+    if cycles:
+        report.session_sec = (records[-1]['t'] - cycles[0]['t']) / 1000
+    report.calls_served = sum(s.served for s in sources)
+    report.calls_left = sum(s.pending() for s in sources)
+    report.stream_left = len(stream)
+    for source in sources:
+        report.arg_mismatches.extend(source.arg_mismatches)
+        report.missing_calls.extend(f"{source._source}.{name}" for name in source.missing)
+    return report
+
+
+# For testing: python session_replay.py session.jsonl
+#   (record with: python alphabot_v4.py sim --record session.jsonl)
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python session_replay.py SESSION.jsonl[.gz]")
+        sys.exit(1)
+
+    report = replay_session(sys.argv[1])
+    print(report.summary())
+    sys.exit(0 if report.identical else 1)
@@ -0,0 +1,390 @@
+"""
+Streaming Indicators - อัปเดต indicators ทีละแท่ง O(1) แทนการคำนวณ 1500 แท่งใหม่ทุกรอบ
+- seed() ครั้งเดียวจาก history แล้ว update() ทุกแท่งที่ปิด
+- แท่งที่ยังไม่ปิด: update(..., closed=False) คำนวณค่าโดยไม่แก้ state (peek)
+- สูตรตรงกับ pandas_ta (pandas implementation): RSI/ATR/ADX = RMA, EMA seed ด้วย SMA,
+  BBands ddof=0, VWAP anchor รายวัน, Volume z-score rolling(20) ddof=1
+"""
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from volatility import VolatilityEstimator
+    VOLATILITY_AVAILABLE = True
+except ImportError:
+    VOLATILITY_AVAILABLE = False
+
+
+NAN = float('nan')
+
+
+def _isnan(x: float) -> bool:
+    return x != x
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BUILDING BLOCKS (update(x, commit) → value)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class _EMA:
+    """pandas_ta ema: SMA of the first `length` values, then ewm(span, adjust=False)"""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.alpha = 2.0 / (length + 1)
+        self.value: Optional[float] = None
+        self.seed_sum = 0.0
+        self.seed_count = 0
+
+    def update(self, x: float, commit: bool = True) -> float:
+        if self.value is None:
+            total = self.seed_sum + x
+            count = self.seed_count + 1
+            value = total / count if count >= self.length else None
+            if commit:
+                self.seed_sum, self.seed_count, self.value = total, count, value
+            return NAN if value is None else value
+
+        value = self.value + self.alpha * (x - self.value)
+        if commit:
+            self.value = value
+        return value
+
+
+class _RMA:
+    """pandas_ta rma: ewm(alpha=1/length, min_periods=length) - adjust=True weights"""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.decay = 1.0 - 1.0 / length
+        self.num = 0.0
+        self.den = 0.0
+        self.count = 0
+
+    def update(self, x: float, commit: bool = True) -> float:
+        if _isnan(x):
+            # Leading NaN (first diff) - does not count towards min_periods
+            return self.num / self.den if self.count >= self.length else NAN
+        num = x + self.decay * self.num
+        den = 1.0 + self.decay * self.den
+        count = self.count + 1
+        if commit:
+            self.num, self.den, self.count = num, den, count
+        return num / den if count >= self.length else NAN
+
+
+class _Rolling:
+    """Fixed-window mean/std (rolling Welford, exact resync every `resync` commits)"""
+
+    def __init__(self, length: int, ddof: int = 0, resync: int = 1000):
+        self.length = length
+        self.ddof = ddof
+        self.resync = resync
+        self.buf: deque = deque(maxlen=length)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.commits = 0
+
+    def _next(self, x: float):
+        n = len(self.buf)
+        if n < self.length:
+            count = n + 1
+            delta = x - self.mean
+            mean = self.mean + delta / count
+            m2 = self.m2 + delta * (x - mean)
+        else:
+            old = self.buf[0]
+            count = n
+            mean = self.mean + (x - old) / count
+            m2 = self.m2 + (x - old) * (x - mean + old - self.mean)
+        return mean, m2, count
+
+    def update(self, x: float, commit: bool = True):
+        """→ (mean, std) once the window is full, else (nan, nan)"""
+        mean, m2, count = self._next(x)
+        if commit:
+            self.buf.append(x)
+            self.mean, self.m2 = mean, m2
+            self.commits += 1
+            if self.commits % self.resync == 0:
+                arr = np.fromiter(self.buf, dtype=np.float64)
+                self.mean = float(arr.mean())
+                self.m2 = float(((arr - self.mean) ** 2).sum())
+                mean, m2 = self.mean, self.m2
+        if count < self.length:
+            return NAN, NAN
+        return mean, math.sqrt(max(m2, 0.0) / (count - self.ddof))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# INDICATOR STATE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class StreamingIndicators:
+    """
+    Same columns as AgentA.calculate_indicators, updated one candle at a time
+    """
+
+    def __init__(self, rsi_period: int = 14, ema_lengths=(9, 21, 20, 50),
+                 macd=(12, 26, 9), bb_period: int = 20, bb_std: float = 2.0,
+                 adx_period: int = 14, atr_period: int = 14,
+                 volume_window: int = 20, momentum_period: int = 10):
+        self.rsi_period = rsi_period
+        self.ema_lengths = list(dict.fromkeys(ema_lengths))
+        self.macd_fast, self.macd_slow, self.macd_signal = macd
+        self.bb_period = bb_period
+        self.bb_std = bb_std
+        self.adx_period = adx_period
+        self.atr_period = atr_period
+        self.momentum_period = momentum_period
+
+        # Column names (pandas_ta naming)
+        macd_props = f"{self.macd_fast}_{self.macd_slow}_{self.macd_signal}"
+        bb_props = f"{bb_period}_{bb_std}_{bb_std}"
+        self.col_rsi = f'RSI_{rsi_period}'
+        self.col_macd = (f'MACD_{macd_props}', f'MACDh_{macd_props}', f'MACDs_{macd_props}')
+        self.col_bb = tuple(f'{k}_{bb_props}' for k in ('BBL', 'BBM', 'BBU', 'BBB', 'BBP'))
+        self.col_adx = (f'ADX_{adx_period}', f'DMP_{adx_period}', f'DMN_{adx_period}')
+        self.col_atr = f'ATRr_{atr_period}'
+
+        # State
+        self.rsi_up = _RMA(rsi_period)
+        self.rsi_dn = _RMA(rsi_period)
+        self.emas = {n: _EMA(n) for n in self.ema_lengths}
+        self.macd_fast_ema = _EMA(self.macd_fast)
+        self.macd_slow_ema = _EMA(self.macd_slow)
+        self.macd_signal_ema = _EMA(self.macd_signal)
+        self.bb = _Rolling(bb_period, ddof=0)
+        self.atr_rma = _RMA(atr_period)
+        self.adx_tr = _RMA(adx_period) if adx_period != atr_period else self.atr_rma
+        self.dm_pos = _RMA(adx_period)
+        self.dm_neg = _RMA(adx_period)
+        self.adx_rma = _RMA(adx_period)
+        self.volume = _Rolling(volume_window, ddof=1)
+        self.closes: deque = deque(maxlen=momentum_period + 1)
+        self.vol_estimator = VolatilityEstimator() if VOLATILITY_AVAILABLE else None
+
+        self.prev: Optional[tuple] = None   # (high, low, close) of last closed candle
+        self.vwap_day = None
+        self.vwap_pv = 0.0
+        self.vwap_v = 0.0
+
+        self.last_timestamp: Optional[pd.Timestamp] = None
+        self.values: Dict[str, float] = {}   # Last closed candle
+        self.count = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'StreamingIndicators':
+        """Same settings AgentA.calculate_indicators uses"""
+        return cls(
+            rsi_period=config.RSI_PERIOD,
+            ema_lengths=(config.EMA_FAST, config.EMA_SLOW, 20, 50),
+            macd=(config.MACD_FAST, config.MACD_SLOW, config.MACD_SIGNAL),
+            bb_period=config.BB_PERIOD,
+            bb_std=config.BB_STD,
+            adx_period=config.ADX_PERIOD,
+        )
+
+    @property
+    def ready(self) -> bool:
+        """All indicators past warm-up (same rows calculate_indicators keeps after dropna)"""
+        return bool(self.values) and not any(_isnan(v) for v in self.values.values())
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # UPDATE
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def update(self, timestamp, open_: float, high: float, low: float, close: float,
+               volume: float, closed: bool = True) -> Dict[str, float]:
+        """
+        Feed one candle → indicator values for it
+        closed=False: in-progress candle, values are computed but state is unchanged
+        """
+        ts = pd.Timestamp(timestamp)
+        if closed and self.last_timestamp is not None and ts <= self.last_timestamp:
+            return self.values  # Already committed
+
+        c = closed
+        out: Dict[str, float] = {
+            'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume,
+        }
+
+        # RSI
+        if self.prev is not None:
+            prev_high, prev_low, prev_close = self.prev
+            diff = close - prev_close
+        else:
+            prev_high = prev_low = prev_close = NAN
+            diff = NAN
+        up = NAN if _isnan(diff) else max(diff, 0.0)
+        dn = NAN if _isnan(diff) else -min(diff, 0.0)
+        avg_up = self.rsi_up.update(up, c)
+        avg_dn = self.rsi_dn.update(dn, c)
+        total = avg_up + avg_dn
+        out[self.col_rsi] = 100.0 * avg_up / total if total > 0 else NAN
+
+        # EMAs
+        for n, ema in self.emas.items():
+            out[f'EMA_{n}'] = ema.update(close, c)
+
+        # MACD (signal = EMA of valid MACD values)
+        fast = self.macd_fast_ema.update(close, c)
+        slow = self.macd_slow_ema.update(close, c)
+        macd = fast - slow
+        if _isnan(macd):
+            signal = NAN
+        else:
+            signal = self.macd_signal_ema.update(macd, c)
+        out[self.col_macd[0]] = macd
+        out[self.col_macd[1]] = macd - signal
+        out[self.col_macd[2]] = signal
+
+        # Bollinger Bands
+        mid, std = self.bb.update(close, c)
+        lower = mid - self.bb_std * std
+        upper = mid + self.bb_std * std
+        width = upper - lower
+        if width == 0:
+            width = np.finfo(float).eps
+        out[self.col_bb[0]] = lower
+        out[self.col_bb[1]] = mid
+        out[self.col_bb[2]] = upper
+        out[self.col_bb[3]] = 100.0 * width / mid
+        out[self.col_bb[4]] = (close - lower) / width
+
+        # ATR / ADX
+        if _isnan(prev_close):
+            tr = NAN
+        else:
+            hl = high - low
+            if hl == 0:
+                hl = np.finfo(float).eps
+            tr = max(abs(hl), abs(high - prev_close), abs(prev_close - low))
+        atr = self.atr_rma.update(tr, c)
+        out[self.col_atr] = atr
+        adx_atr = atr if self.adx_tr is self.atr_rma else self.adx_tr.update(tr, c)
+
+        if _isnan(prev_high):
+            pos = neg = NAN
+        else:
+            move_up = high - prev_high
+            move_dn = prev_low - low
+            pos = move_up if (move_up > move_dn and move_up > 0) else 0.0
+            neg = move_dn if (move_dn > move_up and move_dn > 0) else 0.0
+        k = 100.0 / adx_atr if adx_atr else NAN
+        dmp = k * self.dm_pos.update(pos, c)
+        dmn = k * self.dm_neg.update(neg, c)
+        dx = 100.0 * abs(dmp - dmn) / (dmp + dmn) if (dmp + dmn) else NAN
+        out[self.col_adx[0]] = self.adx_rma.update(dx, c)
+        out[self.col_adx[1]] = dmp
+        out[self.col_adx[2]] = dmn
+
+        # VWAP (anchored daily)
+        day = ts.normalize()
+        pv, v = (self.vwap_pv, self.vwap_v) if day == self.vwap_day else (0.0, 0.0)
+        pv += (high + low + close) / 3.0 * volume
+        v += volume
+        out['VWAP_D'] = pv / v if v else NAN
+
+        # Volume SMA / z-score
+        vol_mean, vol_std = self.volume.update(volume, c)
+        out['Volume_SMA'] = vol_mean
+        out['Volume_Zscore'] = (volume - vol_mean) / vol_std if vol_std else NAN
+
+        # Returns / momentum
+        out['Returns'] = close / prev_close - 1.0 if not _isnan(prev_close) else NAN
+        if len(self.closes) == self.closes.maxlen:
+            base = self.closes[1]   # Oldest close after this candle is appended
+        elif len(self.closes) == self.closes.maxlen - 1:
+            base = self.closes[0]
+        else:
+            base = NAN
+        out['Momentum'] = close / base - 1.0 if not _isnan(base) else NAN
+
+        # Volatility: EWMA starts on the first fully-valid row (after dropna)
+        complete = not any(_isnan(x) for x in out.values())
+        if self.vol_estimator is not None:
+            est = self.vol_estimator
+            if complete and c:
+                out['Volatility'] = est.update(out['Returns'])
+            elif complete:
+                saved = (est.variance, est.count)
+                out['Volatility'] = est.update(out['Returns'])
+                est.variance, est.count = saved
+            else:
+                out['Volatility'] = NAN
+
+        if c:
+            self.prev = (high, low, close)
+            self.closes.append(close)
+            self.vwap_day, self.vwap_pv, self.vwap_v = day, pv, v
+            self.last_timestamp = ts
+            self.values = out
+            self.count += 1
+        return out
+
+    def feed(self, df: pd.DataFrame):
+        """Feed closed OHLCV history (DatetimeIndex) → (timestamps, indicator rows) of new candles"""
+        rows: List[Dict[str, float]] = []
+        index = []
+        cols = df[['open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64)
+        for ts, (o, h, l, c, v) in zip(df.index, cols):
+            if self.last_timestamp is not None and ts <= self.last_timestamp:
+                continue
+            rows.append(self.update(ts, o, h, l, c, v, closed=True))
+            index.append(ts)
+        return index, rows
+
+    def seed(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Feed closed OHLCV history (DatetimeIndex) → indicator frame for those rows"""
+        index, rows = self.feed(df)
+        frame = pd.DataFrame(rows, index=pd.DatetimeIndex(index, name=df.index.name))
+        return frame
+
+    def row(self, values: Dict[str, float], timestamp) -> pd.DataFrame:
+        """Single-row frame (same columns as seed) for appending to a window"""
+        return pd.DataFrame([values], index=pd.DatetimeIndex([pd.Timestamp(timestamp)], name='timestamp'))
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# WINDOW (rows without a DataFrame)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class IndicatorWindow:
+    """
+    Analysis window as indicator rows: closed candles (complete rows) + the in-progress one
+    - latest / window[column] / tail(n) → per-cycle analysis without pandas
+    - frame() builds the DataFrame once, only when asked (chart / Telegram)
+    """
+
+    def __init__(self, index: List[pd.Timestamp], rows: List[Dict[str, float]]):
+        self.index = index
+        self.rows = rows
+        self._frame: Optional[pd.DataFrame] = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return np.fromiter((row[column] for row in self.rows), dtype=np.float64, count=len(self.rows))
+
+    @property
+    def latest(self) -> Dict[str, float]:
+        return self.rows[-1]
+
+    @property
+    def timestamp(self) -> pd.Timestamp:
+        return self.index[-1]
+
+    def tail(self, n: int) -> 'IndicatorWindow':
+        return IndicatorWindow(self.index[-n:], self.rows[-n:])
+
+    def frame(self) -> pd.DataFrame:
+        """Same frame as seed() + row() of these candles (built once)"""
+        if self._frame is None:
+            self._frame = pd.DataFrame(self.rows, index=pd.DatetimeIndex(self.index, name='timestamp'))
+        return self._frame
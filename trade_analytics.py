@@ -0,0 +1,236 @@
+"""
+Trade Analytics - วิเคราะห์เทรดแบบ columnar (pandas) แทน list ของ dict
+- trades_frame(): Trade / JournalEntry / dict → DataFrame ที่มี dtype ชัดเจน (symbol, exit_reason เป็น category)
+- decisions_frame(): decisions.json → 1 แถวต่อ decision (field ใน data แตกเป็นคอลัมน์)
+- add_excursions(): MAE / MFE ของแต่ละเทรดจากแท่งเทียน (backtest) แบบ vectorized
+- TradeQuery: group-by PnL (symbol × hour), การกระจาย MAE/MFE, rolling Sharpe - จำผลไว้ (memoized)
+"""
+from dataclasses import asdict, is_dataclass
+from functools import wraps
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+CATEGORY_COLUMNS = ('symbol', 'side', 'exit_reason', 'market_condition')
+FLOAT_COLUMNS = ('entry_price', 'exit_price', 'size', 'pnl', 'pnl_pct', 'fees',
+                 'signal_confidence', 'mae_pct', 'mfe_pct')
+TIME_COLUMNS = ('entry_time', 'exit_time')
+BASE_COLUMNS = ('id', 'symbol', 'side', 'exit_reason', 'entry_price', 'exit_price', 'size', 'leverage',
+                'pnl', 'pnl_pct', 'fees', 'entry_time', 'exit_time')
+EXCURSION_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FRAMES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _as_record(trade) -> Dict:
+    if isinstance(trade, dict):
+        return trade
+    if is_dataclass(trade):
+        return asdict(trade)
+    return vars(trade)
+
+
+def trades_frame(trades: Iterable) -> pd.DataFrame:
+    """
+    Trades (backtest Trade, JournalEntry or journal dicts) → typed DataFrame
+    Derived: hour / weekday of entry, duration_minutes, win
+    """
+    records = [_as_record(t) for t in trades]
+    df = pd.DataFrame.from_records(records, columns=None if records else list(BASE_COLUMNS))
+    for col in BASE_COLUMNS:
+        if col not in df:
+            df[col] = np.nan
+    # Nested dicts (indicators_at_entry) stay on disk - not columnar
+    df = df.drop(columns=[c for c in ('indicators_at_entry', 'notes') if c in df])
+
+    for col in TIME_COLUMNS:
+        df[col] = pd.to_datetime(df[col], format='ISO8601')
+    for col in FLOAT_COLUMNS:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in CATEGORY_COLUMNS:
+        if col in df:
+            df[col] = df[col].fillna('').astype(str).astype('category')
+    df['id'] = pd.to_numeric(df['id'], errors='coerce').fillna(0).astype('int64')
+    df['leverage'] = pd.to_numeric(df['leverage'], errors='coerce').fillna(0).astype('int32')
+
+    df['hour'] = df['entry_time'].dt.hour.astype('Int8')
+    df['weekday'] = df['entry_time'].dt.dayofweek.astype('Int8')
+    if 'duration_minutes' not in df:
+        df['duration_minutes'] = (df['exit_time'] - df['entry_time']).dt.total_seconds() / 60
+    df['duration_minutes'] = pd.to_numeric(df['duration_minutes'], errors='coerce').astype('float64')
+    df['win'] = df['pnl'] > 0
+    return df.reset_index(drop=True)
+
+
+def decisions_frame(decisions) -> pd.DataFrame:
+    """AlphaBotLogger.decisions (list or decisions.json path) → one row per decision, data.* flattened"""
+    if isinstance(decisions, str):
+        import json
+        with open(decisions, 'r', encoding='utf-8') as f:
+            decisions = json.load(f)
+    if not decisions:
+        return pd.DataFrame(columns=['timestamp', 'agent', 'action'])
+    df = pd.json_normalize(decisions, sep='.', max_level=1)
+    df.columns = [c[5:] if c.startswith('data.') else c for c in df.columns]
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+    for col in ('agent', 'action', 'type', 'side', 'reason', 'symbol'):
+        if col in df and df[col].map(lambda v: isinstance(v, (str, type(None)))).all():
+            df[col] = df[col].astype('category')
+    return df
+
+
+def add_excursions(trades: pd.DataFrame, bars: pd.DataFrame) -> pd.DataFrame:
+    """
+    MAE / MFE (fraction of entry, + = favourable) from OHLC bars covering each trade
+    bars: DatetimeIndex + high/low (one symbol - filter trades first when mixing symbols)
+    """
+    out = trades.copy()
+    if out.empty:
+        out['mae_pct'] = out['mfe_pct'] = pd.Series(dtype='float64')
+        return out
+    index = bars.index.values
+    high = bars['high'].to_numpy(dtype=float)
+    low = bars['low'].to_numpy(dtype=float)
+    start = np.searchsorted(index, out['entry_time'].values, side='right') - 1   # Bar holding the entry
+    stop = np.searchsorted(index, out['exit_time'].values, side='right')         # Exclusive
+    start = np.clip(start, 0, len(index) - 1)
+    stop = np.maximum(stop, start + 1)
+
+    # reduceat over [start, stop): pair every start with its stop in one flat index
+    bounds = np.empty(2 * len(start), dtype=np.int64)
+    bounds[0::2], bounds[1::2] = start, np.minimum(stop, len(index))
+    hi = np.maximum.reduceat(np.append(high, -np.inf), bounds)[0::2]
+    lo = np.minimum.reduceat(np.append(low, np.inf), bounds)[0::2]
+
+    entry = out['entry_price'].to_numpy(dtype=float)
+    is_long = (out['side'] == 'long').to_numpy()
+    out['mfe_pct'] = np.where(is_long, hi / entry - 1, 1 - lo / entry)
+    out['mae_pct'] = np.where(is_long, lo / entry - 1, 1 - hi / entry)
+    return out
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# QUERIES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _memoized(fn):
+    """Cache a query result on the TradeQuery instance per argument tuple"""
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in self._cache:
+            self._cache[key] = fn(self, *args, **kwargs)
+        return self._cache[key]
+    return wrapper
+
+
+class TradeQuery:
+    """
+    Vectorized group-bys over a trades_frame()
+    Results are cached on the instance - TradeJournal.query() hands out a new one after each append
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self._cache: Dict = {}
+
+    @_memoized
+    def pnl_by(self, *keys: str) -> pd.DataFrame:
+        """trades / wins / win_rate / pnl / avg_pnl per group: pnl_by('symbol', 'hour')"""
+        keys = keys or ('symbol',)
+        grouped = self.frame.groupby(list(keys), observed=True)
+        out = grouped.agg(trades=('pnl', 'size'), wins=('win', 'sum'), pnl=('pnl', 'sum'), avg_pnl=('pnl', 'mean'))
+        out['win_rate'] = out['wins'] / out['trades']
+        return out
+
+    @_memoized
+    def pnl_by_symbol_hour(self) -> pd.DataFrame:
+        """symbol × hour-of-entry PnL matrix (0 where no trades)"""
+        return self.pnl_by('symbol', 'hour')['pnl'].unstack('hour', fill_value=0.0).reindex(
+            columns=range(24), fill_value=0.0)
+
+    @_memoized
+    def excursions(self, bins: int = 20) -> Dict[str, pd.DataFrame]:
+        """
+        MAE / MFE distributions, split by win/loss
+        {'quantiles': per (win, mae/mfe) row, 'histogram': counts per bin}
+        """
+        df = self.frame.dropna(subset=['mae_pct', 'mfe_pct']) if 'mae_pct' in self.frame else self.frame.iloc[:0]
+        if df.empty:
+            return {'quantiles': pd.DataFrame(), 'histogram': pd.DataFrame()}
+        long_form = df.melt(id_vars=['win'], value_vars=['mae_pct', 'mfe_pct'], var_name='kind', value_name='pct')
+        quantiles = long_form.groupby(['kind', 'win'])['pct'].quantile(list(EXCURSION_QUANTILES)).unstack()
+        edges = np.linspace(long_form['pct'].min(), long_form['pct'].max(), bins + 1)
+        if edges[0] == edges[-1]:
+            edges = np.array([edges[0] - 1e-9, edges[0] + 1e-9])
+        long_form['bin'] = pd.cut(long_form['pct'], edges, include_lowest=True)
+        histogram = long_form.groupby(['bin', 'kind'], observed=False).size().unstack('kind', fill_value=0)
+        return {'quantiles': quantiles, 'histogram': histogram}
+
+    @_memoized
+    def rolling_sharpe(self, window: int = 50, periods: Optional[float] = None) -> pd.Series:
+        """
+        Per-trade Sharpe of pnl_pct over the last `window` trades (indexed by exit_time)
+        periods → annualize with sqrt(periods) (e.g. trades per year)
+        """
+        returns = self.frame.sort_values('exit_time').set_index('exit_time')['pnl_pct']
+        rolling = returns.rolling(window, min_periods=max(2, window // 2))
+        sharpe = rolling.mean() / rolling.std(ddof=1).replace(0.0, np.nan)
+        return sharpe * np.sqrt(periods) if periods else sharpe
+
+    @_memoized
+    def equity_curve(self) -> pd.Series:
+        """Cumulative PnL by exit time"""
+        return self.frame.sort_values('exit_time').set_index('exit_time')['pnl'].cumsum()
+
+    def summary(self) -> List[str]:
+        """Text lines for Telegram / console"""
+        lines = []
+        by_symbol = self.pnl_by('symbol').sort_values('pnl', ascending=False)
+        for symbol, row in by_symbol.head(5).iterrows():
+            lines.append(f"{symbol}: {int(row['trades'])} trades | WR {row['win_rate']*100:.0f}% | ${row['pnl']:+.2f}")
+        sharpe = self.rolling_sharpe().dropna()
+        if not sharpe.empty:
+            lines.append(f"Rolling Sharpe (50 trades): {sharpe.iloc[-1]:.2f}")
+        return lines
+
+
+# For testing: python trade_analytics.py [trade_journal.jsonl]
+if __name__ == "__main__":
+    import sys
+    import time
+
+    from trade_journal import iter_records
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "trade_journal.jsonl"
+    records = list(iter_records(path))
+    if not records:
+        rng = np.random.default_rng(0)
+        n = 100000
+        entry = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 24 * 60, n)), unit='min')
+        records = pd.DataFrame({
+            'id': np.arange(1, n + 1),
+            'symbol': rng.choice(['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'DOGE/USDT'], n),
+            'side': rng.choice(['long', 'short'], n),
+            'entry_price': 100.0, 'exit_price': 100.0, 'size': 1.0, 'leverage': 20,
+            'pnl': rng.normal(0.01, 1, n), 'pnl_pct': rng.normal(0.0005, 0.01, n), 'fees': 0.01,
+            'entry_time': entry, 'exit_time': entry + pd.to_timedelta(rng.integers(1, 300, n), unit='min'),
+            'exit_reason': rng.choice(['STOP_LOSS', 'TAKE_PROFIT', 'TRAILING_STOP'], n),
+            'mae_pct': -np.abs(rng.normal(0, 0.01, n)), 'mfe_pct': np.abs(rng.normal(0, 0.01, n)),
+        }).to_dict('records')
+        print(f"No journal at {path} - using {n:,} synthetic trades")
+
+    t0 = time.perf_counter()
+    query = TradeQuery(trades_frame(records))
+    print(f"frame: {len(query.frame):,} trades in {(time.perf_counter() - t0) * 1000:.0f}ms")
+    for name, call in (('symbol x hour', query.pnl_by_symbol_hour), ('excursions', query.excursions),
+                       ('rolling sharpe', query.rolling_sharpe), ('cached symbol x hour', query.pnl_by_symbol_hour)):
+        t0 = time.perf_counter()
+        call()
+        print(f"{name}: {(time.perf_counter() - t0) * 1000:.1f}ms")
+    print("\n".join(query.summary()))
@@ -1,13 +1,33 @@
 """
 Trade Journal - บันทึกและวิเคราะห์ทุกเทรด
+- เก็บเป็น JSONL แบบ append-only: 1 เทรด = 1 บรรทัด (ไม่เขียนไฟล์ทั้งก้อนใหม่ทุกเทรด)
+- fsync policy: 'always' / 'batch' / 'never' + ตัดบรรทัดที่เขียนไม่จบ (crash) ทิ้งตอนเปิดไฟล์
+- โหลดแบบ lazy: ไม่สร้าง JournalEntry ทุกตัวถ้าไม่จำเป็น
+- JournalStats: ผลรวมสะสม (count/sum/sum²/streak/bucket ต่อ side, reason, hour) อัปเดตทุก add_trade
+  → get_stats() และ breakdown ทั้งหมดเป็น O(1) ไม่ต้องไล่ทุกเทรดใหม่
+- migrate จาก trade_journal.json เดิมอัตโนมัติครั้งเดียว
+- to_frame() / query(): DataFrame + group-by (trade_analytics.py) จำผลไว้จนกว่าจะมีเทรดใหม่
 """
 import json
 import os
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 from dataclasses import dataclass, asdict
 import pandas as pd
 
+try:
+    from trade_analytics import TradeQuery, trades_frame
+    ANALYTICS_AVAILABLE = True
+except ImportError:
+    ANALYTICS_AVAILABLE = False
+
+
+FSYNC_POLICIES = ('always', 'batch', 'never')
+FSYNC_BATCH_SIZE = 20          # 'batch': fsync every N appends ...
+FSYNC_BATCH_SECONDS = 5.0      # ... or when the last fsync is older than this
+
 
 @dataclass
 class JournalEntry:
@@ -32,39 +52,309 @@ class JournalEntry:
     signal_confidence: float = 0.0
     indicators_at_entry: Dict = None
     notes: str = ""
+    mae_pct: Optional[float] = None     # Max adverse / favourable excursion (fraction of entry)
+    mfe_pct: Optional[float] = None
     
     def __post_init__(self):
         if self.indicators_at_entry is None:
             self.indicators_at_entry = {}
 
 
+def journal_paths(journal_file: str) -> tuple:
+    """'trade_journal.json' (legacy name) → ('trade_journal.jsonl', 'trade_journal.json')"""
+    base, ext = os.path.splitext(journal_file)
+    if ext == '.jsonl':
+        return journal_file, base + '.json'
+    return base + '.jsonl', journal_file
+
+
+def iter_records(journal_file: str) -> Iterator[Dict]:
+    """Raw trade dicts from a JSONL journal (or a legacy JSON array), skipping a torn last line"""
+    path, legacy = journal_paths(journal_file)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    elif os.path.exists(legacy):
+        with open(legacy, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+class JournalStats:
+    """
+    Running aggregates of the journal - add() per trade, every query O(1)
+    Sums are accumulated in trade order → identical to a full rescan
+    """
+    
+    def __init__(self):
+        self.count = 0
+        self.wins = 0
+        self.pnl_sum = 0.0
+        self.pnl_sq_sum = 0.0
+        self.win_sum = 0.0                  # Profit factor numerator
+        self.loss_sum = 0.0                 # ... and denominator (<= 0)
+        self.best = None
+        self.worst = None
+        self.duration_sum = 0
+        self.win_duration_sum = 0
+        self.loss_duration_sum = 0
+        
+        # Streaks
+        self.streak = 0                     # Length of the current run
+        self.last_was_win = None
+        self.best_win_streak = 0
+        self.worst_loss_streak = 0
+        
+        # Buckets
+        self.by_side = {side: {'trades': 0, 'wins': 0, 'pnl': 0} for side in ('long', 'short')}
+        self.by_reason: Dict[str, Dict] = {}
+        self.by_hour = {i: {'trades': 0, 'wins': 0, 'pnl': 0} for i in range(24)}
+        self.by_condition: Dict[str, List[float]] = {}   # condition → [pnl sum, count]
+    
+    def add(self, record: Dict):
+        """Fold one journal record (JournalEntry as dict) into the aggregates"""
+        pnl = record['pnl']
+        duration = record.get('duration_minutes', 0)
+        is_win = pnl > 0
+        
+        self.count += 1
+        self.pnl_sum += pnl
+        self.pnl_sq_sum += pnl * pnl
+        self.best = pnl if self.best is None else max(self.best, pnl)
+        self.worst = pnl if self.worst is None else min(self.worst, pnl)
+        self.duration_sum += duration
+        if is_win:
+            self.wins += 1
+            self.win_sum += pnl
+            self.win_duration_sum += duration
+        else:
+            self.loss_sum += pnl
+            self.loss_duration_sum += duration
+        
+        self.streak = self.streak + 1 if is_win == self.last_was_win else 1
+        self.last_was_win = is_win
+        if is_win:
+            self.best_win_streak = max(self.best_win_streak, self.streak)
+        else:
+            self.worst_loss_streak = max(self.worst_loss_streak, self.streak)
+        
+        side = self.by_side.setdefault(record['side'], {'trades': 0, 'wins': 0, 'pnl': 0})
+        side['trades'] += 1
+        side['pnl'] += pnl
+        side['wins'] += is_win
+        
+        reason = self.by_reason.setdefault(record['exit_reason'], {'count': 0, 'pnl': 0, 'wins': 0})
+        reason['count'] += 1
+        reason['pnl'] += pnl
+        reason['wins'] += is_win
+        
+        hour = self.by_hour[datetime.fromisoformat(record['entry_time']).hour]
+        hour['trades'] += 1
+        hour['pnl'] += pnl
+        hour['wins'] += is_win
+        
+        condition = record.get('market_condition')
+        if condition:
+            bucket = self.by_condition.setdefault(condition, [0.0, 0])
+            bucket[0] += pnl
+            bucket[1] += 1
+    
+    @property
+    def losses(self) -> int:
+        return self.count - self.wins
+    
+    @property
+    def pnl_std(self) -> float:
+        """Population std of trade PnL (from sum / sum of squares)"""
+        if not self.count:
+            return 0.0
+        mean = self.pnl_sum / self.count
+        return max(0.0, self.pnl_sq_sum / self.count - mean * mean) ** 0.5
+    
+    @classmethod
+    def from_records(cls, records) -> 'JournalStats':
+        stats = cls()
+        for record in records:
+            stats.add(record)
+        return stats
+
+
 class TradeJournal:
     """Trade Journal System - บันทึกและวิเคราะห์เทรด"""
     
-    def __init__(self, journal_file: str = "trade_journal.json"):
-        self.journal_file = journal_file
-        self.entries: List[JournalEntry] = []
-        self.load()
+    def __init__(self, journal_file: str = "trade_journal.jsonl", fsync: str = 'batch'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.journal_file, self.legacy_file = journal_paths(journal_file)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._fh = None
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._count: Optional[int] = None      # Lines on disk (lazy)
+        self._last_id = 0
+        self._stats: Optional[JournalStats] = None
+        self._entries: Optional[List[JournalEntry]] = None
+        self._query = None                     # TradeQuery of the current file (dropped on append)
+        
+        self.migrate()
+        self._repair_tail()
     
-    def load(self):
-        """Load journal from file"""
-        if os.path.exists(self.journal_file):
+    # ═══════════════════════════════════════════════════════════════════════════
+    # STORAGE
+    # ═══════════════════════════════════════════════════════════════════════════
+    
+    def migrate(self) -> int:
+        """One-time copy of the legacy indented JSON into JSONL (legacy file is kept as a backup)"""
+        if os.path.exists(self.journal_file) or not os.path.exists(self.legacy_file):
+            return 0
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Journal] Cannot migrate {self.legacy_file}: {e}")
+            return 0
+        tmp = self.journal_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for record in data:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.journal_file)
+        print(f"[Journal] Migrated {len(data)} trades → {self.journal_file}")
+        return len(data)
+    
+    def _repair_tail(self):
+        """Drop a half-written last line (crash mid-append) so the next append starts clean"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            if end == 0:
+                return
+            f.seek(end - 1)
+            if f.read(1) == b'\n':
+                return
+            # Walk back to the last complete line
+            pos = end
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                idx = chunk.rfind(b'\n')
+                if idx >= 0:
+                    pos = pos - step + idx + 1
+                    break
+                pos -= step
+            f.truncate(max(pos, 0))
+            print(f"[Journal] Dropped {end - pos} bytes of a torn record")
+    
+    def _tail(self, n: int) -> List[Dict]:
+        """Last n records read from the end of the file"""
+        if n <= 0 or not os.path.exists(self.journal_file):
+            return []
+        with open(self.journal_file, 'rb') as f:
+            pos = f.seek(0, os.SEEK_END)
+            data = b''
+            while pos > 0 and data.count(b'\n') <= n:
+                step = min(65536, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        records = []
+        for line in data.splitlines()[-n:]:
             try:
-                with open(self.journal_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.entries = [JournalEntry(**e) for e in data]
-            except Exception as e:
-                print(f"[Journal] Error loading: {e}")
-                self.entries = []
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # First line of the block may be partial
+        return records
+    
+    def _ensure_counters(self):
+        if self._count is not None:
+            return
+        count = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    count += block.count(b'\n')
+        last = self._tail(1)
+        self._count = count
+        self._last_id = int(last[0].get('id', count)) if last else 0
+    
+    def _append(self, record: Dict):
+        if self._fh is None:
+            self._fh = open(self.journal_file, 'a', encoding='utf-8')
+        self._fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._fh.flush()
+        self._unsynced += 1
+        if self.fsync == 'always' or (
+                self.fsync == 'batch' and (self._unsynced >= FSYNC_BATCH_SIZE
+                                           or time.time() - self._last_sync >= FSYNC_BATCH_SECONDS)):
+            self.sync()
+    
+    def sync(self):
+        """fsync pending appends"""
+        if self._fh is not None and self._unsynced:
+            os.fsync(self._fh.fileno())
+            self._unsynced = 0
+            self._last_sync = time.time()
+    
+    def close(self):
+        with self._lock:
+            if self._fh is not None:
+                self.sync()
+                self._fh.close()
+                self._fh = None
+    
+    def load(self):
+        """Drop in-memory caches - next access re-reads the file"""
+        self._count = None
+        self._stats = None
+        self._query = None
+        self._entries = None
     
     def save(self):
-        """Save journal to file"""
-        try:
-            with open(self.journal_file, 'w', encoding='utf-8') as f:
-                data = [asdict(e) for e in self.entries]
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"[Journal] Error saving: {e}")
+        """Kept for old callers: appends are already on disk"""
+        with self._lock:
+            self.sync()
+    
+    # ═══════════════════════════════════════════════════════════════════════════
+    # LAZY VIEWS
+    # ═══════════════════════════════════════════════════════════════════════════
+    
+    @property
+    def entries(self) -> List[JournalEntry]:
+        """All trades as JournalEntry (parsed on first access)"""
+        if self._entries is None:
+            self._entries = [JournalEntry(**r) for r in iter_records(self.journal_file)]
+        return self._entries
+    
+    @property
+    def stats(self) -> JournalStats:
+        """Running aggregates (one scan of the file on first use, then updated by add_trade)"""
+        if self._stats is None:
+            with self._lock:
+                if self._stats is None:
+                    self._stats = JournalStats.from_records(iter_records(self.journal_file))
+        return self._stats
+    
+    def rebuild_stats(self, check: bool = False) -> bool:
+        """
+        Recompute the aggregates from disk
+        check=True → keep the running ones and only report whether they match the rebuild
+        """
+        fresh = JournalStats.from_records(iter_records(self.journal_file))
+        matches = self._stats is None or vars(fresh) == vars(self._stats)
+        if not check:
+            self._stats = fresh
+        return matches
+    
+    def __len__(self) -> int:
+        self._ensure_counters()
+        return self._count
     
     def add_trade(self, trade: Dict, indicators: Dict = None, market_condition: str = "", confidence: float = 0.0):
         """Add new trade to journal"""
@@ -73,33 +363,64 @@ class TradeJournal:
         exit_time = datetime.fromisoformat(trade['exit_time']) if isinstance(trade['exit_time'], str) else trade['exit_time']
         duration = int((exit_time - entry_time).total_seconds() / 60)
         
-        entry = JournalEntry(
-            id=len(self.entries) + 1,
-            symbol=trade.get('symbol', 'BTC/USDT'),
-            side=trade['side'],
-            entry_price=trade['entry_price'],
-            exit_price=trade['exit_price'],
-            size=trade['size'],
-            leverage=trade['leverage'],
-            pnl=trade['pnl'],
-            pnl_pct=trade['pnl_pct'],
-            entry_time=entry_time.isoformat(),
-            exit_time=exit_time.isoformat(),
-            exit_reason=trade['exit_reason'],
-            duration_minutes=duration,
-            fees=trade.get('fees', 0),
-            market_condition=market_condition,
-            signal_confidence=confidence,
-            indicators_at_entry=indicators or {}
-        )
-        
-        self.entries.append(entry)
-        self.save()
+        with self._lock:
+            self._ensure_counters()
+            entry = JournalEntry(
+                id=self._last_id + 1,
+                symbol=trade.get('symbol', 'BTC/USDT'),
+                side=trade['side'],
+                entry_price=trade['entry_price'],
+                exit_price=trade['exit_price'],
+                size=trade['size'],
+                leverage=trade['leverage'],
+                pnl=trade['pnl'],
+                pnl_pct=trade['pnl_pct'],
+                entry_time=entry_time.isoformat(),
+                exit_time=exit_time.isoformat(),
+                exit_reason=trade['exit_reason'],
+                duration_minutes=duration,
+                fees=trade.get('fees', 0),
+                market_condition=market_condition,
+                signal_confidence=confidence,
+                indicators_at_entry=indicators or {},
+                mae_pct=trade.get('mae_pct'),
+                mfe_pct=trade.get('mfe_pct')
+            )
+            record = asdict(entry)
+            self._append(record)
+            self._count += 1
+            self._last_id = entry.id
+            
+            # Keep whatever views are already loaded in step with the file
+            if self._stats is not None:
+                self._stats.add(record)
+            if self._entries is not None:
+                self._entries.append(entry)
+            self._query = None
         return entry
     
+    def query(self) -> 'TradeQuery':
+        """Columnar queries (pnl_by, pnl_by_symbol_hour, excursions, rolling_sharpe) - memoized until the next append"""
+        if not ANALYTICS_AVAILABLE:
+            raise ImportError("trade_analytics.py not available")
+        query = self._query
+        if query is None:
+            # Built under the lock (like stats) so an append cannot land between
+            # reading the file and caching the frame
+            with self._lock:
+                if self._query is None:
+                    self._query = TradeQuery(trades_frame(iter_records(self.journal_file)))
+                query = self._query
+        return query
+    
+    def to_frame(self) -> pd.DataFrame:
+        """Typed DataFrame of every trade (category symbol / side / exit_reason)"""
+        return self.query().frame
+    
     def get_stats(self) -> Dict:
         """Get overall statistics"""
-        if not self.entries:
+        st = self.stats
+        if not st.count:
             return {
                 'total_trades': 0,
                 'wins': 0,
@@ -113,120 +434,74 @@ class TradeJournal:
                 'profit_factor': 0
             }
         
-        wins = [e for e in self.entries if e.pnl > 0]
-        losses = [e for e in self.entries if e.pnl <= 0]
-        
-        total_profit = sum(e.pnl for e in wins) if wins else 0
-        total_loss = abs(sum(e.pnl for e in losses)) if losses else 0
+        total_loss = abs(st.loss_sum)
         
         return {
-            'total_trades': len(self.entries),
-            'wins': len(wins),
-            'losses': len(losses),
-            'win_rate': len(wins) / len(self.entries) if self.entries else 0,
-            'total_pnl': sum(e.pnl for e in self.entries),
-            'avg_pnl': sum(e.pnl for e in self.entries) / len(self.entries),
-            'best_trade': max(e.pnl for e in self.entries),
-            'worst_trade': min(e.pnl for e in self.entries),
-            'avg_duration': sum(e.duration_minutes for e in self.entries) / len(self.entries),
-            'profit_factor': total_profit / total_loss if total_loss > 0 else float('inf'),
-            'avg_win': sum(e.pnl for e in wins) / len(wins) if wins else 0,
-            'avg_loss': sum(e.pnl for e in losses) / len(losses) if losses else 0
+            'total_trades': st.count,
+            'wins': st.wins,
+            'losses': st.losses,
+            'win_rate': st.wins / st.count,
+            'total_pnl': st.pnl_sum,
+            'avg_pnl': st.pnl_sum / st.count,
+            'pnl_std': st.pnl_std,
+            'best_trade': st.best,
+            'worst_trade': st.worst,
+            'avg_duration': st.duration_sum / st.count,
+            'profit_factor': st.win_sum / total_loss if total_loss > 0 else float('inf'),
+            'avg_win': st.win_sum / st.wins if st.wins else 0,
+            'avg_loss': st.loss_sum / st.losses if st.losses else 0
         }
     
     def get_stats_by_side(self) -> Dict:
         """Get statistics by long/short"""
-        longs = [e for e in self.entries if e.side == 'long']
-        shorts = [e for e in self.entries if e.side == 'short']
-        
-        def calc_side_stats(trades):
-            if not trades:
+        def calc_side_stats(bucket):
+            if not bucket['trades']:
                 return {'trades': 0, 'win_rate': 0, 'total_pnl': 0}
-            wins = len([t for t in trades if t.pnl > 0])
             return {
-                'trades': len(trades),
-                'win_rate': wins / len(trades),
-                'total_pnl': sum(t.pnl for t in trades)
+                'trades': bucket['trades'],
+                'win_rate': bucket['wins'] / bucket['trades'],
+                'total_pnl': bucket['pnl']
             }
         
+        by_side = self.stats.by_side
         return {
-            'long': calc_side_stats(longs),
-            'short': calc_side_stats(shorts)
+            'long': calc_side_stats(by_side['long']),
+            'short': calc_side_stats(by_side['short'])
         }
     
     def get_stats_by_exit_reason(self) -> Dict:
         """Get statistics by exit reason"""
         reasons = {}
-        for e in self.entries:
-            if e.exit_reason not in reasons:
-                reasons[e.exit_reason] = {'count': 0, 'pnl': 0, 'wins': 0}
-            reasons[e.exit_reason]['count'] += 1
-            reasons[e.exit_reason]['pnl'] += e.pnl
-            if e.pnl > 0:
-                reasons[e.exit_reason]['wins'] += 1
-        
-        # Calculate win rate for each reason
-        for reason in reasons:
-            count = reasons[reason]['count']
-            reasons[reason]['win_rate'] = reasons[reason]['wins'] / count if count > 0 else 0
-        
+        for reason, bucket in self.stats.by_reason.items():
+            reasons[reason] = dict(bucket, win_rate=bucket['wins'] / bucket['count'] if bucket['count'] > 0 else 0)
         return reasons
     
     def get_stats_by_hour(self) -> Dict:
         """Get statistics by hour of day"""
-        hours = {i: {'trades': 0, 'wins': 0, 'pnl': 0} for i in range(24)}
-        
-        for e in self.entries:
-            hour = datetime.fromisoformat(e.entry_time).hour
-            hours[hour]['trades'] += 1
-            hours[hour]['pnl'] += e.pnl
-            if e.pnl > 0:
-                hours[hour]['wins'] += 1
-        
-        return hours
+        return {hour: dict(bucket) for hour, bucket in self.stats.by_hour.items()}
     
     def get_recent_trades(self, n: int = 10) -> List[JournalEntry]:
-        """Get last n trades"""
-        return self.entries[-n:] if self.entries else []
+        """Get last n trades (read from the end of the file)"""
+        if self._entries is not None:
+            return self._entries[-n:] if n > 0 else []
+        return [JournalEntry(**r) for r in self._tail(n)]
     
     def get_streak(self) -> Dict:
         """Get current and best win/loss streaks"""
-        if not self.entries:
+        st = self.stats
+        if not st.count:
             return {'current': 0, 'best_win': 0, 'worst_loss': 0}
         
-        current_streak = 0
-        best_win_streak = 0
-        worst_loss_streak = 0
-        temp_streak = 0
-        last_was_win = None
-        
-        for e in self.entries:
-            is_win = e.pnl > 0
-            
-            if last_was_win is None:
-                temp_streak = 1
-            elif is_win == last_was_win:
-                temp_streak += 1
-            else:
-                temp_streak = 1
-            
-            if is_win:
-                best_win_streak = max(best_win_streak, temp_streak)
-            else:
-                worst_loss_streak = max(worst_loss_streak, temp_streak)
-            
-            last_was_win = is_win
-            current_streak = temp_streak if is_win else -temp_streak
-        
         return {
-            'current': current_streak,
-            'best_win': best_win_streak,
-            'worst_loss': worst_loss_streak
+            'current': st.streak if st.last_was_win else -st.streak,
+            'best_win': st.best_win_streak,
+            'worst_loss': st.worst_loss_streak
         }
     
     def analyze_patterns(self) -> Dict:
         """Analyze trading patterns"""
-        if len(self.entries) < 5:
+        st = self.stats
+        if st.count < 5:
             return {'message': 'ต้องมีอย่างน้อย 5 เทรดเพื่อวิเคราะห์ pattern'}
         
         patterns = {
@@ -240,33 +515,22 @@ class TradeJournal:
         }
         
         # Best/worst by market condition
-        by_condition = {}
-        for e in self.entries:
-            if e.market_condition:
-                if e.market_condition not in by_condition:
-                    by_condition[e.market_condition] = []
-                by_condition[e.market_condition].append(e.pnl)
-        
-        if by_condition:
-            avg_by_condition = {k: sum(v)/len(v) for k, v in by_condition.items()}
+        if st.by_condition:
+            avg_by_condition = {k: total / n for k, (total, n) in st.by_condition.items()}
             patterns['best_market_condition'] = max(avg_by_condition, key=avg_by_condition.get)
             patterns['worst_market_condition'] = min(avg_by_condition, key=avg_by_condition.get)
         
         # Best/worst hour
-        hour_stats = self.get_stats_by_hour()
-        profitable_hours = {h: s['pnl'] for h, s in hour_stats.items() if s['trades'] > 0}
+        profitable_hours = {h: s['pnl'] for h, s in st.by_hour.items() if s['trades'] > 0}
         if profitable_hours:
             patterns['best_hour'] = max(profitable_hours, key=profitable_hours.get)
             patterns['worst_hour'] = min(profitable_hours, key=profitable_hours.get)
         
         # Duration analysis
-        wins = [e for e in self.entries if e.pnl > 0]
-        losses = [e for e in self.entries if e.pnl <= 0]
-        
-        if wins:
-            patterns['avg_winning_duration'] = sum(e.duration_minutes for e in wins) / len(wins)
-        if losses:
-            patterns['avg_losing_duration'] = sum(e.duration_minutes for e in losses) / len(losses)
+        if st.wins:
+            patterns['avg_winning_duration'] = st.win_duration_sum / st.wins
+        if st.losses:
+            patterns['avg_losing_duration'] = st.loss_duration_sum / st.losses
         
         # Generate recommendations
         stats = self.get_stats()
@@ -354,5 +618,6 @@ if __name__ == "__main__":
     
     for trade in sample_trades:
         journal.add_trade(trade, market_condition='trending')
+    journal.close()
     
     print(journal.get_telegram_summary())
@@ -0,0 +1,520 @@
+"""
+User Stream - Binance Futures user-data WebSocket (listen key) แทนการ poll fetch_positions
+- ORDER_TRADE_UPDATE → fills + open orders, ACCOUNT_UPDATE → positions + balances
+- AccountMirror: สำเนา positions / balances / open orders ในหน่วยความจำ (อ่านได้ทันที ไม่ต้องยิง REST)
+- Keepalive listen key ทุก 30 นาที, listenKeyExpired / หลุด → ขอ key ใหม่ + REST resync
+- on_position(): แจ้งเมื่อ position ของ symbol เปลี่ยน (เช่น SL/TP บน exchange ปิดไปแล้ว)
+"""
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+from market_stream import stream_symbol
+
+
+BINANCE_FUTURES_USER_WS = "wss://fstream.binance.com/ws"
+KEEPALIVE_SEC = 30 * 60          # Listen key expires after 60 min without a PUT
+OPEN_STATUSES = ('NEW', 'PARTIALLY_FILLED')
+
+
+def market_id(symbol: str) -> str:
+    """'BTC/USDT' / 'BTC/USDT:USDT' / 'BTCUSDT' → 'BTCUSDT' (stream symbol)"""
+    return stream_symbol(symbol).upper()
+
+
+@dataclass
+class MirrorPosition:
+    """One-way / hedge leg as Binance reports it (amount < 0 = short)"""
+    symbol: str
+    amount: float
+    entry_price: float = 0.0
+    unrealized_pnl: float = 0.0
+    margin_type: str = 'cross'
+    position_side: str = 'BOTH'
+    updated_ms: int = 0
+
+    @property
+    def side(self) -> Optional[str]:
+        if self.amount > 0:
+            return 'long'
+        if self.amount < 0:
+            return 'short'
+        return None
+
+    def to_ccxt(self) -> Dict:
+        """Fields ExchangeExecutor callers read from ccxt fetch_positions()"""
+        return {
+            'symbol': self.symbol,
+            'side': self.side,
+            'contracts': abs(self.amount),
+            'entryPrice': self.entry_price,
+            'unrealizedPnl': self.unrealized_pnl,
+            'marginMode': self.margin_type,
+            'info': {'positionAmt': str(self.amount), 'positionSide': self.position_side},
+        }
+
+
+@dataclass
+class Fill:
+    """One execution from ORDER_TRADE_UPDATE (x == TRADE)"""
+    symbol: str
+    order_id: int
+    side: str                  # BUY / SELL
+    order_type: str            # Original type: MARKET / STOP_MARKET / TAKE_PROFIT_MARKET / LIQUIDATION ...
+    price: float               # Last filled price
+    avg_price: float
+    qty: float
+    realized_pnl: float
+    commission: float
+    reduce_only: bool
+    status: str                # PARTIALLY_FILLED / FILLED
+    client_id: str = ""
+    time_ms: int = 0
+
+
+@dataclass
+class UserStreamStats:
+    messages: int = 0
+    order_updates: int = 0
+    account_updates: int = 0
+    fills: int = 0
+    reconnects: int = 0
+    resyncs: int = 0
+    keepalives: int = 0
+    last_message_at: float = 0.0
+    started_at: float = field(default_factory=time.time)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ACCOUNT MIRROR
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class AccountMirror:
+    """
+    In-memory positions / balances / open orders (thread-safe reads)
+    Updates older than what is already applied (event time T) are ignored
+    """
+
+    def __init__(self, max_fills: int = 200):
+        self.positions: Dict[str, MirrorPosition] = {}
+        self.balances: Dict[str, Dict[str, float]] = {}   # asset → {wallet, cross_wallet, available}
+        self.open_orders: Dict[int, Dict] = {}
+        self.fills: List[Fill] = []
+        self.last_fill: Dict[str, Fill] = {}
+        self.max_fills = max_fills
+        self.synced = False          # REST snapshot applied and stream connected
+        self.synced_at = 0.0
+        self.last_event_ms = 0
+        self._lock = threading.RLock()
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Reads (no network)
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def position(self, symbol: str) -> Optional[MirrorPosition]:
+        """Open position of a symbol (None when flat)"""
+        with self._lock:
+            pos = self.positions.get(market_id(symbol))
+            return pos if pos is not None and pos.amount != 0 else None
+
+    def balance(self, asset: str = 'USDT', kind: str = 'wallet') -> float:
+        with self._lock:
+            return float(self.balances.get(asset, {}).get(kind, 0.0))
+
+    def orders(self, symbol: str = None) -> List[Dict]:
+        with self._lock:
+            sid = market_id(symbol) if symbol else None
+            return [o for o in self.open_orders.values() if sid is None or o['symbol'] == sid]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'synced': self.synced,
+                'positions': {s: vars(p).copy() for s, p in self.positions.items() if p.amount != 0},
+                'balances': {a: dict(b) for a, b in self.balances.items()},
+                'open_orders': len(self.open_orders),
+                'last_event_ms': self.last_event_ms,
+            }
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # Writes
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def _set_position(self, pos: MirrorPosition, changed: List) -> None:
+        key = pos.symbol if pos.position_side == 'BOTH' else f"{pos.symbol}:{pos.position_side}"
+        old = self.positions.get(key)
+        if old is not None and pos.updated_ms and pos.updated_ms < old.updated_ms:
+            return  # Stale (REST snapshot older than a stream event or out-of-order)
+        self.positions[key] = pos
+        before = old.amount if old is not None else 0.0
+        if before != pos.amount:
+            changed.append((pos.symbol, before, pos))
+
+    def apply_account_update(self, data: Dict) -> List:
+        """ACCOUNT_UPDATE → [(symbol, amount before, MirrorPosition)] for positions that changed"""
+        changed = []
+        event_ms = int(data.get('T') or data.get('E') or 0)
+        update = data.get('a', {})
+        with self._lock:
+            self.last_event_ms = max(self.last_event_ms, event_ms)
+            for b in update.get('B', []):
+                entry = self.balances.setdefault(b['a'], {})
+                entry['wallet'] = float(b['wb'])
+                entry['cross_wallet'] = float(b['cw'])
+            for p in update.get('P', []):
+                self._set_position(MirrorPosition(
+                    symbol=p['s'], amount=float(p['pa']), entry_price=float(p['ep']),
+                    unrealized_pnl=float(p['up']), margin_type=p.get('mt', 'cross'),
+                    position_side=p.get('ps', 'BOTH'), updated_ms=event_ms,
+                ), changed)
+        return changed
+
+    def apply_order_update(self, data: Dict) -> Optional[Fill]:
+        """ORDER_TRADE_UPDATE → open orders; returns the Fill for executions"""
+        o = data['o']
+        event_ms = int(data.get('T') or data.get('E') or 0)
+        order_id = int(o['i'])
+        with self._lock:
+            self.last_event_ms = max(self.last_event_ms, event_ms)
+            if o['X'] in OPEN_STATUSES:
+                self.open_orders[order_id] = {
+                    'id': order_id, 'symbol': o['s'], 'side': o['S'], 'type': o.get('ot', o['o']),
+                    'amount': float(o['q']), 'filled': float(o.get('z', 0)),
+                    'price': float(o.get('p', 0)), 'stop_price': float(o.get('sp', 0)),
+                    'reduce_only': bool(o.get('R', False)), 'client_id': o.get('c', ''),
+                }
+            else:
+                self.open_orders.pop(order_id, None)
+
+            if o.get('x') != 'TRADE':
+                return None
+            fill = Fill(
+                symbol=o['s'], order_id=order_id, side=o['S'], order_type=o.get('ot', o['o']),
+                price=float(o['L']), avg_price=float(o.get('ap', o['L'])), qty=float(o['l']),
+                realized_pnl=float(o.get('rp', 0)), commission=float(o.get('n', 0) or 0),
+                reduce_only=bool(o.get('R', False)), status=o['X'], client_id=o.get('c', ''),
+                time_ms=int(o.get('T') or event_ms),
+            )
+            self.fills.append(fill)
+            if len(self.fills) > self.max_fills:
+                del self.fills[:len(self.fills) - self.max_fills]
+            self.last_fill[fill.symbol] = fill
+            return fill
+
+    def apply_snapshot(self, account: Dict, open_orders: List[Dict]) -> List:
+        """REST resync: /fapi/v2/account + /fapi/v1/openOrders (raw Binance JSON)"""
+        changed = []
+        with self._lock:
+            for a in account.get('assets', []):
+                self.balances[a['asset']] = {
+                    'wallet': float(a['walletBalance']),
+                    'cross_wallet': float(a.get('crossWalletBalance', a['walletBalance'])),
+                    'available': float(a.get('availableBalance', 0)),
+                }
+            seen = set()
+            for p in account.get('positions', []):
+                pos = MirrorPosition(
+                    symbol=p['symbol'], amount=float(p['positionAmt']), entry_price=float(p.get('entryPrice', 0)),
+                    unrealized_pnl=float(p.get('unrealizedProfit', 0)),
+                    margin_type='isolated' if p.get('isolated') else 'cross',
+                    position_side=p.get('positionSide', 'BOTH'), updated_ms=int(p.get('updateTime') or 0),
+                )
+                seen.add(pos.symbol if pos.position_side == 'BOTH' else f"{pos.symbol}:{pos.position_side}")
+                self._set_position(pos, changed)
+            # Positions missing from the snapshot are flat
+            for key, old in list(self.positions.items()):
+                if key not in seen and old.amount != 0:
+                    self._set_position(MirrorPosition(old.symbol, 0.0, position_side=old.position_side), changed)
+            self.open_orders = {}
+            for o in open_orders:
+                self.open_orders[int(o['orderId'])] = {
+                    'id': int(o['orderId']), 'symbol': o['symbol'], 'side': o['side'],
+                    'type': o.get('origType', o['type']), 'amount': float(o['origQty']),
+                    'filled': float(o.get('executedQty', 0)), 'price': float(o.get('price', 0)),
+                    'stop_price': float(o.get('stopPrice', 0)), 'reduce_only': bool(o.get('reduceOnly', False)),
+                    'client_id': o.get('clientOrderId', ''),
+                }
+            self.synced = True
+            self.synced_at = time.time()
+        return changed
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# USER DATA STREAM
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class UserDataStream:
+    """
+    Listen-key WebSocket feeding an AccountMirror
+
+    rest_exchange: sync ccxt binanceusdm with API keys (listen key + resync)
+    Callbacks run one at a time on a worker thread (like MarketStream):
+      on_fill(Fill), on_position(symbol, amount_before, MirrorPosition)
+    tap(kind, data): every mirror input in arrival order, before it is applied
+      ('event' raw message / 'snapshot' REST resync / 'disconnect') - session recording
+    """
+
+    def __init__(self, rest_exchange, mirror: AccountMirror = None, url: str = None,
+                 on_fill: Callable[[Fill], None] = None,
+                 on_position: Callable[[str, float, MirrorPosition], None] = None,
+                 tap: Callable[[str, Dict], None] = None,
+                 keepalive_sec: float = KEEPALIVE_SEC,
+                 reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0):
+        self.rest = rest_exchange
+        self.mirror = mirror or AccountMirror()
+        self.base_url = url or BINANCE_FUTURES_USER_WS
+        self.on_fill = on_fill
+        self.on_position = on_position
+        self.tap = tap
+        self.keepalive_sec = keepalive_sec
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.listen_key: Optional[str] = None
+        self.stats = UserStreamStats()
+
+        self._running = False
+        self._ws = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-stream")
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # PUBLIC
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def start(self) -> 'UserDataStream':
+        """Run on a background thread (the bot loop keeps the main thread)"""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="user-stream", daemon=True)
+        self._thread.start()
+        return self
+
+    async def run(self):
+        """Listen key → connect → resync → read; repeat until stop()"""
+        if not WEBSOCKETS_AVAILABLE:
+            raise RuntimeError("websockets not installed (pip install websockets)")
+
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        delay = self.reconnect_delay
+        try:
+            while self._running:
+                keepalive = None
+                try:
+                    self.listen_key = await self._rest('post_listen_key')
+                    url = f"{self.base_url.rstrip('/')}/{self.listen_key}"
+                    async with websockets.connect(url, ping_interval=20, max_size=2 ** 22) as ws:
+                        self._ws = ws
+                        delay = self.reconnect_delay
+                        print(f"[UserStream] Connected {self.base_url}")
+                        # Subscribe first, then snapshot: events after the snapshot are applied on top
+                        await self._resync()
+                        keepalive = asyncio.create_task(self._keepalive())
+                        await self._read(ws)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not self._running:
+                        break
+                    print(f"[UserStream] Disconnected: {e}")
+                finally:
+                    self._ws = None
+                    self.mirror.synced = False
+                    self._tap('disconnect', {})
+                    if keepalive is not None:
+                        keepalive.cancel()
+
+                if not self._running:
+                    break
+                self.stats.reconnects += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+        finally:
+            self._running = False
+            self.mirror.synced = False
+
+    def stop(self):
+        """Stop after the current message (safe to call from any thread)"""
+        self._running = False
+        ws, loop = self._ws, self._loop
+        if ws is not None and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(ws.close()))
+        if self.listen_key:
+            try:
+                self.rest.fapiPrivateDeleteListenKey()
+            except Exception:
+                pass
+
+    def replay(self, kind: str, data: Dict):
+        """Apply one tapped record on the calling thread (session_replay.py) - callbacks run inline"""
+        if kind == 'disconnect':
+            self.mirror.synced = False
+            return
+        if kind == 'snapshot':
+            fill, changed = None, self.mirror.apply_snapshot(data['account'], data['open_orders'])
+        else:
+            fill, changed = self._apply(data)
+        calls = [(self.on_fill, (fill,))] if fill is not None else []
+        calls += [(self.on_position, change) for change in changed]
+        for fn, args in calls:
+            if fn is None:
+                continue
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[UserStream] Callback error in {getattr(fn, '__name__', fn)}: {e}")
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # REST (listen key / resync) - blocking ccxt calls run off the loop
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    def _rest_call(self, name: str):
+        if name == 'post_listen_key':
+            return self.rest.fapiPrivatePostListenKey()['listenKey']
+        if name == 'keepalive':
+            return self.rest.fapiPrivatePutListenKey()
+        if name == 'account':
+            return self.rest.fapiPrivateV2GetAccount()
+        if name == 'open_orders':
+            return self.rest.fapiPrivateGetOpenOrders()
+        raise ValueError(name)
+
+    async def _rest(self, name: str):
+        return await asyncio.get_running_loop().run_in_executor(None, self._rest_call, name)
+
+    async def _resync(self):
+        account, open_orders = await asyncio.gather(self._rest('account'), self._rest('open_orders'))
+        self._tap('snapshot', {'account': account, 'open_orders': open_orders})
+        changed = self.mirror.apply_snapshot(account, open_orders)
+        self.stats.resyncs += 1
+        await self._notify_positions(changed)
+
+    async def _keepalive(self):
+        while self._running:
+            await asyncio.sleep(self.keepalive_sec)
+            try:
+                await self._rest('keepalive')
+                self.stats.keepalives += 1
+            except Exception as e:
+                print(f"[UserStream] Keepalive failed: {e}")
+
+    # ═══════════════════════════════════════════════════════════════════════════
+    # READ
+    # ═══════════════════════════════════════════════════════════════════════════
+
+    async def _read(self, ws):
+        while self._running:
+            raw = await ws.recv()
+            self.stats.messages += 1
+            self.stats.last_message_at = time.time()
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                continue
+            data = msg.get('data', msg)
+            event = data.get('e')
+
+            if event in ('ORDER_TRADE_UPDATE', 'ACCOUNT_UPDATE'):
+                self._tap('event', data)
+                fill, changed = self._apply(data)
+                if fill is not None and self.on_fill:
+                    await self._call(self.on_fill, fill)
+                await self._notify_positions(changed)
+            elif event == 'listenKeyExpired':
+                raise ConnectionError("listen key expired")
+
+    def _apply(self, data: Dict) -> tuple:
+        """ORDER_TRADE_UPDATE / ACCOUNT_UPDATE → mirror; returns (Fill or None, changed positions)"""
+        if data.get('e') == 'ORDER_TRADE_UPDATE':
+            self.stats.order_updates += 1
+            fill = self.mirror.apply_order_update(data)
+            if fill is not None:
+                self.stats.fills += 1
+            return fill, []
+        self.stats.account_updates += 1
+        return None, self.mirror.apply_account_update(data)
+
+    def _tap(self, kind: str, data: Dict):
+        if self.tap is not None:
+            try:
+                self.tap(kind, data)
+            except Exception as e:
+                print(f"[UserStream] Tap error: {e}")
+
+    async def _notify_positions(self, changed: List):
+        if self.on_position:
+            for symbol, before, pos in changed:
+                await self._call(self.on_position, symbol, before, pos)
+
+    async def _call(self, fn, *args):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except Exception as e:
+            print(f"[UserStream] Callback error in {getattr(fn, '__name__', fn)}: {e}")
+
+
+# For testing: python user_stream.py  (local server + fake REST, no keys needed)
+if __name__ == "__main__":
+
+    class FakeRest:
+        def fapiPrivatePostListenKey(self):
+            return {'listenKey': 'demo-key'}
+
+        def fapiPrivatePutListenKey(self):
+            return {}
+
+        def fapiPrivateDeleteListenKey(self):
+            return {}
+
+        def fapiPrivateV2GetAccount(self):
+            return {'assets': [{'asset': 'USDT', 'walletBalance': '100', 'crossWalletBalance': '100',
+                                'availableBalance': '80'}],
+                    'positions': [{'symbol': 'BTCUSDT', 'positionAmt': '0.010', 'entryPrice': '65000',
+                                   'unrealizedProfit': '1.5', 'isolated': False, 'positionSide': 'BOTH'}]}
+
+        def fapiPrivateGetOpenOrders(self):
+            return [{'orderId': 11, 'symbol': 'BTCUSDT', 'side': 'SELL', 'type': 'STOP_MARKET',
+                     'origType': 'STOP_MARKET', 'origQty': '0.010', 'stopPrice': '64000', 'reduceOnly': True}]
+
+    now = int(time.time() * 1000) + 1000
+    events = [
+        {'e': 'ORDER_TRADE_UPDATE', 'E': now, 'T': now, 'o': {
+            's': 'BTCUSDT', 'c': 'sl', 'S': 'SELL', 'o': 'MARKET', 'ot': 'STOP_MARKET', 'q': '0.010',
+            'p': '0', 'ap': '63990', 'sp': '64000', 'x': 'TRADE', 'X': 'FILLED', 'i': 11, 'l': '0.010',
+            'z': '0.010', 'L': '63990', 'n': '0.25', 'T': now, 'R': True, 'rp': '-10.1'}},
+        {'e': 'ACCOUNT_UPDATE', 'E': now, 'T': now, 'a': {'m': 'ORDER',
+            'B': [{'a': 'USDT', 'wb': '89.65', 'cw': '89.65', 'bc': '0'}],
+            'P': [{'s': 'BTCUSDT', 'pa': '0', 'ep': '0', 'cr': '0', 'up': '0', 'mt': 'cross', 'ps': 'BOTH'}]}},
+    ]
+
+    async def demo():
+        async def handler(ws, *args):
+            for event in events:
+                await ws.send(json.dumps(event))
+            await asyncio.sleep(0.2)
+
+        server = await websockets.serve(handler, '127.0.0.1', 8766)
+        stream = UserDataStream(
+            FakeRest(), url="ws://127.0.0.1:8766",
+            on_fill=lambda f: print(f"   fill {f.order_type} {f.side} {f.qty} @ {f.price} rp {f.realized_pnl}"),
+            on_position=lambda s, before, p: print(f"   position {s}: {before} → {p.amount}"),
+        )
+        task = asyncio.create_task(stream.run())
+        await asyncio.sleep(0.5)
+        print(f"mirror: {stream.mirror.snapshot()}")
+        stream.stop()
+        await asyncio.wait_for(task, 5)
+        server.close()
+        await server.wait_closed()
+        print(f"stats: {stream.stats}")
+
+    asyncio.run(demo())
@@ -0,0 +1,217 @@
+"""
+Volatility Models - EWMA (RiskMetrics) และ GARCH(1,1) แบบ vectorized + streaming
+- ewma_variance(): recursion ทั้ง series ในครั้งเดียว (scipy.signal.lfilter / pandas ewm)
+- fit_garch(): หา omega/alpha/beta ด้วย maximum likelihood
+- VolatilityEstimator: update(ret) ทีละค่า O(1) สำหรับ live
+"""
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.signal import lfilter
+    from scipy.optimize import minimize
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+RISKMETRICS_LAMBDA = 0.94                    # Standard RiskMetrics decay factor
+ANNUALIZE_1M = float(np.sqrt(252 * 24 * 60))  # Same factor AgentA has always used
+
+
+def _as_array(returns) -> np.ndarray:
+    if isinstance(returns, pd.Series):
+        return returns.to_numpy(dtype=np.float64)
+    return np.asarray(returns, dtype=np.float64)
+
+
+def ewma_variance(returns, lam: float = RISKMETRICS_LAMBDA) -> np.ndarray:
+    """
+    EWMA variance for every bar: var[0] = r[0]^2, var[t] = lam*var[t-1] + (1-lam)*r[t]^2
+    """
+    r = _as_array(returns)
+    if len(r) == 0:
+        return r.copy()
+
+    sq = r * r
+    if SCIPY_AVAILABLE:
+        # y[n] = (1-lam)*x[n] + lam*y[n-1], zi chosen so that y[0] = x[0]
+        var, _ = lfilter([1 - lam], [1.0, -lam], sq, zi=[lam * sq[0]])
+        return var
+
+    # pandas ewm(adjust=False) is the same recursion with y[0] = x[0]
+    return pd.Series(sq).ewm(alpha=1 - lam, adjust=False).mean().to_numpy()
+
+
+@dataclass
+class GarchParams:
+    """GARCH(1,1): var[t+1] = omega + alpha*r[t]^2 + beta*var[t]"""
+    omega: float
+    alpha: float
+    beta: float
+    log_likelihood: float = 0.0
+    fitted_at: float = 0.0
+
+    @property
+    def persistence(self) -> float:
+        return self.alpha + self.beta
+
+    @property
+    def long_run_variance(self) -> float:
+        return self.omega / (1 - self.persistence) if self.persistence < 1 else float('nan')
+
+
+def garch_variance(returns, params: GarchParams, initial_var: float = None) -> np.ndarray:
+    """
+    Next-bar variance forecast after each return (same convention as ewma_variance:
+    EWMA is GARCH with omega=0, alpha=1-lam, beta=lam)
+    """
+    r = _as_array(returns)
+    if len(r) == 0:
+        return r.copy()
+
+    v0 = float(np.var(r)) if initial_var is None else initial_var
+    u = params.omega + params.alpha * r * r
+
+    if SCIPY_AVAILABLE:
+        var, _ = lfilter([1.0], [1.0, -params.beta], u, zi=[params.beta * v0])
+        return var
+
+    var = np.empty_like(u)
+    prev = v0
+    for t in range(len(u)):
+        prev = u[t] + params.beta * prev
+        var[t] = prev
+    return var
+
+
+def _garch_nll(x: np.ndarray, r: np.ndarray, sample_var: float) -> float:
+    """Negative Gaussian log-likelihood with variance targeting (omega from alpha/beta)"""
+    alpha, beta = x
+    if alpha < 0 or beta < 0 or alpha + beta >= 0.9999:
+        return 1e12
+    omega = sample_var * (1 - alpha - beta)
+    forecast = garch_variance(r, GarchParams(omega, alpha, beta), initial_var=sample_var)
+    # Variance of r[t] is the forecast made after r[t-1]
+    var = np.concatenate(([sample_var], forecast[:-1]))
+    var = np.maximum(var, 1e-20)
+    return 0.5 * float(np.sum(np.log(var) + r * r / var))
+
+
+def fit_garch(returns, min_obs: int = 100) -> Optional[GarchParams]:
+    """
+    Fit GARCH(1,1) by maximum likelihood (variance targeting)
+    Returns None when there is too little data
+    """
+    r = _as_array(returns)
+    r = r[np.isfinite(r)]
+    if len(r) < min_obs:
+        return None
+
+    r = r - r.mean()
+    sample_var = float(np.var(r))
+    if sample_var <= 0:
+        return None
+
+    if SCIPY_AVAILABLE:
+        res = minimize(
+            _garch_nll, x0=[0.05, 0.90], args=(r, sample_var),
+            method='L-BFGS-B', bounds=[(1e-6, 0.5), (0.0, 0.9989)]
+        )
+        alpha, beta = float(res.x[0]), float(res.x[1])
+        nll = float(res.fun)
+    else:
+        # Coarse grid search fallback
+        best = (0.05, 0.90, _garch_nll(np.array([0.05, 0.90]), r, sample_var))
+        for alpha in np.linspace(0.01, 0.30, 30):
+            for beta in np.linspace(0.50, 0.98, 49):
+                nll = _garch_nll(np.array([alpha, beta]), r, sample_var)
+                if nll < best[2]:
+                    best = (alpha, beta, nll)
+        alpha, beta, nll = best
+
+    if alpha + beta >= 0.9999:
+        return None
+
+    return GarchParams(
+        omega=sample_var * (1 - alpha - beta),
+        alpha=alpha,
+        beta=beta,
+        log_likelihood=-nll,
+        fitted_at=time.time()
+    )
+
+
+def volatility_series(returns, model: str = "ewma", params: GarchParams = None,
+                      lam: float = RISKMETRICS_LAMBDA, annualize: float = ANNUALIZE_1M):
+    """Annualized volatility for every bar (same index as the input when it is a Series)"""
+    if model == "garch" and params is not None:
+        var = garch_variance(returns, params)
+    else:
+        var = ewma_variance(returns, lam)
+    vol = np.sqrt(var) * annualize
+    if isinstance(returns, pd.Series):
+        return pd.Series(vol, index=returns.index, name='Volatility')
+    return vol
+
+
+class VolatilityEstimator:
+    """
+    Streaming volatility - O(1) per new return
+    seed() once from history (vectorized), then update(ret) every candle
+    """
+
+    def __init__(self, model: str = "ewma", lam: float = RISKMETRICS_LAMBDA,
+                 annualize: float = ANNUALIZE_1M, params: GarchParams = None):
+        self.model = model
+        self.lam = lam
+        self.annualize = annualize
+        self.params = params
+        self.variance: Optional[float] = None
+        self.count = 0
+
+    def seed(self, returns) -> np.ndarray:
+        """Initialize from history; returns the full annualized volatility series"""
+        r = _as_array(returns)
+        r = r[np.isfinite(r)]
+        if len(r) == 0:
+            return r
+
+        if self.model == "garch" and self.params is None:
+            self.params = fit_garch(r)
+
+        if self.model == "garch" and self.params is not None:
+            var = garch_variance(r, self.params)
+        else:
+            var = ewma_variance(r, self.lam)
+
+        self.variance = float(var[-1])
+        self.count = len(r)
+        return np.sqrt(var) * self.annualize
+
+    def update(self, ret: float) -> float:
+        """Add one return, return annualized volatility"""
+        if not np.isfinite(ret):
+            return self.value
+
+        if self.variance is None:
+            self.variance = ret * ret
+        elif self.model == "garch" and self.params is not None:
+            p = self.params
+            self.variance = p.omega + p.alpha * ret * ret + p.beta * self.variance
+        else:
+            self.variance = self.lam * self.variance + (1 - self.lam) * ret * ret
+
+        self.count += 1
+        return self.value
+
+    @property
+    def value(self) -> float:
+        """Current annualized volatility"""
+        if self.variance is None:
+            return 0.0
+        return float(np.sqrt(self.variance) * self.annualize)